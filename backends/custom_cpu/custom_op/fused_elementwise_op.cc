@@ -0,0 +1,145 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/fused_elementwise.h"
+#include "paddle/extension.h"
+#include "runtime/profiler.h"
+#include "runtime/stream.h"
+
+// fused_elementwise runs a chain of elementwise, compare and cast ops that
+// the fusion pass in passes/ collapsed into a bytecode program, see
+// kernels/funcs/fused_elementwise.h for the encoding.
+
+namespace {
+
+paddle::DataType ToOutDtype(const std::string& out_dtype) {
+  PD_CHECK(
+      out_dtype == "float32" || out_dtype == "float64" || out_dtype == "bool",
+      "fused_elementwise: out_dtype should be float32, float64 or bool, "
+      "but received ",
+      out_dtype,
+      ".");
+  if (out_dtype == "float64") {
+    return paddle::DataType::FLOAT64;
+  }
+  return out_dtype == "bool" ? paddle::DataType::BOOL
+                             : paddle::DataType::FLOAT32;
+}
+
+}  // namespace
+
+std::vector<paddle::Tensor> FusedElementwise(
+    const std::vector<paddle::Tensor>& x,
+    const std::vector<int>& program,
+    const std::vector<float>& constants,
+    const std::string& out_dtype) {
+  custom_cpu::TraceScope trace("fused_elementwise");
+  PD_CHECK(!x.empty(), "fused_elementwise expects at least one input.");
+  // Custom ops do not get the stream of their context, so they wait for
+  // every stream of the device before reading their inputs.
+  custom_cpu::Stream::SynchronizeDevice(x[0].place().GetDeviceId());
+  const int depth = custom_kernel::funcs::FusedProgramDepth(
+      program, static_cast<int>(x.size()), static_cast<int>(constants.size()));
+  PD_CHECK(depth > 0, "fused_elementwise: the program is malformed.");
+
+  // A chain computes in one floating point type, bool values (compare
+  // results, casts to bool) are carried as 0 / 1 in it.
+  const auto dtype = ToOutDtype(out_dtype);
+  auto compute_dtype =
+      dtype == paddle::DataType::BOOL ? paddle::DataType::FLOAT32 : dtype;
+  std::vector<custom_kernel::funcs::FusedInput> inputs;
+  int64_t in_bytes = 0;
+  for (const auto& t : x) {
+    if (t.dtype() == paddle::DataType::FLOAT64) {
+      compute_dtype = paddle::DataType::FLOAT64;
+    }
+  }
+  for (const auto& t : x) {
+    PD_CHECK(t.dtype() == compute_dtype || t.dtype() == paddle::DataType::BOOL,
+             "fused_elementwise: inputs should share one floating point "
+             "type or be bool.");
+    inputs.push_back(
+        {t.data(), t.dtype() == paddle::DataType::BOOL, t.shape()});
+    in_bytes += t.numel() * phi::SizeOf(t.dtype());
+  }
+  std::vector<int64_t> out_dims;
+  PD_CHECK(custom_kernel::funcs::FusedBroadcastDims(inputs, &out_dims),
+           "fused_elementwise: the input shapes do not broadcast.");
+
+  auto out = paddle::empty(out_dims, dtype, x[0].place());
+  if (trace.active()) {
+    trace.set_cost(out.numel() * (program.size() / 2),
+                   in_bytes + out.numel() * phi::SizeOf(dtype));
+  }
+  const bool out_is_bool = dtype == paddle::DataType::BOOL;
+  if (compute_dtype == paddle::DataType::FLOAT64) {
+    custom_kernel::funcs::FusedElementwise<double>(
+        program, constants, inputs, out_dims, depth, out_is_bool, out.data());
+  } else {
+    custom_kernel::funcs::FusedElementwise<float>(
+        program, constants, inputs, out_dims, depth, out_is_bool, out.data());
+  }
+  return {out};
+}
+
+// Same broadcast as FusedBroadcastDims, -1 stands for a dim only known at
+// run time.
+std::vector<std::vector<int64_t>> FusedElementwiseInferShape(
+    const std::vector<std::vector<int64_t>>& x_shapes,
+    const std::vector<int>& program,
+    const std::vector<float>& constants,
+    const std::string& out_dtype) {
+  size_t rank = 0;
+  for (const auto& shape : x_shapes) {
+    rank = std::max(rank, shape.size());
+  }
+  std::vector<int64_t> out(rank, 1);
+  for (const auto& shape : x_shapes) {
+    const size_t offset = rank - shape.size();
+    for (size_t i = 0; i < shape.size(); ++i) {
+      int64_t& d = out[offset + i];
+      if (shape[i] == 1 || shape[i] == d) {
+        continue;
+      }
+      if (d == 1 || d == -1) {
+        d = shape[i];
+      } else {
+        PD_CHECK(shape[i] == -1,
+                 "fused_elementwise: the input shapes do not broadcast.");
+      }
+    }
+  }
+  return {out};
+}
+
+std::vector<paddle::DataType> FusedElementwiseInferDtype(
+    const std::vector<paddle::DataType>& x_dtypes,
+    const std::vector<int>& program,
+    const std::vector<float>& constants,
+    const std::string& out_dtype) {
+  return {ToOutDtype(out_dtype)};
+}
+
+PD_BUILD_OP(fused_elementwise)
+    .Inputs({paddle::Vec("X")})
+    .Outputs({"Out"})
+    .Attrs({"program: std::vector<int>",
+            "constants: std::vector<float>",
+            "out_dtype: std::string"})
+    .SetKernelFn(PD_KERNEL(FusedElementwise))
+    .SetInferShapeFn(PD_INFER_SHAPE(FusedElementwiseInferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(FusedElementwiseInferDtype));
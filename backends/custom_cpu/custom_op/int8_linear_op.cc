@@ -0,0 +1,135 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+#include "kernels/funcs/cast.h"
+#include "kernels/funcs/gemm.h"
+#include "paddle/extension.h"
+#include "runtime/profiler.h"
+#include "runtime/stream.h"
+
+// int8_linear computes out = x * w for an int8 weight w [K, N] quantized per
+// output channel, w_q[k][n] = round(w[k][n] * w_scale[n]). x [..., K] is
+// either int8, quantized with x_scale, or float32, which is quantized on the
+// fly with x_scale, or with 127 / max|x| when x_scale <= 0. The int8 products
+// accumulate in int32 and are dequantized to float32 in the epilogue.
+
+std::vector<paddle::Tensor> Int8Linear(const paddle::Tensor& x,
+                                       const paddle::Tensor& w,
+                                       const paddle::Tensor& w_scale,
+                                       float x_scale) {
+  // Custom ops do not get the stream of their context, so they wait for
+  // every stream of the device before reading their inputs.
+  custom_cpu::Stream::SynchronizeDevice(x.place().GetDeviceId());
+  custom_cpu::TraceScope trace("int8_linear");
+  PD_CHECK(w.dtype() == paddle::DataType::INT8 && w.shape().size() == 2,
+           "int8_linear: w should be a 2-D int8 tensor.");
+  PD_CHECK(w_scale.dtype() == paddle::DataType::FLOAT32,
+           "int8_linear: w_scale should be a float32 tensor.");
+  PD_CHECK(x.dtype() == paddle::DataType::INT8 ||
+               x.dtype() == paddle::DataType::FLOAT32,
+           "int8_linear: x should be an int8 or float32 tensor.");
+  PD_CHECK(!x.shape().empty(), "int8_linear: x must not be a 0-D tensor.");
+  const int64_t K = w.shape()[0];
+  const int64_t N = w.shape()[1];
+  PD_CHECK(x.shape().back() == K,
+           "int8_linear: the last dim of x (",
+           x.shape().back(),
+           ") should equal the rows of w (",
+           K,
+           ").");
+  PD_CHECK(w_scale.numel() == N,
+           "int8_linear: w_scale should hold ",
+           N,
+           " values, but holds ",
+           w_scale.numel(),
+           ".");
+  PD_CHECK(K <= custom_kernel::funcs::kInt8GemmMaxK,
+           "int8_linear: the rows of w (",
+           K,
+           ") should be less than 2^17 to accumulate exactly in int32.");
+  const int64_t M = K == 0 ? 0 : x.numel() / K;
+
+  std::vector<int8_t> quantized;
+  const int8_t* x_int8 = nullptr;
+  if (x.dtype() == paddle::DataType::INT8) {
+    PD_CHECK(x_scale > 0, "int8_linear: x_scale of an int8 x must be > 0.");
+    x_int8 = x.data<int8_t>();
+  } else {
+    const float* x_data = x.data<float>();
+    if (x_scale <= 0) {
+      float max_abs = 0;
+      for (int64_t i = 0; i < x.numel(); ++i) {
+        max_abs = std::max(max_abs, std::abs(x_data[i]));
+      }
+      x_scale = max_abs > 0 ? 127.0f / max_abs : 1.0f;
+    }
+    quantized.resize(x.numel());
+    custom_kernel::funcs::QuantizeInt8(
+        x_data, quantized.data(), x.numel(), x_scale);
+    x_int8 = quantized.data();
+  }
+
+  // The dequant scale of out[m][n] folds both quantization scales.
+  std::vector<float> scale(N);
+  const float* w_scale_data = w_scale.data<float>();
+  for (int64_t n = 0; n < N; ++n) {
+    scale[n] = 1.0f / (x_scale * w_scale_data[n]);
+  }
+
+  std::vector<int64_t> out_dims = x.shape();
+  out_dims.back() = N;
+  auto out = paddle::empty(out_dims, paddle::DataType::FLOAT32, x.place());
+  if (trace.active()) {
+    trace.set_cost(2 * M * N * K, M * K + K * N + M * N * sizeof(float));
+  }
+  custom_kernel::funcs::Int8Gemm(false,
+                                 M,
+                                 K,
+                                 N,
+                                 x_int8,
+                                 w.data<int8_t>(),
+                                 scale.data(),
+                                 nullptr,
+                                 out.data<float>());
+  return {out};
+}
+
+std::vector<std::vector<int64_t>> Int8LinearInferShape(
+    const std::vector<int64_t>& x_shape,
+    const std::vector<int64_t>& w_shape,
+    const std::vector<int64_t>& w_scale_shape,
+    float x_scale) {
+  std::vector<int64_t> out = x_shape;
+  out.back() = w_shape.back();
+  return {out};
+}
+
+std::vector<paddle::DataType> Int8LinearInferDtype(
+    const paddle::DataType& x_dtype,
+    const paddle::DataType& w_dtype,
+    const paddle::DataType& w_scale_dtype) {
+  return {paddle::DataType::FLOAT32};
+}
+
+PD_BUILD_OP(int8_linear)
+    .Inputs({"X", "W", "WScale"})
+    .Outputs({"Out"})
+    .Attrs({"x_scale: float"})
+    .SetKernelFn(PD_KERNEL(Int8Linear))
+    .SetInferShapeFn(PD_INFER_SHAPE(Int8LinearInferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(Int8LinearInferDtype));
@@ -0,0 +1,286 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/optimizer.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+namespace {
+
+template <typename T, typename MomT>
+void AdamImpl(const phi::Context& dev_ctx,
+              const phi::DenseTensor& param,
+              const phi::DenseTensor& grad,
+              const phi::DenseTensor& learning_rate,
+              const phi::DenseTensor& moment1,
+              const phi::DenseTensor& moment2,
+              const phi::DenseTensor* moment2_max,
+              const phi::DenseTensor& beta1_pow,
+              const phi::DenseTensor& beta2_pow,
+              const phi::DenseTensor* master_param,
+              double beta1,
+              double beta2,
+              double epsilon,
+              double lr_ratio,
+              double coeff,
+              bool use_global_beta_pow,
+              phi::DenseTensor* param_out,
+              phi::DenseTensor* moment1_out,
+              phi::DenseTensor* moment2_out,
+              phi::DenseTensor* moment2_max_out,
+              phi::DenseTensor* beta1_pow_out,
+              phi::DenseTensor* beta2_pow_out,
+              phi::DenseTensor* master_param_out) {
+  using MT = typename funcs::OptimizerMathType<T>::type;
+  const double b1_pow = GetScalarValue(beta1_pow);
+  const double b2_pow = GetScalarValue(beta2_pow);
+  const MT lr = static_cast<MT>(GetScalarValue(learning_rate) * lr_ratio);
+  const funcs::AdamConfig<MT> config = {static_cast<MT>(beta1),
+                                        static_cast<MT>(beta2),
+                                        static_cast<MT>(epsilon),
+                                        lr,
+                                        static_cast<MT>(b1_pow),
+                                        static_cast<MT>(b2_pow),
+                                        lr * static_cast<MT>(coeff)};
+  funcs::AdamUpdate(
+      config,
+      param.numel(),
+      grad.data<T>(),
+      param.data<T>(),
+      master_param ? master_param->data<MT>() : nullptr,
+      moment1.data<MomT>(),
+      moment2.data<MomT>(),
+      moment2_max ? moment2_max->data<MomT>() : nullptr,
+      dev_ctx.template Alloc<T>(param_out),
+      master_param ? dev_ctx.template Alloc<MT>(master_param_out) : nullptr,
+      dev_ctx.template Alloc<MomT>(moment1_out),
+      dev_ctx.template Alloc<MomT>(moment2_out),
+      moment2_max ? dev_ctx.template Alloc<MomT>(moment2_max_out) : nullptr);
+
+  // With use_global_beta_pow the optimizer updates the beta pows once per
+  // step outside of this kernel.
+  if (!use_global_beta_pow) {
+    beta1_pow_out->Resize({1});
+    beta2_pow_out->Resize({1});
+    *dev_ctx.template Alloc<MT>(beta1_pow_out) =
+        static_cast<MT>(b1_pow * beta1);
+    *dev_ctx.template Alloc<MT>(beta2_pow_out) =
+        static_cast<MT>(b2_pow * beta2);
+  }
+}
+
+void SkipAdamUpdate(const phi::Context& dev_ctx,
+                    const phi::DenseTensor& param,
+                    const phi::DenseTensor& moment1,
+                    const phi::DenseTensor& moment2,
+                    const paddle::optional<phi::DenseTensor>& moment2_max,
+                    const phi::DenseTensor& beta1_pow,
+                    const phi::DenseTensor& beta2_pow,
+                    const paddle::optional<phi::DenseTensor>& master_param,
+                    bool amsgrad,
+                    phi::DenseTensor* param_out,
+                    phi::DenseTensor* moment1_out,
+                    phi::DenseTensor* moment2_out,
+                    phi::DenseTensor* moment2_max_out,
+                    phi::DenseTensor* beta1_pow_out,
+                    phi::DenseTensor* beta2_pow_out,
+                    phi::DenseTensor* master_param_out) {
+  CopyIfNotSame(dev_ctx, param, param_out);
+  CopyIfNotSame(dev_ctx, moment1, moment1_out);
+  CopyIfNotSame(dev_ctx, moment2, moment2_out);
+  if (amsgrad) {
+    CopyIfNotSame(dev_ctx, *moment2_max, moment2_max_out);
+  }
+  CopyIfNotSame(dev_ctx, beta1_pow, beta1_pow_out);
+  CopyIfNotSame(dev_ctx, beta2_pow, beta2_pow_out);
+  if (master_param) {
+    CopyIfNotSame(dev_ctx, *master_param, master_param_out);
+  }
+}
+
+}  // namespace
+
+template <typename T>
+void AdamwDenseKernel(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& param,
+                      const phi::DenseTensor& grad,
+                      const phi::DenseTensor& learning_rate,
+                      const phi::DenseTensor& moment1,
+                      const phi::DenseTensor& moment2,
+                      const paddle::optional<phi::DenseTensor>& moment2_max,
+                      const phi::DenseTensor& beta1_pow,
+                      const phi::DenseTensor& beta2_pow,
+                      const paddle::optional<phi::DenseTensor>& master_param,
+                      const paddle::optional<phi::DenseTensor>& skip_update,
+                      const phi::Scalar& beta1,
+                      const phi::Scalar& beta2,
+                      const phi::Scalar& epsilon,
+                      float lr_ratio,
+                      float coeff,
+                      bool with_decay,
+                      bool lazy_mode,
+                      int64_t min_row_size_to_use_multithread,
+                      bool multi_precision,
+                      bool use_global_beta_pow,
+                      bool amsgrad,
+                      phi::DenseTensor* param_out,
+                      phi::DenseTensor* moment1_out,
+                      phi::DenseTensor* moment2_out,
+                      phi::DenseTensor* moment2_max_out,
+                      phi::DenseTensor* beta1_pow_out,
+                      phi::DenseTensor* beta2_pow_out,
+                      phi::DenseTensor* master_param_out) {
+  // adam runs as adamw without decay.
+  custom_cpu::TraceScope trace(with_decay ? "adamw" : "adam");
+  if (trace.active()) {
+    trace.set_cost(16 * param.numel(),
+                   3 * param.memory_size() +
+                       2 * (moment1.memory_size() + moment2.memory_size()));
+  }
+  PD_CHECK(!amsgrad || moment2_max,
+           "adam: moment2_max should be given when amsgrad is true.");
+  // skip_update carries the found_inf flag of dynamic loss scaling.
+  if (skip_update && skip_update->data<bool>()[0]) {
+    SkipAdamUpdate(dev_ctx,
+                   param,
+                   moment1,
+                   moment2,
+                   moment2_max,
+                   beta1_pow,
+                   beta2_pow,
+                   master_param,
+                   amsgrad,
+                   param_out,
+                   moment1_out,
+                   moment2_out,
+                   moment2_max_out,
+                   beta1_pow_out,
+                   beta2_pow_out,
+                   master_param_out);
+    return;
+  }
+
+  using MT = typename funcs::OptimizerMathType<T>::type;
+  const phi::DenseTensor* master =
+      multi_precision && master_param ? master_param.get_ptr() : nullptr;
+  // Moments are MT under multi-precision training and may be T otherwise.
+  auto impl = moment1.dtype() == phi::capi::CppTypeToPDType<T>::Type()
+                  ? AdamImpl<T, T>
+                  : AdamImpl<T, MT>;
+  impl(dev_ctx,
+       param,
+       grad,
+       learning_rate,
+       moment1,
+       moment2,
+       amsgrad ? moment2_max.get_ptr() : nullptr,
+       beta1_pow,
+       beta2_pow,
+       master,
+       beta1.to<double>(),
+       beta2.to<double>(),
+       epsilon.to<double>(),
+       static_cast<double>(lr_ratio),
+       with_decay ? static_cast<double>(coeff) : 0.0,
+       use_global_beta_pow,
+       param_out,
+       moment1_out,
+       moment2_out,
+       moment2_max_out,
+       beta1_pow_out,
+       beta2_pow_out,
+       master_param_out);
+}
+
+template <typename T>
+void AdamDenseKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& param,
+                     const phi::DenseTensor& grad,
+                     const phi::DenseTensor& learning_rate,
+                     const phi::DenseTensor& moment1,
+                     const phi::DenseTensor& moment2,
+                     const paddle::optional<phi::DenseTensor>& moment2_max,
+                     const phi::DenseTensor& beta1_pow,
+                     const phi::DenseTensor& beta2_pow,
+                     const paddle::optional<phi::DenseTensor>& master_param,
+                     const paddle::optional<phi::DenseTensor>& skip_update,
+                     const phi::Scalar& beta1,
+                     const phi::Scalar& beta2,
+                     const phi::Scalar& epsilon,
+                     bool lazy_mode,
+                     int64_t min_row_size_to_use_multithread,
+                     bool multi_precision,
+                     bool use_global_beta_pow,
+                     bool amsgrad,
+                     phi::DenseTensor* param_out,
+                     phi::DenseTensor* moment1_out,
+                     phi::DenseTensor* moment2_out,
+                     phi::DenseTensor* moment2_max_out,
+                     phi::DenseTensor* beta1_pow_out,
+                     phi::DenseTensor* beta2_pow_out,
+                     phi::DenseTensor* master_param_out) {
+  AdamwDenseKernel<T>(dev_ctx,
+                      param,
+                      grad,
+                      learning_rate,
+                      moment1,
+                      moment2,
+                      moment2_max,
+                      beta1_pow,
+                      beta2_pow,
+                      master_param,
+                      skip_update,
+                      beta1,
+                      beta2,
+                      epsilon,
+                      1.0f,
+                      0.0f,
+                      false,
+                      lazy_mode,
+                      min_row_size_to_use_multithread,
+                      multi_precision,
+                      use_global_beta_pow,
+                      amsgrad,
+                      param_out,
+                      moment1_out,
+                      moment2_out,
+                      moment2_max_out,
+                      beta1_pow_out,
+                      beta2_pow_out,
+                      master_param_out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(adam,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::AdamDenseKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(adamw,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::AdamwDenseKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
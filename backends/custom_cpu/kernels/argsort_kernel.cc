@@ -12,69 +12,15 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/sort.h"
 #include "kernels/kernels.h"
 #include "kernels/phi_funcs.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
-template <typename T, typename Type>
-static void FullSort(Type input_height,
-                     Type input_width,
-                     int input_dim,
-                     const phi::DenseTensor* input,
-                     T* t_out,
-                     Type* t_indices,
-                     bool descending,
-                     bool stable) {
-  for (Type i = 0; i < input_height; ++i) {
-    std::vector<std::pair<T, Type>> col_vec;
-    col_vec.reserve(input_width);
-    auto e_input = input->data<T>();
-    if (input_dim == 1) {
-      for (Type j = 0; j < input_width; ++j) {
-        col_vec.push_back(std::pair<T, Type>(e_input[j], j));
-      }
-    } else {
-      for (Type j = 0; j < input_width; ++j) {
-        col_vec.push_back(std::pair<T, Type>(e_input[i * input_width + j], j));
-      }
-    }
-    if (stable) {
-      std::stable_sort(
-          col_vec.begin(),
-          col_vec.end(),
-          [&](const std::pair<T, Type>& l, const std::pair<T, Type>& r) {
-            if (descending)
-              return (std::isnan(static_cast<double>(l.first)) &&
-                      !std::isnan(static_cast<double>(r.first))) ||
-                     (l.first > r.first);
-            else
-              return (!std::isnan(static_cast<double>(l.first)) &&
-                      std::isnan(static_cast<double>(r.first))) ||
-                     (l.first < r.first);
-          });
-    } else {
-      std::sort(col_vec.begin(),
-                col_vec.end(),
-                [&](const std::pair<T, Type>& l, const std::pair<T, Type>& r) {
-                  if (descending)
-                    return (std::isnan(static_cast<double>(l.first)) &&
-                            !std::isnan(static_cast<double>(r.first))) ||
-                           (l.first > r.first);
-                  else
-                    return (!std::isnan(static_cast<double>(l.first)) &&
-                            std::isnan(static_cast<double>(r.first))) ||
-                           (l.first < r.first);
-                });
-    }
-    for (Type j = 0; j < input_width; ++j) {
-      t_out[i * input_width + j] = col_vec[j].first;
-      t_indices[i * input_width + j] = col_vec[j].second;
-    }
-  }
-}
-
 template <typename T>
 void ArgsortKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& input,
@@ -83,88 +29,35 @@ void ArgsortKernel(const phi::Context& dev_ctx,
                    bool stable,
                    phi::DenseTensor* output,
                    phi::DenseTensor* indices) {
+  custom_cpu::TraceScope trace("argsort");
+  if (trace.active()) {
+    trace.set_cost(0, input.numel() * (2 * sizeof(T) + sizeof(int64_t)));
+  }
   auto in_dims = input.dims();
-  auto rank = in_dims.size();
-  axis = (axis < 0) ? (in_dims.size() + axis) : axis;
+  const int rank = in_dims.size();
   T* out_data = dev_ctx.template Alloc<T>(output);
-
+  int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+  if (input.numel() == 0) {
+    return;
+  }
   if (rank == 0) {
-    auto numel = input.numel();
-    if (numel == 0) {
-      return;
-    }
-    T* in_data = input.data<T>();
-    // Actually, numel = 1 if rank == 0.
-    for (auto i = 0; i < numel; ++i) {
-      out_data[i] = in_data[i];
-    }
-    int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+    out_data[0] = input.data<T>()[0];
     ids_data[0] = 0;
     return;
   }
 
-  // Do full sort
-  if (axis == -1 || axis + 1 == in_dims.size()) {
-    const int64_t input_height =
-        phi::product(phi::slice_ddim(in_dims, 0, in_dims.size() - 1));
-    const int64_t input_width = in_dims[in_dims.size() - 1];
-    int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
-    FullSort<T, int64_t>(input_height,
-                         input_width,
-                         in_dims.size(),
-                         &input,
-                         out_data,
-                         ids_data,
-                         descending,
-                         stable);
-  } else {
-    // If not full sort do transpose
-    std::vector<int> trans;
-    for (int i = 0; i < axis; i++) {
-      trans.push_back(i);
-    }
-    trans.push_back(in_dims.size() - 1);
-    for (int i = axis + 1; i < in_dims.size() - 1; i++) {
-      trans.push_back(i);
-    }
-    trans.push_back(axis);
-    std::vector<int64_t> trans_dims(in_dims.cbegin(), in_dims.cend());
-    for (size_t i = 0; i < trans.size(); i++) {
-      trans_dims[i] = in_dims[trans[i]];
-    }
-
-    phi::DenseTensor trans_inp;
-    trans_inp.Resize(trans_dims);
-    dev_ctx.template Alloc<T>(&trans_inp);
-    // Do transpose
-    TransposeKernel<T>(dev_ctx, input, trans, &trans_inp);
-
-    const int64_t input_height =
-        phi::product(phi::slice_ddim(trans_dims, 0, trans_dims.size() - 1));
-    const int64_t input_width = trans_dims[trans_dims.size() - 1];
-
-    phi::DenseTensor tmp_out;
-    tmp_out.Resize(trans_dims);
-    T* t_out = dev_ctx.template Alloc<T>(&tmp_out);
-
-    phi::DenseTensor tmp_indices;
-    tmp_indices.Resize(trans_dims);
-    auto* t_ind = dev_ctx.template Alloc<int64_t>(&tmp_indices);
-
-    FullSort<T, int64_t>(input_height,
-                         input_width,
-                         in_dims.size(),
-                         &trans_inp,
-                         t_out,
-                         t_ind,
-                         descending,
-                         stable);
-
-    dev_ctx.template Alloc<int64_t>(indices);
-    TransposeKernel<int64_t>(dev_ctx, tmp_indices, trans, indices);
-    // transpose back
-    TransposeKernel<T>(dev_ctx, tmp_out, trans, output);
-  }
+  // Sorting along any axis works in place on the [outer, n, inner] view, the
+  // result is always the stable order so `stable` needs no special handling.
+  axis = phi::funcs::CanonicalAxis(axis, rank);
+  const int64_t outer = phi::product(phi::slice_ddim(in_dims, 0, axis));
+  const int64_t inner = phi::product(phi::slice_ddim(in_dims, axis + 1, rank));
+  funcs::Argsort(input.data<T>(),
+                 out_data,
+                 ids_data,
+                 outer,
+                 in_dims[axis],
+                 inner,
+                 descending);
 }
 
 }  // namespace custom_kernel
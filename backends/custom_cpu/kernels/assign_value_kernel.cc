@@ -14,6 +14,7 @@
 
 #include <cmath>
 
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
@@ -0,0 +1,190 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <cmath>
+
+#include "kernels/funcs/norm.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+namespace {
+
+// NCHW-like layouts are [N, C, spatial...], NHWC is [N, spatial..., C].
+funcs::ChannelShape MakeChannelShape(const std::vector<int64_t>& dims,
+                                     const std::string& data_layout) {
+  PD_CHECK(dims.size() >= 2 && dims.size() <= 5,
+           "batch_norm expects a 2-D to 5-D input, but received ",
+           dims.size(),
+           "-D.");
+  funcs::ChannelShape s;
+  const int64_t numel = phi::product(dims);
+  if (data_layout == "NHWC" && dims.size() > 2) {
+    s.channels = dims.back();
+    s.inner = 1;
+  } else {
+    s.channels = dims[1];
+    s.inner = numel == 0 ? 0 : numel / (dims[0] * dims[1]);
+  }
+  s.outer =
+      s.channels == 0 || s.inner == 0 ? 0 : numel / (s.channels * s.inner);
+  return s;
+}
+
+}  // namespace
+
+template <typename T>
+void BatchNormKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& x,
+                     const phi::DenseTensor& mean,
+                     const phi::DenseTensor& variance,
+                     const paddle::optional<phi::DenseTensor>& scale,
+                     const paddle::optional<phi::DenseTensor>& bias,
+                     bool is_test,
+                     float momentum,
+                     float epsilon,
+                     const std::string& data_layout,
+                     bool use_global_stats,
+                     bool trainable_statistics,
+                     phi::DenseTensor* y,
+                     phi::DenseTensor* mean_out,
+                     phi::DenseTensor* variance_out,
+                     phi::DenseTensor* saved_mean,
+                     phi::DenseTensor* saved_variance,
+                     phi::DenseTensor* reserve_space) {
+  const bool test_mode = is_test && !trainable_statistics;
+  const bool global_stats = test_mode || use_global_stats;
+  auto s = MakeChannelShape(x.dims(), data_layout);
+  custom_cpu::TraceScope trace("batch_norm");
+  if (trace.active()) {
+    // Two reduction passes in training and one multiply-add per element.
+    trace.set_cost((global_stats ? 2 : 6) * x.numel(),
+                   (global_stats ? 2 : 4) * x.numel() * sizeof(T));
+  }
+  T* y_data = dev_ctx.template Alloc<T>(y);
+  T* mean_out_data = dev_ctx.template Alloc<T>(mean_out);
+  T* variance_out_data = dev_ctx.template Alloc<T>(variance_out);
+  T* saved_mean_data = dev_ctx.template Alloc<T>(saved_mean);
+  T* saved_variance_data = dev_ctx.template Alloc<T>(saved_variance);
+  const T* scale_data = scale ? scale->data<T>() : nullptr;
+  const T* bias_data = bias ? bias->data<T>() : nullptr;
+
+  if (global_stats) {
+    funcs::BatchNormInferForward(s,
+                                 x.data<T>(),
+                                 scale_data,
+                                 bias_data,
+                                 mean.data<T>(),
+                                 variance.data<T>(),
+                                 epsilon,
+                                 y_data);
+    // The running statistics pass through, the batch ones are not computed.
+    CopyIfNotSame(dev_ctx, mean, mean_out);
+    CopyIfNotSame(dev_ctx, variance, variance_out);
+    std::fill(saved_mean_data, saved_mean_data + s.channels, T(0));
+    std::fill(saved_variance_data, saved_variance_data + s.channels, T(0));
+    return;
+  }
+  funcs::BatchNormTrainForward(s,
+                               x.data<T>(),
+                               scale_data,
+                               bias_data,
+                               mean.data<T>(),
+                               variance.data<T>(),
+                               momentum,
+                               epsilon,
+                               y_data,
+                               mean_out_data,
+                               variance_out_data,
+                               saved_mean_data,
+                               saved_variance_data);
+}
+
+template <typename T>
+void BatchNormGradKernel(
+    const phi::Context& dev_ctx,
+    const phi::DenseTensor& x,
+    const paddle::optional<phi::DenseTensor>& scale,
+    const paddle::optional<phi::DenseTensor>& bias,
+    const paddle::optional<phi::DenseTensor>& mean,
+    const paddle::optional<phi::DenseTensor>& variance,
+    const phi::DenseTensor& saved_mean,
+    const phi::DenseTensor& saved_variance,
+    const paddle::optional<phi::DenseTensor>& reserve_space,
+    const phi::DenseTensor& y_grad,
+    float momentum,
+    float epsilon,
+    const std::string& data_layout,
+    bool is_test,
+    bool use_global_stats,
+    bool trainable_statistics,
+    phi::DenseTensor* x_grad,
+    phi::DenseTensor* scale_grad,
+    phi::DenseTensor* bias_grad) {
+  const bool global_stats = is_test || use_global_stats;
+  auto s = MakeChannelShape(x.dims(), data_layout);
+  custom_cpu::TraceScope trace("batch_norm_grad");
+  if (trace.active()) {
+    trace.set_cost(8 * x.numel(), 3 * x.numel() * sizeof(T));
+  }
+  T* dx = x_grad ? dev_ctx.template Alloc<T>(x_grad) : nullptr;
+  T* dscale = scale_grad ? dev_ctx.template Alloc<T>(scale_grad) : nullptr;
+  T* dbias = bias_grad ? dev_ctx.template Alloc<T>(bias_grad) : nullptr;
+
+  const T* mean_data = saved_mean.data<T>();
+  const T* inv_std_data = saved_variance.data<T>();
+  std::vector<T> inv_std;
+  if (global_stats) {
+    PD_CHECK(mean && variance,
+             "batch_norm_grad with global statistics needs the running mean "
+             "and variance.");
+    mean_data = mean->data<T>();
+    const T* var = variance->data<T>();
+    inv_std.resize(s.channels);
+    for (int64_t c = 0; c < s.channels; ++c) {
+      inv_std[c] = static_cast<T>(1.0 / std::sqrt(var[c] + epsilon));
+    }
+    inv_std_data = inv_std.data();
+  }
+  funcs::BatchNormBackward(s,
+                           x.data<T>(),
+                           scale ? scale->data<T>() : nullptr,
+                           mean_data,
+                           inv_std_data,
+                           y_grad.data<T>(),
+                           !global_stats,
+                           dx,
+                           dscale,
+                           dbias);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(batch_norm,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::BatchNormKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(batch_norm_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::BatchNormGradKernel,
+                    float,
+                    double) {}
@@ -14,37 +14,55 @@
 
 #include <cmath>
 
+#include "kernels/funcs/broadcast.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
+template <typename T, typename Functor>
+void CompareCompute(const phi::Context& dev_ctx,
+                    const char* name,
+                    const phi::DenseTensor& x,
+                    const phi::DenseTensor& y,
+                    int axis,
+                    Functor func,
+                    phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace(name);
+  auto x_dims = x.dims();
+  auto y_dims = y.dims();
+  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
+  auto out_data = dev_ctx.template Alloc<bool>(out);
+  if (trace.active()) {
+    trace.set_cost(
+        out->numel(),
+        (x.numel() + y.numel()) * sizeof(T) + out->numel() * sizeof(bool));
+  }
+  funcs::BroadcastBinary(
+      dst_dims, x_dims, x.data<T>(), y_dims, y.data<T>(), axis, out_data, func);
+}
+
 template <typename T>
 void NotEqualRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    if (std::is_floating_point<T>::value) {
-      out_data[i] = static_cast<bool>(
-          fabs(static_cast<double>(x_data[i] - y_data[i])) >= 1e-8);
-    } else {
-      out_data[i] = x_data[i] != y_data[i];
-    }
-  }
+  CompareCompute<T>(
+      dev_ctx,
+      "not_equal",
+      x,
+      y,
+      axis,
+      [](T a, T b) -> bool {
+        if (std::is_floating_point<T>::value) {
+          return fabs(static_cast<double>(a - b)) >= 1e-8;
+        }
+        return a != b;
+      },
+      out);
 }
 
 template <typename T>
@@ -61,26 +79,19 @@ void EqualRawKernel(const phi::Context& dev_ctx,
                     const phi::DenseTensor& y,
                     int axis,
                     phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    if (std::is_floating_point<T>::value) {
-      out_data[i] = static_cast<bool>(
-          fabs(static_cast<double>(x_data[i] - y_data[i])) < 1e-8);
-    } else {
-      out_data[i] = x_data[i] == y_data[i];
-    }
-  }
+  CompareCompute<T>(
+      dev_ctx,
+      "equal",
+      x,
+      y,
+      axis,
+      [](T a, T b) -> bool {
+        if (std::is_floating_point<T>::value) {
+          return fabs(static_cast<double>(a - b)) < 1e-8;
+        }
+        return a == b;
+      },
+      out);
 }
 
 template <typename T>
@@ -97,20 +108,14 @@ void LessThanRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] < y_data[i];
-  }
+  CompareCompute<T>(
+      dev_ctx,
+      "less_than",
+      x,
+      y,
+      axis,
+      [](T a, T b) -> bool { return a < b; },
+      out);
 }
 
 template <typename T>
@@ -127,20 +132,14 @@ void LessEqualRawKernel(const phi::Context& dev_ctx,
                         const phi::DenseTensor& y,
                         int axis,
                         phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] <= y_data[i];
-  }
+  CompareCompute<T>(
+      dev_ctx,
+      "less_equal",
+      x,
+      y,
+      axis,
+      [](T a, T b) -> bool { return a <= b; },
+      out);
 }
 
 template <typename T>
@@ -157,20 +156,14 @@ void GreaterThanRawKernel(const phi::Context& dev_ctx,
                           const phi::DenseTensor& y,
                           int axis,
                           phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] > y_data[i];
-  }
+  CompareCompute<T>(
+      dev_ctx,
+      "greater_than",
+      x,
+      y,
+      axis,
+      [](T a, T b) -> bool { return a > b; },
+      out);
 }
 
 template <typename T>
@@ -187,20 +180,14 @@ void GreaterEqualRawKernel(const phi::Context& dev_ctx,
                            const phi::DenseTensor& y,
                            int axis,
                            phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] >= y_data[i];
-  }
+  CompareCompute<T>(
+      dev_ctx,
+      "greater_equal",
+      x,
+      y,
+      axis,
+      [](T a, T b) -> bool { return a >= b; },
+      out);
 }
 
 template <typename T>
@@ -0,0 +1,443 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <cstring>
+
+#include "kernels/funcs/conv.h"
+#include "kernels/funcs/strided_copy.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+namespace {
+
+const std::vector<int> kNHWCToNCHW = {0, 3, 1, 2};
+const std::vector<int> kNCHWToNHWC = {0, 2, 3, 1};
+
+// `out_dims` are the dims of the output or of the output gradient.
+funcs::Conv2DShape MakeConv2DShape(const std::vector<int64_t>& in_dims,
+                                   const std::vector<int64_t>& filter_dims,
+                                   const std::vector<int64_t>& out_dims,
+                                   const std::vector<int>& strides,
+                                   const std::vector<int>& paddings,
+                                   const std::string& padding_algorithm,
+                                   const std::vector<int>& dilations,
+                                   int groups,
+                                   bool channel_last) {
+  PD_CHECK(in_dims.size() == 4 && filter_dims.size() == 4,
+           "conv2d expects 4-D input and filter, but received ",
+           in_dims.size(),
+           "-D and ",
+           filter_dims.size(),
+           "-D.");
+  const int c_axis = channel_last ? 3 : 1;
+  const int h_axis = channel_last ? 1 : 2;
+  std::vector<int> pads = paddings;
+  std::vector<int> dilation = dilations;
+  phi::funcs::UpdatePaddingAndDilation(&pads,
+                                       &dilation,
+                                       padding_algorithm,
+                                       {in_dims[h_axis], in_dims[h_axis + 1]},
+                                       strides,
+                                       {filter_dims[2], filter_dims[3]});
+
+  funcs::Conv2DShape s;
+  s.batch = in_dims[0];
+  s.in_c = in_dims[c_axis];
+  s.in_h = in_dims[h_axis];
+  s.in_w = in_dims[h_axis + 1];
+  s.out_c = filter_dims[0];
+  s.out_h = out_dims[h_axis];
+  s.out_w = out_dims[h_axis + 1];
+  s.kernel_h = filter_dims[2];
+  s.kernel_w = filter_dims[3];
+  s.stride_h = strides[0];
+  s.stride_w = strides[1];
+  s.pad_top = pads[0];
+  s.pad_left = pads[2];
+  s.dilation_h = dilation[0];
+  s.dilation_w = dilation[1];
+  s.groups = groups;
+  PD_CHECK(
+      groups > 0 && s.in_c == filter_dims[1] * groups && s.out_c % groups == 0,
+      "conv2d: input channels (",
+      s.in_c,
+      ") must equal filter channels (",
+      filter_dims[1],
+      ") * groups (",
+      groups,
+      "), and output channels (",
+      s.out_c,
+      ") must be divisible by groups.");
+  return s;
+}
+
+std::vector<int64_t> NCHWDims(const funcs::Conv2DShape& s, bool input) {
+  return input ? std::vector<int64_t>{s.batch, s.in_c, s.in_h, s.in_w}
+               : std::vector<int64_t>{s.batch, s.out_c, s.out_h, s.out_w};
+}
+
+uint64_t ConvFlops(const funcs::Conv2DShape& s) {
+  return 2 * s.batch * s.out_c * s.out_plane() * s.col_rows();
+}
+
+funcs::ConvActivation ToConvActivation(const std::string& activation) {
+  if (activation == "identity" || activation.empty()) {
+    return funcs::ConvActivation::kIdentity;
+  } else if (activation == "relu") {
+    return funcs::ConvActivation::kRelu;
+  } else if (activation == "relu6") {
+    return funcs::ConvActivation::kRelu6;
+  } else if (activation == "leaky_relu") {
+    return funcs::ConvActivation::kLeakyRelu;
+  } else if (activation == "sigmoid") {
+    return funcs::ConvActivation::kSigmoid;
+  } else if (activation == "tanh") {
+    return funcs::ConvActivation::kTanh;
+  } else if (activation == "swish") {
+    return funcs::ConvActivation::kSwish;
+  }
+  PD_CHECK(false, "Unsupported conv activation ", activation, ".");
+  return funcs::ConvActivation::kIdentity;
+}
+
+// Runs the NCHW engine, NHWC tensors are transposed around it.
+template <typename T>
+void ConvForward(const phi::Context& dev_ctx,
+                 const phi::DenseTensor& input,
+                 const phi::DenseTensor& filter,
+                 const std::vector<int>& strides,
+                 const std::vector<int>& paddings,
+                 const std::string& padding_algorithm,
+                 const std::vector<int>& dilations,
+                 int groups,
+                 const std::string& data_format,
+                 const char* name,
+                 funcs::ConvEpilogue<T> epilogue,
+                 phi::DenseTensor* out) {
+  const bool channel_last = data_format == "NHWC";
+  auto s = MakeConv2DShape(input.dims(),
+                           filter.dims(),
+                           out->dims(),
+                           strides,
+                           paddings,
+                           padding_algorithm,
+                           dilations,
+                           groups,
+                           channel_last);
+  custom_cpu::TraceScope trace(name);
+  if (trace.active()) {
+    trace.set_cost(ConvFlops(s),
+                   (input.numel() + filter.numel() + out->numel()) * sizeof(T));
+  }
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  if (out->numel() == 0) {
+    return;
+  }
+  if (!channel_last) {
+    funcs::Conv2DForward(
+        s, input.data<T>(), filter.data<T>(), out_data, epilogue);
+    return;
+  }
+
+  std::vector<T> x_nchw(input.numel());
+  std::vector<T> out_nchw(out->numel());
+  std::vector<T> residual_nchw;
+  funcs::Transpose(input.dims(), input.data<T>(), kNHWCToNCHW, x_nchw.data());
+  if (epilogue.residual) {
+    residual_nchw.resize(out->numel());
+    funcs::Transpose(
+        out->dims(), epilogue.residual, kNHWCToNCHW, residual_nchw.data());
+    epilogue.residual = residual_nchw.data();
+  }
+  funcs::Conv2DForward(
+      s, x_nchw.data(), filter.data<T>(), out_nchw.data(), epilogue);
+  funcs::Transpose(NCHWDims(s, false), out_nchw.data(), kNCHWToNHWC, out_data);
+}
+
+template <typename T>
+void ConvBackward(const phi::Context& dev_ctx,
+                  const phi::DenseTensor& input,
+                  const phi::DenseTensor& filter,
+                  const phi::DenseTensor& out_grad,
+                  const std::vector<int>& strides,
+                  const std::vector<int>& paddings,
+                  const std::string& padding_algorithm,
+                  const std::vector<int>& dilations,
+                  int groups,
+                  const std::string& data_format,
+                  const char* name,
+                  phi::DenseTensor* input_grad,
+                  phi::DenseTensor* filter_grad) {
+  const bool channel_last = data_format == "NHWC";
+  auto s = MakeConv2DShape(input.dims(),
+                           filter.dims(),
+                           out_grad.dims(),
+                           strides,
+                           paddings,
+                           padding_algorithm,
+                           dilations,
+                           groups,
+                           channel_last);
+  custom_cpu::TraceScope trace(name);
+  if (trace.active()) {
+    const uint64_t passes = (input_grad ? 1 : 0) + (filter_grad ? 1 : 0);
+    trace.set_cost(passes * ConvFlops(s),
+                   (2 * input.numel() + 2 * filter.numel() + out_grad.numel()) *
+                       sizeof(T));
+  }
+  T* dx = input_grad ? dev_ctx.template Alloc<T>(input_grad) : nullptr;
+  T* dw = filter_grad ? dev_ctx.template Alloc<T>(filter_grad) : nullptr;
+
+  const T* x = input.data<T>();
+  const T* dout = out_grad.data<T>();
+  std::vector<T> x_nchw;
+  std::vector<T> dout_nchw;
+  std::vector<T> dx_nchw;
+  if (channel_last) {
+    dout_nchw.resize(out_grad.numel());
+    funcs::Transpose(out_grad.dims(), dout, kNHWCToNCHW, dout_nchw.data());
+    dout = dout_nchw.data();
+    if (dw) {
+      x_nchw.resize(input.numel());
+      funcs::Transpose(input.dims(), x, kNHWCToNCHW, x_nchw.data());
+      x = x_nchw.data();
+    }
+  }
+  if (dw) {
+    funcs::Conv2DBackwardFilter(s, x, dout, dw);
+  }
+  if (dx) {
+    if (channel_last) {
+      dx_nchw.resize(input.numel());
+      funcs::Conv2DBackwardData(s, filter.data<T>(), dout, dx_nchw.data());
+      funcs::Transpose(NCHWDims(s, true), dx_nchw.data(), kNCHWToNHWC, dx);
+    } else {
+      funcs::Conv2DBackwardData(s, filter.data<T>(), dout, dx);
+    }
+  }
+}
+
+}  // namespace
+
+template <typename T>
+void Conv2dKernel(const phi::Context& dev_ctx,
+                  const phi::DenseTensor& input,
+                  const phi::DenseTensor& filter,
+                  const std::vector<int>& strides,
+                  const std::vector<int>& paddings,
+                  const std::string& padding_algorithm,
+                  const std::vector<int>& dilations,
+                  int groups,
+                  const std::string& data_format,
+                  phi::DenseTensor* out) {
+  ConvForward<T>(dev_ctx,
+                 input,
+                 filter,
+                 strides,
+                 paddings,
+                 padding_algorithm,
+                 dilations,
+                 groups,
+                 data_format,
+                 "conv2d",
+                 funcs::ConvEpilogue<T>(),
+                 out);
+}
+
+template <typename T>
+void Conv2dGradKernel(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& input,
+                      const phi::DenseTensor& filter,
+                      const phi::DenseTensor& out_grad,
+                      const std::vector<int>& strides,
+                      const std::vector<int>& paddings,
+                      const std::string& padding_algorithm,
+                      const std::vector<int>& dilations,
+                      int groups,
+                      const std::string& data_format,
+                      phi::DenseTensor* input_grad,
+                      phi::DenseTensor* filter_grad) {
+  ConvBackward<T>(dev_ctx,
+                  input,
+                  filter,
+                  out_grad,
+                  strides,
+                  paddings,
+                  padding_algorithm,
+                  dilations,
+                  groups,
+                  data_format,
+                  "conv2d_grad",
+                  input_grad,
+                  filter_grad);
+}
+
+template <typename T>
+void DepthwiseConv2dKernel(const phi::Context& dev_ctx,
+                           const phi::DenseTensor& input,
+                           const phi::DenseTensor& filter,
+                           const std::vector<int>& strides,
+                           const std::vector<int>& paddings,
+                           const std::string& padding_algorithm,
+                           int groups,
+                           const std::vector<int>& dilations,
+                           const std::string& data_format,
+                           phi::DenseTensor* out) {
+  ConvForward<T>(dev_ctx,
+                 input,
+                 filter,
+                 strides,
+                 paddings,
+                 padding_algorithm,
+                 dilations,
+                 groups,
+                 data_format,
+                 "depthwise_conv2d",
+                 funcs::ConvEpilogue<T>(),
+                 out);
+}
+
+template <typename T>
+void DepthwiseConv2dGradKernel(const phi::Context& dev_ctx,
+                               const phi::DenseTensor& input,
+                               const phi::DenseTensor& filter,
+                               const phi::DenseTensor& out_grad,
+                               const std::vector<int>& strides,
+                               const std::vector<int>& paddings,
+                               const std::string& padding_algorithm,
+                               int groups,
+                               const std::vector<int>& dilations,
+                               const std::string& data_format,
+                               phi::DenseTensor* input_grad,
+                               phi::DenseTensor* filter_grad) {
+  ConvBackward<T>(dev_ctx,
+                  input,
+                  filter,
+                  out_grad,
+                  strides,
+                  paddings,
+                  padding_algorithm,
+                  dilations,
+                  groups,
+                  data_format,
+                  "depthwise_conv2d_grad",
+                  input_grad,
+                  filter_grad);
+}
+
+// conv2d + bias (+ residual) + activation as produced by the inference
+// fusion passes, the epilogue runs on each image right after its GEMM. With
+// split_channels the output is also split along the channel axis.
+template <typename T>
+void FusedConv2dAddActKernel(const phi::Context& dev_ctx,
+                             const phi::DenseTensor& input,
+                             const phi::DenseTensor& filter,
+                             const phi::DenseTensor& bias,
+                             const paddle::optional<phi::DenseTensor>& residual,
+                             const std::vector<int>& strides,
+                             const std::vector<int>& paddings,
+                             const std::string& padding_algorithm,
+                             const std::vector<int>& dilations,
+                             int groups,
+                             const std::string& data_format,
+                             const std::string& activation,
+                             const std::vector<int>& split_channels,
+                             bool exhaustive_search,
+                             int workspace_size_MB,
+                             float fuse_alpha,
+                             phi::DenseTensor* output,
+                             std::vector<phi::DenseTensor*> outputs) {
+  funcs::ConvEpilogue<T> epilogue;
+  epilogue.bias = bias.data<T>();
+  epilogue.residual = residual ? residual->data<T>() : nullptr;
+  epilogue.activation = ToConvActivation(activation);
+  epilogue.alpha = fuse_alpha;
+  ConvForward<T>(dev_ctx,
+                 input,
+                 filter,
+                 strides,
+                 paddings,
+                 padding_algorithm,
+                 dilations,
+                 groups,
+                 data_format,
+                 "fused_conv2d_add_act",
+                 epilogue,
+                 output);
+  if (split_channels.empty() || output->numel() == 0) {
+    return;
+  }
+
+  // Channel slices of the output, [N, C, H * W] or [N * H * W, C].
+  const bool channel_last = data_format == "NHWC";
+  const auto dims = output->dims();
+  const int64_t channels = dims[channel_last ? 3 : 1];
+  const int64_t inner = channel_last ? 1 : dims[2] * dims[3];
+  const int64_t outer = output->numel() / (channels * inner);
+  const T* src = output->data<T>();
+  int64_t offset = 0;
+  for (size_t i = 0; i < outputs.size() && i < split_channels.size(); ++i) {
+    const int64_t c = split_channels[i];
+    if (outputs[i] != nullptr) {
+      T* dst = dev_ctx.template Alloc<T>(outputs[i]);
+      for (int64_t o = 0; o < outer; ++o) {
+        std::memcpy(dst + o * c * inner,
+                    src + (o * channels + offset) * inner,
+                    c * inner * sizeof(T));
+      }
+    }
+    offset += c;
+  }
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(conv2d,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(conv2d_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dGradKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(depthwise_conv2d,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DepthwiseConv2dKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(depthwise_conv2d_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DepthwiseConv2dGradKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(fused_conv2d_add_act,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::FusedConv2dAddActKernel,
+                    float,
+                    double) {}
@@ -12,9 +12,15 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <algorithm>
+#include <cmath>
+
 #include "kernels.h"  //NOLINT
+#include "kernels/funcs/softmax.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
@@ -42,24 +48,27 @@ void CrossEntropy(const T* prob,
   } else {
     for (int i = 0; i < batch_size; ++i) {
       for (int j = 0; j < num_remain; j++) {
-        int lbl = static_cast<int>(label[i * num_remain + j]);
+        const int64_t lbl = static_cast<int64_t>(label[i * num_remain + j]);
         if (lbl != ignore_index) {
           PD_CHECK(lbl >= 0,
-                   "label value should >= 0 when label "
-                   "value(%f) not equal to ignore_index(%f)",
+                   "label value should >= 0 when label value(",
                    lbl,
-                   ignore_index);
+                   ") not equal to ignore_index(",
+                   ignore_index,
+                   ").");
           PD_CHECK(lbl < axis_dim,
                    "label value should less than the shape of axis dimension "
-                   "when label value(%f) not equal to ignore_index(%f), But "
-                   "received label value as %ld and shape of axis dimension "
-                   "is %d",
+                   "when label value(",
                    lbl,
+                   ") not equal to ignore_index(",
                    ignore_index,
+                   "), But received label value as ",
                    lbl,
-                   axis_dim);
+                   " and shape of axis dimension is ",
+                   axis_dim,
+                   ".");
         }
-        int index = i * num_classes + lbl * num_remain + j;
+        int64_t index = i * num_classes + lbl * num_remain + j;
         int loss_idx = i * num_remain + j;
         out[loss_idx] = lbl == ignore_index
                             ? 0
@@ -69,6 +78,84 @@ void CrossEntropy(const T* prob,
   }
 }
 
+// Softmax and cross entropy of [n, axis_dim, remain] logits in one pass: the
+// loss of every row is computed from the row max and exp-sum reported by the
+// softmax engine, log(p_j) = max(x_j - max, -64) - log(sum), so the
+// probabilities are never re-read or passed through log().
+template <typename T, typename U>
+void FusedSoftmaxCrossEntropy(const T* logits,
+                              const U* label,
+                              bool soft_label,
+                              int ignore_index,
+                              int64_t n,
+                              int64_t axis_dim,
+                              int64_t remain,
+                              T* softmax,
+                              T* loss) {
+  const T clip = static_cast<T>(funcs::kSoftmaxClip);
+  if (soft_label) {
+    funcs::SoftmaxForward(
+        logits,
+        softmax,
+        n,
+        axis_dim,
+        remain,
+        [&](int64_t i, int64_t k, T max_val, T sum) {
+          const T log_sum = std::log(sum);
+          const T* x = logits + i * axis_dim * remain + k;
+          const U* y = label + i * axis_dim * remain + k;
+          T acc = 0;
+          for (int64_t j = 0; j < axis_dim; ++j) {
+            acc -= static_cast<T>(y[j * remain]) *
+                   (std::max(x[j * remain] - max_val, clip) - log_sum);
+          }
+          loss[i * remain + k] = acc;
+        });
+    return;
+  }
+
+  // Labels are validated up front, the fused pass below runs on the thread
+  // pool.
+  for (int64_t idx = 0; idx < n * remain; ++idx) {
+    const int64_t lbl = static_cast<int64_t>(label[idx]);
+    if (lbl != ignore_index) {
+      PD_CHECK(lbl >= 0,
+               "label value should >= 0 when label value(",
+               lbl,
+               ") not equal to ignore_index(",
+               ignore_index,
+               ").");
+      PD_CHECK(lbl < axis_dim,
+               "label value should less than the shape of axis dimension "
+               "when label value(",
+               lbl,
+               ") not equal to ignore_index(",
+               ignore_index,
+               "), But received label value as ",
+               lbl,
+               " and shape of axis dimension is ",
+               axis_dim,
+               ".");
+    }
+  }
+  funcs::SoftmaxForward(
+      logits,
+      softmax,
+      n,
+      axis_dim,
+      remain,
+      [&](int64_t i, int64_t k, T max_val, T sum) {
+        const int64_t idx = i * remain + k;
+        const int lbl = static_cast<int>(label[idx]);
+        if (lbl == ignore_index) {
+          loss[idx] = 0;
+          return;
+        }
+        const T x = logits[i * axis_dim * remain + lbl * remain + k];
+        loss[idx] = std::log(sum) - std::max(x - max_val, clip);
+      });
+}
+
 template <typename T>
 void CrossEntropyKernel(const phi::Context& dev_ctx,
                         const phi::DenseTensor& x,
@@ -84,16 +171,18 @@ void CrossEntropyKernel(const phi::Context& dev_ctx,
 
   PD_CHECK(axis_dim > 0,
            "The axis dimention should be larger than 0, but received "
-           "axis dimention is %d.",
-           axis_dim);
+           "axis dimention is ",
+           axis_dim,
+           ".");
 
   auto out_data = dev_ctx.template Alloc<T>(out);
 
   const int n = phi::funcs::SizeToAxis(axis_v, x.dims());
   PD_CHECK(n > 0,
            "The size of axis should be larger than 0, but received "
-           "SizeToAxis of softmax is %d.",
-           n);
+           "SizeToAxis of softmax is ",
+           n,
+           ".");
 
   const int d = phi::funcs::SizeFromAxis(axis_v, x.dims());
   if (soft_label) {
@@ -166,6 +255,11 @@ void CrossEntropyWithSoftmaxKernel(const phi::Context& dev_ctx,
                                    int axis,
                                    phi::DenseTensor* softmax,
                                    phi::DenseTensor* loss) {
+  custom_cpu::TraceScope trace("cross_entropy_with_softmax");
+  if (trace.active()) {
+    trace.set_cost(6 * logits.numel(),
+                   (2 * logits.numel() + loss->numel()) * sizeof(T));
+  }
   // do not with softmax op, and input is softmax
   if (!use_softmax) {
     auto softmax_data = dev_ctx.template Alloc<T>(softmax);
@@ -175,9 +269,84 @@ void CrossEntropyWithSoftmaxKernel(const phi::Context& dev_ctx,
     return;
   }
 
-  custom_kernel::SoftmaxKernel<T>(dev_ctx, logits, axis, softmax);
-  CrossEntropyKernel<T>(
-      dev_ctx, *softmax, label, soft_label, ignore_index, axis, loss);
+  auto logits_dims = logits.dims();
+  const int rank = logits_dims.size();
+  const int axis_v = phi::funcs::CanonicalAxis(axis, rank);
+  const int axis_dim = rank == 0 ? 1 : logits_dims[axis_v];
+  PD_CHECK(axis_dim > 0,
+           "The axis dimention should be larger than 0, but received "
+           "axis dimention is ",
+           axis_dim,
+           ".");
+  auto softmax_data = dev_ctx.template Alloc<T>(softmax);
+  auto loss_data = dev_ctx.template Alloc<T>(loss);
+  const int n = rank == 0 ? 1 : phi::funcs::SizeToAxis(axis_v, logits_dims);
+  const int d = rank == 0 ? 1 : phi::funcs::SizeFromAxis(axis_v, logits_dims);
+  const int remain = d / axis_dim;
+
+  if (soft_label) {
+    FusedSoftmaxCrossEntropy<T>(logits.data<T>(),
+                                label.data<T>(),
+                                soft_label,
+                                ignore_index,
+                                n,
+                                axis_dim,
+                                remain,
+                                softmax_data,
+                                loss_data);
+  } else if (label.dtype() == phi::DataType::INT32) {
+    FusedSoftmaxCrossEntropy<T>(logits.data<T>(),
+                                label.data<int32_t>(),
+                                soft_label,
+                                ignore_index,
+                                n,
+                                axis_dim,
+                                remain,
+                                softmax_data,
+                                loss_data);
+  } else if (label.dtype() == phi::DataType::INT64) {
+    FusedSoftmaxCrossEntropy<T>(logits.data<T>(),
+                                label.data<int64_t>(),
+                                soft_label,
+                                ignore_index,
+                                n,
+                                axis_dim,
+                                remain,
+                                softmax_data,
+                                loss_data);
+  } else if (label.dtype() == phi::DataType::INT16) {
+    FusedSoftmaxCrossEntropy<T>(logits.data<T>(),
+                                label.data<int16_t>(),
+                                soft_label,
+                                ignore_index,
+                                n,
+                                axis_dim,
+                                remain,
+                                softmax_data,
+                                loss_data);
+  } else if (label.dtype() == phi::DataType::INT8) {
+    FusedSoftmaxCrossEntropy<T>(logits.data<T>(),
+                                label.data<int8_t>(),
+                                soft_label,
+                                ignore_index,
+                                n,
+                                axis_dim,
+                                remain,
+                                softmax_data,
+                                loss_data);
+  } else if (label.dtype() == phi::DataType::UINT8) {
+    FusedSoftmaxCrossEntropy<T>(logits.data<T>(),
+                                label.data<uint8_t>(),
+                                soft_label,
+                                ignore_index,
+                                n,
+                                axis_dim,
+                                remain,
+                                softmax_data,
+                                loss_data);
+  } else {
+    PD_CHECK(false, "The dtype of label must be int.");
+  }
 }
 
 template <typename T, typename LabelT>
@@ -198,7 +367,7 @@ void CrossEntropyWithSoftmaxGradCPUKernel(const phi::Context& dev_ctx,
   auto logits_grad_data = logits_grad->data<T>();
   auto softmax_data = softmax.data<T>();
 
-  if (logit_grad != &softmax || !use_softmax) {
+  if (!use_softmax) {
     memcpy(logits_grad_data, softmax_data, softmax.numel() * sizeof(T));
   }
 
@@ -207,16 +376,21 @@ void CrossEntropyWithSoftmaxGradCPUKernel(const phi::Context& dev_ctx,
   int axis_dim = logit_grad->dims()[axis_v];
   PD_CHECK(axis_dim > 0,
            "The axis dimention should be larger than 0, but received "
-           "axis dimention is %d.",
-           axis_dim);
+           "axis dimention is ",
+           axis_dim,
+           ".");
 
   const int n = phi::funcs::SizeToAxis(axis_v, logit_grad->dims());
   PD_CHECK(n > 0,
            "The size of axis should be larger than 0, but received "
-           "SizeToAxis of logit_grad is %d.",
-           n);
+           "SizeToAxis of logit_grad is ",
+           n,
+           ".");
 
   const int d = phi::funcs::SizeFromAxis(axis_v, logit_grad->dims());
+  if (d == 0) {
+    return;
+  }
   int remain = d / axis_dim;
 
   auto out_grad_data = out_grad->data<T>();
@@ -266,68 +440,45 @@ void CrossEntropyWithSoftmaxGradCPUKernel(const phi::Context& dev_ctx,
     }
     return;
   }
-  // for use_softmax=False, continue
-
-  if (soft_label) {
-    // when soft_label = True, ignore_index is not supported
-    for (auto i = 0; i < n; ++i) {
-      for (auto j = 0; j < axis_dim; ++j) {
-        for (auto k = 0; k < remain; ++k) {
-          auto index = i * d + j * remain + k;
-          auto l_index = i * remain + k;
-          logit_grad_data[index] = out_grad_data[l_index] *
-                                   (logit_grad_data[index] - label_data[index]);
-        }
-      }
-    }
-
-    // for each sample, i is sample id
-    // 1) compute dy/dx by p_j - y_j or P-Y, where j is class id,
-    // P=logit_grad_mat[i] is all class's probs, Y=lbl_mat[i] is
-    // all class's label
-    // 2) compute dy * dy/dx by   Chain rule, dy=out_grad_mat[i]
-    // for high dims, e.g. (n,c) or (n,d1,...,dm, c), compute grad by matrix
-    // operation
-
-  } else {
-    for (auto i = 0; i < n; ++i) {
-      for (auto j = 0; j < axis_dim; ++j) {
-        for (auto k = 0; k < remain; ++k) {
-          auto index = i * d + j * remain + k;
-          auto l_index = i * remain + k;
+  // for use_softmax=True, continue
 
-          logit_grad_data[index] =
-              out_grad_data[l_index] * logit_grad_data[index];
-        }
-      }
-    }
-    for (int i = 0; i < n; ++i) {         // for each sample_1_dim
-      for (int j = 0; j < remain; j++) {  // for each sample_other_dims
-        int idx = i * remain + j;  // this sample's label_idx. for 1d case,
-                                   // remain=1 and j=0, so, idx = i
-        auto lbl = static_cast<int64_t>(label_data[idx]);
-        if (lbl == ignore_index) {
-          for (int k = 0; k < axis_dim; ++k) {  // for each class id's label
-            logit_grad_data[i * d + k * remain + j] = 0;
+  // dlogits = (softmax - label) * dloss, computed straight from softmax in a
+  // single pass per sample.
+  funcs::ParallelFor(
+      0, n, std::max(1, (1 << 14) / d), [&](int64_t begin, int64_t end) {
+        for (int64_t i = begin; i < end; ++i) {
+          const T* p = softmax_data + i * d;
+          const T* g = out_grad_data + i * remain;
+          T* dx = logit_grad_data + i * d;
+          if (soft_label) {
+            // when soft_label = True, ignore_index is not supported
+            const LabelT* y = label_data + i * d;
+            for (int j = 0; j < axis_dim; ++j) {
+              for (int k = 0; k < remain; ++k) {
+                dx[j * remain + k] =
+                    g[k] * (p[j * remain + k] - y[j * remain + k]);
+              }
+            }
+            continue;
+          }
+          for (int j = 0; j < axis_dim; ++j) {
+            for (int k = 0; k < remain; ++k) {
+              dx[j * remain + k] = g[k] * p[j * remain + k];
+            }
+          }
+          const LabelT* lbl_row = label_data + i * remain;
+          for (int k = 0; k < remain; ++k) {
+            auto lbl = static_cast<int64_t>(lbl_row[k]);
+            if (lbl == ignore_index) {
+              for (int j = 0; j < axis_dim; ++j) {
+                dx[j * remain + k] = 0;
+              }
+            } else {
+              dx[lbl * remain + k] -= g[k];
+            }
           }
-        } else {
-          // only for this sample's label_idx, the label is 1, others is 0,
-          // so, only compute this label_idx's class
-          // for 1d case, remain=1 and j=0, so, [i * d + label_data[idx] *
-          // remain + j] = [i * d + label_data[idx]]
-          // let idx_x = i * d + label_data[idx] * remain + j,
-          //   logit_grad_data[idx_x] = logit_grad_data[idx_x] -
-          //   out_grad_data[idx]
-          // note: logit_grad_mat = logit_grad_mat * out_grad_mat
-          // so: logit_grad_data[idx_x] =  (logit_grad_data[idx_x] - 1) *
-          // out_grad_data[idx]
-          // means:           dy/dp * dy=   ( p - y ) * dy
-
-          logit_grad_data[i * d + lbl * remain + j] -= out_grad_data[idx];
         }
-      }
-    }
-  }
+      });
 }
 
 template <typename T>
@@ -341,6 +492,11 @@ void CrossEntropyWithSoftmaxGradKernel(const phi::Context& dev_ctx,
                                        int ignore_index,
                                        int axis,
                                        phi::DenseTensor* logits_grad) {
+  custom_cpu::TraceScope trace("cross_entropy_with_softmax_grad");
+  if (trace.active()) {
+    trace.set_cost(2 * softmax.numel(),
+                   (2 * softmax.numel() + loss_grad.numel()) * sizeof(T));
+  }
   if (soft_label) {
     CrossEntropyWithSoftmaxGradCPUKernel<T, T>(dev_ctx,
                                                label,
@@ -0,0 +1,138 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/philox.h"
+#include "kernels/funcs/thread_pool.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+constexpr int64_t kDropoutGrain = 1 << 15;
+
+template <typename T>
+void ScaleCopy(const T *x, T *out, int64_t numel, T scale) {
+  funcs::ParallelFor(0, numel, kDropoutGrain, [&](int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; ++i) {
+      out[i] = x[i] * scale;
+    }
+  });
+}
+
+template <typename T>
+void DropoutRawKernel(const phi::Context &dev_ctx,
+                      const phi::DenseTensor &x,
+                      const paddle::optional<phi::DenseTensor> &seed_tensor,
+                      const phi::Scalar &p,
+                      bool is_test,
+                      const std::string &mode,
+                      int seed,
+                      bool fix_seed,
+                      phi::DenseTensor *out,
+                      phi::DenseTensor *mask) {
+  custom_cpu::TraceScope trace("dropout");
+  if (trace.active()) {
+    trace.set_cost(x.numel(), x.numel() * (2 * sizeof(T) + sizeof(uint8_t)));
+  }
+  const double dropout_prob = p.to<double>();
+  PD_CHECK(dropout_prob >= 0.0 && dropout_prob <= 1.0,
+           "dropout probability should be in [0, 1], but received ",
+           dropout_prob,
+           ".");
+  const bool upscale_in_train = mode == "upscale_in_train";
+  const T *x_data = x.data<T>();
+  T *out_data = dev_ctx.template Alloc<T>(out);
+  const int64_t numel = x.numel();
+
+  if (is_test) {
+    const T scale = static_cast<T>(upscale_in_train ? 1.0 : 1.0 - dropout_prob);
+    ScaleCopy(x_data, out_data, numel, scale);
+    return;
+  }
+
+  uint8_t *mask_data = dev_ctx.template Alloc<uint8_t>(mask);
+  int seed_data = fix_seed ? seed : 0;
+  if (seed_tensor) {
+    seed_data = *seed_tensor->data<int>();
+  }
+  // Nothing is kept for p == 1, avoid the infinite scale.
+  const T scale = static_cast<T>(upscale_in_train && dropout_prob < 1.0
+                                     ? 1.0 / (1.0 - dropout_prob)
+                                     : 1.0);
+  funcs::DropoutFill(GetPhiloxState(dev_ctx, seed_data),
+                     x_data,
+                     out_data,
+                     mask_data,
+                     numel,
+                     dropout_prob,
+                     scale);
+}
+
+template <typename T>
+void DropoutGradRawKernel(const phi::Context &dev_ctx,
+                          const phi::DenseTensor &mask,
+                          const phi::DenseTensor &out_grad,
+                          const phi::Scalar &p,
+                          bool is_test,
+                          const std::string &mode,
+                          phi::DenseTensor *x_grad) {
+  custom_cpu::TraceScope trace("dropout_grad");
+  if (trace.active()) {
+    trace.set_cost(out_grad.numel(),
+                   out_grad.numel() * (2 * sizeof(T) + sizeof(uint8_t)));
+  }
+  const double dropout_prob = p.to<double>();
+  const bool upscale_in_train = mode == "upscale_in_train";
+  const T *dout = out_grad.data<T>();
+  T *dx = dev_ctx.template Alloc<T>(x_grad);
+  const int64_t numel = out_grad.numel();
+
+  if (is_test) {
+    const T scale = static_cast<T>(upscale_in_train ? 1.0 : 1.0 - dropout_prob);
+    ScaleCopy(dout, dx, numel, scale);
+    return;
+  }
+
+  const uint8_t *mask_data = mask.data<uint8_t>();
+  const T scale = static_cast<T>(upscale_in_train && dropout_prob < 1.0
+                                     ? 1.0 / (1.0 - dropout_prob)
+                                     : 1.0);
+  funcs::ParallelFor(0, numel, kDropoutGrain, [&](int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; ++i) {
+      dx[i] = mask_data[i] ? dout[i] * scale : static_cast<T>(0);
+    }
+  });
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(dropout,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DropoutRawKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(dropout_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DropoutGradRawKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
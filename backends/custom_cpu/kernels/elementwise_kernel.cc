@@ -12,31 +12,53 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/broadcast.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
+// func computes in ComputeType<T>, 16-bit floats are only stored in their
+// own type.
+template <typename T, typename Functor>
+void ElementwiseCompute(const phi::Context& dev_ctx,
+                        const char* name,
+                        const phi::DenseTensor& x,
+                        const phi::DenseTensor& y,
+                        int axis,
+                        Functor func,
+                        phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace(name);
+  auto x_dims = x.dims();
+  auto y_dims = y.dims();
+  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
+  auto out_data = dev_ctx.template Alloc<T>(out);
+  if (trace.active()) {
+    trace.set_cost(out->numel(),
+                   (x.numel() + y.numel() + out->numel()) * sizeof(T));
+  }
+  funcs::BroadcastBinary(
+      dst_dims, x_dims, x.data<T>(), y_dims, y.data<T>(), axis, out_data, func);
+}
+
 template <typename T>
 void MultiplyRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] * y_data[i];
-  }
+  using MT = typename funcs::ComputeType<T>::type;
+  ElementwiseCompute<T>(
+      dev_ctx,
+      "multiply",
+      x,
+      y,
+      axis,
+      [](MT a, MT b) -> MT { return a * b; },
+      out);
 }
 
 template <typename T>
@@ -54,21 +76,9 @@ void AddRawKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& y,
                   int axis,
                   phi::DenseTensor* out) {
-  dev_ctx.template Alloc<T>(out);
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] + y_data[i];
-  }
+  using MT = typename funcs::ComputeType<T>::type;
+  ElementwiseCompute<T>(
+      dev_ctx, "add", x, y, axis, [](MT a, MT b) -> MT { return a + b; }, out);
 }
 
 template <typename T>
@@ -86,21 +96,15 @@ void MaxRawKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& y,
                   int axis,
                   phi::DenseTensor* out) {
-  dev_ctx.template Alloc<T>(out);
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = std::max(x_data[i], y_data[i]);
-  }
+  using MT = typename funcs::ComputeType<T>::type;
+  ElementwiseCompute<T>(
+      dev_ctx,
+      "maximum",
+      x,
+      y,
+      axis,
+      [](MT a, MT b) -> MT { return std::max(a, b); },
+      out);
 }
 
 template <typename T>
@@ -121,7 +125,9 @@ PD_BUILD_PHI_KERNEL(multiply_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(multiply,
                     custom_cpu,
@@ -130,7 +136,9 @@ PD_BUILD_PHI_KERNEL(multiply,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(add_raw,
                     custom_cpu,
@@ -139,7 +147,9 @@ PD_BUILD_PHI_KERNEL(add_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(add,
                     custom_cpu,
@@ -148,7 +158,9 @@ PD_BUILD_PHI_KERNEL(add,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(maximum_raw,
                     custom_cpu,
@@ -157,7 +169,9 @@ PD_BUILD_PHI_KERNEL(maximum_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(maximum,
                     custom_cpu,
@@ -166,4 +180,6 @@ PD_BUILD_PHI_KERNEL(maximum,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,105 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/gather.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+template <typename T>
+void EmbeddingKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& inputx,
+                     const phi::DenseTensor& weight,
+                     int64_t padding_idx,
+                     phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("embedding");
+  if (trace.active()) {
+    trace.set_cost(0, 2 * out->numel() * sizeof(T));
+  }
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  if (out->numel() == 0) {
+    return;
+  }
+  const auto dims = weight.dims();
+  const int64_t vocab = dims[0];
+  const int64_t width = dims[1];
+  VisitIndex(inputx, [&](const auto* ids) {
+    CheckIndexRange(ids, inputx.numel(), vocab, "embedding", padding_idx);
+    funcs::GatherRows(weight.data<T>(),
+                      1,
+                      vocab,
+                      width,
+                      ids,
+                      inputx.numel(),
+                      out_data,
+                      padding_idx);
+  });
+}
+
+// The sparse (SelectedRows) weight gradient is not reachable through the
+// C API, so weight_grad is dense. Only its zero fill touches the whole
+// table; the accumulation sorts the ids and reduces each distinct row once,
+// so it scales with the number of looked up tokens.
+template <typename T>
+void EmbeddingGradKernel(const phi::Context& dev_ctx,
+                         const phi::DenseTensor& input,
+                         const phi::DenseTensor& weight,
+                         const phi::DenseTensor& out_grad,
+                         int64_t padding_idx,
+                         phi::DenseTensor* weight_grad) {
+  custom_cpu::TraceScope trace("embedding_grad");
+  if (trace.active()) {
+    trace.set_cost(out_grad.numel(),
+                   (weight_grad->numel() + 2 * out_grad.numel()) * sizeof(T));
+  }
+  T* dw = dev_ctx.template Alloc<T>(weight_grad);
+  funcs::ParallelFill(dw, weight_grad->numel(), T(0));
+  if (out_grad.numel() == 0) {
+    return;
+  }
+  const auto dims = weight.dims();
+  const int64_t vocab = dims[0];
+  const int64_t width = dims[1];
+  VisitIndex(input, [&](const auto* ids) {
+    CheckIndexRange(ids, input.numel(), vocab, "embedding_grad", padding_idx);
+    funcs::ScatterRows(ids,
+                       input.numel(),
+                       out_grad.data<T>(),
+                       1,
+                       vocab,
+                       width,
+                       funcs::ScatterMode::kAdd,
+                       dw,
+                       padding_idx);
+  });
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(embedding,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::EmbeddingKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(embedding_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::EmbeddingGradKernel,
+                    float,
+                    double) {}
@@ -12,7 +12,9 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/thread_pool.h"
 #include "kernels/phi_funcs.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
@@ -26,10 +28,7 @@ void FillKernel(const phi::Context& dev_ctx,
            "fill value should not be NaN, but received NaN");
 
   auto t = dev_ctx.template Alloc<T>(out);
-  T val = value.to<T>();
-  for (auto i = 0; i < out->numel(); ++i) {
-    t[i] = val;
-  }
+  funcs::ParallelFill(t, out->numel(), value.to<T>());
 }
 
 }  // namespace custom_kernel
@@ -12,6 +12,8 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/thread_pool.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
@@ -21,9 +23,7 @@ void FullValue(const phi::Context& dev_ctx,
                phi::DenseTensor* tensor,
                VType val) {
   auto t = dev_ctx.template Alloc<T>(tensor);
-  for (auto i = 0; i < tensor->numel(); ++i) {
-    t[i] = val;
-  }
+  funcs::ParallelFill(t, tensor->numel(), static_cast<T>(val));
 }
 
 template <typename T>
@@ -0,0 +1,271 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstdlib>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/cast.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Iteration space of a binary elementwise op. Broadcast dims get a zero
+// stride instead of being materialized, size-1 output dims are dropped and
+// adjacent dims that are contiguous for every operand are merged, so e.g.
+// [B, S, H] + [H] becomes a 2-D [B * S, H] loop with y strides {0, 1}.
+struct BroadcastIndexer {
+  std::vector<int64_t> dims;
+  std::vector<int64_t> x_strides;
+  std::vector<int64_t> y_strides;
+
+  int64_t numel() const {
+    int64_t n = 1;
+    for (auto d : dims) n *= d;
+    return n;
+  }
+};
+
+namespace detail {
+
+// Right-aligns `in_dims` into a rank `rank` shape following the paddle `axis`
+// convention: the operand starts at dim `axis` of the output, -1 means it is
+// aligned to the trailing dims.
+inline std::vector<int64_t> AlignBroadcastDims(
+    const std::vector<int64_t>& in_dims, size_t rank, int axis) {
+  if (in_dims.size() == rank) {
+    return in_dims;
+  }
+  int offset = axis == -1 ? static_cast<int>(rank - in_dims.size()) : axis;
+  std::vector<int64_t> aligned(rank, 1);
+  for (size_t i = 0; i < in_dims.size(); ++i) {
+    aligned[offset + i] = in_dims[i];
+  }
+  return aligned;
+}
+
+inline std::vector<int64_t> BroadcastStrides(
+    const std::vector<int64_t>& aligned_dims,
+    const std::vector<int64_t>& out_dims) {
+  std::vector<int64_t> strides(aligned_dims.size(), 0);
+  int64_t stride = 1;
+  for (int i = static_cast<int>(aligned_dims.size()) - 1; i >= 0; --i) {
+    strides[i] = (aligned_dims[i] == 1 && out_dims[i] != 1) ? 0 : stride;
+    stride *= aligned_dims[i];
+  }
+  return strides;
+}
+
+}  // namespace detail
+
+inline BroadcastIndexer MakeBroadcastIndexer(
+    const std::vector<int64_t>& out_dims,
+    const std::vector<int64_t>& x_dims,
+    const std::vector<int64_t>& y_dims,
+    int axis = -1) {
+  const size_t rank = out_dims.size();
+  auto x_aligned = detail::AlignBroadcastDims(x_dims, rank, axis);
+  auto y_aligned = detail::AlignBroadcastDims(y_dims, rank, axis);
+  auto x_strides = detail::BroadcastStrides(x_aligned, out_dims);
+  auto y_strides = detail::BroadcastStrides(y_aligned, out_dims);
+
+  BroadcastIndexer indexer;
+  for (size_t i = 0; i < rank; ++i) {
+    if (out_dims[i] == 1) {
+      continue;
+    }
+    if (!indexer.dims.empty()) {
+      // Merge into the previous dim when both operands step through the pair
+      // as one contiguous (or fully broadcast) run.
+      int64_t& prev_x = indexer.x_strides.back();
+      int64_t& prev_y = indexer.y_strides.back();
+      if (prev_x == x_strides[i] * out_dims[i] &&
+          prev_y == y_strides[i] * out_dims[i]) {
+        indexer.dims.back() *= out_dims[i];
+        prev_x = x_strides[i];
+        prev_y = y_strides[i];
+        continue;
+      }
+    }
+    indexer.dims.push_back(out_dims[i]);
+    indexer.x_strides.push_back(x_strides[i]);
+    indexer.y_strides.push_back(y_strides[i]);
+  }
+  if (indexer.dims.empty()) {
+    indexer.dims.push_back(1);
+    indexer.x_strides.push_back(0);
+    indexer.y_strides.push_back(0);
+  }
+  return indexer;
+}
+
+namespace detail {
+
+// Innermost loop, specialized for the stride patterns that actually occur so
+// the compiler can vectorize the common cases.
+template <typename InT, typename OutT, typename Functor>
+inline void BroadcastInnerLoop(const InT* x,
+                               int64_t sx,
+                               const InT* y,
+                               int64_t sy,
+                               OutT* out,
+                               int64_t n,
+                               Functor func,
+                               std::true_type /* computes in InT */) {
+  if (sx == 1 && sy == 1) {
+    for (int64_t i = 0; i < n; ++i) out[i] = func(x[i], y[i]);
+  } else if (sx == 1 && sy == 0) {
+    const InT y0 = *y;
+    for (int64_t i = 0; i < n; ++i) out[i] = func(x[i], y0);
+  } else if (sx == 0 && sy == 1) {
+    const InT x0 = *x;
+    for (int64_t i = 0; i < n; ++i) out[i] = func(x0, y[i]);
+  } else {
+    for (int64_t i = 0; i < n; ++i) out[i] = func(x[i * sx], y[i * sy]);
+  }
+}
+
+// Converts the n elements of x with stride sx into a contiguous tile, only
+// the first one when x is broadcast.
+template <typename InT, typename MT>
+inline void LoadBroadcastTile(const InT* x, int64_t sx, MT* tile, int64_t n) {
+  if (sx == 0) {
+    tile[0] = CastValue<MT>(*x);
+  } else if (sx == 1) {
+    CastTile(x, tile, n);
+  } else {
+    for (int64_t i = 0; i < n; ++i) tile[i] = CastValue<MT>(x[i * sx]);
+  }
+}
+
+// 16-bit floats are converted to float a tile at a time, so that the
+// conversions and func each run as their own vectorizable loop.
+template <typename InT, typename OutT, typename Functor>
+inline void BroadcastInnerLoop(const InT* x,
+                               int64_t sx,
+                               const InT* y,
+                               int64_t sy,
+                               OutT* out,
+                               int64_t n,
+                               Functor func,
+                               std::false_type /* computes in InT */) {
+  using MT = typename ComputeType<InT>::type;
+  using ResultT = decltype(func(MT(), MT()));
+  constexpr int64_t kTile = 512;
+  MT x_tile[kTile];
+  MT y_tile[kTile];
+  ResultT out_tile[kTile];
+  for (int64_t b = 0; b < n; b += kTile) {
+    const int64_t len = std::min(kTile, n - b);
+    LoadBroadcastTile(x + b * sx, sx, x_tile, len);
+    LoadBroadcastTile(y + b * sy, sy, y_tile, len);
+    BroadcastInnerLoop(x_tile,
+                       std::min<int64_t>(sx, 1),
+                       y_tile,
+                       std::min<int64_t>(sy, 1),
+                       out_tile,
+                       len,
+                       func,
+                       std::true_type());
+    CastTile(out_tile, out + b, len);
+  }
+}
+
+}  // namespace detail
+
+// out[i] = func(x[bx(i)], y[by(i)]) over the broadcast of x and y, without
+// allocating broadcast copies of either operand. The output is contiguous
+// with `out_dims`. func takes ComputeType<InT> values, its result is
+// converted to OutT. Outer rows are split across the thread pool and walked
+// with incremental offsets; only the first row of a chunk does a div/mod
+// decomposition.
+template <typename InT, typename OutT, typename Functor>
+void BroadcastBinary(const std::vector<int64_t>& out_dims,
+                     const std::vector<int64_t>& x_dims,
+                     const InT* x,
+                     const std::vector<int64_t>& y_dims,
+                     const InT* y,
+                     int axis,
+                     OutT* out,
+                     Functor func) {
+  const BroadcastIndexer indexer =
+      MakeBroadcastIndexer(out_dims, x_dims, y_dims, axis);
+  const int64_t numel = indexer.numel();
+  if (numel == 0) {
+    return;
+  }
+  const int rank = static_cast<int>(indexer.dims.size());
+  const int64_t inner = indexer.dims.back();
+  const int64_t sx_inner = indexer.x_strides.back();
+  const int64_t sy_inner = indexer.y_strides.back();
+  constexpr int64_t kMinElementsPerTask = 1 << 15;
+  const std::is_same<InT, typename ComputeType<InT>::type> computes_in_t;
+
+  if (rank == 1) {
+    ParallelFor(0, inner, kMinElementsPerTask, [&](int64_t b, int64_t e) {
+      detail::BroadcastInnerLoop(x + b * sx_inner,
+                                 sx_inner,
+                                 y + b * sy_inner,
+                                 sy_inner,
+                                 out + b,
+                                 e - b,
+                                 func,
+                                 computes_in_t);
+    });
+    return;
+  }
+
+  const int64_t rows = numel / inner;
+  const int64_t grain = std::max<int64_t>(1, kMinElementsPerTask / inner);
+  ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    std::vector<int64_t> index(rank - 1, 0);
+    int64_t x_off = 0;
+    int64_t y_off = 0;
+    int64_t rem = begin;
+    for (int d = rank - 2; d >= 0; --d) {
+      index[d] = rem % indexer.dims[d];
+      rem /= indexer.dims[d];
+      x_off += index[d] * indexer.x_strides[d];
+      y_off += index[d] * indexer.y_strides[d];
+    }
+    for (int64_t row = begin; row < end; ++row) {
+      detail::BroadcastInnerLoop(x + x_off,
+                                 sx_inner,
+                                 y + y_off,
+                                 sy_inner,
+                                 out + row * inner,
+                                 inner,
+                                 func,
+                                 computes_in_t);
+      for (int d = rank - 2; d >= 0; --d) {
+        x_off += indexer.x_strides[d];
+        y_off += indexer.y_strides[d];
+        if (++index[d] < indexer.dims[d]) {
+          break;
+        }
+        x_off -= indexer.x_strides[d] * indexer.dims[d];
+        y_off -= indexer.y_strides[d] * indexer.dims[d];
+        index[d] = 0;
+      }
+    }
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
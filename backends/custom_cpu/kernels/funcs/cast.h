@@ -0,0 +1,518 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <limits>
+#include <type_traits>
+#include <vector>
+
+#if defined(__x86_64__) && (defined(__GNUC__) || defined(__clang__))
+#include <immintrin.h>
+#define CUSTOM_CPU_F16C_DISPATCH
+#endif
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Element types known to the cast engine. float16 and bfloat16 are handled
+// as their 16-bit patterns, so this header does not depend on paddle.
+enum class CastType {
+  kBool = 0,
+  kInt8,
+  kUint8,
+  kInt16,
+  kInt32,
+  kInt64,
+  kFloat16,
+  kBFloat16,
+  kFloat32,
+  kFloat64,
+};
+
+constexpr int kNumCastTypes = 10;
+
+// Maps a C++ type to its CastType. The paddle float16 and bfloat16 types are
+// registered in kernels.h.
+template <typename T>
+struct CastTypeOf;
+
+#define CUSTOM_CPU_CAST_TYPE_OF(cpp_type, cast_type) \
+  template <>                                        \
+  struct CastTypeOf<cpp_type> {                      \
+    static constexpr CastType value = cast_type;     \
+  }
+
+CUSTOM_CPU_CAST_TYPE_OF(bool, CastType::kBool);
+CUSTOM_CPU_CAST_TYPE_OF(int8_t, CastType::kInt8);
+CUSTOM_CPU_CAST_TYPE_OF(uint8_t, CastType::kUint8);
+CUSTOM_CPU_CAST_TYPE_OF(int16_t, CastType::kInt16);
+CUSTOM_CPU_CAST_TYPE_OF(int32_t, CastType::kInt32);
+CUSTOM_CPU_CAST_TYPE_OF(int64_t, CastType::kInt64);
+CUSTOM_CPU_CAST_TYPE_OF(float, CastType::kFloat32);
+CUSTOM_CPU_CAST_TYPE_OF(double, CastType::kFloat64);
+
+// Bit-level conversions between float and the 16-bit floating point formats,
+// all of them round to nearest even. They are branch free so that loops over
+// them vectorize.
+
+inline uint32_t FloatBits(float f) {
+  uint32_t bits;
+  std::memcpy(&bits, &f, sizeof(bits));
+  return bits;
+}
+
+inline float FloatFromBits(uint32_t bits) {
+  float f;
+  std::memcpy(&f, &bits, sizeof(f));
+  return f;
+}
+
+// Branch-free a : b, written with masks because the vectorizer does not
+// if-convert every select.
+inline uint32_t SelectBits(bool cond, uint32_t a, uint32_t b) {
+  const uint32_t mask = 0u - static_cast<uint32_t>(cond);
+  return (a & mask) | (b & ~mask);
+}
+
+inline float BFloat16BitsToFloat(uint16_t h) {
+  return FloatFromBits(static_cast<uint32_t>(h) << 16);
+}
+
+inline uint16_t FloatToBFloat16Bits(float f) {
+  const uint32_t bits = FloatBits(f);
+  const uint32_t rounded = (bits + 0x7fffu + ((bits >> 16) & 1u)) >> 16;
+  // Rounding must not turn a NaN into an infinity, keep it quiet instead.
+  const uint32_t nan = (bits >> 16) | 0x40u;
+  return static_cast<uint16_t>((bits & 0x7fffffffu) > 0x7f800000u ? nan
+                                                                  : rounded);
+}
+
+// float16 <-> float after M. Dukhan's FP16 library: the exponent is rebiased
+// with float arithmetic, which also handles subnormals, infinities and NaN.
+inline float Float16BitsToFloat(uint16_t h) {
+  const uint32_t w = static_cast<uint32_t>(h) << 16;
+  const uint32_t sign = w & 0x80000000u;
+  const uint32_t two_w = w + w;
+  // 2^-112
+  const float exp_scale = FloatFromBits(0x07800000u);
+  const float normalized =
+      FloatFromBits((two_w >> 4) + (0xE0u << 23)) * exp_scale;
+  const float denormalized = FloatFromBits((two_w >> 17) | (126u << 23)) - 0.5f;
+  const uint32_t magnitude = SelectBits(
+      two_w < (1u << 27), FloatBits(denormalized), FloatBits(normalized));
+  return FloatFromBits(sign | magnitude);
+}
+
+inline uint16_t FloatToFloat16Bits(float f) {
+  // 2^112 and 2^-110
+  const float scale_to_inf = FloatFromBits(0x77800000u);
+  const float scale_to_zero = FloatFromBits(0x08800000u);
+  float base = (std::abs(f) * scale_to_inf) * scale_to_zero;
+  const uint32_t w = FloatBits(f);
+  const uint32_t shl1_w = w + w;
+  const uint32_t sign = w & 0x80000000u;
+  uint32_t bias = shl1_w & 0xFF000000u;
+  bias = SelectBits(bias < 0x71000000u, 0x71000000u, bias);
+  base = FloatFromBits((bias >> 1) + 0x07800000u) + base;
+  const uint32_t bits = FloatBits(base);
+  const uint32_t nonsign = ((bits >> 13) & 0x7C00u) + (bits & 0x0FFFu);
+  return static_cast<uint16_t>(
+      (sign >> 16) | SelectBits(shl1_w > 0xFF000000u, 0x7E00u, nonsign));
+}
+
+namespace detail {
+
+// Elements converted by one task.
+constexpr int64_t kCastGrain = 1 << 15;
+
+// Tags of the 16-bit floating point formats.
+struct Float16Tag {};
+struct BFloat16Tag {};
+
+template <CastType type>
+struct CastRepr;
+
+template <>
+struct CastRepr<CastType::kBool> {
+  using type = bool;
+};
+template <>
+struct CastRepr<CastType::kInt8> {
+  using type = int8_t;
+};
+template <>
+struct CastRepr<CastType::kUint8> {
+  using type = uint8_t;
+};
+template <>
+struct CastRepr<CastType::kInt16> {
+  using type = int16_t;
+};
+template <>
+struct CastRepr<CastType::kInt32> {
+  using type = int32_t;
+};
+template <>
+struct CastRepr<CastType::kInt64> {
+  using type = int64_t;
+};
+template <>
+struct CastRepr<CastType::kFloat16> {
+  using type = Float16Tag;
+};
+template <>
+struct CastRepr<CastType::kBFloat16> {
+  using type = BFloat16Tag;
+};
+template <>
+struct CastRepr<CastType::kFloat32> {
+  using type = float;
+};
+template <>
+struct CastRepr<CastType::kFloat64> {
+  using type = double;
+};
+
+// Converts between builtin types. Floating point to integer conversions
+// saturate and map NaN to 0 instead of being undefined out of range, any
+// nonzero value converts to true.
+template <typename D, typename S>
+inline D ConvertValue(S v, std::false_type /* float_to_int */) {
+  return static_cast<D>(v);
+}
+
+template <typename D, typename S>
+inline D ConvertValue(S v, std::true_type /* float_to_int */) {
+  const S lo = static_cast<S>(std::numeric_limits<D>::lowest());
+  const S hi = static_cast<S>(std::numeric_limits<D>::max());
+  // The upper bound may round up to 2^bits, which is out of range.
+  return v != v    ? D(0)
+         : v <= lo ? std::numeric_limits<D>::lowest()
+         : v >= hi ? std::numeric_limits<D>::max()
+                   : static_cast<D>(v);
+}
+
+template <typename D, typename S>
+inline D ConvertValue(S v) {
+  return ConvertValue<D>(
+      v,
+      std::integral_constant < bool,
+      std::is_floating_point<S>::value&& std::is_integral<D>::value &&
+          !std::is_same<D, bool>::value > ());
+}
+
+// Load turns a stored element into a builtin value, Store converts a builtin
+// value into a stored element.
+template <typename R>
+struct CastIO {
+  using storage = R;
+  static R Load(R v) { return v; }
+  template <typename V>
+  static R Store(V v) {
+    return ConvertValue<R>(v);
+  }
+};
+
+template <>
+struct CastIO<Float16Tag> {
+  using storage = uint16_t;
+  static float Load(uint16_t v) { return Float16BitsToFloat(v); }
+  template <typename V>
+  static uint16_t Store(V v) {
+    return FloatToFloat16Bits(static_cast<float>(v));
+  }
+};
+
+template <>
+struct CastIO<BFloat16Tag> {
+  using storage = uint16_t;
+  static float Load(uint16_t v) { return BFloat16BitsToFloat(v); }
+  template <typename V>
+  static uint16_t Store(V v) {
+    return FloatToBFloat16Bits(static_cast<float>(v));
+  }
+};
+
+using CastFn = void (*)(const void*, void*, int64_t);
+
+template <typename S, typename D>
+struct CastRange {
+  static void Run(const void* x, void* y, int64_t n) {
+    using In = CastIO<S>;
+    using Out = CastIO<D>;
+    const auto* in = static_cast<const typename In::storage*>(x);
+    auto* out = static_cast<typename Out::storage*>(y);
+    for (int64_t i = 0; i < n; ++i) {
+      out[i] = Out::Store(In::Load(in[i]));
+    }
+  }
+};
+
+template <typename T>
+struct CastRange<T, T> {
+  static void Run(const void* x, void* y, int64_t n) {
+    std::memcpy(y, x, n * sizeof(typename CastIO<T>::storage));
+  }
+};
+
+#if defined(CUSTOM_CPU_F16C_DISPATCH)
+// The F16C conversions are compiled for their own target and chosen at run
+// time, so they are used even when the build does not enable F16C.
+inline bool CpuHasF16C() {
+#if defined(__F16C__)
+  return true;
+#else
+  static const bool has =
+      __builtin_cpu_supports("avx") && __builtin_cpu_supports("f16c");
+  return has;
+#endif
+}
+
+// n must be a multiple of 8.
+__attribute__((target("avx,f16c"))) inline void FloatToFloat16F16C(
+    const float* in, uint16_t* out, int64_t n) {
+  for (int64_t i = 0; i < n; i += 8) {
+    const __m128i h =
+        _mm256_cvtps_ph(_mm256_loadu_ps(in + i), _MM_FROUND_TO_NEAREST_INT);
+    _mm_storeu_si128(reinterpret_cast<__m128i*>(out + i), h);
+  }
+}
+
+__attribute__((target("avx,f16c"))) inline void Float16ToFloatF16C(
+    const uint16_t* in, float* out, int64_t n) {
+  for (int64_t i = 0; i < n; i += 8) {
+    const __m128i h = _mm_loadu_si128(reinterpret_cast<const __m128i*>(in + i));
+    _mm256_storeu_ps(out + i, _mm256_cvtph_ps(h));
+  }
+}
+
+template <>
+struct CastRange<float, Float16Tag> {
+  static void Run(const void* x, void* y, int64_t n) {
+    const float* in = static_cast<const float*>(x);
+    uint16_t* out = static_cast<uint16_t*>(y);
+    int64_t i = 0;
+    if (CpuHasF16C()) {
+      i = n - n % 8;
+      FloatToFloat16F16C(in, out, i);
+    }
+    for (; i < n; ++i) {
+      out[i] = FloatToFloat16Bits(in[i]);
+    }
+  }
+};
+
+template <>
+struct CastRange<Float16Tag, float> {
+  static void Run(const void* x, void* y, int64_t n) {
+    const uint16_t* in = static_cast<const uint16_t*>(x);
+    float* out = static_cast<float*>(y);
+    int64_t i = 0;
+    if (CpuHasF16C()) {
+      i = n - n % 8;
+      Float16ToFloatF16C(in, out, i);
+    }
+    for (; i < n; ++i) {
+      out[i] = Float16BitsToFloat(in[i]);
+    }
+  }
+};
+#endif
+
+// table[src][dst] converts a contiguous range from src to dst.
+template <CastType... types>
+struct CastTable {
+  CastFn table[kNumCastTypes][kNumCastTypes];
+
+  CastTable() {
+    int row = 0;
+    int unused[] = {(FillRow<types>(table[row++]), 0)...};
+    (void)unused;
+  }
+
+  template <CastType src>
+  static void FillRow(CastFn* row) {
+    const CastFn fns[] = {&CastRange<typename CastRepr<src>::type,
+                                     typename CastRepr<types>::type>::Run...};
+    std::copy(fns, fns + sizeof...(types), row);
+  }
+};
+
+inline CastFn GetCastFn(CastType src, CastType dst) {
+  static const CastTable<CastType::kBool,
+                         CastType::kInt8,
+                         CastType::kUint8,
+                         CastType::kInt16,
+                         CastType::kInt32,
+                         CastType::kInt64,
+                         CastType::kFloat16,
+                         CastType::kBFloat16,
+                         CastType::kFloat32,
+                         CastType::kFloat64>
+      cast_table;
+  return cast_table.table[static_cast<int>(src)][static_cast<int>(dst)];
+}
+
+}  // namespace detail
+
+inline int64_t CastTypeSize(CastType type) {
+  static const int64_t sizes[kNumCastTypes] = {
+      sizeof(bool), 1, 1, 2, 4, 8, 2, 2, 4, 8};
+  return sizes[static_cast<int>(type)];
+}
+
+// y[i] = x[i] converted from x_type to y_type, for n elements.
+inline void Cast(
+    const void* x, CastType x_type, void* y, CastType y_type, int64_t n) {
+  const detail::CastFn fn = detail::GetCastFn(x_type, y_type);
+  const int64_t x_size = CastTypeSize(x_type);
+  const int64_t y_size = CastTypeSize(y_type);
+  ParallelFor(0, n, detail::kCastGrain, [&](int64_t begin, int64_t end) {
+    fn(static_cast<const char*>(x) + begin * x_size,
+       static_cast<char*>(y) + begin * y_size,
+       end - begin);
+  });
+}
+
+template <typename S, typename D>
+void Cast(const S* x, D* y, int64_t n) {
+  Cast(x, CastTypeOf<S>::value, y, CastTypeOf<D>::value, n);
+}
+
+// Converts a single value with the same rounding as Cast, for kernels that
+// fuse the conversion into their own loops.
+template <typename D, typename S>
+inline D CastValue(S v) {
+  using In =
+      detail::CastIO<typename detail::CastRepr<CastTypeOf<S>::value>::type>;
+  using Out =
+      detail::CastIO<typename detail::CastRepr<CastTypeOf<D>::value>::type>;
+  typename In::storage in;
+  std::memcpy(&in, &v, sizeof(in));
+  const typename Out::storage out = Out::Store(In::Load(in));
+  D result;
+  std::memcpy(&result, &out, sizeof(result));
+  return result;
+}
+
+// Converts n contiguous elements on the calling thread, for kernels that
+// convert small tiles inside their own parallel loops.
+template <typename S, typename D>
+inline void CastTile(const S* x, D* y, int64_t n) {
+  detail::CastRange<
+      typename detail::CastRepr<CastTypeOf<S>::value>::type,
+      typename detail::CastRepr<CastTypeOf<D>::value>::type>::Run(x, y, n);
+}
+
+// Type arithmetic on T runs in. Builtin types compute in themselves, the
+// 16-bit floating point formats are only stored and compute in float.
+template <typename T>
+struct ComputeType {
+  // NOTE: paddle specializes std::is_floating_point for its 16-bit float
+  // types, so test for the built-in types explicitly.
+  using type = typename std::conditional<std::is_same<T, float>::value ||
+                                             std::is_same<T, double>::value ||
+                                             std::is_integral<T>::value,
+                                         T,
+                                         float>::type;
+};
+
+namespace detail {
+
+template <typename T, typename Fn>
+void RowsInComputeType(const std::vector<const T*>& x,
+                       T* y,
+                       int64_t rows,
+                       int64_t row_size,
+                       const Fn& fn,
+                       std::true_type /* computes in T */) {
+  fn(x, y, rows);
+}
+
+template <typename T, typename Fn>
+void RowsInComputeType(const std::vector<const T*>& x,
+                       T* y,
+                       int64_t rows,
+                       int64_t row_size,
+                       const Fn& fn,
+                       std::false_type /* computes in T */) {
+  using MT = typename ComputeType<T>::type;
+  const int64_t block_rows =
+      std::max<int64_t>(1, kCastGrain / std::max<int64_t>(row_size, 1));
+  ParallelFor(0, rows, block_rows, [&](int64_t begin, int64_t end) {
+    static thread_local std::vector<MT> buffer;
+    const int64_t block = std::min(block_rows, end - begin) * row_size;
+    buffer.resize(block * (x.size() + 1));
+    std::vector<const MT*> in(x.size());
+    MT* out = buffer.data() + block * x.size();
+    for (int64_t r = begin; r < end; r += block_rows) {
+      const int64_t n = std::min(block_rows, end - r);
+      for (size_t i = 0; i < x.size(); ++i) {
+        MT* dst = buffer.data() + block * i;
+        CastTile(x[i] + r * row_size, dst, n * row_size);
+        in[i] = dst;
+      }
+      fn(in, out, n);
+      CastTile(out, y + r * row_size, n * row_size);
+    }
+  });
+}
+
+}  // namespace detail
+
+// Runs fn(inputs, output, rows) on the [rows, row_size] views of tensors
+// stored as T with pointers to ComputeType<T> data, for kernels whose math
+// only exists for float and double. Types that compute in themselves are
+// passed through. 16-bit floats are converted to float a group of rows at a
+// time into per-thread buffers that stay in cache, so memory only sees the
+// 16-bit data. Groups run in parallel, fn itself runs serially then.
+template <typename T, typename Fn>
+void RowsInComputeType(const std::vector<const T*>& x,
+                       T* y,
+                       int64_t rows,
+                       int64_t row_size,
+                       const Fn& fn) {
+  detail::RowsInComputeType(x,
+                            y,
+                            rows,
+                            row_size,
+                            fn,
+                            std::is_same<T, typename ComputeType<T>::type>());
+}
+
+// Symmetric int8 quantization, y[i] = saturate(round(x[i] * scale)) with
+// ties to even. NaN quantizes to 0.
+inline void QuantizeInt8(const float* x, int8_t* y, int64_t n, float scale) {
+  ParallelFor(0, n, detail::kCastGrain, [&](int64_t begin, int64_t end) {
+    // Adding and subtracting 1.5 * 2^23 rounds floats of magnitude below 2^22
+    // to an integer with the current (nearest even) rounding mode.
+    const float magic = 12582912.0f;
+    for (int64_t i = begin; i < end; ++i) {
+      float v = x[i] * scale;
+      v = v != v ? 0.0f : v;
+      v = std::min(std::max(v, -128.0f), 127.0f);
+      y[i] = static_cast<int8_t>((v + magic) - magic);
+    }
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
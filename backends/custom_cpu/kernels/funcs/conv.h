@@ -0,0 +1,651 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/gemm.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Geometry of an NCHW 2D convolution with an OIHW filter of shape
+// [out_c, in_c / groups, kernel_h, kernel_w]. Bottom and right paddings are
+// implied by the output size.
+struct Conv2DShape {
+  int64_t batch;
+  int64_t in_c;
+  int64_t in_h;
+  int64_t in_w;
+  int64_t out_c;
+  int64_t out_h;
+  int64_t out_w;
+  int64_t kernel_h;
+  int64_t kernel_w;
+  int64_t stride_h;
+  int64_t stride_w;
+  int64_t pad_top;
+  int64_t pad_left;
+  int64_t dilation_h;
+  int64_t dilation_w;
+  int64_t groups;
+
+  int64_t in_plane() const { return in_h * in_w; }
+  int64_t out_plane() const { return out_h * out_w; }
+  int64_t in_c_per_group() const { return in_c / groups; }
+  int64_t out_c_per_group() const { return out_c / groups; }
+  // Rows of the im2col matrix of one group.
+  int64_t col_rows() const { return in_c_per_group() * kernel_h * kernel_w; }
+
+  bool IsDepthwise() const { return groups > 1 && groups == in_c; }
+  bool IsPointwise() const {
+    return kernel_h == 1 && kernel_w == 1 && stride_h == 1 && stride_w == 1 &&
+           pad_top == 0 && pad_left == 0 && out_h == in_h && out_w == in_w;
+  }
+  bool IsWinograd3x3() const {
+    return kernel_h == 3 && kernel_w == 3 && stride_h == 1 && stride_w == 1 &&
+           dilation_h == 1 && dilation_w == 1 && groups == 1;
+  }
+};
+
+enum class ConvActivation {
+  kIdentity,
+  kRelu,
+  kRelu6,
+  kLeakyRelu,
+  kSigmoid,
+  kTanh,
+  kSwish,
+};
+
+// Work fused into the convolution output while it is still in cache:
+// out = act(out + bias[c] + residual), each part optional.
+template <typename T>
+struct ConvEpilogue {
+  const T* bias = nullptr;
+  // NCHW tensor of the output shape.
+  const T* residual = nullptr;
+  ConvActivation activation = ConvActivation::kIdentity;
+  // Negative slope of kLeakyRelu.
+  float alpha = 0.0f;
+
+  bool empty() const {
+    return bias == nullptr && residual == nullptr &&
+           activation == ConvActivation::kIdentity;
+  }
+};
+
+namespace detail {
+
+template <typename T>
+inline T Activate(T v, ConvActivation activation, float alpha) {
+  switch (activation) {
+    case ConvActivation::kIdentity:
+      return v;
+    case ConvActivation::kRelu:
+      return v > T(0) ? v : T(0);
+    case ConvActivation::kRelu6:
+      return std::min(std::max(v, T(0)), T(6));
+    case ConvActivation::kLeakyRelu:
+      return v > T(0) ? v : static_cast<T>(alpha) * v;
+    case ConvActivation::kSigmoid:
+      return T(1) / (T(1) + std::exp(-v));
+    case ConvActivation::kTanh:
+      return std::tanh(v);
+    case ConvActivation::kSwish:
+      return v / (T(1) + std::exp(-v));
+  }
+  return v;
+}
+
+// Applies the epilogue to channels [c_begin, c_end) of image n, `out` points
+// to the first of those channels.
+template <typename T>
+void ApplyEpilogue(const Conv2DShape& s,
+                   const ConvEpilogue<T>& epilogue,
+                   int64_t n,
+                   int64_t c_begin,
+                   int64_t c_end,
+                   T* out) {
+  if (epilogue.empty()) {
+    return;
+  }
+  const int64_t plane = s.out_plane();
+  for (int64_t c = c_begin; c < c_end; ++c) {
+    T* dst = out + (c - c_begin) * plane;
+    const T bias = epilogue.bias ? epilogue.bias[c] : T(0);
+    const T* residual = epilogue.residual
+                            ? epilogue.residual + (n * s.out_c + c) * plane
+                            : nullptr;
+    for (int64_t i = 0; i < plane; ++i) {
+      T v = dst[i] + bias;
+      if (residual) {
+        v += residual[i];
+      }
+      dst[i] = Activate(v, epilogue.activation, epilogue.alpha);
+    }
+  }
+}
+
+// Unfolds the input channels of one group of one image into a
+// [in_c_per_group * kernel_h * kernel_w, out_h * out_w] matrix, taps that
+// fall into the padding are zero.
+template <typename T>
+void Im2Col(const Conv2DShape& s, const T* x, T* col) {
+  const int64_t out_plane = s.out_plane();
+  for (int64_t c = 0; c < s.in_c_per_group(); ++c) {
+    const T* src = x + c * s.in_plane();
+    for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+      for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+        T* dst = col + ((c * s.kernel_h + kh) * s.kernel_w + kw) * out_plane;
+        const int64_t w_offset = kw * s.dilation_w - s.pad_left;
+        for (int64_t oh = 0; oh < s.out_h; ++oh) {
+          const int64_t ih = oh * s.stride_h - s.pad_top + kh * s.dilation_h;
+          T* row = dst + oh * s.out_w;
+          if (ih < 0 || ih >= s.in_h) {
+            std::fill(row, row + s.out_w, T(0));
+            continue;
+          }
+          const T* src_row = src + ih * s.in_w;
+          if (s.stride_w == 1) {
+            // A contiguous run of the input row with zero borders.
+            const int64_t lo =
+                std::min(s.out_w, std::max<int64_t>(0, -w_offset));
+            const int64_t hi =
+                std::max(lo, std::min(s.out_w, s.in_w - w_offset));
+            std::fill(row, row + lo, T(0));
+            std::copy(
+                src_row + lo + w_offset, src_row + hi + w_offset, row + lo);
+            std::fill(row + hi, row + s.out_w, T(0));
+          } else {
+            for (int64_t ow = 0; ow < s.out_w; ++ow) {
+              const int64_t iw = ow * s.stride_w + w_offset;
+              row[ow] = iw >= 0 && iw < s.in_w ? src_row[iw] : T(0);
+            }
+          }
+        }
+      }
+    }
+  }
+}
+
+// Inverse of Im2Col, accumulates the columns into the input channels of one
+// group of one image. `x` must be zeroed by the caller.
+template <typename T>
+void Col2Im(const Conv2DShape& s, const T* col, T* x) {
+  const int64_t out_plane = s.out_plane();
+  for (int64_t c = 0; c < s.in_c_per_group(); ++c) {
+    T* dst = x + c * s.in_plane();
+    for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+      for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+        const T* src =
+            col + ((c * s.kernel_h + kh) * s.kernel_w + kw) * out_plane;
+        const int64_t w_offset = kw * s.dilation_w - s.pad_left;
+        for (int64_t oh = 0; oh < s.out_h; ++oh) {
+          const int64_t ih = oh * s.stride_h - s.pad_top + kh * s.dilation_h;
+          if (ih < 0 || ih >= s.in_h) {
+            continue;
+          }
+          const T* row = src + oh * s.out_w;
+          T* dst_row = dst + ih * s.in_w;
+          for (int64_t ow = 0; ow < s.out_w; ++ow) {
+            const int64_t iw = ow * s.stride_w + w_offset;
+            if (iw >= 0 && iw < s.in_w) {
+              dst_row[iw] += row[ow];
+            }
+          }
+        }
+      }
+    }
+  }
+}
+
+// Depthwise convolution, output channel oc reads input channel
+// oc / multiplier. Each output plane is an independent task.
+template <typename T>
+void DepthwiseConvForward(const Conv2DShape& s,
+                          const T* x,
+                          const T* w,
+                          T* out) {
+  const int64_t multiplier = s.out_c / s.in_c;
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  const int64_t grain =
+      std::max<int64_t>(1, (1 << 14) / std::max<int64_t>(1, s.out_plane()));
+  ParallelFor(0, s.batch * s.out_c, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t task = begin; task < end; ++task) {
+      const int64_t n = task / s.out_c;
+      const int64_t oc = task % s.out_c;
+      const T* src = x + (n * s.in_c + oc / multiplier) * s.in_plane();
+      const T* filter = w + oc * taps;
+      T* dst = out + task * s.out_plane();
+      for (int64_t oh = 0; oh < s.out_h; ++oh) {
+        for (int64_t ow = 0; ow < s.out_w; ++ow) {
+          T acc = T(0);
+          for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+            const int64_t ih = oh * s.stride_h - s.pad_top + kh * s.dilation_h;
+            if (ih < 0 || ih >= s.in_h) {
+              continue;
+            }
+            for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+              const int64_t iw =
+                  ow * s.stride_w - s.pad_left + kw * s.dilation_w;
+              if (iw >= 0 && iw < s.in_w) {
+                acc += src[ih * s.in_w + iw] * filter[kh * s.kernel_w + kw];
+              }
+            }
+          }
+          dst[oh * s.out_w + ow] = acc;
+        }
+      }
+    }
+  });
+}
+
+// dx of a depthwise convolution. Input channels are independent tasks, each
+// gathers from the `multiplier` output channels that read it.
+template <typename T>
+void DepthwiseConvBackwardData(const Conv2DShape& s,
+                               const T* w,
+                               const T* dout,
+                               T* dx) {
+  const int64_t multiplier = s.out_c / s.in_c;
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  ParallelFor(0, s.batch * s.in_c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t task = begin; task < end; ++task) {
+      const int64_t n = task / s.in_c;
+      const int64_t ic = task % s.in_c;
+      T* dst = dx + task * s.in_plane();
+      std::fill(dst, dst + s.in_plane(), T(0));
+      for (int64_t m = 0; m < multiplier; ++m) {
+        const int64_t oc = ic * multiplier + m;
+        const T* src = dout + (n * s.out_c + oc) * s.out_plane();
+        const T* filter = w + oc * taps;
+        for (int64_t oh = 0; oh < s.out_h; ++oh) {
+          for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+            const int64_t ih = oh * s.stride_h - s.pad_top + kh * s.dilation_h;
+            if (ih < 0 || ih >= s.in_h) {
+              continue;
+            }
+            for (int64_t ow = 0; ow < s.out_w; ++ow) {
+              const T g = src[oh * s.out_w + ow];
+              for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                const int64_t iw =
+                    ow * s.stride_w - s.pad_left + kw * s.dilation_w;
+                if (iw >= 0 && iw < s.in_w) {
+                  dst[ih * s.in_w + iw] += g * filter[kh * s.kernel_w + kw];
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  });
+}
+
+// dw of a depthwise convolution, output channels are independent tasks that
+// reduce over the batch.
+template <typename T>
+void DepthwiseConvBackwardFilter(const Conv2DShape& s,
+                                 const T* x,
+                                 const T* dout,
+                                 T* dw) {
+  const int64_t multiplier = s.out_c / s.in_c;
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  ParallelFor(0, s.out_c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t oc = begin; oc < end; ++oc) {
+      T* filter = dw + oc * taps;
+      std::fill(filter, filter + taps, T(0));
+      for (int64_t n = 0; n < s.batch; ++n) {
+        const T* src = x + (n * s.in_c + oc / multiplier) * s.in_plane();
+        const T* grad = dout + (n * s.out_c + oc) * s.out_plane();
+        for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+          for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+            T acc = T(0);
+            for (int64_t oh = 0; oh < s.out_h; ++oh) {
+              const int64_t ih =
+                  oh * s.stride_h - s.pad_top + kh * s.dilation_h;
+              if (ih < 0 || ih >= s.in_h) {
+                continue;
+              }
+              for (int64_t ow = 0; ow < s.out_w; ++ow) {
+                const int64_t iw =
+                    ow * s.stride_w - s.pad_left + kw * s.dilation_w;
+                if (iw >= 0 && iw < s.in_w) {
+                  acc += grad[oh * s.out_w + ow] * src[ih * s.in_w + iw];
+                }
+              }
+            }
+            filter[kh * s.kernel_w + kw] += acc;
+          }
+        }
+      }
+    }
+  });
+}
+
+// Winograd F(2x2, 3x3): every 2x2 output tile is computed from a 4x4 input
+// tile with 16 multiplies per channel pair instead of 36. The filter and the
+// input tiles are transformed once, leaving 16 independent GEMMs of
+// [out_c x in_c] * [in_c x tiles], then each tile is transformed back.
+template <typename T>
+void WinogradConv3x3Forward(const Conv2DShape& s,
+                            const T* x,
+                            const T* w,
+                            T* out,
+                            const ConvEpilogue<T>& epilogue) {
+  const int64_t tiles_h = (s.out_h + 1) / 2;
+  const int64_t tiles_w = (s.out_w + 1) / 2;
+  const int64_t tiles = tiles_h * tiles_w;
+  const int64_t ic_count = s.in_c;
+  const int64_t oc_count = s.out_c;
+
+  // U = G g G^T, stored as 16 matrices of [out_c, in_c].
+  std::vector<T> u(16 * oc_count * ic_count);
+  ParallelFor(0, oc_count * ic_count, 64, [&](int64_t begin, int64_t end) {
+    for (int64_t idx = begin; idx < end; ++idx) {
+      const T* g = w + idx * 9;
+      T tmp[4][3];
+      for (int j = 0; j < 3; ++j) {
+        tmp[0][j] = g[j];
+        tmp[1][j] = T(0.5) * (g[j] + g[3 + j] + g[6 + j]);
+        tmp[2][j] = T(0.5) * (g[j] - g[3 + j] + g[6 + j]);
+        tmp[3][j] = g[6 + j];
+      }
+      for (int i = 0; i < 4; ++i) {
+        const T r[4] = {tmp[i][0],
+                        T(0.5) * (tmp[i][0] + tmp[i][1] + tmp[i][2]),
+                        T(0.5) * (tmp[i][0] - tmp[i][1] + tmp[i][2]),
+                        tmp[i][2]};
+        for (int j = 0; j < 4; ++j) {
+          u[(i * 4 + j) * oc_count * ic_count + idx] = r[j];
+        }
+      }
+    }
+  });
+
+  std::vector<T> v(16 * ic_count * tiles);
+  std::vector<T> m(16 * oc_count * tiles);
+  for (int64_t n = 0; n < s.batch; ++n) {
+    const T* image = x + n * s.in_c * s.in_plane();
+    // V = B^T d B, stored as 16 matrices of [in_c, tiles].
+    ParallelFor(0, ic_count, 1, [&](int64_t begin, int64_t end) {
+      for (int64_t c = begin; c < end; ++c) {
+        const T* src = image + c * s.in_plane();
+        for (int64_t th = 0; th < tiles_h; ++th) {
+          for (int64_t tw = 0; tw < tiles_w; ++tw) {
+            T d[4][4];
+            for (int i = 0; i < 4; ++i) {
+              const int64_t ih = th * 2 - s.pad_top + i;
+              for (int j = 0; j < 4; ++j) {
+                const int64_t iw = tw * 2 - s.pad_left + j;
+                d[i][j] = ih >= 0 && ih < s.in_h && iw >= 0 && iw < s.in_w
+                              ? src[ih * s.in_w + iw]
+                              : T(0);
+              }
+            }
+            T t[4][4];
+            for (int j = 0; j < 4; ++j) {
+              t[0][j] = d[0][j] - d[2][j];
+              t[1][j] = d[1][j] + d[2][j];
+              t[2][j] = d[2][j] - d[1][j];
+              t[3][j] = d[1][j] - d[3][j];
+            }
+            const int64_t tile = th * tiles_w + tw;
+            T* dst = v.data() + c * tiles + tile;
+            const int64_t stride = ic_count * tiles;
+            for (int i = 0; i < 4; ++i) {
+              dst[(i * 4 + 0) * stride] = t[i][0] - t[i][2];
+              dst[(i * 4 + 1) * stride] = t[i][1] + t[i][2];
+              dst[(i * 4 + 2) * stride] = t[i][2] - t[i][1];
+              dst[(i * 4 + 3) * stride] = t[i][1] - t[i][3];
+            }
+          }
+        }
+      }
+    });
+
+    BatchedGemm<T>(false,
+                   false,
+                   oc_count,
+                   ic_count,
+                   tiles,
+                   u.data(),
+                   oc_count * ic_count,
+                   v.data(),
+                   ic_count * tiles,
+                   m.data(),
+                   16);
+
+    // Y = A^T M A, then the epilogue while the output plane is hot.
+    T* image_out = out + n * s.out_c * s.out_plane();
+    ParallelFor(0, oc_count, 1, [&](int64_t begin, int64_t end) {
+      for (int64_t c = begin; c < end; ++c) {
+        T* dst = image_out + c * s.out_plane();
+        const int64_t stride = oc_count * tiles;
+        for (int64_t th = 0; th < tiles_h; ++th) {
+          for (int64_t tw = 0; tw < tiles_w; ++tw) {
+            const T* src = m.data() + c * tiles + th * tiles_w + tw;
+            T a[4][4];
+            for (int i = 0; i < 4; ++i) {
+              for (int j = 0; j < 4; ++j) {
+                a[i][j] = src[(i * 4 + j) * stride];
+              }
+            }
+            T t[2][4];
+            for (int j = 0; j < 4; ++j) {
+              t[0][j] = a[0][j] + a[1][j] + a[2][j];
+              t[1][j] = a[1][j] - a[2][j] - a[3][j];
+            }
+            for (int i = 0; i < 2; ++i) {
+              const int64_t oh = th * 2 + i;
+              if (oh >= s.out_h) {
+                break;
+              }
+              const T y[2] = {t[i][0] + t[i][1] + t[i][2],
+                              t[i][1] - t[i][2] - t[i][3]};
+              for (int j = 0; j < 2; ++j) {
+                const int64_t ow = tw * 2 + j;
+                if (ow < s.out_w) {
+                  dst[oh * s.out_w + ow] = y[j];
+                }
+              }
+            }
+          }
+        }
+        ApplyEpilogue(s, epilogue, n, c, c + 1, dst);
+      }
+    });
+  }
+}
+
+}  // namespace detail
+
+// Forward convolution of an NCHW batch. Picks a direct loop for depthwise
+// filters, Winograd F(2x2, 3x3) for wide stride-1 3x3 filters, a plain GEMM
+// for 1x1 filters and im2col + GEMM otherwise. The epilogue runs on each
+// image right after its GEMM.
+template <typename T>
+void Conv2DForward(const Conv2DShape& s,
+                   const T* x,
+                   const T* w,
+                   T* out,
+                   const ConvEpilogue<T>& epilogue = ConvEpilogue<T>()) {
+  const int64_t out_image = s.out_c * s.out_plane();
+  if (s.batch == 0 || out_image == 0) {
+    return;
+  }
+  if (s.IsDepthwise()) {
+    detail::DepthwiseConvForward(s, x, w, out);
+    if (!epilogue.empty()) {
+      ParallelFor(0, s.batch * s.out_c, 1, [&](int64_t begin, int64_t end) {
+        for (int64_t task = begin; task < end; ++task) {
+          const int64_t c = task % s.out_c;
+          detail::ApplyEpilogue(s,
+                                epilogue,
+                                task / s.out_c,
+                                c,
+                                c + 1,
+                                out + task * s.out_plane());
+        }
+      });
+    }
+    return;
+  }
+  // The transforms only pay off with enough channels to amortize them over.
+  constexpr int64_t kWinogradMinChannels = 16;
+  if ((std::is_same<T, float>::value || std::is_same<T, double>::value) &&
+      s.IsWinograd3x3() && s.in_c >= kWinogradMinChannels &&
+      s.out_c >= kWinogradMinChannels) {
+    detail::WinogradConv3x3Forward(s, x, w, out, epilogue);
+    return;
+  }
+
+  const int64_t in_image = s.in_c * s.in_plane();
+  const int64_t icg = s.in_c_per_group();
+  const int64_t ocg = s.out_c_per_group();
+  const int64_t col_rows = s.col_rows();
+  const bool pointwise = s.IsPointwise();
+  auto run = [&](int64_t begin, int64_t end) {
+    std::vector<T> col(pointwise ? 0 : col_rows * s.out_plane());
+    for (int64_t n = begin; n < end; ++n) {
+      for (int64_t g = 0; g < s.groups; ++g) {
+        const T* src = x + n * in_image + g * icg * s.in_plane();
+        if (!pointwise) {
+          detail::Im2Col(s, src, col.data());
+          src = col.data();
+        }
+        T* dst = out + n * out_image + g * ocg * s.out_plane();
+        Gemm<T>(false,
+                false,
+                ocg,
+                col_rows,
+                s.out_plane(),
+                w + g * ocg * col_rows,
+                src,
+                dst);
+        detail::ApplyEpilogue(s, epilogue, n, g * ocg, (g + 1) * ocg, dst);
+      }
+    }
+  };
+  // Whole images per thread when there are enough of them, otherwise the
+  // GEMM of each image is parallel.
+  if (s.batch >= ThreadPool::Instance().NumThreads()) {
+    ParallelFor(0, s.batch, 1, run);
+  } else {
+    run(0, s.batch);
+  }
+}
+
+// dx = W^T * dout per group, folded back with col2im.
+template <typename T>
+void Conv2DBackwardData(const Conv2DShape& s,
+                        const T* w,
+                        const T* dout,
+                        T* dx) {
+  const int64_t in_image = s.in_c * s.in_plane();
+  if (s.batch == 0 || in_image == 0) {
+    return;
+  }
+  if (s.IsDepthwise()) {
+    detail::DepthwiseConvBackwardData(s, w, dout, dx);
+    return;
+  }
+  const int64_t out_image = s.out_c * s.out_plane();
+  const int64_t icg = s.in_c_per_group();
+  const int64_t ocg = s.out_c_per_group();
+  const int64_t col_rows = s.col_rows();
+  const bool pointwise = s.IsPointwise();
+  auto run = [&](int64_t begin, int64_t end) {
+    std::vector<T> col(pointwise ? 0 : col_rows * s.out_plane());
+    for (int64_t n = begin; n < end; ++n) {
+      for (int64_t g = 0; g < s.groups; ++g) {
+        T* dst = dx + n * in_image + g * icg * s.in_plane();
+        Gemm<T>(true,
+                false,
+                col_rows,
+                ocg,
+                s.out_plane(),
+                w + g * ocg * col_rows,
+                dout + n * out_image + g * ocg * s.out_plane(),
+                pointwise ? dst : col.data());
+        if (!pointwise) {
+          std::fill(dst, dst + icg * s.in_plane(), T(0));
+          detail::Col2Im(s, col.data(), dst);
+        }
+      }
+    }
+  };
+  if (s.batch >= ThreadPool::Instance().NumThreads()) {
+    ParallelFor(0, s.batch, 1, run);
+  } else {
+    run(0, s.batch);
+  }
+}
+
+// dw = sum over the batch of dout * col^T per group. The images are
+// accumulated in order into dw, so the result does not depend on the number
+// of threads.
+template <typename T>
+void Conv2DBackwardFilter(const Conv2DShape& s,
+                          const T* x,
+                          const T* dout,
+                          T* dw) {
+  using AccT = typename GemmAccType<T>::type;
+  const int64_t icg = s.in_c_per_group();
+  const int64_t ocg = s.out_c_per_group();
+  const int64_t col_rows = s.col_rows();
+  if (s.batch == 0 || s.out_plane() == 0) {
+    std::fill(dw, dw + s.out_c * col_rows, T(0));
+    return;
+  }
+  if (s.IsDepthwise()) {
+    detail::DepthwiseConvBackwardFilter(s, x, dout, dw);
+    return;
+  }
+  const int64_t in_image = s.in_c * s.in_plane();
+  const int64_t out_image = s.out_c * s.out_plane();
+  const bool pointwise = s.IsPointwise();
+  std::vector<T> col(pointwise ? 0 : col_rows * s.out_plane());
+  for (int64_t n = 0; n < s.batch; ++n) {
+    for (int64_t g = 0; g < s.groups; ++g) {
+      const T* src = x + n * in_image + g * icg * s.in_plane();
+      if (!pointwise) {
+        detail::Im2Col(s, src, col.data());
+        src = col.data();
+      }
+      Gemm<T>(false,
+              true,
+              ocg,
+              s.out_plane(),
+              col_rows,
+              dout + n * out_image + g * ocg * s.out_plane(),
+              src,
+              dw + g * ocg * col_rows,
+              false,
+              AccT(1),
+              n == 0 ? AccT(0) : AccT(1));
+    }
+  }
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
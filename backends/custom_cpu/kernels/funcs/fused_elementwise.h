@@ -0,0 +1,390 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <vector>
+
+#include "kernels/funcs/broadcast.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Bytecode of the fused_elementwise op. A program is a flat list of
+// (opcode, operand) pairs evaluated on a value stack, e.g. relu(x * 2 + y) is
+//   kLoad 0, kConst 0, kMul 0, kLoad 1, kAdd 0, kRelu 0
+// The numbering is shared with the fusion pass in passes/ and must not be
+// reordered.
+enum class FusedOp : int {
+  kLoad = 0,   // push inputs[operand]
+  kConst = 1,  // push constants[operand]
+  kAdd = 2,
+  kSub = 3,
+  kMul = 4,
+  kDiv = 5,
+  kMax = 6,
+  kMin = 7,
+  kPow = 8,
+  kEqual = 9,
+  kNotEqual = 10,
+  kLess = 11,
+  kLessEqual = 12,
+  kGreater = 13,
+  kGreaterEqual = 14,
+  kRelu = 15,
+  kAbs = 16,
+  kExp = 17,
+  kSqrt = 18,
+  kSigmoid = 19,
+  kTanh = 20,
+  kToBool = 21,  // x != 0, i.e. a cast to bool
+  kNumOps = 22,
+};
+
+// An input of a fused chain, either of the compute type or bool.
+struct FusedInput {
+  const void* data;
+  bool is_bool;
+  std::vector<int64_t> dims;
+};
+
+// Stack depth needed by `program`, or -1 when it is malformed: an unknown
+// opcode, an operand out of range, a stack underflow or not exactly one
+// value left at the end.
+inline int FusedProgramDepth(const std::vector<int>& program,
+                             int num_inputs,
+                             int num_constants) {
+  if (program.empty() || program.size() % 2 != 0) {
+    return -1;
+  }
+  int depth = 0;
+  int max_depth = 0;
+  for (size_t pc = 0; pc < program.size(); pc += 2) {
+    const int op = program[pc];
+    const int arg = program[pc + 1];
+    if (op < 0 || op >= static_cast<int>(FusedOp::kNumOps)) {
+      return -1;
+    }
+    switch (static_cast<FusedOp>(op)) {
+      case FusedOp::kLoad:
+        if (arg < 0 || arg >= num_inputs) return -1;
+        ++depth;
+        break;
+      case FusedOp::kConst:
+        if (arg < 0 || arg >= num_constants) return -1;
+        ++depth;
+        break;
+      case FusedOp::kRelu:
+      case FusedOp::kAbs:
+      case FusedOp::kExp:
+      case FusedOp::kSqrt:
+      case FusedOp::kSigmoid:
+      case FusedOp::kTanh:
+      case FusedOp::kToBool:
+        if (depth < 1) return -1;
+        break;
+      default:
+        if (depth < 2) return -1;
+        --depth;
+        break;
+    }
+    max_depth = std::max(max_depth, depth);
+  }
+  return depth == 1 ? max_depth : -1;
+}
+
+// Numpy-style broadcast of all input shapes, false if they do not broadcast.
+inline bool FusedBroadcastDims(const std::vector<FusedInput>& inputs,
+                               std::vector<int64_t>* out_dims) {
+  size_t rank = 0;
+  for (const auto& in : inputs) {
+    rank = std::max(rank, in.dims.size());
+  }
+  out_dims->assign(rank, 1);
+  for (const auto& in : inputs) {
+    const size_t offset = rank - in.dims.size();
+    for (size_t i = 0; i < in.dims.size(); ++i) {
+      int64_t& d = (*out_dims)[offset + i];
+      if (in.dims[i] == d || in.dims[i] == 1) {
+        continue;
+      }
+      if (d != 1) {
+        return false;
+      }
+      d = in.dims[i];
+    }
+  }
+  return true;
+}
+
+namespace detail {
+
+constexpr int64_t kFusedBlock = 1024;
+
+// How an input is read for a block of consecutive output elements.
+struct FusedLoader {
+  enum Kind { kContiguous, kScalar, kStrided };
+  Kind kind;
+  const void* data;
+  bool is_bool;
+  std::vector<int64_t> strides;  // per output dim, 0 where broadcast
+
+  template <typename T, typename InT>
+  void LoadAs(const std::vector<int64_t>& out_dims,
+              int64_t begin,
+              int64_t n,
+              T* dst) const {
+    const InT* src = static_cast<const InT*>(data);
+    if (kind == kContiguous) {
+      for (int64_t i = 0; i < n; ++i) dst[i] = static_cast<T>(src[begin + i]);
+      return;
+    }
+    if (kind == kScalar) {
+      std::fill(dst, dst + n, static_cast<T>(src[0]));
+      return;
+    }
+    // Decompose the first element once, then walk the block in runs along
+    // the innermost dim, which are plain copies or fills in the common
+    // bias / row broadcast cases.
+    const int rank = static_cast<int>(out_dims.size());
+    const int64_t inner = out_dims[rank - 1];
+    const int64_t inner_stride = strides[rank - 1];
+    std::vector<int64_t> index(rank, 0);
+    int64_t offset = 0;
+    int64_t rem = begin;
+    for (int d = rank - 1; d >= 0; --d) {
+      index[d] = rem % out_dims[d];
+      rem /= out_dims[d];
+      offset += index[d] * strides[d];
+    }
+    for (int64_t i = 0; i < n;) {
+      const int64_t run = std::min(n - i, inner - index[rank - 1]);
+      const InT* in = src + offset;
+      T* out = dst + i;
+      if (inner_stride == 1) {
+        for (int64_t k = 0; k < run; ++k) out[k] = static_cast<T>(in[k]);
+      } else if (inner_stride == 0) {
+        std::fill(out, out + run, static_cast<T>(*in));
+      } else {
+        for (int64_t k = 0; k < run; ++k) {
+          out[k] = static_cast<T>(in[k * inner_stride]);
+        }
+      }
+      i += run;
+      offset += run * inner_stride;
+      index[rank - 1] += run;
+      for (int d = rank - 1; d > 0 && index[d] == out_dims[d]; --d) {
+        offset += strides[d - 1] - index[d] * strides[d];
+        index[d] = 0;
+        ++index[d - 1];
+      }
+    }
+  }
+
+  template <typename T>
+  void Load(const std::vector<int64_t>& out_dims,
+            int64_t begin,
+            int64_t n,
+            T* dst) const {
+    if (is_bool) {
+      LoadAs<T, bool>(out_dims, begin, n, dst);
+    } else {
+      LoadAs<T, T>(out_dims, begin, n, dst);
+    }
+  }
+};
+
+inline FusedLoader MakeFusedLoader(const FusedInput& in,
+                                   const std::vector<int64_t>& out_dims) {
+  FusedLoader loader;
+  loader.data = in.data;
+  loader.is_bool = in.is_bool;
+  auto aligned = AlignBroadcastDims(in.dims, out_dims.size(), -1);
+  int64_t numel = 1;
+  for (auto d : aligned) numel *= d;
+  if (numel == 1) {
+    loader.kind = FusedLoader::kScalar;
+  } else if (aligned == out_dims) {
+    loader.kind = FusedLoader::kContiguous;
+  } else {
+    loader.kind = FusedLoader::kStrided;
+    loader.strides = BroadcastStrides(aligned, out_dims);
+  }
+  return loader;
+}
+
+template <typename T, typename Functor>
+inline void FusedBinary(T* a, const T* b, int64_t n, Functor func) {
+  for (int64_t i = 0; i < n; ++i) a[i] = func(a[i], b[i]);
+}
+
+template <typename T, typename Functor>
+inline void FusedUnary(T* a, int64_t n, Functor func) {
+  for (int64_t i = 0; i < n; ++i) a[i] = func(a[i]);
+}
+
+// Runs `program` over one block of n elements. Each stack slot is a block of
+// values, so the dispatch cost is paid once per instruction and block rather
+// than per element, and every instruction is a plain vectorizable loop.
+template <typename T>
+void RunFusedBlock(const std::vector<int>& program,
+                   const std::vector<T>& constants,
+                   const std::vector<FusedLoader>& loaders,
+                   const std::vector<int64_t>& out_dims,
+                   int64_t begin,
+                   int64_t n,
+                   T* stack) {
+  int sp = 0;
+  auto slot = [&](int i) { return stack + i * kFusedBlock; };
+  for (size_t pc = 0; pc < program.size(); pc += 2) {
+    const int arg = program[pc + 1];
+    T* a = sp >= 2 ? slot(sp - 2) : nullptr;
+    T* b = sp >= 1 ? slot(sp - 1) : nullptr;
+    switch (static_cast<FusedOp>(program[pc])) {
+      case FusedOp::kLoad:
+        loaders[arg].Load(out_dims, begin, n, slot(sp++));
+        continue;
+      case FusedOp::kConst:
+        std::fill(slot(sp), slot(sp) + n, constants[arg]);
+        ++sp;
+        continue;
+      case FusedOp::kAdd:
+        FusedBinary(a, b, n, [](T x, T y) { return x + y; });
+        break;
+      case FusedOp::kSub:
+        FusedBinary(a, b, n, [](T x, T y) { return x - y; });
+        break;
+      case FusedOp::kMul:
+        FusedBinary(a, b, n, [](T x, T y) { return x * y; });
+        break;
+      case FusedOp::kDiv:
+        FusedBinary(a, b, n, [](T x, T y) { return x / y; });
+        break;
+      case FusedOp::kMax:
+        FusedBinary(a, b, n, [](T x, T y) { return x > y ? x : y; });
+        break;
+      case FusedOp::kMin:
+        FusedBinary(a, b, n, [](T x, T y) { return x < y ? x : y; });
+        break;
+      case FusedOp::kPow:
+        FusedBinary(a, b, n, [](T x, T y) { return std::pow(x, y); });
+        break;
+      // Float equality uses the same 1e-8 tolerance as compare_kernel.cc.
+      case FusedOp::kEqual:
+        FusedBinary(a, b, n, [](T x, T y) {
+          return static_cast<T>(std::fabs(static_cast<double>(x - y)) < 1e-8);
+        });
+        break;
+      case FusedOp::kNotEqual:
+        FusedBinary(a, b, n, [](T x, T y) {
+          return static_cast<T>(std::fabs(static_cast<double>(x - y)) >= 1e-8);
+        });
+        break;
+      case FusedOp::kLess:
+        FusedBinary(a, b, n, [](T x, T y) { return static_cast<T>(x < y); });
+        break;
+      case FusedOp::kLessEqual:
+        FusedBinary(a, b, n, [](T x, T y) { return static_cast<T>(x <= y); });
+        break;
+      case FusedOp::kGreater:
+        FusedBinary(a, b, n, [](T x, T y) { return static_cast<T>(x > y); });
+        break;
+      case FusedOp::kGreaterEqual:
+        FusedBinary(a, b, n, [](T x, T y) { return static_cast<T>(x >= y); });
+        break;
+      case FusedOp::kRelu:
+        FusedUnary(b, n, [](T x) { return x > T(0) ? x : T(0); });
+        continue;
+      case FusedOp::kAbs:
+        FusedUnary(b, n, [](T x) { return std::abs(x); });
+        continue;
+      case FusedOp::kExp:
+        FusedUnary(b, n, [](T x) { return std::exp(x); });
+        continue;
+      case FusedOp::kSqrt:
+        FusedUnary(b, n, [](T x) { return std::sqrt(x); });
+        continue;
+      case FusedOp::kSigmoid:
+        FusedUnary(b, n, [](T x) { return T(1) / (T(1) + std::exp(-x)); });
+        continue;
+      case FusedOp::kTanh:
+        FusedUnary(b, n, [](T x) { return std::tanh(x); });
+        continue;
+      case FusedOp::kToBool:
+        FusedUnary(b, n, [](T x) { return static_cast<T>(x != T(0)); });
+        continue;
+      default:
+        break;
+    }
+    --sp;  // binary ops pop b and leave the result in a
+  }
+}
+
+}  // namespace detail
+
+// out = program(inputs) over the broadcast of all input shapes in a single
+// pass: the output is split into blocks of kFusedBlock elements and each
+// task evaluates the whole program on its blocks with a private stack, so
+// intermediates never leave the cache and the only allocation that scales
+// with the tensor is the output itself. T is the compute type (float or
+// double); bool inputs are read as 0 / 1 and a bool output stores x != 0.
+// The program is expected to be validated with FusedProgramDepth.
+template <typename T>
+void FusedElementwise(const std::vector<int>& program,
+                      const std::vector<float>& constants,
+                      const std::vector<FusedInput>& inputs,
+                      const std::vector<int64_t>& out_dims,
+                      int depth,
+                      bool out_is_bool,
+                      void* out) {
+  int64_t numel = 1;
+  for (auto d : out_dims) numel *= d;
+  if (numel == 0) {
+    return;
+  }
+  std::vector<detail::FusedLoader> loaders;
+  loaders.reserve(inputs.size());
+  for (const auto& in : inputs) {
+    loaders.push_back(detail::MakeFusedLoader(in, out_dims));
+  }
+  const std::vector<T> consts(constants.begin(), constants.end());
+  const int64_t num_blocks =
+      (numel + detail::kFusedBlock - 1) / detail::kFusedBlock;
+  const int64_t grain = std::max<int64_t>(
+      1,
+      (1 << 15) /
+          (detail::kFusedBlock * std::max<size_t>(1, program.size() / 2)));
+  ParallelFor(0, num_blocks, grain, [&](int64_t first, int64_t last) {
+    std::vector<T> stack(depth * detail::kFusedBlock);
+    for (int64_t block = first; block < last; ++block) {
+      const int64_t begin = block * detail::kFusedBlock;
+      const int64_t n = std::min(detail::kFusedBlock, numel - begin);
+      detail::RunFusedBlock(
+          program, consts, loaders, out_dims, begin, n, stack.data());
+      if (out_is_bool) {
+        bool* dst = static_cast<bool*>(out) + begin;
+        for (int64_t i = 0; i < n; ++i) dst[i] = stack[i] != T(0);
+      } else {
+        std::copy(stack.data(), stack.data() + n, static_cast<T*>(out) + begin);
+      }
+    }
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
@@ -0,0 +1,140 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/sort.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Row gathers and scatters on tensors viewed as [outer, rows, inner], where
+// a row is a contiguous run of `inner` elements: gather / index_select along
+// an axis, embedding lookups (outer == 1) and gather_nd with flattened row
+// ids. Indices are validated by the callers.
+
+// out[o, i, :] = x[o, index[i], :]. Rows equal to `skip` are zero filled
+// instead, e.g. the padding_idx of an embedding.
+template <typename T, typename IndexT>
+void GatherRows(const T* x,
+                int64_t outer,
+                int64_t rows,
+                int64_t inner,
+                const IndexT* index,
+                int64_t n,
+                T* out,
+                int64_t skip = -1) {
+  const int64_t grain =
+      std::max<int64_t>(1, (1 << 14) / std::max<int64_t>(1, inner));
+  ParallelFor(0, outer * n, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t task = begin; task < end; ++task) {
+      const int64_t o = task / n;
+      const int64_t row = static_cast<int64_t>(index[task % n]);
+      T* dst = out + task * inner;
+      if (row == skip) {
+        std::fill(dst, dst + inner, T(0));
+      } else {
+        std::memcpy(dst, x + (o * rows + row) * inner, inner * sizeof(T));
+      }
+    }
+  });
+}
+
+enum class ScatterMode {
+  // dst[row] += sum of its updates.
+  kAdd,
+  // dst[row] = sum of its updates.
+  kSum,
+  // dst[row] = the last of its updates.
+  kOverwrite,
+};
+
+// Scatters updates[o, i, :] into dst[o, index[i], :] for every i whose row
+// is not `skip`; rows that are not indexed are left untouched. The indices
+// are sorted once (stable radix sort) and every run of equal rows is reduced
+// by a single task in index order, so there are no atomics, duplicates are
+// deterministic and the work and scratch memory scale with n, not with the
+// number of rows of dst.
+template <typename T, typename IndexT>
+void ScatterRows(const IndexT* index,
+                 int64_t n,
+                 const T* updates,
+                 int64_t outer,
+                 int64_t rows,
+                 int64_t inner,
+                 ScatterMode mode,
+                 T* dst,
+                 int64_t skip = -1) {
+  if (n == 0 || inner == 0) {
+    return;
+  }
+  std::vector<uint64_t> keys(n);
+  for (int64_t i = 0; i < n; ++i) {
+    keys[i] = static_cast<uint64_t>(index[i]);
+  }
+  std::vector<int64_t> order(n);
+  detail::RadixSorter<uint64_t> sorter(n);
+  sorter(keys.data(), order.data());
+
+  // Start of every run of equal rows in `order`, plus the end.
+  std::vector<int64_t> segments;
+  for (int64_t j = 0; j < n; ++j) {
+    if (j == 0 || index[order[j]] != index[order[j - 1]]) {
+      segments.push_back(j);
+    }
+  }
+  segments.push_back(n);
+  const int64_t num_segments = static_cast<int64_t>(segments.size()) - 1;
+
+  const int64_t grain = std::max<int64_t>(
+      1, (1 << 14) / std::max<int64_t>(1, inner * outer * n / num_segments));
+  ParallelFor(0, num_segments, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t seg = begin; seg < end; ++seg) {
+      const int64_t first = segments[seg];
+      const int64_t last = segments[seg + 1];
+      const int64_t row = static_cast<int64_t>(index[order[first]]);
+      if (row == skip) {
+        continue;
+      }
+      for (int64_t o = 0; o < outer; ++o) {
+        T* out = dst + (o * rows + row) * inner;
+        const T* src = updates + o * n * inner;
+        if (mode == ScatterMode::kOverwrite) {
+          std::memcpy(out, src + order[last - 1] * inner, inner * sizeof(T));
+          continue;
+        }
+        int64_t j = first;
+        if (mode == ScatterMode::kSum) {
+          std::memcpy(out, src + order[j] * inner, inner * sizeof(T));
+          ++j;
+        }
+        for (; j < last; ++j) {
+          const T* update = src + order[j] * inner;
+          for (int64_t k = 0; k < inner; ++k) {
+            out[k] += update[k];
+          }
+        }
+      }
+    }
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
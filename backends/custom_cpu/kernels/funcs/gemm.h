@@ -0,0 +1,958 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/cast.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Accumulation type of the GEMM engine. Builtin arithmetic types accumulate in
+// themselves, storage-only types (float16, bfloat16) accumulate in float and
+// int8 accumulates exactly in int32.
+template <typename T>
+struct GemmAccType {
+  using type = typename ComputeType<T>::type;
+};
+
+template <>
+struct GemmAccType<int8_t> {
+  using type = int32_t;
+};
+
+// Width in bytes of the vector registers the compiler targets.
+#if defined(__AVX512F__)
+constexpr int64_t kGemmVectorBytes = 64;
+#elif defined(__AVX__)
+constexpr int64_t kGemmVectorBytes = 32;
+#else
+constexpr int64_t kGemmVectorBytes = 16;
+#endif
+
+// Blocking parameters of the packed GEMM. MR x NR is the register tile of the
+// micro kernel, KC x NR panels of B stay in L1, MC x KC blocks of A stay in L2
+// and KC x NC panels of B stay in L3. A row of the tile is two vector
+// registers, so the 6 x NR accumulators, one row of B and the broadcast A
+// value fit the 16 registers of SSE, AVX and NEON.
+template <typename AccT>
+struct GemmBlocking {
+  static constexpr int64_t kMR = 6;
+  static constexpr int64_t kNR = 2 * kGemmVectorBytes / sizeof(AccT) < 4
+                                     ? 4
+                                     : 2 * kGemmVectorBytes / sizeof(AccT);
+  static constexpr int64_t kKC = 256;
+  static constexpr int64_t kMC = kMR * 24;
+  static constexpr int64_t kNC = kNR * 128;
+};
+
+#if defined(CUSTOM_CPU_F16C_DISPATCH)
+// float uses the 6 x 16 tile of FloatMicroKernelAvx2, which is chosen at run
+// time whatever the compiled width.
+template <>
+struct GemmBlocking<float> {
+  static constexpr int64_t kMR = 6;
+  static constexpr int64_t kNR = 16;
+  static constexpr int64_t kKC = 256;
+  static constexpr int64_t kMC = kMR * 24;
+  static constexpr int64_t kNC = kNR * 128;
+};
+#endif
+
+// A matrix view with arbitrary row/column strides, so that transposed operands
+// and transposed outputs are handled by the packing routines instead of the
+// inner loops.
+template <typename T>
+struct MatrixRef {
+  T* data;
+  int64_t row_stride;
+  int64_t col_stride;
+
+  T& operator()(int64_t r, int64_t c) const {
+    return data[r * row_stride + c * col_stride];
+  }
+};
+
+namespace detail {
+
+template <typename AccT>
+struct AlignedBuffer {
+  AccT* Get(size_t numel) {
+    if (numel > capacity) {
+      std::free(data);
+      void* ptr = nullptr;
+      if (posix_memalign(&ptr, 64, numel * sizeof(AccT)) != 0) {
+        ptr = nullptr;
+      }
+      data = static_cast<AccT*>(ptr);
+      capacity = data ? numel : 0;
+    }
+    return data;
+  }
+  ~AlignedBuffer() { std::free(data); }
+
+  AccT* data = nullptr;
+  size_t capacity = 0;
+};
+
+// Packs an mc x kc block of A into row panels of kMR rows, panel-major and
+// k-major inside a panel. Rows past the matrix edge are zero padded.
+template <typename T, typename AccT>
+void PackA(const MatrixRef<const T>& a,
+           int64_t row0,
+           int64_t col0,
+           int64_t mc,
+           int64_t kc,
+           AccT* packed) {
+  constexpr int64_t MR = GemmBlocking<AccT>::kMR;
+  for (int64_t i = 0; i < mc; i += MR) {
+    int64_t mr = std::min(MR, mc - i);
+    for (int64_t k = 0; k < kc; ++k) {
+      const T* src = &a(row0 + i, col0 + k);
+      for (int64_t r = 0; r < mr; ++r) {
+        packed[r] = CastValue<AccT>(src[r * a.row_stride]);
+      }
+      for (int64_t r = mr; r < MR; ++r) {
+        packed[r] = AccT(0);
+      }
+      packed += MR;
+    }
+  }
+}
+
+// Packs a kc x nc panel of B into column panels of kNR columns. Columns past
+// the matrix edge are zero padded.
+template <typename T, typename AccT>
+void PackB(const MatrixRef<const T>& b,
+           int64_t row0,
+           int64_t col0,
+           int64_t kc,
+           int64_t nc,
+           AccT* packed) {
+  constexpr int64_t NR = GemmBlocking<AccT>::kNR;
+  for (int64_t j = 0; j < nc; j += NR) {
+    int64_t nr = std::min(NR, nc - j);
+    AccT* dst = packed + j * kc;
+    if (b.col_stride == 1) {
+      for (int64_t k = 0; k < kc; ++k) {
+        CastTile(&b(row0 + k, col0 + j), dst, nr);
+        for (int64_t c = nr; c < NR; ++c) {
+          dst[c] = AccT(0);
+        }
+        dst += NR;
+      }
+    } else {
+      for (int64_t k = 0; k < kc; ++k) {
+        for (int64_t c = 0; c < nr; ++c) {
+          dst[c] = CastValue<AccT>(b(row0 + k, col0 + j + c));
+        }
+        for (int64_t c = nr; c < NR; ++c) {
+          dst[c] = AccT(0);
+        }
+        dst += NR;
+      }
+    }
+  }
+}
+
+// Writes the valid mr x nr corner of an accumulator tile as
+// C = alpha * AB + beta * C.
+template <typename T, typename AccT>
+void StoreTile(
+    const AccT (&acc)[GemmBlocking<AccT>::kMR][GemmBlocking<AccT>::kNR],
+    AccT alpha,
+    AccT beta,
+    const MatrixRef<T>& c,
+    int64_t row0,
+    int64_t col0,
+    int64_t mr,
+    int64_t nr) {
+  if (beta == AccT(0)) {
+    for (int64_t r = 0; r < mr; ++r) {
+      for (int64_t j = 0; j < nr; ++j) {
+        c(row0 + r, col0 + j) = CastValue<T>(alpha * acc[r][j]);
+      }
+    }
+  } else {
+    for (int64_t r = 0; r < mr; ++r) {
+      for (int64_t j = 0; j < nr; ++j) {
+        T& dst = c(row0 + r, col0 + j);
+        dst = CastValue<T>(alpha * acc[r][j] + beta * CastValue<AccT>(dst));
+      }
+    }
+  }
+}
+
+// Computes an MR x NR tile from packed panels in registers, then writes the
+// valid mr x nr corner back as C = alpha * AB + beta * C.
+template <typename T, typename AccT>
+void MicroKernel(int64_t kc,
+                 const AccT* a,
+                 const AccT* b,
+                 AccT alpha,
+                 AccT beta,
+                 const MatrixRef<T>& c,
+                 int64_t row0,
+                 int64_t col0,
+                 int64_t mr,
+                 int64_t nr) {
+  constexpr int64_t MR = GemmBlocking<AccT>::kMR;
+  constexpr int64_t NR = GemmBlocking<AccT>::kNR;
+  AccT acc[MR][NR] = {};
+  for (int64_t k = 0; k < kc; ++k) {
+    for (int64_t r = 0; r < MR; ++r) {
+      const AccT av = a[r];
+      for (int64_t j = 0; j < NR; ++j) {
+        acc[r][j] += av * b[j];
+      }
+    }
+    a += MR;
+    b += NR;
+  }
+  StoreTile(acc, alpha, beta, c, row0, col0, mr, nr);
+}
+
+#if defined(CUSTOM_CPU_F16C_DISPATCH)
+// The AVX2 micro kernels are compiled for their own target and chosen at run
+// time like the F16C conversions.
+inline bool CpuHasAvx2() {
+#if defined(__AVX2__)
+  return true;
+#else
+  static const bool has = __builtin_cpu_supports("avx2");
+  return has;
+#endif
+}
+
+inline bool CpuHasAvx2Fma() {
+#if defined(__AVX2__) && defined(__FMA__)
+  return true;
+#else
+  static const bool has =
+      __builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma");
+  return has;
+#endif
+}
+
+// Keeps the 6 x 16 tile in twelve ymm registers. Each k step loads the two
+// halves of the B row once and broadcasts the six A values into fused
+// multiply-adds. Full tiles of a dense float C are written back with vector
+// loads and stores.
+template <typename T>
+__attribute__((target("avx2,fma"))) void FloatMicroKernelAvx2(
+    int64_t kc,
+    const float* a,
+    const float* b,
+    float alpha,
+    float beta,
+    const MatrixRef<T>& c,
+    int64_t row0,
+    int64_t col0,
+    int64_t mr,
+    int64_t nr) {
+  static_assert(GemmBlocking<float>::kMR == 6 && GemmBlocking<float>::kNR == 16,
+                "the AVX2 float micro kernel holds a 6 x 16 register tile");
+  __m256 c00 = _mm256_setzero_ps(), c01 = _mm256_setzero_ps();
+  __m256 c10 = _mm256_setzero_ps(), c11 = _mm256_setzero_ps();
+  __m256 c20 = _mm256_setzero_ps(), c21 = _mm256_setzero_ps();
+  __m256 c30 = _mm256_setzero_ps(), c31 = _mm256_setzero_ps();
+  __m256 c40 = _mm256_setzero_ps(), c41 = _mm256_setzero_ps();
+  __m256 c50 = _mm256_setzero_ps(), c51 = _mm256_setzero_ps();
+  for (int64_t k = 0; k < kc; ++k) {
+    const __m256 b0 = _mm256_loadu_ps(b);
+    const __m256 b1 = _mm256_loadu_ps(b + 8);
+    __m256 av = _mm256_broadcast_ss(a);
+    c00 = _mm256_fmadd_ps(av, b0, c00);
+    c01 = _mm256_fmadd_ps(av, b1, c01);
+    av = _mm256_broadcast_ss(a + 1);
+    c10 = _mm256_fmadd_ps(av, b0, c10);
+    c11 = _mm256_fmadd_ps(av, b1, c11);
+    av = _mm256_broadcast_ss(a + 2);
+    c20 = _mm256_fmadd_ps(av, b0, c20);
+    c21 = _mm256_fmadd_ps(av, b1, c21);
+    av = _mm256_broadcast_ss(a + 3);
+    c30 = _mm256_fmadd_ps(av, b0, c30);
+    c31 = _mm256_fmadd_ps(av, b1, c31);
+    av = _mm256_broadcast_ss(a + 4);
+    c40 = _mm256_fmadd_ps(av, b0, c40);
+    c41 = _mm256_fmadd_ps(av, b1, c41);
+    av = _mm256_broadcast_ss(a + 5);
+    c50 = _mm256_fmadd_ps(av, b0, c50);
+    c51 = _mm256_fmadd_ps(av, b1, c51);
+    a += 6;
+    b += 16;
+  }
+
+  const __m256 rows[6][2] = {
+      {c00, c01}, {c10, c11}, {c20, c21}, {c30, c31}, {c40, c41}, {c50, c51}};
+  if (std::is_same<T, float>::value && c.col_stride == 1 && mr == 6 &&
+      nr == 16) {
+    const __m256 valpha = _mm256_set1_ps(alpha);
+    const __m256 vbeta = _mm256_set1_ps(beta);
+    for (int r = 0; r < 6; ++r) {
+      float* dst = reinterpret_cast<float*>(&c(row0 + r, col0));
+      __m256 lo = _mm256_mul_ps(valpha, rows[r][0]);
+      __m256 hi = _mm256_mul_ps(valpha, rows[r][1]);
+      if (beta != 0.f) {
+        lo = _mm256_fmadd_ps(vbeta, _mm256_loadu_ps(dst), lo);
+        hi = _mm256_fmadd_ps(vbeta, _mm256_loadu_ps(dst + 8), hi);
+      }
+      _mm256_storeu_ps(dst, lo);
+      _mm256_storeu_ps(dst + 8, hi);
+    }
+    return;
+  }
+  float acc[GemmBlocking<float>::kMR][GemmBlocking<float>::kNR];
+  for (int r = 0; r < 6; ++r) {
+    _mm256_storeu_ps(acc[r], rows[r][0]);
+    _mm256_storeu_ps(acc[r] + 8, rows[r][1]);
+  }
+  StoreTile(acc, alpha, beta, c, row0, col0, mr, nr);
+}
+#endif
+
+// The micro kernel StridedGemm uses for an output and accumulation type.
+template <typename T, typename AccT>
+struct MicroKernelFor {
+  using Fn = void (*)(int64_t,
+                      const AccT*,
+                      const AccT*,
+                      AccT,
+                      AccT,
+                      const MatrixRef<T>&,
+                      int64_t,
+                      int64_t,
+                      int64_t,
+                      int64_t);
+  static Fn Get() { return MicroKernel<T, AccT>; }
+};
+
+#if defined(CUSTOM_CPU_F16C_DISPATCH)
+template <typename T>
+struct MicroKernelFor<T, float> {
+  using Fn = void (*)(int64_t,
+                      const float*,
+                      const float*,
+                      float,
+                      float,
+                      const MatrixRef<T>&,
+                      int64_t,
+                      int64_t,
+                      int64_t,
+                      int64_t);
+  static Fn Get() {
+    return CpuHasAvx2Fma() ? FloatMicroKernelAvx2<T> : MicroKernel<T, float>;
+  }
+};
+#endif
+
+// Matrix-vector product for M == 1, where packing B would cost as much as the
+// product itself. Row-major B is streamed row by row into an accumulator row,
+// column-major B is reduced with contiguous dot products.
+template <typename T, typename AccT, typename OutT>
+void Gemv(int64_t N,
+          int64_t K,
+          AccT alpha,
+          const MatrixRef<const T>& a,
+          const MatrixRef<const T>& b,
+          AccT beta,
+          const MatrixRef<OutT>& c) {
+  ParallelFor(0, N, 256, [&](int64_t begin, int64_t end) {
+    std::vector<AccT> acc(end - begin, AccT(0));
+    if (b.col_stride == 1) {
+      // Rows of types that do not compute in themselves are converted into
+      // row_buf first, which keeps the update loop vectorizable.
+      const bool computes_in_t =
+          std::is_same<T, typename ComputeType<T>::type>::value;
+      std::vector<AccT> row_buf(computes_in_t ? 0 : end - begin);
+      for (int64_t k = 0; k < K; ++k) {
+        const AccT av = CastValue<AccT>(a(0, k));
+        const T* row = &b(k, begin);
+        if (row_buf.empty()) {
+          for (int64_t j = 0; j < end - begin; ++j) {
+            acc[j] += av * CastValue<AccT>(row[j]);
+          }
+        } else {
+          CastTile(row, row_buf.data(), end - begin);
+          for (int64_t j = 0; j < end - begin; ++j) {
+            acc[j] += av * row_buf[j];
+          }
+        }
+      }
+    } else {
+      for (int64_t j = begin; j < end; ++j) {
+        AccT sum = AccT(0);
+        for (int64_t k = 0; k < K; ++k) {
+          sum += CastValue<AccT>(a(0, k)) * CastValue<AccT>(b(k, j));
+        }
+        acc[j - begin] = sum;
+      }
+    }
+    for (int64_t j = begin; j < end; ++j) {
+      OutT& dst = c(0, j);
+      dst = beta == AccT(0) ? CastValue<OutT>(alpha * acc[j - begin])
+                            : CastValue<OutT>(alpha * acc[j - begin] +
+                                              beta * CastValue<AccT>(dst));
+    }
+  });
+}
+
+template <typename AccT>
+AlignedBuffer<AccT>& ThreadLocalPackA() {
+  static thread_local AlignedBuffer<AccT> buffer;
+  return buffer;
+}
+
+}  // namespace detail
+
+// C = alpha * A * B + beta * C where A is M x K, B is K x N and C is M x N,
+// each described by a strided MatrixRef. When beta is zero C is never read.
+// C is usually of the operand type, or of the accumulation type to keep the
+// exact int32 result of an int8 product. Work is split over blocks of M and N
+// on the shared thread pool; callers that already run inside the pool get a
+// serial GEMM.
+template <typename T, typename OutT>
+void StridedGemm(int64_t M,
+                 int64_t N,
+                 int64_t K,
+                 typename GemmAccType<T>::type alpha,
+                 const MatrixRef<const T>& a,
+                 const MatrixRef<const T>& b,
+                 typename GemmAccType<T>::type beta,
+                 const MatrixRef<OutT>& c) {
+  using AccT = typename GemmAccType<T>::type;
+  constexpr int64_t MR = GemmBlocking<AccT>::kMR;
+  constexpr int64_t NR = GemmBlocking<AccT>::kNR;
+  constexpr int64_t KC = GemmBlocking<AccT>::kKC;
+  constexpr int64_t MC = GemmBlocking<AccT>::kMC;
+  constexpr int64_t NC = GemmBlocking<AccT>::kNC;
+  if (M <= 0 || N <= 0) {
+    return;
+  }
+  if (K <= 0) {
+    for (int64_t i = 0; i < M; ++i) {
+      for (int64_t j = 0; j < N; ++j) {
+        c(i, j) = beta == AccT(0)
+                      ? OutT(0)
+                      : CastValue<OutT>(beta * CastValue<AccT>(c(i, j)));
+      }
+    }
+    return;
+  }
+
+  if (M == 1) {
+    detail::Gemv<T, AccT, OutT>(N, K, alpha, a, b, beta, c);
+    return;
+  }
+  if (N == 1) {
+    // C^T = B^T * A^T turns the matrix-vector product into the M == 1 case.
+    MatrixRef<const T> bt{b.data, b.col_stride, b.row_stride};
+    MatrixRef<const T> at{a.data, a.col_stride, a.row_stride};
+    MatrixRef<OutT> ct{c.data, c.col_stride, c.row_stride};
+    detail::Gemv<T, AccT, OutT>(M, K, alpha, bt, at, beta, ct);
+    return;
+  }
+
+  const auto micro_kernel = detail::MicroKernelFor<OutT, AccT>::Get();
+  const int num_threads = ThreadPool::Instance().NumThreads();
+  detail::AlignedBuffer<AccT> packed_b;
+
+  for (int64_t jc = 0; jc < N; jc += NC) {
+    const int64_t nc = std::min(NC, N - jc);
+    const int64_t nc_panels = (nc + NR - 1) / NR;
+    for (int64_t pc = 0; pc < K; pc += KC) {
+      const int64_t kc = std::min(KC, K - pc);
+      const AccT cur_beta = pc == 0 ? beta : AccT(1);
+      AccT* b_buf = packed_b.Get(nc_panels * NR * kc);
+
+      ParallelFor(0, nc_panels, 8, [&](int64_t begin, int64_t end) {
+        detail::PackB(b,
+                      pc,
+                      jc + begin * NR,
+                      kc,
+                      std::min(nc, end * NR) - begin * NR,
+                      b_buf + begin * NR * kc);
+      });
+
+      // Split the N panel into column groups when there are too few M blocks
+      // to keep every thread busy, e.g. for skinny GEMMs.
+      const int64_t m_blocks = (M + MC - 1) / MC;
+      int64_t n_groups = 1;
+      if (m_blocks < num_threads) {
+        n_groups = std::min<int64_t>(nc_panels,
+                                     (num_threads + m_blocks - 1) / m_blocks);
+      }
+      const int64_t panels_per_group = (nc_panels + n_groups - 1) / n_groups;
+      n_groups = (nc_panels + panels_per_group - 1) / panels_per_group;
+
+      ParallelFor(0, m_blocks * n_groups, 1, [&](int64_t begin, int64_t end) {
+        AccT* a_buf = detail::ThreadLocalPackA<AccT>().Get(
+            ((MC + MR - 1) / MR) * MR * kc);
+        int64_t packed_ic = -1;
+        for (int64_t task = begin; task < end; ++task) {
+          const int64_t ic = (task / n_groups) * MC;
+          const int64_t group = task % n_groups;
+          const int64_t mc = std::min(MC, M - ic);
+          if (packed_ic != ic) {
+            detail::PackA(a, ic, pc, mc, kc, a_buf);
+            packed_ic = ic;
+          }
+          const int64_t jr_begin = group * panels_per_group;
+          const int64_t jr_end =
+              std::min(nc_panels, jr_begin + panels_per_group);
+          for (int64_t jr = jr_begin; jr < jr_end; ++jr) {
+            const int64_t nr = std::min(NR, nc - jr * NR);
+            for (int64_t ir = 0; ir < mc; ir += MR) {
+              micro_kernel(kc,
+                           a_buf + ir * kc,
+                           b_buf + jr * NR * kc,
+                           alpha,
+                           cur_beta,
+                           c,
+                           ic + ir,
+                           jc + jr * NR,
+                           std::min(MR, mc - ir),
+                           nr);
+            }
+          }
+        }
+      });
+    }
+  }
+}
+
+// Row-major GEMM with optional transposed operands and a transposed (column
+// major) output, out = alpha * op(x) * op(y) + beta * out.
+template <typename T>
+void Gemm(bool trans_x,
+          bool trans_y,
+          int64_t M,
+          int64_t K,
+          int64_t N,
+          const T* x,
+          const T* y,
+          T* out,
+          bool trans_out = false,
+          typename GemmAccType<T>::type alpha = 1,
+          typename GemmAccType<T>::type beta = 0) {
+  MatrixRef<const T> a{x, trans_x ? 1 : K, trans_x ? M : 1};
+  MatrixRef<const T> b{y, trans_y ? 1 : N, trans_y ? K : 1};
+  MatrixRef<T> c{out, trans_out ? 1 : N, trans_out ? M : 1};
+  StridedGemm<T, T>(M, N, K, alpha, a, b, beta, c);
+}
+
+// Runs `batch_size` row-major GEMMs. A zero batch stride broadcasts an
+// operand over the batch. With reduce_batch all products are summed into a
+// single M x N output. Small independent problems are spread over the thread
+// pool one batch per task, larger ones parallelize inside each GEMM.
+template <typename T>
+void BatchedGemm(bool trans_x,
+                 bool trans_y,
+                 int64_t M,
+                 int64_t K,
+                 int64_t N,
+                 const T* x,
+                 int64_t x_batch_stride,
+                 const T* y,
+                 int64_t y_batch_stride,
+                 T* out,
+                 int64_t batch_size,
+                 bool trans_out = false,
+                 bool reduce_batch = false,
+                 typename GemmAccType<T>::type alpha = 1) {
+  using AccT = typename GemmAccType<T>::type;
+  if (batch_size <= 0) {
+    return;
+  }
+  if (reduce_batch) {
+    for (int64_t bs = 0; bs < batch_size; ++bs) {
+      Gemm<T>(trans_x,
+              trans_y,
+              M,
+              K,
+              N,
+              x + bs * x_batch_stride,
+              y + bs * y_batch_stride,
+              out,
+              trans_out,
+              alpha,
+              bs == 0 ? AccT(0) : AccT(1));
+    }
+    return;
+  }
+
+  const int64_t flops_per_batch = 2 * M * N * K;
+  const int64_t kParallelGemmFlops = 1 << 22;
+  const int64_t out_batch_stride = M * N;
+  auto run = [&](int64_t begin, int64_t end) {
+    for (int64_t bs = begin; bs < end; ++bs) {
+      Gemm<T>(trans_x,
+              trans_y,
+              M,
+              K,
+              N,
+              x + bs * x_batch_stride,
+              y + bs * y_batch_stride,
+              out + bs * out_batch_stride,
+              trans_out,
+              alpha);
+    }
+  };
+  if (flops_per_batch >= kParallelGemmFlops) {
+    run(0, batch_size);
+  } else {
+    ParallelFor(0, batch_size, 1, run);
+  }
+}
+
+// Blocking of the int8 GEMM. Both operands are packed as int16 pairs of
+// consecutive k, so that one 32-bit lane holds (x[k], x[k + 1]) and a
+// pairwise multiply-add of int16 lanes (pmaddwd) adds the products of two k
+// to an int32 accumulator. The packed panels take half the space of int32
+// ones and a register tile of MR x NR int32 needs 2 x 6 AVX2 accumulators.
+struct Int8GemmBlocking {
+  static constexpr int64_t kMR = 6;
+  static constexpr int64_t kNR = 16;
+  static constexpr int64_t kKC = 512;
+  static constexpr int64_t kMC = kMR * 24;
+  static constexpr int64_t kNC = kNR * 128;
+};
+
+namespace detail {
+
+// Packs an mc x kc block of A into panels of kMR rows. Each k pair is stored
+// as kMR (a[r][k], a[r][k + 1]) pairs, an odd kc and rows past the matrix
+// edge are zero padded.
+inline void PackInt8A(const MatrixRef<const int8_t>& a,
+                      int64_t row0,
+                      int64_t col0,
+                      int64_t mc,
+                      int64_t kc,
+                      int16_t* packed) {
+  constexpr int64_t MR = Int8GemmBlocking::kMR;
+  for (int64_t i = 0; i < mc; i += MR) {
+    const int64_t mr = std::min(MR, mc - i);
+    for (int64_t k = 0; k < kc; k += 2) {
+      const bool has_next = k + 1 < kc;
+      for (int64_t r = 0; r < mr; ++r) {
+        const int8_t* src = &a(row0 + i + r, col0 + k);
+        packed[2 * r] = src[0];
+        packed[2 * r + 1] = has_next ? src[a.col_stride] : 0;
+      }
+      for (int64_t r = mr; r < MR; ++r) {
+        packed[2 * r] = 0;
+        packed[2 * r + 1] = 0;
+      }
+      packed += 2 * MR;
+    }
+  }
+}
+
+// Packs a kc x nc panel of B into panels of kNR columns. Each k pair is
+// stored as kNR (b[k][j], b[k + 1][j]) pairs, zero padded like PackInt8A.
+inline void PackInt8B(const MatrixRef<const int8_t>& b,
+                      int64_t row0,
+                      int64_t col0,
+                      int64_t kc,
+                      int64_t nc,
+                      int16_t* packed) {
+  constexpr int64_t NR = Int8GemmBlocking::kNR;
+  const int64_t kc_even = (kc + 1) / 2 * 2;
+  for (int64_t j = 0; j < nc; j += NR) {
+    const int64_t nr = std::min(NR, nc - j);
+    int16_t* dst = packed + j * kc_even;
+    for (int64_t k = 0; k < kc; k += 2) {
+      const bool has_next = k + 1 < kc;
+      const int8_t* row = &b(row0 + k, col0 + j);
+      for (int64_t c = 0; c < nr; ++c) {
+        const int8_t* src = row + c * b.col_stride;
+        dst[2 * c] = src[0];
+        dst[2 * c + 1] = has_next ? src[b.row_stride] : 0;
+      }
+      for (int64_t c = nr; c < NR; ++c) {
+        dst[2 * c] = 0;
+        dst[2 * c + 1] = 0;
+      }
+      dst += 2 * NR;
+    }
+  }
+}
+
+// Writes the valid mr x nr corner of an int32 tile to c, or adds it to c for
+// every k block after the first.
+inline void StoreInt8Tile(
+    const int32_t (&acc)[Int8GemmBlocking::kMR][Int8GemmBlocking::kNR],
+    bool accumulate,
+    int32_t* c,
+    int64_t ldc,
+    int64_t mr,
+    int64_t nr) {
+  for (int64_t r = 0; r < mr; ++r) {
+    int32_t* dst = c + r * ldc;
+    if (accumulate) {
+      for (int64_t j = 0; j < nr; ++j) {
+        dst[j] += acc[r][j];
+      }
+    } else {
+      std::memcpy(dst, acc[r], nr * sizeof(int32_t));
+    }
+  }
+}
+
+// kp is the number of k pairs in the packed panels.
+inline void Int8MicroKernel(int64_t kp,
+                            const int16_t* a,
+                            const int16_t* b,
+                            bool accumulate,
+                            int32_t* c,
+                            int64_t ldc,
+                            int64_t mr,
+                            int64_t nr) {
+  constexpr int64_t MR = Int8GemmBlocking::kMR;
+  constexpr int64_t NR = Int8GemmBlocking::kNR;
+  int32_t acc[MR][NR] = {};
+  for (int64_t p = 0; p < kp; ++p) {
+    for (int64_t r = 0; r < MR; ++r) {
+      const int32_t a0 = a[2 * r];
+      const int32_t a1 = a[2 * r + 1];
+      for (int64_t j = 0; j < NR; ++j) {
+        acc[r][j] += a0 * b[2 * j] + a1 * b[2 * j + 1];
+      }
+    }
+    a += 2 * MR;
+    b += 2 * NR;
+  }
+  StoreInt8Tile(acc, accumulate, c, ldc, mr, nr);
+}
+
+#if defined(CUSTOM_CPU_F16C_DISPATCH)
+// Broadcasts the (a[r][k], a[r][k + 1]) pair of every row and multiplies it
+// into the 16 packed columns with vpmaddwd. The products of int8 values fit
+// int16 lanes without saturation, and each pair sum is exact in int32.
+__attribute__((target("avx2"))) inline void Int8MicroKernelAvx2(
+    int64_t kp,
+    const int16_t* a,
+    const int16_t* b,
+    bool accumulate,
+    int32_t* c,
+    int64_t ldc,
+    int64_t mr,
+    int64_t nr) {
+  static_assert(Int8GemmBlocking::kMR == 6 && Int8GemmBlocking::kNR == 16,
+                "the AVX2 int8 micro kernel holds a 6 x 16 register tile");
+  __m256i c00 = _mm256_setzero_si256(), c01 = _mm256_setzero_si256();
+  __m256i c10 = _mm256_setzero_si256(), c11 = _mm256_setzero_si256();
+  __m256i c20 = _mm256_setzero_si256(), c21 = _mm256_setzero_si256();
+  __m256i c30 = _mm256_setzero_si256(), c31 = _mm256_setzero_si256();
+  __m256i c40 = _mm256_setzero_si256(), c41 = _mm256_setzero_si256();
+  __m256i c50 = _mm256_setzero_si256(), c51 = _mm256_setzero_si256();
+  for (int64_t p = 0; p < kp; ++p) {
+    const __m256i b0 =
+        _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b));
+    const __m256i b1 =
+        _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b + 16));
+    int32_t pairs[6];
+    std::memcpy(pairs, a, sizeof(pairs));
+    __m256i av = _mm256_set1_epi32(pairs[0]);
+    c00 = _mm256_add_epi32(c00, _mm256_madd_epi16(av, b0));
+    c01 = _mm256_add_epi32(c01, _mm256_madd_epi16(av, b1));
+    av = _mm256_set1_epi32(pairs[1]);
+    c10 = _mm256_add_epi32(c10, _mm256_madd_epi16(av, b0));
+    c11 = _mm256_add_epi32(c11, _mm256_madd_epi16(av, b1));
+    av = _mm256_set1_epi32(pairs[2]);
+    c20 = _mm256_add_epi32(c20, _mm256_madd_epi16(av, b0));
+    c21 = _mm256_add_epi32(c21, _mm256_madd_epi16(av, b1));
+    av = _mm256_set1_epi32(pairs[3]);
+    c30 = _mm256_add_epi32(c30, _mm256_madd_epi16(av, b0));
+    c31 = _mm256_add_epi32(c31, _mm256_madd_epi16(av, b1));
+    av = _mm256_set1_epi32(pairs[4]);
+    c40 = _mm256_add_epi32(c40, _mm256_madd_epi16(av, b0));
+    c41 = _mm256_add_epi32(c41, _mm256_madd_epi16(av, b1));
+    av = _mm256_set1_epi32(pairs[5]);
+    c50 = _mm256_add_epi32(c50, _mm256_madd_epi16(av, b0));
+    c51 = _mm256_add_epi32(c51, _mm256_madd_epi16(av, b1));
+    a += 12;
+    b += 32;
+  }
+
+  const __m256i rows[6][2] = {
+      {c00, c01}, {c10, c11}, {c20, c21}, {c30, c31}, {c40, c41}, {c50, c51}};
+  if (mr == 6 && nr == 16) {
+    for (int r = 0; r < 6; ++r) {
+      __m256i* dst = reinterpret_cast<__m256i*>(c + r * ldc);
+      __m256i lo = rows[r][0];
+      __m256i hi = rows[r][1];
+      if (accumulate) {
+        lo = _mm256_add_epi32(lo, _mm256_loadu_si256(dst));
+        hi = _mm256_add_epi32(hi, _mm256_loadu_si256(dst + 1));
+      }
+      _mm256_storeu_si256(dst, lo);
+      _mm256_storeu_si256(dst + 1, hi);
+    }
+    return;
+  }
+  int32_t acc[Int8GemmBlocking::kMR][Int8GemmBlocking::kNR];
+  for (int r = 0; r < 6; ++r) {
+    _mm256_storeu_si256(reinterpret_cast<__m256i*>(acc[r]), rows[r][0]);
+    _mm256_storeu_si256(reinterpret_cast<__m256i*>(acc[r] + 8), rows[r][1]);
+  }
+  StoreInt8Tile(acc, accumulate, c, ldc, mr, nr);
+}
+#endif
+
+inline AlignedBuffer<int16_t>& ThreadLocalPackInt8A() {
+  static thread_local AlignedBuffer<int16_t> buffer;
+  return buffer;
+}
+
+// C = A * B into a dense M x N int32 matrix with the packed int16 pair
+// panels above. Blocking and the split over the thread pool follow
+// StridedGemm.
+inline void PackedInt8Gemm(int64_t M,
+                           int64_t N,
+                           int64_t K,
+                           const MatrixRef<const int8_t>& a,
+                           const MatrixRef<const int8_t>& b,
+                           int32_t* c) {
+  constexpr int64_t MR = Int8GemmBlocking::kMR;
+  constexpr int64_t NR = Int8GemmBlocking::kNR;
+  constexpr int64_t KC = Int8GemmBlocking::kKC;
+  constexpr int64_t MC = Int8GemmBlocking::kMC;
+  constexpr int64_t NC = Int8GemmBlocking::kNC;
+  auto micro_kernel = Int8MicroKernel;
+#if defined(CUSTOM_CPU_F16C_DISPATCH)
+  if (CpuHasAvx2()) {
+    micro_kernel = Int8MicroKernelAvx2;
+  }
+#endif
+
+  const int num_threads = ThreadPool::Instance().NumThreads();
+  AlignedBuffer<int16_t> packed_b;
+
+  for (int64_t jc = 0; jc < N; jc += NC) {
+    const int64_t nc = std::min(NC, N - jc);
+    const int64_t nc_panels = (nc + NR - 1) / NR;
+    for (int64_t pc = 0; pc < K; pc += KC) {
+      const int64_t kc = std::min(KC, K - pc);
+      const int64_t kc_even = (kc + 1) / 2 * 2;
+      int16_t* b_buf = packed_b.Get(nc_panels * NR * kc_even);
+
+      ParallelFor(0, nc_panels, 8, [&](int64_t begin, int64_t end) {
+        PackInt8B(b,
+                  pc,
+                  jc + begin * NR,
+                  kc,
+                  std::min(nc, end * NR) - begin * NR,
+                  b_buf + begin * NR * kc_even);
+      });
+
+      const int64_t m_blocks = (M + MC - 1) / MC;
+      int64_t n_groups = 1;
+      if (m_blocks < num_threads) {
+        n_groups = std::min<int64_t>(nc_panels,
+                                     (num_threads + m_blocks - 1) / m_blocks);
+      }
+      const int64_t panels_per_group = (nc_panels + n_groups - 1) / n_groups;
+      n_groups = (nc_panels + panels_per_group - 1) / panels_per_group;
+
+      ParallelFor(0, m_blocks * n_groups, 1, [&](int64_t begin, int64_t end) {
+        int16_t* a_buf =
+            ThreadLocalPackInt8A().Get(((MC + MR - 1) / MR) * MR * kc_even);
+        int64_t packed_ic = -1;
+        for (int64_t task = begin; task < end; ++task) {
+          const int64_t ic = (task / n_groups) * MC;
+          const int64_t group = task % n_groups;
+          const int64_t mc = std::min(MC, M - ic);
+          if (packed_ic != ic) {
+            PackInt8A(a, ic, pc, mc, kc, a_buf);
+            packed_ic = ic;
+          }
+          const int64_t jr_begin = group * panels_per_group;
+          const int64_t jr_end =
+              std::min(nc_panels, jr_begin + panels_per_group);
+          for (int64_t jr = jr_begin; jr < jr_end; ++jr) {
+            const int64_t nr = std::min(NR, nc - jr * NR);
+            for (int64_t ir = 0; ir < mc; ir += MR) {
+              micro_kernel(kc_even / 2,
+                           a_buf + ir * kc_even,
+                           b_buf + jr * NR * kc_even,
+                           pc != 0,
+                           c + (ic + ir) * N + jc + jr * NR,
+                           N,
+                           std::min(MR, mc - ir),
+                           nr);
+            }
+          }
+        }
+      });
+    }
+  }
+}
+
+}  // namespace detail
+
+// Largest reduction length for which an int8 product is exact in int32:
+// |x[m][k] * w[k][n]| <= 2^14, so K * 2^14 must stay below 2^31.
+constexpr int64_t kInt8GemmMaxK = (int64_t{1} << 17) - 1;
+
+// Quantized GEMM with a dequantizing epilogue,
+//   out[m][n] = (sum_k x[m][k] * w[k][n]) * scale[n] + (bias ? bias[n] : 0),
+// for int8 x (M x K, row-major) and w (K x N, or N x K with trans_w). The
+// products accumulate exactly in int32, which holds for K < 2^17 (see
+// kInt8GemmMaxK), and scale folds the activation and the per output channel
+// weight scales. Matrix-vector shapes go through the int32 GEMV, everything
+// else through the packed int16 pair kernel.
+inline void Int8Gemm(bool trans_w,
+                     int64_t M,
+                     int64_t K,
+                     int64_t N,
+                     const int8_t* x,
+                     const int8_t* w,
+                     const float* scale,
+                     const float* bias,
+                     float* out) {
+  std::vector<int32_t> acc(M * N);
+  MatrixRef<const int8_t> a{x, K, 1};
+  MatrixRef<const int8_t> b{w, trans_w ? 1 : N, trans_w ? K : 1};
+  if (M == 1 || N == 1 || K <= 0) {
+    MatrixRef<int32_t> c{acc.data(), N, 1};
+    StridedGemm<int8_t, int32_t>(M, N, K, 1, a, b, 0, c);
+  } else if (M > 0 && N > 0) {
+    detail::PackedInt8Gemm(M, N, K, a, b, acc.data());
+  }
+  ParallelFor(0,
+              M,
+              std::max<int64_t>(1, 4096 / std::max<int64_t>(N, 1)),
+              [&](int64_t begin, int64_t end) {
+                for (int64_t m = begin; m < end; ++m) {
+                  const int32_t* src = acc.data() + m * N;
+                  float* dst = out + m * N;
+                  for (int64_t n = 0; n < N; ++n) {
+                    dst[n] = static_cast<float>(src[n]) * scale[n] +
+                             (bias ? bias[n] : 0.0f);
+                  }
+                }
+              });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
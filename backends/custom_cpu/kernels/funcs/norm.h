@@ -0,0 +1,430 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <vector>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// A tensor normalized per channel, viewed as [outer, channels, inner]:
+// NCHW is [N, C, H * W] and NHWC is [N * H * W, C, 1].
+struct ChannelShape {
+  int64_t outer;
+  int64_t channels;
+  int64_t inner;
+
+  int64_t numel() const { return outer * channels * inner; }
+  // Elements reduced into each channel.
+  int64_t reduce_size() const { return outer * inner; }
+};
+
+namespace detail {
+
+// Row blocks of the deterministic column reductions. The block count is
+// fixed, so partial sums and their order do not depend on the thread count.
+constexpr int64_t kReduceBlocks = 64;
+
+// sum_a[c] and sum_b[c] are the sums of fa(i, c) and fb(i, c) over the
+// flat indices i of channel c, accumulated in double.
+template <typename FA, typename FB>
+void ChannelSums(const ChannelShape& s,
+                 const FA& fa,
+                 const FB& fb,
+                 std::vector<double>* sum_a,
+                 std::vector<double>* sum_b) {
+  const int64_t C = s.channels;
+  sum_a->assign(C, 0.0);
+  sum_b->assign(C, 0.0);
+  if (s.inner > 1) {
+    // Channel-first, every channel is a set of contiguous planes.
+    ParallelFor(0, C, 1, [&](int64_t begin, int64_t end) {
+      for (int64_t c = begin; c < end; ++c) {
+        double a = 0.0;
+        double b = 0.0;
+        for (int64_t o = 0; o < s.outer; ++o) {
+          const int64_t base = (o * C + c) * s.inner;
+          for (int64_t i = base; i < base + s.inner; ++i) {
+            a += fa(i, c);
+            b += fb(i, c);
+          }
+        }
+        (*sum_a)[c] = a;
+        (*sum_b)[c] = b;
+      }
+    });
+    return;
+  }
+  // Channel-last, rows of C values are reduced in fixed blocks of rows.
+  const int64_t rows_per_block = (s.outer + kReduceBlocks - 1) / kReduceBlocks;
+  const int64_t blocks =
+      rows_per_block == 0 ? 0 : (s.outer + rows_per_block - 1) / rows_per_block;
+  std::vector<double> partial(2 * blocks * C, 0.0);
+  ParallelFor(0, blocks, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t blk = begin; blk < end; ++blk) {
+      double* pa = partial.data() + 2 * blk * C;
+      double* pb = pa + C;
+      const int64_t r1 = std::min(s.outer, (blk + 1) * rows_per_block);
+      for (int64_t r = blk * rows_per_block; r < r1; ++r) {
+        for (int64_t c = 0; c < C; ++c) {
+          pa[c] += fa(r * C + c, c);
+          pb[c] += fb(r * C + c, c);
+        }
+      }
+    }
+  });
+  for (int64_t blk = 0; blk < blocks; ++blk) {
+    for (int64_t c = 0; c < C; ++c) {
+      (*sum_a)[c] += partial[2 * blk * C + c];
+      (*sum_b)[c] += partial[(2 * blk + 1) * C + c];
+    }
+  }
+}
+
+// y = x * a[c] + b[c] over the [outer, channels, inner] view.
+template <typename T>
+void ChannelAffine(const ChannelShape& s,
+                   const T* x,
+                   const std::vector<double>& a,
+                   const std::vector<double>& b,
+                   T* y) {
+  const int64_t C = s.channels;
+  const int64_t grain =
+      std::max<int64_t>(1, (1 << 14) / std::max<int64_t>(1, C * s.inner));
+  ParallelFor(0, s.outer, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t o = begin; o < end; ++o) {
+      for (int64_t c = 0; c < C; ++c) {
+        const int64_t base = (o * C + c) * s.inner;
+        const T ac = static_cast<T>(a[c]);
+        const T bc = static_cast<T>(b[c]);
+        for (int64_t i = base; i < base + s.inner; ++i) {
+          y[i] = x[i] * ac + bc;
+        }
+      }
+    }
+  });
+}
+
+}  // namespace detail
+
+// Training batch norm: normalizes with the statistics of the batch, updates
+// the running statistics as running = running * momentum + batch * (1 -
+// momentum) and saves the batch mean and 1 / sqrt(var + epsilon) for the
+// backward pass. `scale` and `bias` may be null (1 and 0). The running
+// outputs may alias their inputs.
+template <typename T>
+void BatchNormTrainForward(const ChannelShape& s,
+                           const T* x,
+                           const T* scale,
+                           const T* bias,
+                           const T* running_mean,
+                           const T* running_var,
+                           float momentum,
+                           float epsilon,
+                           T* y,
+                           T* running_mean_out,
+                           T* running_var_out,
+                           T* saved_mean,
+                           T* saved_inv_std) {
+  const int64_t C = s.channels;
+  const double m = static_cast<double>(std::max<int64_t>(1, s.reduce_size()));
+  std::vector<double> sum;
+  std::vector<double> unused;
+  detail::ChannelSums(
+      s,
+      [&](int64_t i, int64_t) { return static_cast<double>(x[i]); },
+      [](int64_t, int64_t) { return 0.0; },
+      &sum,
+      &unused);
+  std::vector<double> mean(C);
+  for (int64_t c = 0; c < C; ++c) {
+    mean[c] = sum[c] / m;
+  }
+  // Centered second pass, no cancellation for inputs with a large mean.
+  std::vector<double> sq_sum;
+  detail::ChannelSums(
+      s,
+      [&](int64_t i, int64_t c) {
+        const double d = static_cast<double>(x[i]) - mean[c];
+        return d * d;
+      },
+      [](int64_t, int64_t) { return 0.0; },
+      &sq_sum,
+      &unused);
+
+  std::vector<double> a(C);
+  std::vector<double> b(C);
+  for (int64_t c = 0; c < C; ++c) {
+    const double var = sq_sum[c] / m;
+    const double inv_std = 1.0 / std::sqrt(var + epsilon);
+    const double gamma = scale ? static_cast<double>(scale[c]) : 1.0;
+    const double beta = bias ? static_cast<double>(bias[c]) : 0.0;
+    a[c] = gamma * inv_std;
+    b[c] = beta - mean[c] * a[c];
+    running_mean_out[c] =
+        static_cast<T>(static_cast<double>(running_mean[c]) * momentum +
+                       mean[c] * (1.0 - momentum));
+    running_var_out[c] =
+        static_cast<T>(static_cast<double>(running_var[c]) * momentum +
+                       var * (1.0 - momentum));
+    saved_mean[c] = static_cast<T>(mean[c]);
+    saved_inv_std[c] = static_cast<T>(inv_std);
+  }
+  detail::ChannelAffine(s, x, a, b, y);
+}
+
+// Inference batch norm with the given statistics, y = (x - mean) /
+// sqrt(var + epsilon) * scale + bias folded into one multiply-add.
+template <typename T>
+void BatchNormInferForward(const ChannelShape& s,
+                           const T* x,
+                           const T* scale,
+                           const T* bias,
+                           const T* mean,
+                           const T* var,
+                           float epsilon,
+                           T* y) {
+  const int64_t C = s.channels;
+  std::vector<double> a(C);
+  std::vector<double> b(C);
+  for (int64_t c = 0; c < C; ++c) {
+    const double inv_std =
+        1.0 / std::sqrt(static_cast<double>(var[c]) + epsilon);
+    const double gamma = scale ? static_cast<double>(scale[c]) : 1.0;
+    const double beta = bias ? static_cast<double>(bias[c]) : 0.0;
+    a[c] = gamma * inv_std;
+    b[c] = beta - static_cast<double>(mean[c]) * a[c];
+  }
+  detail::ChannelAffine(s, x, a, b, y);
+}
+
+// Gradient of batch norm given the mean and 1 / sqrt(var + epsilon) used in
+// the forward pass. With batch statistics the mean and variance depend on x:
+//   dx = scale * inv_std * (dy - mean(dy) - x_hat * mean(dy * x_hat)),
+// with global statistics they are constants and dx = scale * inv_std * dy.
+// Any of dx, dscale and dbias may be null.
+template <typename T>
+void BatchNormBackward(const ChannelShape& s,
+                       const T* x,
+                       const T* scale,
+                       const T* mean,
+                       const T* inv_std,
+                       const T* dy,
+                       bool batch_stats,
+                       T* dx,
+                       T* dscale,
+                       T* dbias) {
+  const int64_t C = s.channels;
+  const double m = static_cast<double>(std::max<int64_t>(1, s.reduce_size()));
+  std::vector<double> dy_sum;
+  std::vector<double> dy_xhat_sum;
+  detail::ChannelSums(
+      s,
+      [&](int64_t i, int64_t) { return static_cast<double>(dy[i]); },
+      [&](int64_t i, int64_t c) {
+        return static_cast<double>(dy[i]) *
+               (static_cast<double>(x[i]) - static_cast<double>(mean[c])) *
+               static_cast<double>(inv_std[c]);
+      },
+      &dy_sum,
+      &dy_xhat_sum);
+  for (int64_t c = 0; c < C; ++c) {
+    if (dscale) {
+      dscale[c] = static_cast<T>(dy_xhat_sum[c]);
+    }
+    if (dbias) {
+      dbias[c] = static_cast<T>(dy_sum[c]);
+    }
+  }
+  if (dx == nullptr) {
+    return;
+  }
+
+  // dx = k1 * dy + k2 * x + k3 per channel.
+  std::vector<double> k1(C);
+  std::vector<double> k2(C);
+  std::vector<double> k3(C);
+  for (int64_t c = 0; c < C; ++c) {
+    const double gamma = scale ? static_cast<double>(scale[c]) : 1.0;
+    const double istd = static_cast<double>(inv_std[c]);
+    k1[c] = gamma * istd;
+    if (batch_stats) {
+      // x_hat = (x - mean) * istd, folded into the linear form.
+      const double coef = k1[c] * istd * dy_xhat_sum[c] / m;
+      k2[c] = -coef;
+      k3[c] = coef * static_cast<double>(mean[c]) - k1[c] * dy_sum[c] / m;
+    } else {
+      k2[c] = 0.0;
+      k3[c] = 0.0;
+    }
+  }
+  const int64_t grain =
+      std::max<int64_t>(1, (1 << 14) / std::max<int64_t>(1, C * s.inner));
+  ParallelFor(0, s.outer, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t o = begin; o < end; ++o) {
+      for (int64_t c = 0; c < C; ++c) {
+        const int64_t base = (o * C + c) * s.inner;
+        const T a = static_cast<T>(k1[c]);
+        const T b = static_cast<T>(k2[c]);
+        const T d = static_cast<T>(k3[c]);
+        for (int64_t i = base; i < base + s.inner; ++i) {
+          dx[i] = a * dy[i] + b * x[i] + d;
+        }
+      }
+    }
+  });
+}
+
+// Layer norm over the last `cols` elements of each of `rows` rows. `scale`
+// and `bias` of length `cols` may be null. Saves the mean and the biased
+// variance of every row.
+template <typename T>
+void LayerNormForward(int64_t rows,
+                      int64_t cols,
+                      const T* x,
+                      const T* scale,
+                      const T* bias,
+                      float epsilon,
+                      T* y,
+                      T* mean,
+                      T* var) {
+  const int64_t grain =
+      std::max<int64_t>(1, (1 << 14) / std::max<int64_t>(1, cols));
+  ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t r = begin; r < end; ++r) {
+      const T* src = x + r * cols;
+      T* dst = y + r * cols;
+      double sum = 0.0;
+      for (int64_t j = 0; j < cols; ++j) {
+        sum += static_cast<double>(src[j]);
+      }
+      const double mu = cols > 0 ? sum / cols : 0.0;
+      double sq_sum = 0.0;
+      for (int64_t j = 0; j < cols; ++j) {
+        const double d = static_cast<double>(src[j]) - mu;
+        sq_sum += d * d;
+      }
+      const double sigma2 = cols > 0 ? sq_sum / cols : 0.0;
+      const T inv_std = static_cast<T>(1.0 / std::sqrt(sigma2 + epsilon));
+      const T mu_t = static_cast<T>(mu);
+      for (int64_t j = 0; j < cols; ++j) {
+        T v = (src[j] - mu_t) * inv_std;
+        if (scale) {
+          v *= scale[j];
+        }
+        if (bias) {
+          v += bias[j];
+        }
+        dst[j] = v;
+      }
+      if (mean) {
+        mean[r] = mu_t;
+      }
+      if (var) {
+        var[r] = static_cast<T>(sigma2);
+      }
+    }
+  });
+}
+
+// Gradient of LayerNormForward. Per row, with g = dy * scale,
+//   dx = inv_std * (g - mean(g) - x_hat * mean(g * x_hat)),
+// dscale and dbias are column sums of dy * x_hat and dy, reduced in fixed row
+// blocks so the result does not depend on the thread count. Any of dx,
+// dscale and dbias may be null.
+template <typename T>
+void LayerNormBackward(int64_t rows,
+                       int64_t cols,
+                       const T* x,
+                       const T* scale,
+                       const T* mean,
+                       const T* var,
+                       const T* dy,
+                       float epsilon,
+                       T* dx,
+                       T* dscale,
+                       T* dbias) {
+  const bool param_grad = dscale != nullptr || dbias != nullptr;
+  const int64_t rows_per_block = std::max<int64_t>(
+      1, (rows + detail::kReduceBlocks - 1) / detail::kReduceBlocks);
+  const int64_t blocks = (rows + rows_per_block - 1) / rows_per_block;
+  std::vector<double> partial(param_grad ? 2 * blocks * cols : 0, 0.0);
+  ParallelFor(0, blocks, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t blk = begin; blk < end; ++blk) {
+      double* p_scale = param_grad ? partial.data() + 2 * blk * cols : nullptr;
+      double* p_bias = param_grad ? p_scale + cols : nullptr;
+      const int64_t r1 = std::min(rows, (blk + 1) * rows_per_block);
+      for (int64_t r = blk * rows_per_block; r < r1; ++r) {
+        const T* src = x + r * cols;
+        const T* grad = dy + r * cols;
+        const double mu = static_cast<double>(mean[r]);
+        const double inv_std =
+            1.0 / std::sqrt(static_cast<double>(var[r]) + epsilon);
+        if (param_grad) {
+          for (int64_t j = 0; j < cols; ++j) {
+            const double g = static_cast<double>(grad[j]);
+            p_scale[j] += g * (static_cast<double>(src[j]) - mu) * inv_std;
+            p_bias[j] += g;
+          }
+        }
+        if (dx == nullptr) {
+          continue;
+        }
+        double g_sum = 0.0;
+        double g_xhat_sum = 0.0;
+        for (int64_t j = 0; j < cols; ++j) {
+          const double g = static_cast<double>(grad[j]) *
+                           (scale ? static_cast<double>(scale[j]) : 1.0);
+          g_sum += g;
+          g_xhat_sum += g * (static_cast<double>(src[j]) - mu) * inv_std;
+        }
+        const double g_mean = g_sum / cols;
+        const double g_xhat_mean = g_xhat_sum / cols;
+        T* dst = dx + r * cols;
+        for (int64_t j = 0; j < cols; ++j) {
+          const double g = static_cast<double>(grad[j]) *
+                           (scale ? static_cast<double>(scale[j]) : 1.0);
+          const double xhat = (static_cast<double>(src[j]) - mu) * inv_std;
+          dst[j] = static_cast<T>(inv_std * (g - g_mean - xhat * g_xhat_mean));
+        }
+      }
+    }
+  });
+  if (!param_grad) {
+    return;
+  }
+  for (int64_t j = 0; j < cols; ++j) {
+    double s_scale = 0.0;
+    double s_bias = 0.0;
+    for (int64_t blk = 0; blk < blocks; ++blk) {
+      s_scale += partial[2 * blk * cols + j];
+      s_bias += partial[(2 * blk + 1) * cols + j];
+    }
+    if (dscale) {
+      dscale[j] = static_cast<T>(s_scale);
+    }
+    if (dbias) {
+      dbias[j] = static_cast<T>(s_bias);
+    }
+  }
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
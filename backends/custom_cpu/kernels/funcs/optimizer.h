@@ -0,0 +1,170 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <type_traits>
+
+#include "kernels/funcs/cast.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Type the optimizer math runs in, 16-bit floating point parameters are
+// updated in float.
+template <typename T>
+struct OptimizerMathType {
+  using type = typename std::
+      conditional<std::is_same<T, double>::value, double, float>::type;
+};
+
+template <typename MT>
+struct AdamConfig {
+  MT beta1;
+  MT beta2;
+  MT epsilon;
+  MT lr;
+  MT beta1_pow;
+  MT beta2_pow;
+  // Decoupled weight decay (AdamW), the parameter is scaled by 1 - decay
+  // before the Adam step. 0 for Adam.
+  MT decay;
+};
+
+namespace detail {
+
+// Optimizer steps are memory bound, a task should stream enough bytes to
+// amortize the dispatch.
+constexpr int64_t kOptimizerGrain = 1 << 14;
+
+}  // namespace detail
+
+// One Adam step on n elements:
+//   m1 = beta1 * m1 + (1 - beta1) * g
+//   m2 = beta2 * m2 + (1 - beta2) * g^2
+//   p  = p * (1 - decay)
+//        - lr / (1 - beta1_pow) * m1 / (sqrt(m2 / (1 - beta2_pow)) + eps)
+// `master` is the MT copy of a 16-bit parameter and may be null. When set,
+// the step reads it instead of `param` and writes both master_out and
+// param_out, rounded like the cast op. `moment2_max` is set for AMSGrad,
+// which keeps the running maximum of m2 and divides by it instead of m2.
+template <typename T, typename MomT, typename MT>
+void AdamUpdate(const AdamConfig<MT>& config,
+                int64_t n,
+                const T* grad,
+                const T* param,
+                const MT* master,
+                const MomT* moment1,
+                const MomT* moment2,
+                const MomT* moment2_max,
+                T* param_out,
+                MT* master_out,
+                MomT* moment1_out,
+                MomT* moment2_out,
+                MomT* moment2_max_out) {
+  const MT one = static_cast<MT>(1);
+  const MT beta1 = config.beta1;
+  const MT beta2 = config.beta2;
+  const MT epsilon = config.epsilon;
+  const MT step = -config.lr / (one - config.beta1_pow);
+  const MT bias2 = one / std::sqrt(one - config.beta2_pow);
+  const MT keep = one - config.decay;
+  auto update = [&](int64_t i, MT p) {
+    const MT g = CastValue<MT>(grad[i]);
+    const MT m1 = beta1 * CastValue<MT>(moment1[i]) + (one - beta1) * g;
+    const MT m2 = beta2 * CastValue<MT>(moment2[i]) + (one - beta2) * g * g;
+    moment1_out[i] = CastValue<MomT>(m1);
+    moment2_out[i] = CastValue<MomT>(m2);
+    MT denom = m2;
+    if (moment2_max) {
+      denom = std::max(CastValue<MT>(moment2_max[i]), m2);
+      moment2_max_out[i] = CastValue<MomT>(denom);
+    }
+    return p * keep + step * m1 / (std::sqrt(denom) * bias2 + epsilon);
+  };
+  ParallelFor(0, n, detail::kOptimizerGrain, [&](int64_t begin, int64_t end) {
+    if (master) {
+      for (int64_t i = begin; i < end; ++i) {
+        const MT p = update(i, master[i]);
+        master_out[i] = p;
+        param_out[i] = CastValue<T>(p);
+      }
+    } else {
+      for (int64_t i = begin; i < end; ++i) {
+        param_out[i] = CastValue<T>(update(i, CastValue<MT>(param[i])));
+      }
+    }
+  });
+}
+
+template <typename MT>
+struct MomentumConfig {
+  MT mu;
+  MT lr;
+  MT rescale_grad;
+  // Coefficient of the L2 regularization folded into the gradient, 0 for
+  // none.
+  MT l2_coeff;
+  bool use_nesterov;
+};
+
+// One momentum step on n elements:
+//   g = g * rescale_grad + l2_coeff * p
+//   v = mu * v + g
+//   p = p - lr * (nesterov ? g + mu * v : v)
+// `master` has the same meaning as for AdamUpdate.
+template <typename T, typename VelT, typename MT>
+void MomentumUpdate(const MomentumConfig<MT>& config,
+                    int64_t n,
+                    const T* grad,
+                    const T* param,
+                    const MT* master,
+                    const VelT* velocity,
+                    T* param_out,
+                    MT* master_out,
+                    VelT* velocity_out) {
+  const MT mu = config.mu;
+  const MT lr = config.lr;
+  const MT rescale = config.rescale_grad;
+  const MT l2 = config.l2_coeff;
+  // Nesterov moves by g + mu * v instead of v.
+  const MT g_weight = config.use_nesterov ? static_cast<MT>(1) : 0;
+  const MT v_weight = config.use_nesterov ? mu : static_cast<MT>(1);
+  auto update = [&](int64_t i, MT p) {
+    const MT g = CastValue<MT>(grad[i]) * rescale + l2 * p;
+    const MT v = mu * CastValue<MT>(velocity[i]) + g;
+    velocity_out[i] = CastValue<VelT>(v);
+    return p - lr * (g_weight * g + v_weight * v);
+  };
+  ParallelFor(0, n, detail::kOptimizerGrain, [&](int64_t begin, int64_t end) {
+    if (master) {
+      for (int64_t i = begin; i < end; ++i) {
+        const MT p = update(i, master[i]);
+        master_out[i] = p;
+        param_out[i] = CastValue<T>(p);
+      }
+    } else {
+      for (int64_t i = begin; i < end; ++i) {
+        param_out[i] = CastValue<T>(update(i, CastValue<MT>(param[i])));
+      }
+    }
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
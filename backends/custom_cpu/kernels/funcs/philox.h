@@ -0,0 +1,245 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <type_traits>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Counter-based random numbers with Philox4x32-10 (Salmon et al., "Parallel
+// Random Numbers: As Easy as 1, 2, 3", SC'11).
+//
+// A stream is identified by (seed, offset): block b of the stream is the
+// encryption of the counter (b, offset) under the key seed and yields four
+// 32-bit words. Element i of an output only depends on block i / per_block,
+// so any range of the output can be generated independently and results do
+// not depend on the number of threads.
+struct PhiloxState {
+  uint64_t seed;
+  uint64_t offset;
+};
+
+namespace detail {
+
+constexpr uint32_t kPhiloxM0 = 0xD2511F53u;
+constexpr uint32_t kPhiloxM1 = 0xCD9E8D57u;
+constexpr uint32_t kPhiloxW0 = 0x9E3779B9u;
+constexpr uint32_t kPhiloxW1 = 0xBB67AE85u;
+// Blocks generated together, the rounds run element-wise over the lanes so
+// the 32x32->64 bit multiplies vectorize.
+constexpr int kPhiloxLanes = 8;
+constexpr int64_t kRandomGrain = 1 << 12;
+
+// words[w][l] is word w of block `block + l`.
+inline void PhiloxBlocks(const PhiloxState& state,
+                         uint64_t block,
+                         uint32_t words[4][kPhiloxLanes]) {
+  uint32_t c0[kPhiloxLanes], c1[kPhiloxLanes], c2[kPhiloxLanes],
+      c3[kPhiloxLanes];
+  for (int l = 0; l < kPhiloxLanes; ++l) {
+    c0[l] = static_cast<uint32_t>(block + l);
+    c1[l] = static_cast<uint32_t>((block + l) >> 32);
+    c2[l] = static_cast<uint32_t>(state.offset);
+    c3[l] = static_cast<uint32_t>(state.offset >> 32);
+  }
+  uint32_t k0 = static_cast<uint32_t>(state.seed);
+  uint32_t k1 = static_cast<uint32_t>(state.seed >> 32);
+  for (int round = 0; round < 10; ++round) {
+    for (int l = 0; l < kPhiloxLanes; ++l) {
+      const uint64_t p0 = static_cast<uint64_t>(kPhiloxM0) * c0[l];
+      const uint64_t p1 = static_cast<uint64_t>(kPhiloxM1) * c2[l];
+      const uint32_t n0 = static_cast<uint32_t>(p1 >> 32) ^ c1[l] ^ k0;
+      const uint32_t n2 = static_cast<uint32_t>(p0 >> 32) ^ c3[l] ^ k1;
+      c1[l] = static_cast<uint32_t>(p1);
+      c3[l] = static_cast<uint32_t>(p0);
+      c0[l] = n0;
+      c2[l] = n2;
+    }
+    k0 += kPhiloxW0;
+    k1 += kPhiloxW1;
+  }
+  for (int l = 0; l < kPhiloxLanes; ++l) {
+    words[0][l] = c0[l];
+    words[1][l] = c1[l];
+    words[2][l] = c2[l];
+    words[3][l] = c3[l];
+  }
+}
+
+// Uniform in [0, 1) from the top 24 bits of a word.
+inline float ToUniformFloat(uint32_t x) {
+  return static_cast<float>(x >> 8) * (1.0f / 16777216.0f);
+}
+
+// Uniform in [0, 1) with 53 random bits.
+inline double ToUniformDouble(uint32_t hi, uint32_t lo) {
+  const uint64_t bits = (static_cast<uint64_t>(hi) << 32) | lo;
+  return static_cast<double>(bits >> 11) * (1.0 / 9007199254740992.0);
+}
+
+// Box-Muller needs u1 in (0, 1] for the logarithm.
+template <typename T>
+inline void BoxMuller(T u1, T u2, T* z0, T* z1) {
+  const T r = std::sqrt(static_cast<T>(-2) * std::log(u1));
+  const T theta = static_cast<T>(6.283185307179586476925) * u2;
+  *z0 = r * std::cos(theta);
+  *z1 = r * std::sin(theta);
+}
+
+}  // namespace detail
+
+// Calls fn(i, words, count) for every block of the stream, where words are
+// the four words of the block that provides elements [i, i + count) of an
+// n-element output, count == kPerBlock except for the last block.
+template <int kPerBlock, typename Fn>
+void PhiloxFor(const PhiloxState& state, int64_t n, const Fn& fn) {
+  const int64_t blocks = (n + kPerBlock - 1) / kPerBlock;
+  const int64_t grain =
+      std::max<int64_t>(detail::kPhiloxLanes, detail::kRandomGrain / kPerBlock);
+  ParallelFor(0, blocks, grain, [&](int64_t begin, int64_t end) {
+    uint32_t words[4][detail::kPhiloxLanes];
+    for (int64_t b0 = begin; b0 < end; b0 += detail::kPhiloxLanes) {
+      detail::PhiloxBlocks(state, static_cast<uint64_t>(b0), words);
+      const int64_t lanes = std::min<int64_t>(detail::kPhiloxLanes, end - b0);
+      for (int64_t l = 0; l < lanes; ++l) {
+        const uint32_t w[4] = {
+            words[0][l], words[1][l], words[2][l], words[3][l]};
+        const int64_t i = (b0 + l) * kPerBlock;
+        fn(i, w, static_cast<int>(std::min<int64_t>(kPerBlock, n - i)));
+      }
+    }
+  });
+}
+
+namespace detail {
+
+template <typename T>
+void UniformFill(const PhiloxState& state,
+                 T* out,
+                 int64_t n,
+                 double min,
+                 double max,
+                 std::false_type /* is_double */) {
+  const float lo = static_cast<float>(min);
+  const float range = static_cast<float>(max - min);
+  PhiloxFor<4>(state, n, [&](int64_t i, const uint32_t* w, int count) {
+    for (int k = 0; k < count; ++k) {
+      out[i + k] = static_cast<T>(lo + ToUniformFloat(w[k]) * range);
+    }
+  });
+}
+
+inline void UniformFill(const PhiloxState& state,
+                        double* out,
+                        int64_t n,
+                        double min,
+                        double max,
+                        std::true_type /* is_double */) {
+  const double range = max - min;
+  PhiloxFor<2>(state, n, [&](int64_t i, const uint32_t* w, int count) {
+    for (int k = 0; k < count; ++k) {
+      out[i + k] = min + ToUniformDouble(w[2 * k], w[2 * k + 1]) * range;
+    }
+  });
+}
+
+template <typename T>
+void GaussianFill(const PhiloxState& state,
+                  T* out,
+                  int64_t n,
+                  double mean,
+                  double std,
+                  std::false_type /* is_double */) {
+  const float mu = static_cast<float>(mean);
+  const float sigma = static_cast<float>(std);
+  PhiloxFor<4>(state, n, [&](int64_t i, const uint32_t* w, int count) {
+    float z[4];
+    for (int k = 0; k < 4; k += 2) {
+      BoxMuller(1.0f - ToUniformFloat(w[k]),
+                ToUniformFloat(w[k + 1]),
+                &z[k],
+                &z[k + 1]);
+    }
+    for (int k = 0; k < count; ++k) {
+      out[i + k] = static_cast<T>(mu + z[k] * sigma);
+    }
+  });
+}
+
+inline void GaussianFill(const PhiloxState& state,
+                         double* out,
+                         int64_t n,
+                         double mean,
+                         double std,
+                         std::true_type /* is_double */) {
+  PhiloxFor<2>(state, n, [&](int64_t i, const uint32_t* w, int count) {
+    double z[2];
+    BoxMuller(1.0 - ToUniformDouble(w[0], w[1]),
+              ToUniformDouble(w[2], w[3]),
+              &z[0],
+              &z[1]);
+    for (int k = 0; k < count; ++k) {
+      out[i + k] = mean + z[k] * std;
+    }
+  });
+}
+
+}  // namespace detail
+
+// out[i] ~ U[min, max). double uses 53 random bits per element, other types
+// are drawn as float and rounded.
+template <typename T>
+void UniformFill(
+    const PhiloxState& state, T* out, int64_t n, double min, double max) {
+  detail::UniformFill(state, out, n, min, max, std::is_same<T, double>());
+}
+
+// out[i] ~ N(mean, std^2), with Box-Muller on pairs of uniforms.
+template <typename T>
+void GaussianFill(
+    const PhiloxState& state, T* out, int64_t n, double mean, double std) {
+  detail::GaussianFill(state, out, n, mean, std, std::is_same<T, double>());
+}
+
+// Dropout in training mode: mask[i] = 1 with probability 1 - p, and
+// out[i] = x[i] * mask[i] * scale.
+template <typename T>
+void DropoutFill(const PhiloxState& state,
+                 const T* x,
+                 T* out,
+                 uint8_t* mask,
+                 int64_t n,
+                 double p,
+                 T scale) {
+  // An element is dropped when its word is below p * 2^32.
+  const uint64_t threshold =
+      static_cast<uint64_t>(std::min(std::max(p, 0.0), 1.0) * 4294967296.0);
+  PhiloxFor<4>(state, n, [&](int64_t i, const uint32_t* w, int count) {
+    for (int k = 0; k < count; ++k) {
+      const bool keep = w[k] >= threshold;
+      mask[i + k] = keep ? 1 : 0;
+      out[i + k] = keep ? x[i + k] * scale : static_cast<T>(0);
+    }
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
@@ -0,0 +1,223 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Geometry of an NCHW 2D pooling. With `adaptive` the windows split the
+// input evenly into out_h x out_w bins and kernel, stride and padding are
+// ignored.
+struct Pool2DShape {
+  int64_t planes;  // batch * channels
+  int64_t in_h;
+  int64_t in_w;
+  int64_t out_h;
+  int64_t out_w;
+  int64_t kernel_h;
+  int64_t kernel_w;
+  int64_t stride_h;
+  int64_t stride_w;
+  int64_t pad_top;
+  int64_t pad_left;
+  bool adaptive;
+  // Average over the valid taps only instead of the full kernel.
+  bool exclusive;
+
+  int64_t in_plane() const { return in_h * in_w; }
+  int64_t out_plane() const { return out_h * out_w; }
+};
+
+enum class PoolType { kMax, kAvg };
+
+namespace detail {
+
+// Clamped input window [begin, end) of output index `o` along one axis.
+// `extent` is the window length counted by a non-exclusive average, which
+// includes the padding before and after the input but not the part of a
+// ceil_mode window that hangs past the padding.
+inline void PoolWindow(int64_t o,
+                       int64_t in,
+                       int64_t out,
+                       int64_t kernel,
+                       int64_t stride,
+                       int64_t pad,
+                       bool adaptive,
+                       int64_t* begin,
+                       int64_t* end,
+                       int64_t* extent) {
+  if (adaptive) {
+    *begin = o * in / out;
+    *end = ((o + 1) * in + out - 1) / out;
+    *extent = *end - *begin;
+  } else {
+    const int64_t start = o * stride - pad;
+    const int64_t stop = std::min(start + kernel, in + pad);
+    *extent = stop - start;
+    *begin = std::max<int64_t>(start, 0);
+    *end = std::min(stop, in);
+  }
+}
+
+// Planes per task, so that a task covers at least ~16K window taps.
+inline int64_t PoolGrain(const Pool2DShape& s) {
+  const int64_t work =
+      std::max<int64_t>(1, s.out_plane() * s.kernel_h * s.kernel_w);
+  return std::max<int64_t>(1, (1 << 14) / work);
+}
+
+}  // namespace detail
+
+// Max or average pooling, the planes are spread over the thread pool.
+template <typename T>
+void Pool2DForward(const Pool2DShape& s, PoolType type, const T* x, T* out) {
+  ParallelFor(
+      0, s.planes, detail::PoolGrain(s), [&](int64_t begin, int64_t end) {
+        for (int64_t p = begin; p < end; ++p) {
+          const T* src = x + p * s.in_plane();
+          T* dst = out + p * s.out_plane();
+          for (int64_t oh = 0; oh < s.out_h; ++oh) {
+            int64_t h0, h1, h_extent;
+            detail::PoolWindow(oh,
+                               s.in_h,
+                               s.out_h,
+                               s.kernel_h,
+                               s.stride_h,
+                               s.pad_top,
+                               s.adaptive,
+                               &h0,
+                               &h1,
+                               &h_extent);
+            for (int64_t ow = 0; ow < s.out_w; ++ow) {
+              int64_t w0, w1, w_extent;
+              detail::PoolWindow(ow,
+                                 s.in_w,
+                                 s.out_w,
+                                 s.kernel_w,
+                                 s.stride_w,
+                                 s.pad_left,
+                                 s.adaptive,
+                                 &w0,
+                                 &w1,
+                                 &w_extent);
+              if (type == PoolType::kMax) {
+                T v = std::numeric_limits<T>::lowest();
+                for (int64_t h = h0; h < h1; ++h) {
+                  for (int64_t w = w0; w < w1; ++w) {
+                    v = std::max(v, src[h * s.in_w + w]);
+                  }
+                }
+                dst[oh * s.out_w + ow] = v;
+              } else {
+                T sum = T(0);
+                for (int64_t h = h0; h < h1; ++h) {
+                  for (int64_t w = w0; w < w1; ++w) {
+                    sum += src[h * s.in_w + w];
+                  }
+                }
+                const int64_t count = s.exclusive || s.adaptive
+                                          ? (h1 - h0) * (w1 - w0)
+                                          : h_extent * w_extent;
+                dst[oh * s.out_w + ow] =
+                    count > 0 ? sum / static_cast<T>(count) : T(0);
+              }
+            }
+          }
+        }
+      });
+}
+
+// Gradient of Pool2DForward. Max pooling routes each output gradient to the
+// first tap of its window equal to the pooled value, average pooling spreads
+// it evenly over the window.
+template <typename T>
+void Pool2DBackward(const Pool2DShape& s,
+                    PoolType type,
+                    const T* x,
+                    const T* out,
+                    const T* dout,
+                    T* dx) {
+  ParallelFor(
+      0, s.planes, detail::PoolGrain(s), [&](int64_t begin, int64_t end) {
+        for (int64_t p = begin; p < end; ++p) {
+          const T* src = x + p * s.in_plane();
+          const T* pooled = out + p * s.out_plane();
+          const T* grad = dout + p * s.out_plane();
+          T* dst = dx + p * s.in_plane();
+          std::fill(dst, dst + s.in_plane(), T(0));
+          for (int64_t oh = 0; oh < s.out_h; ++oh) {
+            int64_t h0, h1, h_extent;
+            detail::PoolWindow(oh,
+                               s.in_h,
+                               s.out_h,
+                               s.kernel_h,
+                               s.stride_h,
+                               s.pad_top,
+                               s.adaptive,
+                               &h0,
+                               &h1,
+                               &h_extent);
+            for (int64_t ow = 0; ow < s.out_w; ++ow) {
+              int64_t w0, w1, w_extent;
+              detail::PoolWindow(ow,
+                                 s.in_w,
+                                 s.out_w,
+                                 s.kernel_w,
+                                 s.stride_w,
+                                 s.pad_left,
+                                 s.adaptive,
+                                 &w0,
+                                 &w1,
+                                 &w_extent);
+              const int64_t o = oh * s.out_w + ow;
+              if (type == PoolType::kMax) {
+                bool found = false;
+                for (int64_t h = h0; h < h1 && !found; ++h) {
+                  for (int64_t w = w0; w < w1; ++w) {
+                    if (src[h * s.in_w + w] == pooled[o]) {
+                      dst[h * s.in_w + w] += grad[o];
+                      found = true;
+                      break;
+                    }
+                  }
+                }
+              } else {
+                const int64_t count = s.exclusive || s.adaptive
+                                          ? (h1 - h0) * (w1 - w0)
+                                          : h_extent * w_extent;
+                if (count == 0) {
+                  continue;
+                }
+                const T g = grad[o] / static_cast<T>(count);
+                for (int64_t h = h0; h < h1; ++h) {
+                  for (int64_t w = w0; w < w1; ++w) {
+                    dst[h * s.in_w + w] += g;
+                  }
+                }
+              }
+            }
+          }
+        }
+      });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
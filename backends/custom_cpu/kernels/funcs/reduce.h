@@ -0,0 +1,361 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/cast.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Accumulation type of a sum: float and double inputs are summed in double,
+// integers in int64_t and the 16-bit floating point formats in float.
+template <typename T>
+struct SumAccType {
+  using type = typename std::conditional<
+      std::is_same<typename ComputeType<T>::type, T>::value,
+      typename std::
+          conditional<std::is_floating_point<T>::value, double, int64_t>::type,
+      float>::type;
+};
+
+template <typename AccT>
+struct SumReducer {
+  static AccT Identity() { return AccT(0); }
+  static AccT Combine(AccT a, AccT b) { return a + b; }
+};
+
+template <typename AccT>
+struct MinReducer {
+  static AccT Identity() { return std::numeric_limits<AccT>::max(); }
+  static AccT Combine(AccT a, AccT b) { return b < a ? b : a; }
+};
+
+template <typename AccT>
+struct MaxReducer {
+  static AccT Identity() { return std::numeric_limits<AccT>::lowest(); }
+  static AccT Combine(AccT a, AccT b) { return b > a ? b : a; }
+};
+
+// A reduction over x_dims collapsed to groups of adjacent dims that are
+// either all reduced or all kept. Size-1 dims are dropped.
+struct ReduceLayout {
+  std::vector<int64_t> dims;
+  std::vector<bool> reduced;
+};
+
+inline ReduceLayout MakeReduceLayout(const std::vector<int64_t>& x_dims,
+                                     const std::vector<int64_t>& reduce_dims) {
+  std::vector<bool> is_reduced(x_dims.size(), false);
+  for (auto d : reduce_dims) {
+    is_reduced[d] = true;
+  }
+  ReduceLayout layout;
+  for (size_t i = 0; i < x_dims.size(); ++i) {
+    if (x_dims[i] == 1) {
+      continue;
+    }
+    if (!layout.dims.empty() && layout.reduced.back() == is_reduced[i]) {
+      layout.dims.back() *= x_dims[i];
+    } else {
+      layout.dims.push_back(x_dims[i]);
+      layout.reduced.push_back(is_reduced[i]);
+    }
+  }
+  return layout;
+}
+
+namespace detail {
+
+constexpr int kReduceLanes = 8;
+constexpr int64_t kPairwiseBlock = 128;
+constexpr int64_t kReduceChunk = 1 << 16;
+constexpr int64_t kInnerTile = 256;
+constexpr int64_t kCascadeRows = 128;
+constexpr int64_t kReduceGrain = 1 << 15;
+
+// Base case of ReduceContiguous, kReduceLanes independent accumulators let
+// the loop vectorize.
+template <typename AccT, typename Reducer, typename InT>
+AccT ReduceBlock(const InT* x,
+                 int64_t n,
+                 std::true_type /* computes in InT */) {
+  AccT lanes[kReduceLanes];
+  for (int l = 0; l < kReduceLanes; ++l) {
+    lanes[l] = Reducer::Identity();
+  }
+  int64_t i = 0;
+  for (; i + kReduceLanes <= n; i += kReduceLanes) {
+    for (int l = 0; l < kReduceLanes; ++l) {
+      lanes[l] = Reducer::Combine(lanes[l], CastValue<AccT>(x[i + l]));
+    }
+  }
+  for (int w = kReduceLanes / 2; w > 0; w /= 2) {
+    for (int l = 0; l < w; ++l) {
+      lanes[l] = Reducer::Combine(lanes[l], lanes[l + w]);
+    }
+  }
+  AccT acc = lanes[0];
+  for (; i < n; ++i) {
+    acc = Reducer::Combine(acc, CastValue<AccT>(x[i]));
+  }
+  return acc;
+}
+
+// 16-bit floats are converted to float a block at a time, which vectorizes
+// unlike a conversion inside the reduction loop.
+template <typename AccT, typename Reducer, typename InT>
+AccT ReduceBlock(const InT* x,
+                 int64_t n,
+                 std::false_type /* computes in InT */) {
+  typename ComputeType<InT>::type tile[kPairwiseBlock];
+  CastTile(x, tile, n);
+  return ReduceBlock<AccT, Reducer>(tile, n, std::true_type());
+}
+
+// Pairwise reduction of a contiguous run. Runs longer than kPairwiseBlock are
+// split in halves, which bounds the rounding error growth of a sum to
+// O(log n).
+template <typename AccT, typename Reducer, typename InT>
+AccT ReduceContiguous(const InT* x, int64_t n) {
+  if (n <= kPairwiseBlock) {
+    return ReduceBlock<AccT, Reducer>(
+        x, n, std::is_same<InT, typename ComputeType<InT>::type>());
+  }
+  const int64_t half = (n / 2 + kReduceLanes - 1) / kReduceLanes * kReduceLanes;
+  return Reducer::Combine(ReduceContiguous<AccT, Reducer>(x, half),
+                          ReduceContiguous<AccT, Reducer>(x + half, n - half));
+}
+
+// block[i] = Combine(block[i], row[i]) for i < width.
+template <typename AccT, typename Reducer, typename InT>
+void CombineRow(const InT* row,
+                int64_t width,
+                AccT* block,
+                std::true_type /* computes in InT */) {
+  for (int64_t i = 0; i < width; ++i) {
+    block[i] = Reducer::Combine(block[i], CastValue<AccT>(row[i]));
+  }
+}
+
+template <typename AccT, typename Reducer, typename InT>
+void CombineRow(const InT* row,
+                int64_t width,
+                AccT* block,
+                std::false_type /* computes in InT */) {
+  typename ComputeType<InT>::type tile[kInnerTile];
+  CastTile(row, tile, width);
+  CombineRow<AccT, Reducer>(tile, width, block, std::true_type());
+}
+
+// Reduces `reduce` rows of `width` (<= kInnerTile) elements that are `inner`
+// apart. Rows are accumulated element-wise, which vectorizes along the row,
+// in blocks of kCascadeRows whose partial results are then folded into acc.
+template <typename AccT, typename Reducer, typename InT>
+void ReduceRows(
+    const InT* x, int64_t reduce, int64_t inner, int64_t width, AccT* acc) {
+  AccT block[kInnerTile];
+  for (int64_t i = 0; i < width; ++i) {
+    acc[i] = Reducer::Identity();
+  }
+  for (int64_t r0 = 0; r0 < reduce; r0 += kCascadeRows) {
+    const int64_t r1 = std::min(reduce, r0 + kCascadeRows);
+    for (int64_t i = 0; i < width; ++i) {
+      block[i] = Reducer::Identity();
+    }
+    for (int64_t r = r0; r < r1; ++r) {
+      CombineRow<AccT, Reducer>(
+          x + r * inner,
+          width,
+          block,
+          std::is_same<InT, typename ComputeType<InT>::type>());
+    }
+    for (int64_t i = 0; i < width; ++i) {
+      acc[i] = Reducer::Combine(acc[i], block[i]);
+    }
+  }
+}
+
+// out[o, i] = project(reduce_r x[o, r, i]).
+template <typename AccT,
+          typename Reducer,
+          typename InT,
+          typename OutT,
+          typename Project>
+void Reduce3D(const InT* x,
+              int64_t outer,
+              int64_t reduce,
+              int64_t inner,
+              OutT* out,
+              const Project& project) {
+  // The partitioning depends on the shape only, never on the number of
+  // threads, so every thread count combines the elements in the same order
+  // and gives bitwise the same result.
+  if (inner == 1) {
+    if (reduce <= kReduceChunk) {
+      const int64_t grain =
+          std::max<int64_t>(1, kReduceGrain / std::max<int64_t>(reduce, 1));
+      ParallelFor(0, outer, grain, [&](int64_t begin, int64_t end) {
+        for (int64_t o = begin; o < end; ++o) {
+          out[o] =
+              project(ReduceContiguous<AccT, Reducer>(x + o * reduce, reduce));
+        }
+      });
+      return;
+    }
+    // Long rows are split into fixed-size chunks, which keeps the threads
+    // busy when there are fewer rows than threads.
+    const int64_t chunks = (reduce + kReduceChunk - 1) / kReduceChunk;
+    std::vector<AccT> partial(outer * chunks);
+    ParallelFor(0, outer * chunks, 1, [&](int64_t begin, int64_t end) {
+      for (int64_t t = begin; t < end; ++t) {
+        const int64_t o = t / chunks;
+        const int64_t c = t % chunks;
+        const int64_t b = c * kReduceChunk;
+        const int64_t n = std::min(reduce - b, kReduceChunk);
+        partial[t] = ReduceContiguous<AccT, Reducer>(x + o * reduce + b, n);
+      }
+    });
+    for (int64_t o = 0; o < outer; ++o) {
+      out[o] = project(
+          ReduceContiguous<AccT, Reducer>(partial.data() + o * chunks, chunks));
+    }
+    return;
+  }
+
+  const int64_t tiles = (inner + kInnerTile - 1) / kInnerTile;
+  const int64_t grain = std::max<int64_t>(
+      1,
+      kReduceGrain /
+          std::max<int64_t>(reduce * std::min(inner, kInnerTile), 1));
+  ParallelFor(0, outer * tiles, grain, [&](int64_t begin, int64_t end) {
+    AccT acc[kInnerTile];
+    for (int64_t t = begin; t < end; ++t) {
+      const int64_t o = t / tiles;
+      const int64_t i0 = (t % tiles) * kInnerTile;
+      const int64_t width = std::min(inner - i0, kInnerTile);
+      ReduceRows<AccT, Reducer>(
+          x + o * reduce * inner + i0, reduce, inner, width, acc);
+      OutT* dst = out + o * inner + i0;
+      for (int64_t i = 0; i < width; ++i) {
+        dst[i] = project(acc[i]);
+      }
+    }
+  });
+}
+
+}  // namespace detail
+
+// Reduces x over the (non-negative, unique) axes in reduce_dims with Reducer
+// accumulating in AccT, and writes project(acc) for every output element.
+//
+// Adjacent axes are coalesced first, so any reduction over one contiguous
+// group of axes runs as a single (outer, reduce, inner) pass. Reductions over
+// several separate groups are done group by group, innermost first, with
+// intermediates kept in AccT.
+template <typename AccT,
+          typename Reducer,
+          typename InT,
+          typename OutT,
+          typename Project>
+void Reduce(const std::vector<int64_t>& x_dims,
+            const std::vector<int64_t>& reduce_dims,
+            const InT* x,
+            OutT* out,
+            const Project& project) {
+  ReduceLayout layout = MakeReduceLayout(x_dims, reduce_dims);
+  int num_reduced = 0;
+  for (bool r : layout.reduced) {
+    num_reduced += r ? 1 : 0;
+  }
+  if (num_reduced == 0) {
+    int64_t numel = 1;
+    for (auto d : layout.dims) {
+      numel *= d;
+    }
+    ParallelFor(0, numel, detail::kReduceGrain, [&](int64_t b, int64_t e) {
+      for (int64_t i = b; i < e; ++i) {
+        out[i] = project(CastValue<AccT>(x[i]));
+      }
+    });
+    return;
+  }
+
+  std::vector<AccT> buffer[2];
+  const void* src = x;
+  bool src_is_input = true;
+  int stage = 0;
+  auto keep = [](AccT v) { return v; };
+  while (true) {
+    int g = static_cast<int>(layout.dims.size()) - 1;
+    while (!layout.reduced[g]) {
+      --g;
+    }
+    int64_t outer = 1;
+    int64_t inner = 1;
+    for (int i = 0; i < g; ++i) {
+      outer *= layout.dims[i];
+    }
+    for (size_t i = g + 1; i < layout.dims.size(); ++i) {
+      inner *= layout.dims[i];
+    }
+    const int64_t reduce = layout.dims[g];
+    const bool last = --num_reduced == 0;
+
+    if (last) {
+      if (src_is_input) {
+        detail::Reduce3D<AccT, Reducer>(x, outer, reduce, inner, out, project);
+      } else {
+        detail::Reduce3D<AccT, Reducer>(
+            static_cast<const AccT*>(src), outer, reduce, inner, out, project);
+      }
+      return;
+    }
+
+    auto& dst = buffer[stage++ % 2];
+    dst.resize(outer * inner);
+    if (src_is_input) {
+      detail::Reduce3D<AccT, Reducer>(
+          x, outer, reduce, inner, dst.data(), keep);
+    } else {
+      detail::Reduce3D<AccT, Reducer>(static_cast<const AccT*>(src),
+                                      outer,
+                                      reduce,
+                                      inner,
+                                      dst.data(),
+                                      keep);
+    }
+    src = dst.data();
+    src_is_input = false;
+
+    // The reduced group disappears; merge the kept groups around it.
+    layout.dims.erase(layout.dims.begin() + g);
+    layout.reduced.erase(layout.reduced.begin() + g);
+    if (g > 0 && g < static_cast<int>(layout.dims.size())) {
+      layout.dims[g - 1] *= layout.dims[g];
+      layout.dims.erase(layout.dims.begin() + g);
+      layout.reduced.erase(layout.reduced.begin() + g);
+    }
+  }
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
@@ -0,0 +1,290 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <limits>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Softmax over the middle axis of a tensor viewed as [outer, axis_dim, inner].
+//
+// Shifted logits are clipped at kSoftmaxClip like the reference
+// implementation, i.e. y = exp(max(x - max, -64)) / sum.
+constexpr double kSoftmaxClip = -64.0;
+
+namespace detail {
+
+constexpr int64_t kSoftmaxBlock = 512;
+constexpr int64_t kSoftmaxMaxBlocks = 64;
+constexpr int64_t kSoftmaxTile = 64;
+constexpr int64_t kSoftmaxGrain = 1 << 14;
+
+template <typename T>
+inline T RowMax(const T* x, int64_t n) {
+  T lanes[8];
+  for (int l = 0; l < 8; ++l) {
+    lanes[l] = x[0];
+  }
+  int64_t j = 0;
+  for (; j + 8 <= n; j += 8) {
+    for (int l = 0; l < 8; ++l) {
+      lanes[l] = x[j + l] > lanes[l] ? x[j + l] : lanes[l];
+    }
+  }
+  T m = lanes[0];
+  for (int l = 1; l < 8; ++l) {
+    m = lanes[l] > m ? lanes[l] : m;
+  }
+  for (; j < n; ++j) {
+    m = x[j] > m ? x[j] : m;
+  }
+  return m;
+}
+
+// Softmax of one contiguous row. The row is processed in at most
+// kSoftmaxMaxBlocks blocks: every block is exponentiated against its own
+// maximum while the running (max, sum) pair of the row is updated online, and
+// a final pass rescales each block to the row maximum. x is read once and no
+// temporary buffer is needed. Returns the row maximum and the sum of the
+// shifted exponentials.
+template <typename T>
+void SoftmaxContiguousRow(const T* x, T* y, int64_t n, T* row_max, T* row_sum) {
+  const T clip = static_cast<T>(std::exp(kSoftmaxClip));
+  const int64_t block =
+      std::max(kSoftmaxBlock, (n + kSoftmaxMaxBlocks - 1) / kSoftmaxMaxBlocks);
+  T block_max[kSoftmaxMaxBlocks];
+  T m = -std::numeric_limits<T>::infinity();
+  T s = 0;
+  int64_t num_blocks = 0;
+  for (int64_t b0 = 0; b0 < n; b0 += block, ++num_blocks) {
+    const int64_t len = std::min(block, n - b0);
+    const T bm = RowMax(x + b0, len);
+    T bs = 0;
+    for (int64_t j = b0; j < b0 + len; ++j) {
+      const T e = std::exp(std::max(x[j] - bm, static_cast<T>(kSoftmaxClip)));
+      y[j] = e;
+      bs += e;
+    }
+    block_max[num_blocks] = bm;
+    if (bm > m) {
+      s = s * std::exp(m - bm) + bs;
+      m = bm;
+    } else {
+      s += bs * std::exp(bm - m);
+    }
+  }
+  const T inv_s = static_cast<T>(1) / s;
+  for (int64_t b = 0; b < num_blocks; ++b) {
+    const T scale = std::exp(block_max[b] - m);
+    const int64_t b0 = b * block;
+    const int64_t b1 = std::min(n, b0 + block);
+    // exp(max(a, c)) == max(exp(a), exp(c)), so clamping after rescaling
+    // gives the same clipped values as exponentiating against the row max.
+    for (int64_t j = b0; j < b1; ++j) {
+      y[j] = std::max(y[j] * scale, clip) * inv_s;
+    }
+  }
+  *row_max = m;
+  *row_sum = s;
+}
+
+// Softmax of up to kSoftmaxTile rows that are interleaved with stride
+// `inner` (axis is not the innermost dim). Loops run along the inner dim so
+// they stay contiguous.
+template <typename T>
+void SoftmaxStridedTile(const T* x,
+                        T* y,
+                        int64_t axis_dim,
+                        int64_t inner,
+                        int64_t width,
+                        T* m,
+                        T* s) {
+  for (int64_t w = 0; w < width; ++w) {
+    m[w] = x[w];
+    s[w] = 0;
+  }
+  for (int64_t j = 1; j < axis_dim; ++j) {
+    const T* xj = x + j * inner;
+    for (int64_t w = 0; w < width; ++w) {
+      m[w] = xj[w] > m[w] ? xj[w] : m[w];
+    }
+  }
+  for (int64_t j = 0; j < axis_dim; ++j) {
+    const T* xj = x + j * inner;
+    T* yj = y + j * inner;
+    for (int64_t w = 0; w < width; ++w) {
+      const T e =
+          std::exp(std::max(xj[w] - m[w], static_cast<T>(kSoftmaxClip)));
+      yj[w] = e;
+      s[w] += e;
+    }
+  }
+  T inv_s[kSoftmaxTile];
+  for (int64_t w = 0; w < width; ++w) {
+    inv_s[w] = static_cast<T>(1) / s[w];
+  }
+  for (int64_t j = 0; j < axis_dim; ++j) {
+    T* yj = y + j * inner;
+    for (int64_t w = 0; w < width; ++w) {
+      yj[w] *= inv_s[w];
+    }
+  }
+}
+
+}  // namespace detail
+
+// Computes y = softmax(x) over axis and calls on_row(o, i, max, sum) once per
+// softmax row (o in [0, outer), i in [0, inner)) right after the row is done,
+// with the row maximum and the sum of the shifted exponentials, so that
+// consumers such as cross entropy can be fused into the same pass:
+// log(y_j) = max(x_j - max, -64) - log(sum).
+template <typename T, typename RowFn>
+void SoftmaxForward(const T* x,
+                    T* y,
+                    int64_t outer,
+                    int64_t axis_dim,
+                    int64_t inner,
+                    const RowFn& on_row) {
+  if (outer * axis_dim * inner == 0) {
+    return;
+  }
+  if (inner == 1) {
+    const int64_t grain =
+        std::max<int64_t>(1, detail::kSoftmaxGrain / axis_dim);
+    ParallelFor(0, outer, grain, [&](int64_t begin, int64_t end) {
+      for (int64_t o = begin; o < end; ++o) {
+        T m, s;
+        detail::SoftmaxContiguousRow(
+            x + o * axis_dim, y + o * axis_dim, axis_dim, &m, &s);
+        on_row(o, 0, m, s);
+      }
+    });
+    return;
+  }
+
+  const int64_t tiles =
+      (inner + detail::kSoftmaxTile - 1) / detail::kSoftmaxTile;
+  const int64_t grain =
+      std::max<int64_t>(1,
+                        detail::kSoftmaxGrain /
+                            (axis_dim * std::min(inner, detail::kSoftmaxTile)));
+  ParallelFor(0, outer * tiles, grain, [&](int64_t begin, int64_t end) {
+    T m[detail::kSoftmaxTile];
+    T s[detail::kSoftmaxTile];
+    for (int64_t t = begin; t < end; ++t) {
+      const int64_t o = t / tiles;
+      const int64_t i0 = (t % tiles) * detail::kSoftmaxTile;
+      const int64_t width = std::min(inner - i0, detail::kSoftmaxTile);
+      const int64_t offset = o * axis_dim * inner + i0;
+      detail::SoftmaxStridedTile(
+          x + offset, y + offset, axis_dim, inner, width, m, s);
+      for (int64_t w = 0; w < width; ++w) {
+        on_row(o, i0 + w, m[w], s[w]);
+      }
+    }
+  });
+}
+
+template <typename T>
+void SoftmaxForward(
+    const T* x, T* y, int64_t outer, int64_t axis_dim, int64_t inner) {
+  SoftmaxForward(x, y, outer, axis_dim, inner, [](int64_t, int64_t, T, T) {});
+}
+
+// dx = (dy - sum_j(dy_j * y_j)) * y over the same [outer, axis_dim, inner]
+// view.
+template <typename T>
+void SoftmaxBackward(const T* y,
+                     const T* dy,
+                     T* dx,
+                     int64_t outer,
+                     int64_t axis_dim,
+                     int64_t inner) {
+  if (outer * axis_dim * inner == 0) {
+    return;
+  }
+  if (inner == 1) {
+    const int64_t grain =
+        std::max<int64_t>(1, detail::kSoftmaxGrain / axis_dim);
+    ParallelFor(0, outer, grain, [&](int64_t begin, int64_t end) {
+      for (int64_t o = begin; o < end; ++o) {
+        const T* yo = y + o * axis_dim;
+        const T* dyo = dy + o * axis_dim;
+        T* dxo = dx + o * axis_dim;
+        T lanes[8] = {0, 0, 0, 0, 0, 0, 0, 0};
+        int64_t j = 0;
+        for (; j + 8 <= axis_dim; j += 8) {
+          for (int l = 0; l < 8; ++l) {
+            lanes[l] += yo[j + l] * dyo[j + l];
+          }
+        }
+        T dot = 0;
+        for (int l = 0; l < 8; ++l) {
+          dot += lanes[l];
+        }
+        for (; j < axis_dim; ++j) {
+          dot += yo[j] * dyo[j];
+        }
+        for (j = 0; j < axis_dim; ++j) {
+          dxo[j] = (dyo[j] - dot) * yo[j];
+        }
+      }
+    });
+    return;
+  }
+
+  const int64_t tiles =
+      (inner + detail::kSoftmaxTile - 1) / detail::kSoftmaxTile;
+  const int64_t grain =
+      std::max<int64_t>(1,
+                        detail::kSoftmaxGrain /
+                            (axis_dim * std::min(inner, detail::kSoftmaxTile)));
+  ParallelFor(0, outer * tiles, grain, [&](int64_t begin, int64_t end) {
+    T dot[detail::kSoftmaxTile];
+    for (int64_t t = begin; t < end; ++t) {
+      const int64_t o = t / tiles;
+      const int64_t i0 = (t % tiles) * detail::kSoftmaxTile;
+      const int64_t width = std::min(inner - i0, detail::kSoftmaxTile);
+      const int64_t offset = o * axis_dim * inner + i0;
+      for (int64_t w = 0; w < width; ++w) {
+        dot[w] = 0;
+      }
+      for (int64_t j = 0; j < axis_dim; ++j) {
+        const T* yj = y + offset + j * inner;
+        const T* dyj = dy + offset + j * inner;
+        for (int64_t w = 0; w < width; ++w) {
+          dot[w] += yj[w] * dyj[w];
+        }
+      }
+      for (int64_t j = 0; j < axis_dim; ++j) {
+        const T* yj = y + offset + j * inner;
+        const T* dyj = dy + offset + j * inner;
+        T* dxj = dx + offset + j * inner;
+        for (int64_t w = 0; w < width; ++w) {
+          dxj[w] = (dyj[w] - dot[w]) * yj[w];
+        }
+      }
+    }
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
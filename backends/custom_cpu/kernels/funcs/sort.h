@@ -0,0 +1,342 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <utility>
+#include <vector>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Sorting along the middle axis of a tensor viewed as [outer, n, inner].
+//
+// Values are mapped to unsigned keys whose integer order is the sort order,
+// so rows are sorted without a comparator on T: LSD radix sort for long rows,
+// std::sort on (key, index) entries for short rows and std::nth_element for
+// top-k (a heap for small k). Ties are broken by index, every result is
+// therefore the stable one. NaN maps to the largest key, i.e. it is placed last
+// in ascending and first in descending order.
+
+template <typename T>
+struct SortKey;
+
+template <>
+struct SortKey<float> {
+  using type = uint32_t;
+  static uint32_t Of(float v) {
+    if (std::isnan(v)) {
+      return ~0u;
+    }
+    uint32_t bits = 0;
+    // -0.0 and 0.0 compare equal.
+    if (v != 0) {
+      std::memcpy(&bits, &v, sizeof(bits));
+    }
+    return (bits & 0x80000000u) ? ~bits : (bits | 0x80000000u);
+  }
+};
+
+template <>
+struct SortKey<double> {
+  using type = uint64_t;
+  static uint64_t Of(double v) {
+    if (std::isnan(v)) {
+      return ~0ull;
+    }
+    uint64_t bits = 0;
+    if (v != 0) {
+      std::memcpy(&bits, &v, sizeof(bits));
+    }
+    return (bits & 0x8000000000000000ull) ? ~bits
+                                          : (bits | 0x8000000000000000ull);
+  }
+};
+
+template <>
+struct SortKey<int32_t> {
+  using type = uint32_t;
+  static uint32_t Of(int32_t v) {
+    return static_cast<uint32_t>(v) ^ 0x80000000u;
+  }
+};
+
+template <>
+struct SortKey<int64_t> {
+  using type = uint64_t;
+  static uint64_t Of(int64_t v) {
+    return static_cast<uint64_t>(v) ^ 0x8000000000000000ull;
+  }
+};
+
+namespace detail {
+
+// Elements sorted by one task.
+constexpr int64_t kSortGrain = 1 << 14;
+// Rows shorter than this are sorted by comparison, radix sort pays a fixed
+// 256-bucket histogram per pass.
+constexpr int64_t kRadixMinWidth = 256;
+// Rows that are interleaved along inner are gathered and scattered in tiles
+// of up to kSortMaxTile rows so that the strided loops touch whole cache
+// lines, the tile is limited to kSortTileElems keys.
+constexpr int64_t kSortMaxTile = 16;
+constexpr int64_t kSortTileElems = 1 << 16;
+// For k <= n / kTopkHeapRatio top-k keeps a heap of the k best entries
+// (std::partial_sort), most entries are rejected with a single comparison
+// against the heap top. Larger k use std::nth_element.
+constexpr int64_t kTopkHeapRatio = 32;
+
+// A key together with its position in the row, ordered by key and then by
+// position. 32-bit keys are packed with the position into one 64-bit integer
+// (rows are shorter than 2^32), which makes the comparisons much cheaper.
+template <typename K>
+struct SortEntry {
+  using type = std::pair<K, int64_t>;
+  static type Make(K key, int64_t j) { return std::make_pair(key, j); }
+  static int64_t Index(const type& entry) { return entry.second; }
+};
+
+template <>
+struct SortEntry<uint32_t> {
+  using type = uint64_t;
+  static uint64_t Make(uint32_t key, int64_t j) {
+    return (static_cast<uint64_t>(key) << 32) | static_cast<uint64_t>(j);
+  }
+  static int64_t Index(uint64_t entry) {
+    return static_cast<int64_t>(entry & 0xffffffffu);
+  }
+};
+
+// Sorts n keys and writes the resulting permutation to `indices`.
+template <typename K>
+class RadixSorter {
+ public:
+  explicit RadixSorter(int64_t n) : n_(n) {
+    if (n_ < kRadixMinWidth) {
+      entries_.resize(n_);
+    } else {
+      keys_tmp_.resize(n_);
+      indices_tmp_.resize(n_);
+    }
+  }
+
+  // `keys` is used as scratch.
+  void operator()(K* keys, int64_t* indices) {
+    if (n_ < kRadixMinWidth) {
+      for (int64_t j = 0; j < n_; ++j) {
+        entries_[j] = Entry::Make(keys[j], j);
+      }
+      std::sort(entries_.begin(), entries_.end());
+      for (int64_t j = 0; j < n_; ++j) {
+        indices[j] = Entry::Index(entries_[j]);
+      }
+      return;
+    }
+
+    constexpr int kPasses = sizeof(K);
+    int64_t hist[kPasses][256];
+    std::memset(hist, 0, sizeof(hist));
+    for (int64_t j = 0; j < n_; ++j) {
+      const K key = keys[j];
+      for (int p = 0; p < kPasses; ++p) {
+        ++hist[p][(key >> (8 * p)) & 0xff];
+      }
+    }
+
+    K* src_keys = keys;
+    K* dst_keys = keys_tmp_.data();
+    int64_t* src_indices = nullptr;
+    int64_t* dst_indices = indices;
+    for (int p = 0; p < kPasses; ++p) {
+      int64_t* h = hist[p];
+      // A digit that is the same for every key leaves the order unchanged.
+      if (h[(src_keys[0] >> (8 * p)) & 0xff] == n_) {
+        continue;
+      }
+      int64_t offset = 0;
+      for (int d = 0; d < 256; ++d) {
+        const int64_t count = h[d];
+        h[d] = offset;
+        offset += count;
+      }
+      for (int64_t j = 0; j < n_; ++j) {
+        const K key = src_keys[j];
+        const int64_t pos = h[(key >> (8 * p)) & 0xff]++;
+        dst_keys[pos] = key;
+        dst_indices[pos] = src_indices ? src_indices[j] : j;
+      }
+      std::swap(src_keys, dst_keys);
+      src_indices = dst_indices;
+      dst_indices = dst_indices == indices ? indices_tmp_.data() : indices;
+    }
+
+    if (src_indices == nullptr) {
+      for (int64_t j = 0; j < n_; ++j) {
+        indices[j] = j;
+      }
+    } else if (src_indices != indices) {
+      std::memcpy(indices, src_indices, n_ * sizeof(int64_t));
+    }
+  }
+
+ private:
+  using Entry = SortEntry<K>;
+
+  int64_t n_;
+  std::vector<K> keys_tmp_;
+  std::vector<int64_t> indices_tmp_;
+  std::vector<typename Entry::type> entries_;
+};
+
+// Writes the positions of the k smallest of n keys to `indices`, in
+// ascending order when `sorted`.
+template <typename K>
+class TopkSelector {
+ public:
+  TopkSelector(int64_t n, int64_t k, bool sorted)
+      : n_(n), k_(k), sorted_(sorted), entries_(n) {}
+
+  void operator()(K* keys, int64_t* indices) {
+    for (int64_t j = 0; j < n_; ++j) {
+      entries_[j] = Entry::Make(keys[j], j);
+    }
+    if (k_ * kTopkHeapRatio <= n_) {
+      std::partial_sort(
+          entries_.begin(), entries_.begin() + k_, entries_.end());
+    } else {
+      if (k_ < n_) {
+        std::nth_element(
+            entries_.begin(), entries_.begin() + k_, entries_.end());
+      }
+      if (sorted_) {
+        std::sort(entries_.begin(), entries_.begin() + k_);
+      }
+    }
+    for (int64_t j = 0; j < k_; ++j) {
+      indices[j] = Entry::Index(entries_[j]);
+    }
+  }
+
+ private:
+  using Entry = SortEntry<K>;
+
+  int64_t n_;
+  int64_t k_;
+  bool sorted_;
+  std::vector<typename Entry::type> entries_;
+};
+
+// Runs `Selector` on every row of x viewed as [outer, n, inner]. The selector
+// maps the n keys of a row to m indices, out and indices are [outer, m,
+// inner] with out = x[indices]. `invert` complements the keys, which turns
+// ascending into descending order.
+template <typename T, typename MakeSelector>
+void SelectRows(const T* x,
+                T* out,
+                int64_t* indices,
+                int64_t outer,
+                int64_t n,
+                int64_t inner,
+                int64_t m,
+                bool invert,
+                const MakeSelector& make_selector) {
+  using K = typename SortKey<T>::type;
+  const K mask = invert ? static_cast<K>(~K(0)) : K(0);
+  const int64_t max_tile =
+      std::max<int64_t>(1, std::min(kSortMaxTile, kSortTileElems / n));
+  const int64_t grain = std::max<int64_t>(1, kSortGrain / n);
+  ParallelFor(0, outer * inner, grain, [&](int64_t begin, int64_t end) {
+    auto select = make_selector();
+    std::vector<K> keys(max_tile * n);
+    std::vector<int64_t> tile_indices(max_tile * m);
+    for (int64_t r = begin; r < end;) {
+      const int64_t o = r / inner;
+      const int64_t i = r % inner;
+      const int64_t tile = std::min(max_tile, std::min(inner - i, end - r));
+      const T* x_tile = x + o * n * inner + i;
+      for (int64_t j = 0; j < n; ++j) {
+        const T* xj = x_tile + j * inner;
+        for (int64_t t = 0; t < tile; ++t) {
+          keys[t * n + j] = SortKey<T>::Of(xj[t]) ^ mask;
+        }
+      }
+      for (int64_t t = 0; t < tile; ++t) {
+        select(keys.data() + t * n, tile_indices.data() + t * m);
+      }
+      T* out_tile = out + o * m * inner + i;
+      int64_t* indices_tile = indices + o * m * inner + i;
+      for (int64_t j = 0; j < m; ++j) {
+        for (int64_t t = 0; t < tile; ++t) {
+          const int64_t index = tile_indices[t * m + j];
+          out_tile[j * inner + t] = x_tile[index * inner + t];
+          indices_tile[j * inner + t] = index;
+        }
+      }
+      r += tile;
+    }
+  });
+}
+
+}  // namespace detail
+
+// Sorts x viewed as [outer, n, inner] along n. out and indices have the
+// shape of x.
+template <typename T>
+void Argsort(const T* x,
+             T* out,
+             int64_t* indices,
+             int64_t outer,
+             int64_t n,
+             int64_t inner,
+             bool descending) {
+  using K = typename SortKey<T>::type;
+  if (outer * n * inner == 0) {
+    return;
+  }
+  detail::SelectRows(x, out, indices, outer, n, inner, n, descending, [n]() {
+    return detail::RadixSorter<K>(n);
+  });
+}
+
+// The k largest (or smallest) elements of x viewed as [outer, n, inner]
+// along n, out and indices are [outer, k, inner]. Equal elements are taken
+// in index order.
+template <typename T>
+void Topk(const T* x,
+          T* out,
+          int64_t* indices,
+          int64_t outer,
+          int64_t n,
+          int64_t inner,
+          int64_t k,
+          bool largest,
+          bool sorted) {
+  using K = typename SortKey<T>::type;
+  if (outer * k * inner == 0) {
+    return;
+  }
+  detail::SelectRows(
+      x, out, indices, outer, n, inner, k, largest, [n, k, sorted]() {
+        return detail::TopkSelector<K>(n, k, sorted);
+      });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
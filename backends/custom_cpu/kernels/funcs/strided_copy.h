@@ -0,0 +1,393 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <numeric>
+#include <vector>
+
+#if defined(__SSE2__)
+#include <emmintrin.h>
+#include <xmmintrin.h>
+#endif
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace funcs {
+
+// Shape and element strides of a copy after normalization: size-1 dims are
+// dropped, loops are ordered by descending destination stride and adjacent
+// dims that stay adjacent in both tensors are folded into one.
+struct CopyLayout {
+  std::vector<int64_t> dims;
+  std::vector<int64_t> src_strides;
+  std::vector<int64_t> dst_strides;
+
+  int rank() const { return static_cast<int>(dims.size()); }
+};
+
+inline CopyLayout MakeCopyLayout(const std::vector<int64_t>& dims,
+                                 const std::vector<int64_t>& src_strides,
+                                 const std::vector<int64_t>& dst_strides) {
+  std::vector<int> order;
+  for (size_t i = 0; i < dims.size(); ++i) {
+    if (dims[i] != 1) {
+      order.push_back(static_cast<int>(i));
+    }
+  }
+  std::stable_sort(order.begin(), order.end(), [&](int a, int b) {
+    if (dst_strides[a] != dst_strides[b]) {
+      return dst_strides[a] > dst_strides[b];
+    }
+    return src_strides[a] > src_strides[b];
+  });
+
+  CopyLayout layout;
+  for (int i : order) {
+    if (!layout.dims.empty() &&
+        layout.src_strides.back() == src_strides[i] * dims[i] &&
+        layout.dst_strides.back() == dst_strides[i] * dims[i]) {
+      layout.dims.back() *= dims[i];
+      layout.src_strides.back() = src_strides[i];
+      layout.dst_strides.back() = dst_strides[i];
+      continue;
+    }
+    layout.dims.push_back(dims[i]);
+    layout.src_strides.push_back(src_strides[i]);
+    layout.dst_strides.push_back(dst_strides[i]);
+  }
+  if (layout.dims.empty()) {
+    layout.dims.push_back(1);
+    layout.src_strides.push_back(1);
+    layout.dst_strides.push_back(1);
+  }
+  return layout;
+}
+
+inline std::vector<int64_t> ContiguousStrides(
+    const std::vector<int64_t>& dims) {
+  std::vector<int64_t> strides(dims.size(), 1);
+  for (int i = static_cast<int>(dims.size()) - 2; i >= 0; --i) {
+    strides[i] = strides[i + 1] * dims[i + 1];
+  }
+  return strides;
+}
+
+namespace detail {
+
+template <size_t kSize>
+struct CopyElement;
+template <>
+struct CopyElement<1> {
+  using type = uint8_t;
+};
+template <>
+struct CopyElement<2> {
+  using type = uint16_t;
+};
+template <>
+struct CopyElement<4> {
+  using type = uint32_t;
+};
+template <>
+struct CopyElement<8> {
+  using type = uint64_t;
+};
+template <>
+struct CopyElement<16> {
+  struct type {
+    uint64_t lo;
+    uint64_t hi;
+  };
+};
+
+constexpr int64_t kTransposeTile = 32;
+
+// Scalar tile: dst[r * ld_dst + c] = src[r + c * ld_src].
+template <typename U>
+inline void TransposeTileScalar(const U* src,
+                                int64_t ld_src,
+                                U* dst,
+                                int64_t ld_dst,
+                                int64_t rows,
+                                int64_t cols) {
+  for (int64_t r = 0; r < rows; ++r) {
+    for (int64_t c = 0; c < cols; ++c) {
+      dst[r * ld_dst + c] = src[r + c * ld_src];
+    }
+  }
+}
+
+template <typename U>
+inline void TransposeTile(const U* src,
+                          int64_t ld_src,
+                          U* dst,
+                          int64_t ld_dst,
+                          int64_t rows,
+                          int64_t cols) {
+  TransposeTileScalar(src, ld_src, dst, ld_dst, rows, cols);
+}
+
+#if defined(__SSE2__)
+// 4-byte elements are moved in 4x4 register blocks.
+template <>
+inline void TransposeTile<uint32_t>(const uint32_t* src,
+                                    int64_t ld_src,
+                                    uint32_t* dst,
+                                    int64_t ld_dst,
+                                    int64_t rows,
+                                    int64_t cols) {
+  const int64_t rows4 = rows & ~int64_t(3);
+  const int64_t cols4 = cols & ~int64_t(3);
+  for (int64_t r = 0; r < rows4; r += 4) {
+    for (int64_t c = 0; c < cols4; c += 4) {
+      const float* s = reinterpret_cast<const float*>(src + r + c * ld_src);
+      __m128 row0 = _mm_loadu_ps(s);
+      __m128 row1 = _mm_loadu_ps(s + ld_src);
+      __m128 row2 = _mm_loadu_ps(s + 2 * ld_src);
+      __m128 row3 = _mm_loadu_ps(s + 3 * ld_src);
+      _MM_TRANSPOSE4_PS(row0, row1, row2, row3);
+      float* d = reinterpret_cast<float*>(dst + r * ld_dst + c);
+      _mm_storeu_ps(d, row0);
+      _mm_storeu_ps(d + ld_dst, row1);
+      _mm_storeu_ps(d + 2 * ld_dst, row2);
+      _mm_storeu_ps(d + 3 * ld_dst, row3);
+    }
+  }
+  if (cols4 < cols) {
+    TransposeTileScalar(
+        src + cols4 * ld_src, ld_src, dst + cols4, ld_dst, rows4, cols - cols4);
+  }
+  if (rows4 < rows) {
+    TransposeTileScalar(
+        src + rows4, ld_src, dst + rows4 * ld_dst, ld_dst, rows - rows4, cols);
+  }
+}
+
+// 8-byte elements are moved in 2x2 register blocks.
+template <>
+inline void TransposeTile<uint64_t>(const uint64_t* src,
+                                    int64_t ld_src,
+                                    uint64_t* dst,
+                                    int64_t ld_dst,
+                                    int64_t rows,
+                                    int64_t cols) {
+  const int64_t rows2 = rows & ~int64_t(1);
+  const int64_t cols2 = cols & ~int64_t(1);
+  for (int64_t r = 0; r < rows2; r += 2) {
+    for (int64_t c = 0; c < cols2; c += 2) {
+      const double* s = reinterpret_cast<const double*>(src + r + c * ld_src);
+      __m128d row0 = _mm_loadu_pd(s);
+      __m128d row1 = _mm_loadu_pd(s + ld_src);
+      double* d = reinterpret_cast<double*>(dst + r * ld_dst + c);
+      _mm_storeu_pd(d, _mm_unpacklo_pd(row0, row1));
+      _mm_storeu_pd(d + ld_dst, _mm_unpackhi_pd(row0, row1));
+    }
+  }
+  if (cols2 < cols) {
+    TransposeTileScalar(
+        src + cols2 * ld_src, ld_src, dst + cols2, ld_dst, rows2, cols - cols2);
+  }
+  if (rows2 < rows) {
+    TransposeTileScalar(
+        src + rows2, ld_src, dst + rows2 * ld_dst, ld_dst, rows - rows2, cols);
+  }
+}
+#endif
+
+// Walks the outer dims [0, rank - num_inner) of a layout as an odometer with
+// incremental offsets, starting from linear outer index `begin`.
+struct OuterOdometer {
+  OuterOdometer(const CopyLayout& layout, int num_outer, int64_t begin)
+      : layout_(layout), index_(num_outer, 0), src_off(0), dst_off(0) {
+    int64_t rem = begin;
+    for (int d = num_outer - 1; d >= 0; --d) {
+      index_[d] = rem % layout.dims[d];
+      rem /= layout.dims[d];
+      src_off += index_[d] * layout.src_strides[d];
+      dst_off += index_[d] * layout.dst_strides[d];
+    }
+  }
+
+  void Next() {
+    for (int d = static_cast<int>(index_.size()) - 1; d >= 0; --d) {
+      src_off += layout_.src_strides[d];
+      dst_off += layout_.dst_strides[d];
+      if (++index_[d] < layout_.dims[d]) {
+        return;
+      }
+      src_off -= layout_.src_strides[d] * layout_.dims[d];
+      dst_off -= layout_.dst_strides[d] * layout_.dims[d];
+      index_[d] = 0;
+    }
+  }
+
+  const CopyLayout& layout_;
+  std::vector<int64_t> index_;
+  int64_t src_off;
+  int64_t dst_off;
+};
+
+template <typename U>
+void StridedCopyImpl(CopyLayout layout, const U* src, U* dst) {
+  constexpr int64_t kMinElementsPerTask = 1 << 14;
+  int rank = layout.rank();
+  const int64_t inner = layout.dims[rank - 1];
+  const int64_t inner_src = layout.src_strides[rank - 1];
+  const int64_t inner_dst = layout.dst_strides[rank - 1];
+
+  // Contiguous runs: one memcpy per innermost row.
+  if (inner_src == 1 && inner_dst == 1) {
+    if (rank == 1) {
+      ParallelFor(0, inner, kMinElementsPerTask, [&](int64_t b, int64_t e) {
+        std::memcpy(dst + b, src + b, (e - b) * sizeof(U));
+      });
+      return;
+    }
+    int64_t outer = 1;
+    for (int d = 0; d < rank - 1; ++d) outer *= layout.dims[d];
+    const int64_t grain = std::max<int64_t>(1, kMinElementsPerTask / inner);
+    ParallelFor(0, outer, grain, [&](int64_t b, int64_t e) {
+      OuterOdometer it(layout, rank - 1, b);
+      for (int64_t i = b; i < e; ++i, it.Next()) {
+        std::memcpy(dst + it.dst_off, src + it.src_off, inner * sizeof(U));
+      }
+    });
+    return;
+  }
+
+  // Transposes: the destination is contiguous along the last dim and the
+  // source along another dim j. Move j next to the last dim and copy the
+  // (j, last) planes in cache-sized tiles.
+  int src_unit = -1;
+  if (inner_dst == 1) {
+    for (int d = rank - 2; d >= 0; --d) {
+      if (layout.src_strides[d] == 1) {
+        src_unit = d;
+        break;
+      }
+    }
+  }
+  if (src_unit >= 0) {
+    if (src_unit != rank - 2) {
+      auto move = [&](std::vector<int64_t>* v) {
+        int64_t value = (*v)[src_unit];
+        v->erase(v->begin() + src_unit);
+        v->insert(v->end() - 1, value);
+      };
+      move(&layout.dims);
+      move(&layout.src_strides);
+      move(&layout.dst_strides);
+    }
+    const int64_t rows = layout.dims[rank - 2];
+    const int64_t cols = layout.dims[rank - 1];
+    const int64_t ld_src = layout.src_strides[rank - 1];
+    const int64_t ld_dst = layout.dst_strides[rank - 2];
+    int64_t outer = 1;
+    for (int d = 0; d < rank - 2; ++d) outer *= layout.dims[d];
+    // Parallelize over (outer, row band) so a single large 2-D transpose
+    // is split as well.
+    const int64_t band = kTransposeTile * 2;
+    const int64_t bands = (rows + band - 1) / band;
+    const int64_t grain =
+        std::max<int64_t>(1, kMinElementsPerTask / (band * cols));
+    ParallelFor(0, outer * bands, grain, [&](int64_t b, int64_t e) {
+      OuterOdometer it(layout, rank - 2, b / bands);
+      int64_t cur_outer = b / bands;
+      for (int64_t task = b; task < e; ++task) {
+        while (cur_outer < task / bands) {
+          it.Next();
+          ++cur_outer;
+        }
+        const int64_t r0 = (task % bands) * band;
+        const int64_t r1 = std::min(rows, r0 + band);
+        const U* s = src + it.src_off;
+        U* d = dst + it.dst_off;
+        for (int64_t rb = r0; rb < r1; rb += kTransposeTile) {
+          const int64_t rn = std::min(kTransposeTile, r1 - rb);
+          for (int64_t cb = 0; cb < cols; cb += kTransposeTile) {
+            const int64_t cn = std::min(kTransposeTile, cols - cb);
+            TransposeTile(s + rb + cb * ld_src,
+                          ld_src,
+                          d + rb * ld_dst + cb,
+                          ld_dst,
+                          rn,
+                          cn);
+          }
+        }
+      }
+    });
+    return;
+  }
+
+  // Anything else: strided innermost loop under the odometer.
+  int64_t outer = 1;
+  for (int d = 0; d < rank - 1; ++d) outer *= layout.dims[d];
+  const int64_t grain = std::max<int64_t>(1, kMinElementsPerTask / inner);
+  ParallelFor(0, outer, grain, [&](int64_t b, int64_t e) {
+    OuterOdometer it(layout, rank - 1, b);
+    for (int64_t i = b; i < e; ++i, it.Next()) {
+      const U* s = src + it.src_off;
+      U* d = dst + it.dst_off;
+      for (int64_t k = 0; k < inner; ++k) {
+        d[k * inner_dst] = s[k * inner_src];
+      }
+    }
+  });
+}
+
+}  // namespace detail
+
+// Copies a tensor of shape `dims` between two strided layouts (strides are in
+// elements). Runs that are contiguous on both sides become memcpy calls,
+// transposed planes are copied in SIMD tiles, and the outer loop is split over
+// the thread pool.
+template <typename T>
+void StridedCopy(const std::vector<int64_t>& dims,
+                 const T* src,
+                 const std::vector<int64_t>& src_strides,
+                 T* dst,
+                 const std::vector<int64_t>& dst_strides) {
+  for (auto d : dims) {
+    if (d == 0) return;
+  }
+  using U = typename detail::CopyElement<sizeof(T)>::type;
+  static_assert(sizeof(U) == sizeof(T), "unsupported element size");
+  detail::StridedCopyImpl(MakeCopyLayout(dims, src_strides, dst_strides),
+                          reinterpret_cast<const U*>(src),
+                          reinterpret_cast<U*>(dst));
+}
+
+// out = x.transpose(axis) for a contiguous x and a contiguous out.
+template <typename T>
+void Transpose(const std::vector<int64_t>& x_dims,
+               const T* x,
+               const std::vector<int>& axis,
+               T* out) {
+  const auto x_strides = ContiguousStrides(x_dims);
+  std::vector<int64_t> out_dims(axis.size());
+  std::vector<int64_t> src_strides(axis.size());
+  for (size_t i = 0; i < axis.size(); ++i) {
+    out_dims[i] = x_dims[axis[i]];
+    src_strides[i] = x_strides[axis[i]];
+  }
+  StridedCopy(out_dims, x, src_strides, out, ContiguousStrides(out_dims));
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
@@ -0,0 +1,423 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <exception>
+#include <fstream>
+#include <functional>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+#ifdef __linux__
+#include <dirent.h>
+#include <pthread.h>
+#include <sched.h>
+#endif
+
+namespace custom_kernel {
+namespace funcs {
+
+namespace detail {
+
+// CPU ids of a sysfs cpulist such as "0-3,8-11".
+inline std::vector<int> ParseCpuList(const std::string& list) {
+  std::vector<int> cpus;
+  size_t pos = 0;
+  while (pos < list.size()) {
+    size_t comma = list.find(',', pos);
+    if (comma == std::string::npos) comma = list.size();
+    const std::string range = list.substr(pos, comma - pos);
+    const size_t dash = range.find('-');
+    const int first = std::atoi(range.c_str());
+    const int last =
+        dash == std::string::npos ? first : std::atoi(range.c_str() + dash + 1);
+    for (int c = first; c <= last; ++c) cpus.push_back(c);
+    pos = comma + 1;
+  }
+  return cpus;
+}
+
+// CPUs the process may run on (its affinity mask, which honours taskset and
+// cgroup cpusets), grouped by NUMA node. Consecutive workers own consecutive
+// parts of a range, so pinning them in this order keeps neighbouring data on
+// one node.
+inline std::vector<int> AllowedCpus() {
+  std::vector<int> cpus;
+#ifdef __linux__
+  cpu_set_t mask;
+  CPU_ZERO(&mask);
+  if (sched_getaffinity(0, sizeof(mask), &mask) != 0) {
+    return cpus;
+  }
+  std::vector<bool> taken(CPU_SETSIZE, false);
+  std::vector<int> nodes;
+  if (DIR* dir = opendir("/sys/devices/system/node")) {
+    while (dirent* entry = readdir(dir)) {
+      if (std::strncmp(entry->d_name, "node", 4) == 0 &&
+          entry->d_name[4] >= '0' && entry->d_name[4] <= '9') {
+        nodes.push_back(std::atoi(entry->d_name + 4));
+      }
+    }
+    closedir(dir);
+  }
+  std::sort(nodes.begin(), nodes.end());
+  for (int node : nodes) {
+    std::ifstream in("/sys/devices/system/node/node" + std::to_string(node) +
+                     "/cpulist");
+    std::string list;
+    std::getline(in, list);
+    for (int c : ParseCpuList(list)) {
+      if (c >= 0 && c < CPU_SETSIZE && CPU_ISSET(c, &mask) && !taken[c]) {
+        cpus.push_back(c);
+        taken[c] = true;
+      }
+    }
+  }
+  for (int c = 0; c < CPU_SETSIZE; ++c) {
+    if (CPU_ISSET(c, &mask) && !taken[c]) cpus.push_back(c);
+  }
+#endif
+  return cpus;
+}
+
+}  // namespace detail
+
+// A fixed-size, work-stealing pool of worker threads shared by the custom_cpu
+// kernels.
+//
+// A ParallelFor splits its range into up to kChunksPerThread chunks per
+// thread and deals them out as contiguous runs, one run per participant: the
+// calling thread and the first workers. Every participant works through its
+// own run front to back and then steals single chunks from the back of the
+// others' runs, nearest first, so uneven chunks (ragged tails, triangular
+// loops, a descheduled thread) are balanced without a shared queue, and a
+// worker keeps touching the same part of a range on every call.
+//
+// A ParallelFor issued from inside a worker, or while another thread is
+// dispatching, runs serially on the calling thread, so nested kernels never
+// deadlock. An exception thrown by fn is rethrown on the calling thread once
+// all chunks are done.
+//
+// Environment variables:
+//   FLAGS_custom_cpu_num_threads   threads including the caller, default all
+//                                  CPUs of the process affinity mask
+//   FLAGS_custom_cpu_bind_threads  1 pins worker i to the i-th allowed CPU in
+//                                  NUMA node order, default 0
+class ThreadPool {
+ public:
+  static ThreadPool& Instance() {
+    ThreadPool* pool = SharedPool().load(std::memory_order_acquire);
+    if (pool == nullptr) {
+      static std::mutex init_mutex;
+      std::lock_guard<std::mutex> guard(init_mutex);
+      pool = SharedPool().load(std::memory_order_relaxed);
+      if (pool == nullptr) {
+        // NOTE: the pool is intentionally leaked, joining workers from a
+        // static destructor of a dlopen'ed plugin is not safe at process exit.
+        pool = new ThreadPool(DefaultNumThreads(), DefaultBindThreads());
+        SharedPool().store(pool, std::memory_order_release);
+        RegisterForkHandler();
+      }
+    }
+    return *pool;
+  }
+
+  ThreadPool(int num_threads, bool bind_threads) {
+    const std::vector<int> cpus =
+        bind_threads ? detail::AllowedCpus() : std::vector<int>();
+    for (int i = 1; i < num_threads; ++i) {
+      const int cpu = cpus.empty() ? -1 : cpus[i % cpus.size()];
+      workers_.emplace_back([this, i, cpu]() { WorkerLoop(i, cpu); });
+    }
+  }
+
+  ThreadPool(const ThreadPool&) = delete;
+  ThreadPool& operator=(const ThreadPool&) = delete;
+
+  ~ThreadPool() {
+    {
+      std::lock_guard<std::mutex> guard(mutex_);
+      stop_ = true;
+    }
+    cv_.notify_all();
+    for (auto& worker : workers_) {
+      worker.join();
+    }
+  }
+
+  int NumThreads() const { return static_cast<int>(workers_.size()) + 1; }
+
+  // Splits [begin, end) into chunks of at least `grain` items and invokes
+  // fn(chunk_begin, chunk_end) on them in parallel. Returns after all chunks
+  // are done. Ranges of at most `grain` items run inline without touching
+  // the pool.
+  void ParallelFor(int64_t begin,
+                   int64_t end,
+                   int64_t grain,
+                   const std::function<void(int64_t, int64_t)>& fn) {
+    if (end <= begin) {
+      return;
+    }
+    grain = std::max<int64_t>(grain, 1);
+    const int64_t range = end - begin;
+    int64_t num_chunks = std::min<int64_t>(NumThreads() * kChunksPerThread,
+                                           (range + grain - 1) / grain);
+    if (num_chunks <= 1 || InParallelRegion()) {
+      fn(begin, end);
+      return;
+    }
+    std::unique_lock<std::mutex> dispatch(dispatch_mutex_, std::try_to_lock);
+    if (!dispatch.owns_lock()) {
+      fn(begin, end);
+      return;
+    }
+
+    Job job;
+    job.fn = &fn;
+    job.begin = begin;
+    job.end = end;
+    job.chunk = (range + num_chunks - 1) / num_chunks;
+    num_chunks = (range + job.chunk - 1) / job.chunk;
+    job.num_slots =
+        static_cast<int>(std::min<int64_t>(NumThreads(), num_chunks));
+    job.slots.reset(new std::atomic<uint64_t>[job.num_slots]);
+    for (int s = 0; s < job.num_slots; ++s) {
+      const uint64_t first = num_chunks * s / job.num_slots;
+      const uint64_t last = num_chunks * (s + 1) / job.num_slots;
+      job.slots[s].store((first << 32) | last, std::memory_order_relaxed);
+    }
+    job.remaining.store(num_chunks, std::memory_order_relaxed);
+    job.active.store(0, std::memory_order_relaxed);
+
+    {
+      std::lock_guard<std::mutex> guard(mutex_);
+      job_ = &job;
+      ++generation_;
+    }
+    cv_.notify_all();
+    {
+      ParallelRegionGuard region;
+      RunSlots(&job, 0);
+    }
+    // Every chunk has been claimed once the caller runs out of work, workers
+    // that have not joined yet are turned away.
+    {
+      std::lock_guard<std::mutex> guard(mutex_);
+      job_ = nullptr;
+    }
+    std::unique_lock<std::mutex> lock(done_mutex_);
+    done_cv_.wait(lock, [&]() {
+      return job.remaining.load(std::memory_order_acquire) == 0 &&
+             job.active.load(std::memory_order_acquire) == 0;
+    });
+    if (job.error) {
+      std::rethrow_exception(job.error);
+    }
+  }
+
+ private:
+  static constexpr int64_t kChunksPerThread = 4;
+
+  struct Job {
+    const std::function<void(int64_t, int64_t)>* fn;
+    int64_t begin;
+    int64_t end;
+    int64_t chunk;
+    int num_slots;
+    // Unclaimed chunks [first, last) of every participant, packed as
+    // first << 32 | last so the owner (front) and thieves (back) can claim
+    // them with a single CAS.
+    std::unique_ptr<std::atomic<uint64_t>[]> slots;
+    std::atomic<int64_t> remaining;
+    std::atomic<int> active;
+    // First exception thrown by fn, rethrown on the calling thread.
+    std::mutex error_mutex;
+    std::exception_ptr error;
+  };
+
+  static std::atomic<ThreadPool*>& SharedPool() {
+    static std::atomic<ThreadPool*> pool(nullptr);
+    return pool;
+  }
+
+  // Workers do not survive fork(), the child builds a fresh pool on first
+  // use (the parent's one is leaked, its locks may be held by dead threads).
+  static void RegisterForkHandler() {
+#ifdef __linux__
+    pthread_atfork(nullptr, nullptr, []() {
+      SharedPool().store(nullptr, std::memory_order_relaxed);
+    });
+#endif
+  }
+
+  static int DefaultNumThreads() {
+    const char* value = std::getenv("FLAGS_custom_cpu_num_threads");
+    if (value && std::atoi(value) > 0) {
+      return std::atoi(value);
+    }
+    const size_t cpus = detail::AllowedCpus().size();
+    if (cpus > 0) {
+      return static_cast<int>(cpus);
+    }
+    return std::max(1u, std::thread::hardware_concurrency());
+  }
+
+  static bool DefaultBindThreads() {
+    const char* value = std::getenv("FLAGS_custom_cpu_bind_threads");
+    return value &&
+           (std::strcmp(value, "1") == 0 || std::strcmp(value, "true") == 0);
+  }
+
+  static bool& InParallelRegion() {
+    static thread_local bool in_region = false;
+    return in_region;
+  }
+
+  struct ParallelRegionGuard {
+    ParallelRegionGuard() { InParallelRegion() = true; }
+    ~ParallelRegionGuard() { InParallelRegion() = false; }
+  };
+
+  static int64_t PopFront(std::atomic<uint64_t>* slot) {
+    uint64_t v = slot->load(std::memory_order_relaxed);
+    while (true) {
+      const uint64_t first = v >> 32;
+      const uint64_t last = v & 0xffffffffu;
+      if (first >= last) return -1;
+      if (slot->compare_exchange_weak(
+              v, ((first + 1) << 32) | last, std::memory_order_acq_rel)) {
+        return static_cast<int64_t>(first);
+      }
+    }
+  }
+
+  static int64_t PopBack(std::atomic<uint64_t>* slot) {
+    uint64_t v = slot->load(std::memory_order_relaxed);
+    while (true) {
+      const uint64_t first = v >> 32;
+      const uint64_t last = v & 0xffffffffu;
+      if (first >= last) return -1;
+      if (slot->compare_exchange_weak(
+              v, (first << 32) | (last - 1), std::memory_order_acq_rel)) {
+        return static_cast<int64_t>(last - 1);
+      }
+    }
+  }
+
+  void RunSlots(Job* job, int self) {
+    auto run = [job](int64_t c) {
+      const int64_t b = job->begin + c * job->chunk;
+      try {
+        (*job->fn)(b, std::min(job->end, b + job->chunk));
+      } catch (...) {
+        std::lock_guard<std::mutex> guard(job->error_mutex);
+        if (!job->error) job->error = std::current_exception();
+      }
+      job->remaining.fetch_sub(1, std::memory_order_acq_rel);
+    };
+    int64_t c;
+    while ((c = PopFront(&job->slots[self])) >= 0) run(c);
+    for (int k = 1; k < job->num_slots; ++k) {
+      auto* victim = &job->slots[(self + k) % job->num_slots];
+      while ((c = PopBack(victim)) >= 0) run(c);
+    }
+  }
+
+  void WorkerLoop(int index, int cpu) {
+#ifdef __linux__
+    if (cpu >= 0) {
+      cpu_set_t set;
+      CPU_ZERO(&set);
+      CPU_SET(cpu, &set);
+      pthread_setaffinity_np(pthread_self(), sizeof(set), &set);
+    }
+#endif
+    InParallelRegion() = true;
+    uint64_t seen = 0;
+    while (true) {
+      Job* job = nullptr;
+      {
+        std::unique_lock<std::mutex> lock(mutex_);
+        cv_.wait(lock, [&]() { return stop_ || generation_ != seen; });
+        if (stop_) return;
+        seen = generation_;
+        // Worker i always takes slot i, so it keeps working on the same part
+        // of a range across calls.
+        if (job_ == nullptr || index >= job_->num_slots) continue;
+        job = job_;
+        job->active.fetch_add(1, std::memory_order_relaxed);
+      }
+      RunSlots(job, index);
+      if (job->active.fetch_sub(1, std::memory_order_acq_rel) == 1) {
+        std::lock_guard<std::mutex> guard(done_mutex_);
+        done_cv_.notify_all();
+      }
+    }
+  }
+
+  std::vector<std::thread> workers_;
+  std::mutex dispatch_mutex_;
+  std::mutex mutex_;
+  std::condition_variable cv_;
+  Job* job_ = nullptr;
+  uint64_t generation_ = 0;
+  bool stop_ = false;
+  std::mutex done_mutex_;
+  std::condition_variable done_cv_;
+};
+
+inline void ParallelFor(int64_t begin,
+                        int64_t end,
+                        int64_t grain,
+                        const std::function<void(int64_t, int64_t)>& fn) {
+  ThreadPool::Instance().ParallelFor(begin, end, grain, fn);
+}
+
+// memcpy split over the pool, copies below 1 MiB per thread stay on the
+// calling thread.
+inline void ParallelMemcpy(void* dst, const void* src, size_t size) {
+  constexpr int64_t kMinBytesPerTask = 1 << 20;
+  ParallelFor(0,
+              static_cast<int64_t>(size),
+              kMinBytesPerTask,
+              [&](int64_t begin, int64_t end) {
+                std::memcpy(static_cast<char*>(dst) + begin,
+                            static_cast<const char*>(src) + begin,
+                            end - begin);
+              });
+}
+
+// std::fill split over the pool, with the same per thread minimum.
+template <typename T>
+void ParallelFill(T* dst, int64_t n, const T& value) {
+  constexpr int64_t kMinBytesPerTask = 1 << 20;
+  const int64_t grain =
+      std::max<int64_t>(1, kMinBytesPerTask / static_cast<int64_t>(sizeof(T)));
+  ParallelFor(0, n, grain, [&](int64_t begin, int64_t end) {
+    std::fill(dst + begin, dst + end, value);
+  });
+}
+
+}  // namespace funcs
+}  // namespace custom_kernel
@@ -0,0 +1,271 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/gather.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+namespace {
+
+// x viewed as [outer, rows, inner] around `axis`.
+void SplitAtAxis(const std::vector<int64_t>& dims,
+                 int axis,
+                 int64_t* outer,
+                 int64_t* rows,
+                 int64_t* inner) {
+  *outer = 1;
+  *inner = 1;
+  for (int i = 0; i < axis; ++i) {
+    *outer *= dims[i];
+  }
+  for (size_t i = axis + 1; i < dims.size(); ++i) {
+    *inner *= dims[i];
+  }
+  *rows = dims.empty() ? 1 : dims[axis];
+}
+
+}  // namespace
+
+template <typename T>
+void GatherKernel(const phi::Context& dev_ctx,
+                  const phi::DenseTensor& x,
+                  const phi::DenseTensor& index,
+                  const phi::Scalar& axis,
+                  phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("gather");
+  if (trace.active()) {
+    trace.set_cost(0, 2 * out->numel() * sizeof(T));
+  }
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  if (out->numel() == 0) {
+    return;
+  }
+  const auto dims = x.dims();
+  const int axis_v =
+      phi::funcs::CanonicalAxis(axis.to<int>(), std::max<int>(dims.size(), 1));
+  int64_t outer, rows, inner;
+  SplitAtAxis(dims, axis_v, &outer, &rows, &inner);
+  VisitIndex(index, [&](const auto* idx) {
+    CheckIndexRange(idx, index.numel(), rows, "gather");
+    funcs::GatherRows(
+        x.data<T>(), outer, rows, inner, idx, index.numel(), out_data);
+  });
+}
+
+template <typename T>
+void GatherGradKernel(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& x,
+                      const phi::DenseTensor& index,
+                      const phi::DenseTensor& out_grad,
+                      const phi::Scalar& axis,
+                      phi::DenseTensor* x_grad) {
+  custom_cpu::TraceScope trace("gather_grad");
+  if (trace.active()) {
+    trace.set_cost(out_grad.numel(),
+                   (x_grad->numel() + 2 * out_grad.numel()) * sizeof(T));
+  }
+  T* dx = dev_ctx.template Alloc<T>(x_grad);
+  std::fill(dx, dx + x_grad->numel(), T(0));
+  if (out_grad.numel() == 0) {
+    return;
+  }
+  const auto dims = x.dims();
+  const int axis_v =
+      phi::funcs::CanonicalAxis(axis.to<int>(), std::max<int>(dims.size(), 1));
+  int64_t outer, rows, inner;
+  SplitAtAxis(dims, axis_v, &outer, &rows, &inner);
+  VisitIndex(index, [&](const auto* idx) {
+    funcs::ScatterRows(idx,
+                       index.numel(),
+                       out_grad.data<T>(),
+                       outer,
+                       rows,
+                       inner,
+                       funcs::ScatterMode::kAdd,
+                       dx);
+  });
+}
+
+template <typename T>
+void GatherNdKernel(const phi::Context& dev_ctx,
+                    const phi::DenseTensor& x,
+                    const phi::DenseTensor& index,
+                    phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("gather_nd");
+  if (trace.active()) {
+    trace.set_cost(0, 2 * out->numel() * sizeof(T));
+  }
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  if (out->numel() == 0) {
+    return;
+  }
+  const auto dims = x.dims();
+  int64_t rows, inner;
+  const auto ids = FlattenNdIndex(index, dims, "gather_nd", &rows, &inner);
+  funcs::GatherRows(x.data<T>(),
+                    1,
+                    rows,
+                    inner,
+                    ids.data(),
+                    static_cast<int64_t>(ids.size()),
+                    out_data);
+}
+
+template <typename T>
+void GatherNdGradKernel(const phi::Context& dev_ctx,
+                        const phi::DenseTensor& x,
+                        const phi::DenseTensor& index,
+                        const phi::DenseTensor& out_grad,
+                        phi::DenseTensor* x_grad) {
+  custom_cpu::TraceScope trace("gather_nd_grad");
+  if (trace.active()) {
+    trace.set_cost(out_grad.numel(),
+                   (x_grad->numel() + 2 * out_grad.numel()) * sizeof(T));
+  }
+  T* dx = dev_ctx.template Alloc<T>(x_grad);
+  std::fill(dx, dx + x_grad->numel(), T(0));
+  if (out_grad.numel() == 0) {
+    return;
+  }
+  const auto dims = x.dims();
+  int64_t rows, inner;
+  const auto ids = FlattenNdIndex(index, dims, "gather_nd_grad", &rows, &inner);
+  funcs::ScatterRows(ids.data(),
+                     static_cast<int64_t>(ids.size()),
+                     out_grad.data<T>(),
+                     1,
+                     rows,
+                     inner,
+                     funcs::ScatterMode::kAdd,
+                     dx);
+}
+
+template <typename T>
+void IndexSelectKernel(const phi::Context& dev_ctx,
+                       const phi::DenseTensor& x,
+                       const phi::DenseTensor& index,
+                       int dim,
+                       phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("index_select");
+  if (trace.active()) {
+    trace.set_cost(0, 2 * out->numel() * sizeof(T));
+  }
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  if (out->numel() == 0) {
+    return;
+  }
+  const auto dims = x.dims();
+  int64_t outer, rows, inner;
+  SplitAtAxis(dims,
+              phi::funcs::CanonicalAxis(dim, std::max<int>(dims.size(), 1)),
+              &outer,
+              &rows,
+              &inner);
+  VisitIndex(index, [&](const auto* idx) {
+    CheckIndexRange(idx, index.numel(), rows, "index_select");
+    funcs::GatherRows(
+        x.data<T>(), outer, rows, inner, idx, index.numel(), out_data);
+  });
+}
+
+template <typename T>
+void IndexSelectGradKernel(const phi::Context& dev_ctx,
+                           const phi::DenseTensor& x,
+                           const phi::DenseTensor& index,
+                           const phi::DenseTensor& out_grad,
+                           int dim,
+                           phi::DenseTensor* x_grad) {
+  custom_cpu::TraceScope trace("index_select_grad");
+  if (trace.active()) {
+    trace.set_cost(out_grad.numel(),
+                   (x_grad->numel() + 2 * out_grad.numel()) * sizeof(T));
+  }
+  T* dx = dev_ctx.template Alloc<T>(x_grad);
+  std::fill(dx, dx + x_grad->numel(), T(0));
+  if (out_grad.numel() == 0) {
+    return;
+  }
+  const auto dims = x.dims();
+  int64_t outer, rows, inner;
+  SplitAtAxis(dims,
+              phi::funcs::CanonicalAxis(dim, std::max<int>(dims.size(), 1)),
+              &outer,
+              &rows,
+              &inner);
+  VisitIndex(index, [&](const auto* idx) {
+    funcs::ScatterRows(idx,
+                       index.numel(),
+                       out_grad.data<T>(),
+                       outer,
+                       rows,
+                       inner,
+                       funcs::ScatterMode::kAdd,
+                       dx);
+  });
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(gather,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::GatherKernel,
+                    float,
+                    double,
+                    int32_t,
+                    int64_t) {}
+
+PD_BUILD_PHI_KERNEL(gather_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::GatherGradKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(gather_nd,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::GatherNdKernel,
+                    float,
+                    double,
+                    int32_t,
+                    int64_t) {}
+
+PD_BUILD_PHI_KERNEL(gather_nd_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::GatherNdGradKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(index_select,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::IndexSelectKernel,
+                    float,
+                    double,
+                    int32_t,
+                    int64_t) {}
+
+PD_BUILD_PHI_KERNEL(index_select_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::IndexSelectGradKernel,
+                    float,
+                    double) {}
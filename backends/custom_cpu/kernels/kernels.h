@@ -14,9 +14,133 @@
 
 #pragma once
 
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/cast.h"
+#include "kernels/funcs/philox.h"
+#include "kernels/funcs/thread_pool.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
+namespace funcs {
+CUSTOM_CPU_CAST_TYPE_OF(phi::dtype::float16, CastType::kFloat16);
+CUSTOM_CPU_CAST_TYPE_OF(phi::dtype::bfloat16, CastType::kBFloat16);
+}  // namespace funcs
+
+// Value of a one-element floating point tensor, e.g. a learning rate.
+inline double GetScalarValue(const phi::DenseTensor& x) {
+  switch (x.dtype()) {
+    case phi::DataType::FLOAT64:
+      return *x.data<double>();
+    case phi::DataType::FLOAT16:
+      return static_cast<float>(*x.data<phi::dtype::float16>());
+    case phi::DataType::BFLOAT16:
+      return static_cast<float>(*x.data<phi::dtype::bfloat16>());
+    default:
+      return *x.data<float>();
+  }
+}
+
+// Makes out a copy of x, nothing to do when out already shares x's buffer.
+inline void CopyIfNotSame(const phi::Context& dev_ctx,
+                          const phi::DenseTensor& x,
+                          phi::DenseTensor* out) {
+  if (x.initialized() && x.Holder() == out->Holder()) {
+    return;
+  }
+  out->Resize(x.dims());
+  auto out_data = dev_ctx.Alloc(out, x.dtype());
+  funcs::ParallelMemcpy(out_data, x.data<void>(), x.memory_size());
+}
+
+// Calls fn(data) with the int32_t or int64_t data of an index tensor.
+template <typename Fn>
+void VisitIndex(const phi::DenseTensor& index, Fn&& fn) {
+  if (index.dtype() == phi::DataType::INT32) {
+    fn(index.data<int32_t>());
+    return;
+  }
+  PD_CHECK(index.dtype() == phi::DataType::INT64,
+           "Index holds int32 or int64 values, but received data type ",
+           index.dtype(),
+           ".");
+  fn(index.data<int64_t>());
+}
+
+// Checks that every index except `skip` is in [0, bound).
+template <typename IndexT>
+void CheckIndexRange(const IndexT* index,
+                     int64_t n,
+                     int64_t bound,
+                     const char* op,
+                     int64_t skip = -1) {
+  for (int64_t i = 0; i < n; ++i) {
+    const int64_t v = static_cast<int64_t>(index[i]);
+    PD_CHECK(v == skip || (v >= 0 && v < bound),
+             op,
+             ": index ",
+             v,
+             " is out of range [0, ",
+             bound,
+             ").");
+  }
+}
+
+// Flat ids of the index tuples in the last dim of `index` into x viewed as
+// [rows, inner], where rows spans the dims addressed by a tuple (gather_nd,
+// scatter_nd_add).
+inline std::vector<int64_t> FlattenNdIndex(const phi::DenseTensor& index,
+                                           const std::vector<int64_t>& x_dims,
+                                           const char* op,
+                                           int64_t* rows,
+                                           int64_t* inner) {
+  const auto index_dims = index.dims();
+  PD_CHECK(!index_dims.empty(), op, ": index must not be a 0-D tensor.");
+  const int64_t k = index_dims.back();
+  PD_CHECK(k <= static_cast<int64_t>(x_dims.size()),
+           op,
+           ": the last dim of index (",
+           k,
+           ") exceeds the rank of x (",
+           x_dims.size(),
+           ").");
+  *rows = 1;
+  *inner = 1;
+  for (int64_t i = 0; i < static_cast<int64_t>(x_dims.size()); ++i) {
+    (i < k ? *rows : *inner) *= x_dims[i];
+  }
+  int64_t n = 1;
+  for (size_t i = 0; i + 1 < index_dims.size(); ++i) {
+    n *= index_dims[i];
+  }
+  std::vector<int64_t> ids(n, 0);
+  VisitIndex(index, [&](const auto* data) {
+    for (int64_t i = 0; i < n; ++i) {
+      int64_t id = 0;
+      for (int64_t j = 0; j < k; ++j) {
+        const int64_t v = static_cast<int64_t>(data[i * k + j]);
+        PD_CHECK(v >= 0 && v < x_dims[j],
+                 op,
+                 ": index ",
+                 v,
+                 " is out of range [0, ",
+                 x_dims[j],
+                 ") of dim ",
+                 j,
+                 ".");
+        id = id * x_dims[j] + v;
+      }
+      ids[i] = id;
+    }
+  });
+  return ids;
+}
+
+// Random stream of a random op with the given seed attribute, 0 means the
+// device generator.
+funcs::PhiloxState GetPhiloxState(const phi::Context& dev_ctx, int seed);
+
 template <typename T>
 void TransposeKernel(const phi::Context& ctx,
                      const phi::DenseTensor& x,
@@ -0,0 +1,116 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/norm.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+template <typename T>
+void LayerNormKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& x,
+                     const paddle::optional<phi::DenseTensor>& scale,
+                     const paddle::optional<phi::DenseTensor>& bias,
+                     float epsilon,
+                     int begin_norm_axis,
+                     phi::DenseTensor* out,
+                     phi::DenseTensor* mean,
+                     phi::DenseTensor* variance) {
+  custom_cpu::TraceScope trace("layer_norm");
+  if (trace.active()) {
+    trace.set_cost(8 * x.numel(), 2 * x.numel() * sizeof(T));
+  }
+  const auto x_dims = x.dims();
+  const int64_t rows = phi::funcs::SizeToAxis(begin_norm_axis, x_dims);
+  const int64_t cols = phi::funcs::SizeFromAxis(begin_norm_axis, x_dims);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  T* mean_data = mean ? dev_ctx.template Alloc<T>(mean) : nullptr;
+  T* var_data = variance ? dev_ctx.template Alloc<T>(variance) : nullptr;
+  if (x.numel() == 0) {
+    return;
+  }
+  funcs::LayerNormForward(rows,
+                          cols,
+                          x.data<T>(),
+                          scale ? scale->data<T>() : nullptr,
+                          bias ? bias->data<T>() : nullptr,
+                          epsilon,
+                          out_data,
+                          mean_data,
+                          var_data);
+}
+
+template <typename T>
+void LayerNormGradKernel(const phi::Context& dev_ctx,
+                         const phi::DenseTensor& x,
+                         const paddle::optional<phi::DenseTensor>& scale,
+                         const paddle::optional<phi::DenseTensor>& bias,
+                         const phi::DenseTensor& mean,
+                         const phi::DenseTensor& variance,
+                         const phi::DenseTensor& out_grad,
+                         float epsilon,
+                         int begin_norm_axis,
+                         phi::DenseTensor* x_grad,
+                         phi::DenseTensor* scale_grad,
+                         phi::DenseTensor* bias_grad) {
+  custom_cpu::TraceScope trace("layer_norm_grad");
+  if (trace.active()) {
+    trace.set_cost(12 * x.numel(), 3 * x.numel() * sizeof(T));
+  }
+  const auto x_dims = x.dims();
+  const int64_t rows = phi::funcs::SizeToAxis(begin_norm_axis, x_dims);
+  const int64_t cols = phi::funcs::SizeFromAxis(begin_norm_axis, x_dims);
+  T* dx = x_grad ? dev_ctx.template Alloc<T>(x_grad) : nullptr;
+  T* dscale = scale_grad ? dev_ctx.template Alloc<T>(scale_grad) : nullptr;
+  T* dbias = bias_grad ? dev_ctx.template Alloc<T>(bias_grad) : nullptr;
+  if (x.numel() == 0) {
+    if (dscale) {
+      std::fill(dscale, dscale + scale_grad->numel(), T(0));
+    }
+    if (dbias) {
+      std::fill(dbias, dbias + bias_grad->numel(), T(0));
+    }
+    return;
+  }
+  funcs::LayerNormBackward(rows,
+                           cols,
+                           x.data<T>(),
+                           scale ? scale->data<T>() : nullptr,
+                           mean.data<T>(),
+                           variance.data<T>(),
+                           out_grad.data<T>(),
+                           epsilon,
+                           dx,
+                           dscale,
+                           dbias);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(layer_norm,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::LayerNormKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(layer_norm_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::LayerNormGradKernel,
+                    float,
+                    double) {}
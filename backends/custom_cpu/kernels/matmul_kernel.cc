@@ -12,8 +12,12 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/gemm.h"
+#include "kernels/kernels.h"
 #include "kernels/phi_funcs.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
@@ -27,17 +31,7 @@ void GEMM(bool trans_x,
           const T* y,
           T* out,
           bool trans_out = false) {
-  memset(out, 0, M * N * sizeof(T));
-  for (size_t m = 0; m < M; ++m) {
-    for (size_t n = 0; n < N; ++n) {
-      auto* out_data = trans_out ? &out[n * M + m] : &out[m * N + n];
-      for (size_t k = 0; k < K; ++k) {
-        auto x_dat = trans_x ? x[k * M + m] : x[m * K + k];
-        auto y_dat = trans_y ? y[n * K + k] : y[k * N + n];
-        *out_data += x_dat * y_dat;
-      }
-    }
-  }
+  funcs::Gemm<T>(trans_x, trans_y, M, K, N, x, y, out, trans_out);
 }
 
 template <typename T>
@@ -55,42 +49,45 @@ void BatchedGEMM(bool trans_x,
                  bool bs_flag = false,
                  bool reduce_bs = false,
                  float alpha = 1.0) {
-  memset(out, 0, sizeof(T) * (reduce_bs ? M * N : batch_size * M * N));
-  if (x_is_larger) {
-    for (size_t bs = 0; bs < batch_size; ++bs) {
-      for (size_t m = 0; m < M; ++m) {
-        for (size_t n = 0; n < N; ++n) {
-          auto out_bs = reduce_bs ? 0 : bs * M * N;
-          auto* out_data =
-              trans_out ? &out[out_bs + n * M + m] : &out[out_bs + m * N + n];
-          for (size_t k = 0; k < K; ++k) {
-            auto x_dat =
-                trans_x ? x[bs * M * K + k * M + m] : x[bs * M * K + m * K + k];
-            auto y_bs = bs_flag ? bs * N * K : 0;
-            auto y_dat = trans_y ? y[y_bs + n * K + k] : y[y_bs + k * N + n];
-            *out_data += static_cast<T>(alpha) * (x_dat * y_dat);
-          }
-        }
-      }
-    }
-  } else {
-    for (size_t bs = 0; bs < batch_size; ++bs) {
-      for (size_t m = 0; m < M; ++m) {
-        for (size_t n = 0; n < N; ++n) {
-          auto out_bs = reduce_bs ? 0 : bs * M * N;
-          auto* out_data =
-              trans_out ? &out[out_bs + n * M + m] : &out[out_bs + m * N + n];
-          for (size_t k = 0; k < K; ++k) {
-            auto y_dat =
-                trans_y ? y[bs * K * N + n * K + k] : y[bs * K * N + k * N + n];
-            auto x_bs = bs_flag ? bs * M * K : 0;
-            auto x_dat = trans_x ? x[x_bs + k * M + m] : x[x_bs + m * K + k];
-            *out_data += static_cast<T>(alpha) * (x_dat * y_dat);
-          }
-        }
-      }
-    }
-  }
+  // The larger operand always advances with the batch, the other one only
+  // when bs_flag is set and is broadcast otherwise.
+  int64_t x_batch_stride = (x_is_larger || bs_flag) ? M * K : 0;
+  int64_t y_batch_stride = (!x_is_larger || bs_flag) ? K * N : 0;
+  funcs::BatchedGemm<T>(trans_x,
+                        trans_y,
+                        M,
+                        K,
+                        N,
+                        x,
+                        x_batch_stride,
+                        y,
+                        y_batch_stride,
+                        out,
+                        batch_size,
+                        trans_out,
+                        reduce_bs,
+                        alpha);
+}
+
+// 2 * M * N * K flops per matrix of out = x * y, over the broadcast batch.
+static uint64_t MatmulFlops(const phi::DenseTensor& x,
+                            const phi::DenseTensor& y,
+                            bool transpose_x,
+                            bool transpose_y) {
+  auto x_dims = x.dims();
+  auto y_dims = y.dims();
+  auto x_ndim = x_dims.size();
+  auto y_ndim = y_dims.size();
+  int64_t K = x_ndim == 1
+                  ? x_dims[0]
+                  : (transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1]);
+  int64_t N =
+      y_ndim == 1 ? 1 : (transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1]);
+  int64_t x_rows = K == 0 ? 0 : x.numel() / K;
+  int64_t y_batch = K * N == 0 ? 0 : y.numel() / (K * N);
+  // x_rows is batch * M of x, y only adds rows when it carries the batch.
+  int64_t rows = x_ndim <= 2 && y_batch > 1 ? x_rows * y_batch : x_rows;
+  return 2 * static_cast<uint64_t>(rows) * N * K;
 }
 
 template <typename T>
@@ -100,6 +97,11 @@ void MatmulKernel(const phi::Context& dev_ctx,
                   bool transpose_x,
                   bool transpose_y,
                   phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("matmul");
+  if (trace.active()) {
+    trace.set_cost(MatmulFlops(x, y, transpose_x, transpose_y),
+                   (x.numel() + y.numel() + out->numel()) * sizeof(T));
+  }
   auto x_dims = x.dims();
   auto y_dims = y.dims();
   auto x_data = x.data<T>();
@@ -303,6 +305,11 @@ void MatmulGradKernel(const phi::Context& dev_ctx,
                       bool transpose_y,
                       phi::DenseTensor* dx,
                       phi::DenseTensor* dy) {
+  custom_cpu::TraceScope trace("matmul_grad");
+  if (trace.active()) {
+    trace.set_cost(2 * MatmulFlops(x, y, transpose_x, transpose_y),
+                   2 * (x.numel() + y.numel() + out_grad.numel()) * sizeof(T));
+  }
   auto x_dims = x.dims();
   auto y_dims = y.dims();
   auto dout_dims = out_grad.dims();
@@ -544,6 +551,7 @@ PD_BUILD_PHI_KERNEL(matmul,
                     ALL_LAYOUT,
                     custom_kernel::MatmulKernel,
                     phi::dtype::float16,
+                    phi::dtype::bfloat16,
                     float,
                     double) {}
 
@@ -552,5 +560,6 @@ PD_BUILD_PHI_KERNEL(matmul_grad,
                     ALL_LAYOUT,
                     custom_kernel::MatmulGradKernel,
                     phi::dtype::float16,
+                    phi::dtype::bfloat16,
                     float,
                     double) {}
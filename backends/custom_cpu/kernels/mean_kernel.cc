@@ -12,8 +12,14 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <algorithm>
+
+#include "kernels/funcs/reduce.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
@@ -21,15 +27,20 @@ template <typename T>
 void MeanAllKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& x,
                    phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("mean_all");
+  if (trace.active()) {
+    trace.set_cost(x.numel(), (x.numel() + 1) * sizeof(T));
+  }
+  using AccT = typename funcs::SumAccType<T>::type;
   auto out_data = dev_ctx.template Alloc<T>(out);
   auto x_data = x.data<T>();
   auto numel = x.numel();
 
-  *out_data = 0;
-  for (auto i = 0; i < numel; ++i) {
-    *out_data += x_data[i];
-  }
-  *out_data /= static_cast<T>(numel);
+  const AccT scale = AccT(1) / static_cast<AccT>(numel);
+  funcs::Reduce<AccT, funcs::SumReducer<AccT>>(
+      {numel}, {0}, x_data, out_data, [scale](AccT v) {
+        return funcs::CastValue<T>(v * scale);
+      });
 }
 
 template <typename T>
@@ -37,6 +48,10 @@ void MeanAllGradKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& out_grad,
                        phi::DenseTensor* x_grad) {
+  custom_cpu::TraceScope trace("mean_all_grad");
+  if (trace.active()) {
+    trace.set_cost(x_grad->numel(), (x_grad->numel() + 1) * sizeof(T));
+  }
   PD_CHECK(out_grad.numel() == 1UL,
            "Mean Gradient should be scalar. But received "
            "Out@Grad's elements num is %d.",
@@ -44,9 +59,10 @@ void MeanAllGradKernel(const phi::Context& dev_ctx,
   auto x_grad_data = dev_ctx.template Alloc<T>(x_grad);
   auto out_grad_data = out_grad.data<T>();
   auto numel = x_grad->numel();
-  for (auto i = 0; i < numel; ++i) {
-    x_grad_data[i] = *out_grad_data / static_cast<T>(numel);
-  }
+  using MT = typename funcs::ComputeType<T>::type;
+  const T value = funcs::CastValue<T>(funcs::CastValue<MT>(*out_grad_data) /
+                                      static_cast<MT>(numel));
+  funcs::ParallelFill(x_grad_data, numel, value);
 }
 
 }  // namespace custom_kernel
@@ -56,11 +72,15 @@ PD_BUILD_PHI_KERNEL(mean_all,
                     ALL_LAYOUT,
                     custom_kernel::MeanAllKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(mean_all_grad,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::MeanAllGradKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
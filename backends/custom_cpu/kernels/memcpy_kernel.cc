@@ -12,7 +12,9 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/thread_pool.h"
 #include "kernels/phi_funcs.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
@@ -24,7 +26,7 @@ void MemcpyD2HKernel(const phi::Context& dev_ctx,
                      phi::DenseTensor* out) {
   auto out_data = dev_ctx.HostAlloc<T>(out);
   auto x_data = x.data<T>();
-  memcpy(out_data, x_data, x.memory_size());
+  funcs::ParallelMemcpy(out_data, x_data, x.memory_size());
 }
 
 template <typename T>
@@ -34,7 +36,7 @@ void MemcpyH2DKernel(const phi::Context& dev_ctx,
                      phi::DenseTensor* out) {
   auto out_data = dev_ctx.Alloc<T>(out);
   auto x_data = x.data<T>();
-  memcpy(out_data, x_data, x.memory_size());
+  funcs::ParallelMemcpy(out_data, x_data, x.memory_size());
 }
 
 }  // namespace custom_kernel
@@ -0,0 +1,114 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/optimizer.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+namespace {
+
+template <typename T, typename VelT>
+void MomentumImpl(const phi::Context& dev_ctx,
+                  const phi::DenseTensor& param,
+                  const phi::DenseTensor& grad,
+                  const phi::DenseTensor& velocity,
+                  const phi::DenseTensor& learning_rate,
+                  const phi::DenseTensor* master_param,
+                  float mu,
+                  bool use_nesterov,
+                  float l2_coeff,
+                  float rescale_grad,
+                  phi::DenseTensor* param_out,
+                  phi::DenseTensor* velocity_out,
+                  phi::DenseTensor* master_param_out) {
+  using MT = typename funcs::OptimizerMathType<T>::type;
+  const funcs::MomentumConfig<MT> config = {
+      static_cast<MT>(mu),
+      static_cast<MT>(GetScalarValue(learning_rate)),
+      static_cast<MT>(rescale_grad),
+      static_cast<MT>(l2_coeff),
+      use_nesterov};
+  funcs::MomentumUpdate(
+      config,
+      param.numel(),
+      grad.data<T>(),
+      param.data<T>(),
+      master_param ? master_param->data<MT>() : nullptr,
+      velocity.data<VelT>(),
+      dev_ctx.template Alloc<T>(param_out),
+      master_param ? dev_ctx.template Alloc<MT>(master_param_out) : nullptr,
+      dev_ctx.template Alloc<VelT>(velocity_out));
+}
+
+}  // namespace
+
+template <typename T>
+void MomentumDenseKernel(const phi::Context& dev_ctx,
+                         const phi::DenseTensor& param,
+                         const phi::DenseTensor& grad,
+                         const phi::DenseTensor& velocity,
+                         const phi::DenseTensor& learning_rate,
+                         const paddle::optional<phi::DenseTensor>& master_param,
+                         float mu,
+                         bool use_nesterov,
+                         const std::string& regularization_method,
+                         float regularization_coeff,
+                         bool multi_precision,
+                         float rescale_grad,
+                         phi::DenseTensor* param_out,
+                         phi::DenseTensor* velocity_out,
+                         phi::DenseTensor* master_param_out) {
+  custom_cpu::TraceScope trace("momentum");
+  if (trace.active()) {
+    trace.set_cost(5 * param.numel(),
+                   3 * param.memory_size() + 2 * velocity.memory_size());
+  }
+  using MT = typename funcs::OptimizerMathType<T>::type;
+  const phi::DenseTensor* master =
+      multi_precision && master_param ? master_param.get_ptr() : nullptr;
+  const float l2_coeff =
+      regularization_method == "l2_decay" ? regularization_coeff : 0.0f;
+  // Velocities are MT under multi-precision training and may be T otherwise.
+  auto impl = velocity.dtype() == phi::capi::CppTypeToPDType<T>::Type()
+                  ? MomentumImpl<T, T>
+                  : MomentumImpl<T, MT>;
+  impl(dev_ctx,
+       param,
+       grad,
+       velocity,
+       learning_rate,
+       master,
+       mu,
+       use_nesterov,
+       l2_coeff,
+       rescale_grad,
+       param_out,
+       velocity_out,
+       master_param_out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(momentum,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::MomentumDenseKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
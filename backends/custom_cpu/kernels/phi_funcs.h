@@ -256,82 +256,53 @@ inline std::vector<int64_t> GetDecreasedDims(
   return decreased_dims;
 }
 
-}  // namespace funcs
-
-template <typename T>
-static inline void BroadcastTo(const phi::Context& dev_ctx,
-                               const phi::DenseTensor& in,
-                               std::vector<int64_t> out_dims,
-                               int axis,
-                               phi::DenseTensor* out) {
-  auto in_dims = in.dims();
-
-  if (in_dims.size() == out_dims.size()) {
-    bool broadcast = false;
-    for (auto i = 0; i < in_dims.size(); ++i) {
-      if (in_dims[i] != out_dims[i]) {
-        broadcast = true;
-        break;
-      }
-    }
-    if (!broadcast) {
-      out->ShareDataWith(in);
-      return;
+// Expands `paddings` of a conv or pool op to [begin_0, end_0, begin_1, end_1,
+// ...] and applies `padding_algorithm`: "SAME" pads so that out = ceil(in /
+// stride) and resets the dilation to 1, "VALID" drops the padding.
+// `dilation` may be null for pooling. IntT follows the attribute type of the
+// op: int for conv, int64_t for pool.
+template <typename IntT>
+void UpdatePaddingAndDilation(std::vector<IntT>* paddings,
+                              std::vector<IntT>* dilation,
+                              const std::string& padding_algorithm,
+                              const std::vector<int64_t>& data_dims,
+                              const std::vector<IntT>& strides,
+                              const std::vector<int64_t>& ksize) {
+  if (paddings->size() == data_dims.size()) {
+    std::vector<IntT> expanded;
+    for (size_t i = 0; i < data_dims.size(); ++i) {
+      expanded.push_back((*paddings)[i]);
+      expanded.push_back((*paddings)[i]);
     }
+    *paddings = expanded;
   }
-
-  out->Resize(out_dims);
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto in_data = in.data<T>();
-
-  axis = axis == -1 ? std::abs(static_cast<int>(in_dims.size()) -
-                               static_cast<int>(out_dims.size()))
-                    : axis;
-  auto retain = static_cast<int>(out_dims.size()) - axis -
-                static_cast<int>(in_dims.size());
-  std::vector<size_t> tmp_dims;
-  for (auto i = 0; i < axis; ++i) {
-    tmp_dims.push_back(1);
-  }
-  tmp_dims.insert(tmp_dims.end(), in_dims.cbegin(), in_dims.cend());
-  for (auto i = 0; i < retain; ++i) {
-    tmp_dims.push_back(1);
-  }
-
-  auto numel = out->numel();
-  std::vector<size_t> index(out_dims.size(), 0);
-  std::vector<size_t> in_step(tmp_dims.size(), 1);
-  std::vector<size_t> out_step(out_dims.size(), 1);
-  for (auto i = tmp_dims.size() - 1; i > 0; --i) {
-    in_step[i - 1] = in_step[i] * tmp_dims[i];
-  }
-  for (auto i = out_dims.size() - 1; i > 0; --i) {
-    out_step[i - 1] = out_step[i] * out_dims[i];
-  }
-
-  for (auto i = 0; i < numel; ++i) {
-    auto src_index = index;
-    for (auto j = 0; j < tmp_dims.size(); ++j) {
-      if (tmp_dims[j] == 1) {
-        src_index[j] = 0;
-      }
-    }
-
-    out_data[phi::vec_product(index, out_step)] =
-        in_data[phi::vec_product(src_index, in_step)];
-
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= out_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
+  PD_CHECK(paddings->size() == 2 * data_dims.size(),
+           "Paddings should have ",
+           data_dims.size(),
+           " or ",
+           2 * data_dims.size(),
+           " elements, but received ",
+           paddings->size(),
+           ".");
+
+  if (padding_algorithm == "SAME") {
+    for (size_t i = 0; i < data_dims.size(); ++i) {
+      const int64_t out_size = (data_dims[i] + strides[i] - 1) / strides[i];
+      const IntT pad_sum = static_cast<IntT>(std::max<int64_t>(
+          (out_size - 1) * strides[i] + ksize[i] - data_dims[i], 0));
+      (*paddings)[2 * i] = pad_sum / 2;
+      (*paddings)[2 * i + 1] = pad_sum - pad_sum / 2;
+      if (dilation) {
+        (*dilation)[i] = 1;
       }
     }
+  } else if (padding_algorithm == "VALID") {
+    std::fill(paddings->begin(), paddings->end(), 0);
   }
 }
 
+}  // namespace funcs
+
 static inline std::vector<int64_t> BroadcastDims(
     int axis,
     const std::vector<int64_t>& x_dims,
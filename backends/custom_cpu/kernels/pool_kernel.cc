@@ -0,0 +1,219 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/pool.h"
+#include "kernels/funcs/strided_copy.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+namespace {
+
+const std::vector<int> kNHWCToNCHW = {0, 3, 1, 2};
+const std::vector<int> kNCHWToNHWC = {0, 2, 3, 1};
+
+funcs::Pool2DShape MakePool2DShape(const std::vector<int64_t>& x_dims,
+                                   const std::vector<int64_t>& out_dims,
+                                   const phi::IntArray& kernel_size,
+                                   const std::vector<int64_t>& strides,
+                                   const std::vector<int64_t>& paddings,
+                                   bool exclusive,
+                                   bool channel_last,
+                                   bool global_pooling,
+                                   bool adaptive,
+                                   const std::string& padding_algorithm) {
+  PD_CHECK(x_dims.size() == 4,
+           "pool2d expects a 4-D input, but received ",
+           x_dims.size(),
+           "-D.");
+  const int h_axis = channel_last ? 1 : 2;
+  std::vector<int64_t> ksize = kernel_size.GetData();
+  if (ksize.size() == 1) {
+    ksize.push_back(ksize[0]);
+  }
+  std::vector<int64_t> pads = paddings;
+  if (global_pooling) {
+    ksize = {x_dims[h_axis], x_dims[h_axis + 1]};
+    pads.assign(4, 0);
+  } else {
+    phi::funcs::UpdatePaddingAndDilation<int64_t>(
+        &pads,
+        nullptr,
+        padding_algorithm,
+        {x_dims[h_axis], x_dims[h_axis + 1]},
+        strides,
+        ksize);
+  }
+
+  funcs::Pool2DShape s;
+  s.planes = x_dims[0] * x_dims[channel_last ? 3 : 1];
+  s.in_h = x_dims[h_axis];
+  s.in_w = x_dims[h_axis + 1];
+  s.out_h = out_dims[h_axis];
+  s.out_w = out_dims[h_axis + 1];
+  s.kernel_h = ksize[0];
+  s.kernel_w = ksize[1];
+  s.stride_h = global_pooling ? 1 : strides[0];
+  s.stride_w = global_pooling ? 1 : strides[1];
+  s.pad_top = pads[0];
+  s.pad_left = pads[2];
+  s.adaptive = adaptive;
+  s.exclusive = exclusive;
+  return s;
+}
+
+funcs::PoolType ToPoolType(const std::string& pooling_type) {
+  PD_CHECK(pooling_type == "max" || pooling_type == "avg",
+           "pooling_type should be max or avg, but received ",
+           pooling_type,
+           ".");
+  return pooling_type == "max" ? funcs::PoolType::kMax : funcs::PoolType::kAvg;
+}
+
+}  // namespace
+
+template <typename T>
+void Pool2dKernel(const phi::Context& dev_ctx,
+                  const phi::DenseTensor& x,
+                  const phi::IntArray& kernel_size,
+                  const std::vector<int64_t>& strides,
+                  const std::vector<int64_t>& paddings,
+                  bool ceil_mode,
+                  bool exclusive,
+                  const std::string& data_format,
+                  const std::string& pooling_type,
+                  bool global_pooling,
+                  bool adaptive,
+                  const std::string& padding_algorithm,
+                  phi::DenseTensor* out) {
+  const bool channel_last = data_format == "NHWC";
+  auto s = MakePool2DShape(x.dims(),
+                           out->dims(),
+                           kernel_size,
+                           strides,
+                           paddings,
+                           exclusive,
+                           channel_last,
+                           global_pooling,
+                           adaptive,
+                           padding_algorithm);
+  const auto type = ToPoolType(pooling_type);
+  custom_cpu::TraceScope trace("pool2d");
+  if (trace.active()) {
+    trace.set_cost(out->numel() * s.kernel_h * s.kernel_w,
+                   (x.numel() + out->numel()) * sizeof(T));
+  }
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  if (out->numel() == 0) {
+    return;
+  }
+  if (!channel_last) {
+    funcs::Pool2DForward(s, type, x.data<T>(), out_data);
+    return;
+  }
+
+  // NHWC runs the NCHW engine between two transposes.
+  const auto dims = x.dims();
+  std::vector<T> x_nchw(x.numel());
+  std::vector<T> out_nchw(out->numel());
+  funcs::Transpose(dims, x.data<T>(), kNHWCToNCHW, x_nchw.data());
+  funcs::Pool2DForward(s, type, x_nchw.data(), out_nchw.data());
+  funcs::Transpose({dims[0], dims[3], s.out_h, s.out_w},
+                   out_nchw.data(),
+                   kNCHWToNHWC,
+                   out_data);
+}
+
+template <typename T>
+void Pool2dGradKernel(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& x,
+                      const phi::DenseTensor& out,
+                      const phi::DenseTensor& dout,
+                      const phi::IntArray& kernel_size,
+                      const std::vector<int64_t>& strides,
+                      const std::vector<int64_t>& paddings,
+                      bool ceil_mode,
+                      bool exclusive,
+                      const std::string& data_format,
+                      const std::string& pooling_type,
+                      bool global_pooling,
+                      bool adaptive,
+                      const std::string& padding_algorithm,
+                      phi::DenseTensor* dx) {
+  const bool channel_last = data_format == "NHWC";
+  auto s = MakePool2DShape(x.dims(),
+                           out.dims(),
+                           kernel_size,
+                           strides,
+                           paddings,
+                           exclusive,
+                           channel_last,
+                           global_pooling,
+                           adaptive,
+                           padding_algorithm);
+  const auto type = ToPoolType(pooling_type);
+  custom_cpu::TraceScope trace("pool2d_grad");
+  if (trace.active()) {
+    trace.set_cost(out.numel() * s.kernel_h * s.kernel_w,
+                   (2 * x.numel() + 2 * out.numel()) * sizeof(T));
+  }
+  T* dx_data = dev_ctx.template Alloc<T>(dx);
+  if (dx->numel() == 0) {
+    return;
+  }
+  if (!channel_last) {
+    funcs::Pool2DBackward(
+        s, type, x.data<T>(), out.data<T>(), dout.data<T>(), dx_data);
+    return;
+  }
+
+  const auto dims = x.dims();
+  const auto out_dims = out.dims();
+  std::vector<T> x_nchw(x.numel());
+  std::vector<T> out_nchw(out.numel());
+  std::vector<T> dout_nchw(out.numel());
+  std::vector<T> dx_nchw(x.numel());
+  funcs::Transpose(dims, x.data<T>(), kNHWCToNCHW, x_nchw.data());
+  funcs::Transpose(out_dims, out.data<T>(), kNHWCToNCHW, out_nchw.data());
+  funcs::Transpose(out_dims, dout.data<T>(), kNHWCToNCHW, dout_nchw.data());
+  funcs::Pool2DBackward(s,
+                        type,
+                        x_nchw.data(),
+                        out_nchw.data(),
+                        dout_nchw.data(),
+                        dx_nchw.data());
+  funcs::Transpose({dims[0], dims[3], dims[1], dims[2]},
+                   dx_nchw.data(),
+                   kNCHWToNHWC,
+                   dx_data);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(pool2d,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Pool2dKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(pool2d_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Pool2dGradKernel,
+                    float,
+                    double) {}
@@ -12,13 +12,56 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <algorithm>
 #include <cmath>
 
+#include "kernels/funcs/reduce.h"
+#include "kernels/kernels.h"
 #include "kernels/phi_funcs.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
+// Returns the sorted, non-negative axes to reduce. An empty axis list means
+// reducing over all axes.
+inline std::vector<int64_t> GetReduceDims(const std::vector<int64_t>& x_dims,
+                                          const phi::IntArray& dims,
+                                          bool reduce_all) {
+  const int64_t rank = x_dims.size();
+  std::vector<int64_t> reduce_dims;
+  if (reduce_all || dims.size() == 0) {
+    for (int64_t i = 0; i < rank; ++i) {
+      reduce_dims.push_back(i);
+    }
+    return reduce_dims;
+  }
+  for (auto d : dims.GetData()) {
+    // handle negative dims, f.e. "-1" means rightmost dimension
+    if (d < 0) {
+      d = d + rank;
+    }
+    PD_CHECK(d >= 0 && d < std::max<int64_t>(rank, 1),
+             "The reduce dim should be in range [-",
+             rank,
+             ", ",
+             rank,
+             "), but received ",
+             d,
+             ".");
+    reduce_dims.push_back(d);
+  }
+  std::sort(reduce_dims.begin(), reduce_dims.end());
+  reduce_dims.erase(std::unique(reduce_dims.begin(), reduce_dims.end()),
+                    reduce_dims.end());
+  // A 0-D tensor may be reduced over axis 0 / -1.
+  if (rank == 0) {
+    reduce_dims.clear();
+  }
+  return reduce_dims;
+}
+
 template <typename T>
 void MeanRawKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& x,
@@ -26,56 +69,24 @@ void MeanRawKernel(const phi::Context& dev_ctx,
                    bool keep_dim,
                    bool reduce_all,
                    phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
+  custom_cpu::TraceScope trace("mean");
+  if (trace.active()) {
+    trace.set_cost(x.numel(), (x.numel() + out->numel()) * sizeof(T));
   }
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
+  using AccT = typename funcs::SumAccType<T>::type;
+  auto x_dims = x.dims();
+  auto reduce_dims = GetReduceDims(x_dims, dims, reduce_all);
   auto out_data = dev_ctx.template Alloc<T>(out);
 
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  memset(out_data, 0, sizeof(T) * out->numel());
-  size_t reduce_numel = 1;
+  int64_t reduce_numel = 1;
   for (auto d : reduce_dims) {
     reduce_numel *= x_dims[d];
   }
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] +=
-        x_data[phi::vec_product(step, index)] / reduce_numel;
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  const AccT scale = AccT(1) / static_cast<AccT>(reduce_numel);
+  funcs::Reduce<AccT, funcs::SumReducer<AccT>>(
+      x_dims, reduce_dims, x.data<T>(), out_data, [scale](AccT v) {
+        return funcs::CastValue<T>(v * scale);
+      });
 }
 
 template <typename T>
@@ -99,57 +110,18 @@ void SumRawKernel(const phi::Context& dev_ctx,
                   bool reduce_all,
                   phi::DataType out_dtype,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_dims.size() == 0) {
-    reduce_all = true;
+  custom_cpu::TraceScope trace("sum");
+  if (trace.active()) {
+    trace.set_cost(x.numel(), (x.numel() + out->numel()) * sizeof(T));
   }
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
+  using AccT = typename funcs::SumAccType<T>::type;
+  auto x_dims = x.dims();
+  auto reduce_dims = GetReduceDims(x_dims, dims, reduce_all);
   auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-
-  memset(out_data, 0, sizeof(T) * out->numel());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] +=
-        x_data[phi::vec_product(step, index)];
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  funcs::Reduce<AccT, funcs::SumReducer<AccT>>(
+      x_dims, reduce_dims, x.data<T>(), out_data, [](AccT v) {
+        return funcs::CastValue<T>(v);
+      });
 }
 
 template <typename T>
@@ -173,57 +145,18 @@ void MinRawKernel(const phi::Context& dev_ctx,
                   bool keep_dim,
                   bool reduce_all,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_dims.size() == 0) {
-    reduce_all = true;
-  }
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
+  custom_cpu::TraceScope trace("min");
+  if (trace.active()) {
+    trace.set_cost(x.numel(), (x.numel() + out->numel()) * sizeof(T));
   }
-
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
+  auto x_dims = x.dims();
+  auto reduce_dims = GetReduceDims(x_dims, dims, reduce_all);
   auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  std::fill(out_data, out_data + out->numel(), std::numeric_limits<T>::max());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] =
-        std::min(out_data[phi::vec_product(dst_step, index)],
-                 x_data[phi::vec_product(step, index)]);
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  using MT = typename funcs::ComputeType<T>::type;
+  funcs::Reduce<MT, funcs::MinReducer<MT>>(
+      x_dims, reduce_dims, x.data<T>(), out_data, [](MT v) {
+        return funcs::CastValue<T>(v);
+      });
 }
 
 template <typename T>
@@ -246,54 +179,18 @@ void MaxRawKernel(const phi::Context& dev_ctx,
                   bool keep_dim,
                   bool reduce_all,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
+  custom_cpu::TraceScope trace("max");
+  if (trace.active()) {
+    trace.set_cost(x.numel(), (x.numel() + out->numel()) * sizeof(T));
   }
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
+  auto x_dims = x.dims();
+  auto reduce_dims = GetReduceDims(x_dims, dims, reduce_all);
   auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  std::fill(
-      out_data, out_data + out->numel(), std::numeric_limits<T>::lowest());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] =
-        std::max(out_data[phi::vec_product(dst_step, index)],
-                 x_data[phi::vec_product(step, index)]);
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  using MT = typename funcs::ComputeType<T>::type;
+  funcs::Reduce<MT, funcs::MaxReducer<MT>>(
+      x_dims, reduce_dims, x.data<T>(), out_data, [](MT v) {
+        return funcs::CastValue<T>(v);
+      });
 }
 
 template <typename T>
@@ -316,20 +213,36 @@ PD_BUILD_PHI_KERNEL(mean_raw,
                     ALL_LAYOUT,
                     custom_kernel::MeanRawKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
-PD_BUILD_PHI_KERNEL(
-    mean, custom_cpu, ALL_LAYOUT, custom_kernel::MeanKernel, float, double) {}
+PD_BUILD_PHI_KERNEL(mean,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::MeanKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(sum_raw,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::SumRawKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
-PD_BUILD_PHI_KERNEL(
-    sum, custom_cpu, ALL_LAYOUT, custom_kernel::SumKernel, float, double) {}
+PD_BUILD_PHI_KERNEL(sum,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::SumKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(min_raw,
                     custom_cpu,
@@ -338,7 +251,9 @@ PD_BUILD_PHI_KERNEL(min_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(min,
                     custom_cpu,
@@ -347,7 +262,9 @@ PD_BUILD_PHI_KERNEL(min,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(max_raw,
                     custom_cpu,
@@ -356,7 +273,9 @@ PD_BUILD_PHI_KERNEL(max_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(max,
                     custom_cpu,
@@ -365,4 +284,6 @@ PD_BUILD_PHI_KERNEL(max,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -14,6 +14,7 @@
 
 #include <cstring>
 
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
@@ -135,16 +136,14 @@ void ReshapeInferKernel(const phi::Context& dev_ctx,
     out->share_lod(x);
   }
 
-  dev_ctx.Alloc(out, x.dtype());
+  // Reshape of a contiguous tensor is a view: share the buffer and only
+  // change the meta data, no bytes are moved.
   if (!(x.initialized() && x.Holder() == out->Holder())) {
-    dev_ctx.Alloc(out, x.dtype());
-    auto dims = out->dims();
-    auto x_data = x.data<T>();
-    auto out_data = out->data<T>();
-
-    memcpy(out_data, x_data, x.numel() * sizeof(T));
-    out->Resize(dims);
-    out->ResetLoD(x.lod());
+    auto lod = x.lod();
+    out->ShareDataWith(x);
+    out->Resize(out_dims);
+    out->set_strides(phi::CalcStrides(out_dims));
+    out->ResetLoD(lod);
   }
 }
 
@@ -0,0 +1,200 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/gather.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+namespace {
+
+// scatter updates whole rows of x, the index is [n] or [n, 1].
+void ScatterRowShape(const std::vector<int64_t>& x_dims,
+                     const phi::DenseTensor& index,
+                     int64_t* rows,
+                     int64_t* inner) {
+  const auto index_dims = index.dims();
+  PD_CHECK(
+      index_dims.size() == 1 || (index_dims.size() == 2 && index_dims[1] == 1),
+      "scatter expects an index of shape [n] or [n, 1].");
+  *rows = x_dims.empty() ? 1 : x_dims[0];
+  *inner = 1;
+  for (size_t i = 1; i < x_dims.size(); ++i) {
+    *inner *= x_dims[i];
+  }
+}
+
+}  // namespace
+
+template <typename T>
+void ScatterKernel(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& x,
+                   const phi::DenseTensor& index,
+                   const phi::DenseTensor& updates,
+                   bool overwrite,
+                   phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("scatter");
+  if (trace.active()) {
+    trace.set_cost(updates.numel(),
+                   (2 * x.numel() + 2 * updates.numel()) * sizeof(T));
+  }
+  CopyIfNotSame(dev_ctx, x, out);
+  if (updates.numel() == 0) {
+    return;
+  }
+  int64_t rows, inner;
+  ScatterRowShape(x.dims(), index, &rows, &inner);
+  VisitIndex(index, [&](const auto* idx) {
+    CheckIndexRange(idx, index.numel(), rows, "scatter");
+    funcs::ScatterRows(
+        idx,
+        index.numel(),
+        updates.data<T>(),
+        1,
+        rows,
+        inner,
+        overwrite ? funcs::ScatterMode::kOverwrite : funcs::ScatterMode::kSum,
+        out->data<T>());
+  });
+}
+
+template <typename T>
+void ScatterGradKernel(const phi::Context& dev_ctx,
+                       const phi::DenseTensor& index,
+                       const phi::DenseTensor& updates,
+                       const phi::DenseTensor& out_grad,
+                       bool overwrite,
+                       phi::DenseTensor* x_grad,
+                       phi::DenseTensor* updates_grad) {
+  custom_cpu::TraceScope trace("scatter_grad");
+  if (trace.active()) {
+    trace.set_cost(0, (2 * out_grad.numel() + 2 * updates.numel()) * sizeof(T));
+  }
+  int64_t rows, inner;
+  ScatterRowShape(out_grad.dims(), index, &rows, &inner);
+  VisitIndex(index, [&](const auto* idx) {
+    CheckIndexRange(idx, index.numel(), rows, "scatter_grad");
+    // Both modes replace the indexed rows of x, so they get no gradient.
+    if (x_grad) {
+      CopyIfNotSame(dev_ctx, out_grad, x_grad);
+      T* dx = x_grad->data<T>();
+      for (int64_t i = 0; i < index.numel(); ++i) {
+        T* row = dx + static_cast<int64_t>(idx[i]) * inner;
+        std::fill(row, row + inner, T(0));
+      }
+    }
+    if (updates_grad) {
+      T* dupdates = dev_ctx.template Alloc<T>(updates_grad);
+      funcs::GatherRows(
+          out_grad.data<T>(), 1, rows, inner, idx, index.numel(), dupdates);
+    }
+  });
+}
+
+template <typename T>
+void ScatterNdAddKernel(const phi::Context& dev_ctx,
+                        const phi::DenseTensor& x,
+                        const phi::DenseTensor& index,
+                        const phi::DenseTensor& updates,
+                        phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("scatter_nd_add");
+  if (trace.active()) {
+    trace.set_cost(updates.numel(),
+                   (2 * x.numel() + 2 * updates.numel()) * sizeof(T));
+  }
+  CopyIfNotSame(dev_ctx, x, out);
+  if (updates.numel() == 0) {
+    return;
+  }
+  int64_t rows, inner;
+  const auto ids =
+      FlattenNdIndex(index, x.dims(), "scatter_nd_add", &rows, &inner);
+  funcs::ScatterRows(ids.data(),
+                     static_cast<int64_t>(ids.size()),
+                     updates.data<T>(),
+                     1,
+                     rows,
+                     inner,
+                     funcs::ScatterMode::kAdd,
+                     out->data<T>());
+}
+
+template <typename T>
+void ScatterNdAddGradKernel(const phi::Context& dev_ctx,
+                            const phi::DenseTensor& index,
+                            const phi::DenseTensor& updates,
+                            const phi::DenseTensor& out_grad,
+                            phi::DenseTensor* x_grad,
+                            phi::DenseTensor* updates_grad) {
+  custom_cpu::TraceScope trace("scatter_nd_add_grad");
+  if (trace.active()) {
+    trace.set_cost(0, (2 * out_grad.numel() + 2 * updates.numel()) * sizeof(T));
+  }
+  if (x_grad) {
+    CopyIfNotSame(dev_ctx, out_grad, x_grad);
+  }
+  if (updates_grad) {
+    T* dupdates = dev_ctx.template Alloc<T>(updates_grad);
+    if (updates_grad->numel() == 0) {
+      return;
+    }
+    int64_t rows, inner;
+    const auto ids = FlattenNdIndex(
+        index, out_grad.dims(), "scatter_nd_add_grad", &rows, &inner);
+    funcs::GatherRows(out_grad.data<T>(),
+                      1,
+                      rows,
+                      inner,
+                      ids.data(),
+                      static_cast<int64_t>(ids.size()),
+                      dupdates);
+  }
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(scatter,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::ScatterKernel,
+                    float,
+                    double,
+                    int32_t,
+                    int64_t) {}
+
+PD_BUILD_PHI_KERNEL(scatter_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::ScatterGradKernel,
+                    float,
+                    double) {}
+
+PD_BUILD_PHI_KERNEL(scatter_nd_add,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::ScatterNdAddKernel,
+                    float,
+                    double,
+                    int32_t,
+                    int64_t) {}
+
+PD_BUILD_PHI_KERNEL(scatter_nd_add_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::ScatterNdAddGradKernel,
+                    float,
+                    double) {}
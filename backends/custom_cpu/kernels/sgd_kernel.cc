@@ -12,7 +12,9 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
@@ -41,6 +43,10 @@ void SGDDenseKernel(const phi::Context& dev_ctx,
                     bool multi_precision,
                     phi::DenseTensor* param_out,
                     phi::DenseTensor* master_param_out) {
+  custom_cpu::TraceScope trace("sgd");
+  if (trace.active()) {
+    trace.set_cost(2 * param.numel(), 3 * param.numel() * sizeof(T));
+  }
   dev_ctx.template Alloc<T>(param_out);
   sgd_dense_param_dense_grad_impl<T>(param, learning_rate, grad, param_out);
 }
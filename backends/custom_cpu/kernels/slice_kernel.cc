@@ -12,8 +12,11 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/strided_copy.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
@@ -26,6 +29,10 @@ void SliceRawKernel(const phi::Context& ctx,
                     const std::vector<int64_t>& infer_flags,
                     const std::vector<int64_t>& decrease_axis,
                     phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("slice");
+  if (trace.active()) {
+    trace.set_cost(0, 2 * out->numel() * sizeof(T));
+  }
   // Step 1: Get the accurate attribute value of starts and ends
   auto starts = starts_arr.GetData();
   auto ends = ends_arr.GetData();
@@ -59,41 +66,27 @@ void SliceRawKernel(const phi::Context& ctx,
       in_dims, axes, starts, ends, nullptr, nullptr);
   out_dims = phi::funcs::GetDecreasedDims<int64_t>(slice_dims, decrease_axis);
 
-  // 2.2 Get output
-  auto offsets = std::vector<size_t>(rank);
-  auto extents = std::vector<size_t>(rank);
-
-  for (size_t i = 0; i < rank; ++i) {
-    offsets[i] = 0;
-    extents[i] = slice_dims[i];
-  }
+  // 2.2 Get output. slice is not a view op for the framework, so the output
+  // owns its data; views are left to the stride kernels. A leading-dim
+  // slice is one contiguous run and StridedCopy moves it with one memcpy.
+  std::vector<int64_t> offsets(rank, 0);
   for (size_t i = 0; i < axes.size(); ++i) {
     offsets[axes[i]] = starts[i];
   }
+  const auto in_strides = funcs::ContiguousStrides(in_dims);
+  int64_t in_offset = 0;
+  for (int i = 0; i < rank; ++i) {
+    in_offset += offsets[i] * in_strides[i];
+  }
 
   out->Resize(slice_dims);
   auto out_data = ctx.template Alloc<T>(out);
-
-  std::vector<size_t> in_step(rank, 1);
-  for (auto i = rank - 1; i > 0; --i) {
-    in_step[i - 1] = in_step[i] * in_dims[i];
-  }
-
-  auto numel = phi::product(slice_dims);
-  auto index = std::vector<size_t>(offsets.cbegin(), offsets.cend());
-  for (auto i = 0; i < numel; i += slice_dims.back()) {
-    memcpy(out_data + i,
-           in_data + phi::vec_product(index, in_step),
-           sizeof(T) * slice_dims.back());
-    index[index.size() - 2]++;
-    for (auto j = index.size() - 2; j > 0; --j) {
-      if (index[j] >= offsets[j] + extents[j]) {
-        index[j] = offsets[j];
-        index[j - 1] += 1;
-      } else {
-        break;
-      }
-    }
+  if (out->numel() > 0) {
+    funcs::StridedCopy<T>(slice_dims,
+                          in_data + in_offset,
+                          in_strides,
+                          out_data,
+                          funcs::ContiguousStrides(slice_dims));
   }
   out->Resize(out_dims);
 }
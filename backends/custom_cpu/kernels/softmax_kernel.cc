@@ -12,51 +12,25 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/softmax.h"
+#include "kernels/kernels.h"
 #include "kernels/phi_funcs.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
-template <typename T>
-T ValueClip(const T& x) {
-  const T kThreshold = static_cast<T>(-64.);
-  return x < kThreshold ? kThreshold : x;
-}
-
-template <typename T>
-void Softmax(int axis_dim, const T* in, T* out, size_t M, size_t N) {
-  auto remain = N / axis_dim;
-
-  for (size_t i = 0; i < M; ++i) {
-    for (size_t k = 0; k < remain; ++k) {
-      T max_val = in[i * N + k];
-      for (size_t j = 0; j < axis_dim; ++j) {
-        max_val = std::max(max_val, in[i * N + j * remain + k]);
-      }
-
-      auto exps = new T[axis_dim];
-      for (size_t j = 0; j < axis_dim; ++j) {
-        exps[j] = std::exp(ValueClip(in[i * N + j * remain + k] - max_val));
-      }
-
-      T sum = 0;
-      for (size_t j = 0; j < axis_dim; ++j) {
-        sum += exps[j];
-      }
-
-      for (size_t j = 0; j < axis_dim; ++j) {
-        out[i * N + j * remain + k] = exps[j] / sum;
-      }
-      delete[] exps;
-    }
-  }
-}
-
 template <typename T>
 void SoftmaxKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& x,
                    int axis,
                    phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("softmax");
+  if (trace.active()) {
+    // max, subtract, exp, sum and scale per element.
+    trace.set_cost(5 * x.numel(), 2 * x.numel() * sizeof(T));
+  }
   const int rank = x.dims().size();
   const int calc_axis = phi::funcs::CanonicalAxis(axis, rank);
   int axis_dim = x.dims()[calc_axis];
@@ -71,35 +45,17 @@ void SoftmaxKernel(const phi::Context& dev_ctx,
     return;
   }
 
+  using MT = typename funcs::ComputeType<T>::type;
   const int n = phi::funcs::SizeToAxis(calc_axis, x.dims());
   const int d = phi::funcs::SizeFromAxis(calc_axis, x.dims());
-  Softmax(axis_dim, x.data<T>(), out->data<T>(), n, d);
-}
-
-template <typename T>
-void SoftmaxGrad(
-    const T* out, const T* out_grad, int axis_dim, int M, int N, T* x_grad) {
-  int num_remain = N / axis_dim;
-  T* dot = new T[M * num_remain];
-  for (auto i = 0; i < M; ++i) {
-    for (auto k = 0; k < num_remain; ++k) {
-      dot[i * num_remain + k] = 0;
-      for (auto j = 0; j < axis_dim; ++j) {
-        dot[i * num_remain + k] += out[i * N + j * num_remain + k] *
-                                   out_grad[i * N + j * num_remain + k];
-      }
-    }
-  }
-  for (auto i = 0; i < M; ++i) {
-    for (auto j = 0; j < axis_dim; ++j) {
-      for (auto k = 0; k < num_remain; ++k) {
-        x_grad[i * N + j * num_remain + k] =
-            (out_grad[i * N + j * num_remain + k] - dot[i * num_remain + k]) *
-            out[i * N + j * num_remain + k];
-      }
-    }
-  }
-  delete[] dot;
+  funcs::RowsInComputeType<T>(
+      {x.data<T>()},
+      out_data,
+      n,
+      d,
+      [&](const std::vector<const MT*>& in, MT* y, int64_t rows) {
+        funcs::SoftmaxForward(in[0], y, rows, axis_dim, d / axis_dim);
+      });
 }
 
 template <typename T>
@@ -108,6 +64,10 @@ void SoftmaxGradKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& out_grad,
                        int axis,
                        phi::DenseTensor* x_grad) {
+  custom_cpu::TraceScope trace("softmax_grad");
+  if (trace.active()) {
+    trace.set_cost(4 * out.numel(), 3 * out.numel() * sizeof(T));
+  }
   const int rank = x_grad->dims().size();
   const int calc_axis = phi::funcs::CanonicalAxis(axis, rank);
   int axis_dim = x_grad->dims()[calc_axis];
@@ -123,10 +83,17 @@ void SoftmaxGradKernel(const phi::Context& dev_ctx,
     return;
   }
 
+  using MT = typename funcs::ComputeType<T>::type;
   const int n = phi::funcs::SizeToAxis(calc_axis, x_grad->dims());
   const int d = phi::funcs::SizeFromAxis(calc_axis, x_grad->dims());
-  SoftmaxGrad(
-      out.data<T>(), out_grad.data<T>(), axis_dim, n, d, x_grad->data<T>());
+  funcs::RowsInComputeType<T>(
+      {out.data<T>(), out_grad.data<T>()},
+      x_grad_data,
+      n,
+      d,
+      [&](const std::vector<const MT*>& in, MT* dx, int64_t rows) {
+        funcs::SoftmaxBackward(in[0], in[1], dx, rows, axis_dim, d / axis_dim);
+      });
 }
 
 }  // namespace custom_kernel
@@ -136,11 +103,15 @@ PD_BUILD_PHI_KERNEL(softmax,
                     ALL_LAYOUT,
                     custom_kernel::SoftmaxKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(softmax_grad,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::SoftmaxGradKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,69 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <type_traits>
+
+#include "paddle/phi/capi/all.h"
+#include "runtime/stream.h"
+
+namespace custom_kernel {
+
+// Entry points of a registered kernel. Kernels run on the calling thread, so
+// before the kernel body they wait for the tasks (copies, event waits,
+// callbacks) queued on the stream of their context. Kernels calling each
+// other directly do not wait again.
+template <typename Fn, Fn kernel_fn>
+struct StreamOrderedKernel;
+
+template <typename Return,
+          typename DevCtx,
+          typename... Args,
+          Return (*kernel_fn)(DevCtx, Args...)>
+struct StreamOrderedKernel<Return (*)(DevCtx, Args...), kernel_fn> {
+  using Impl =
+      ::phi::capi::CustomKernelImpl<Return (*)(DevCtx, Args...), kernel_fn>;
+
+  static void Compute(PD_KernelContext* ctx) {
+    custom_cpu::WaitStream(::phi::capi::PD_GetDeviceContext(ctx).stream());
+    Impl::Compute(ctx);
+  }
+
+  // The framework passes its own device context object here, see
+  // CustomKernelImpl::VariadicCompute.
+  static void VariadicCompute(DevCtx dev_ctx, Args... args) {
+    using Context = typename std::decay<DevCtx>::type;
+    auto* raw = reinterpret_cast<PD_DeviceContext*>(
+        const_cast<Context*>(&dev_ctx));
+    custom_cpu::WaitStream(::phi::capi::DeviceContext(raw).stream());
+    Impl::VariadicCompute(dev_ctx, args...);
+  }
+};
+
+}  // namespace custom_kernel
+
+// PD_BUILD_PHI_KERNEL expands these at the registration site, so every kernel
+// registered in a file including this header goes through
+// StreamOrderedKernel.
+#undef CUSTOM_PHI_KERNEL
+#define CUSTOM_PHI_KERNEL(...)                                       \
+  ::custom_kernel::StreamOrderedKernel<decltype(&__VA_ARGS__),       \
+                                       &__VA_ARGS__>::Compute
+
+#undef CUSTOM_PHI_VARIADIC_KERNEL
+#define CUSTOM_PHI_VARIADIC_KERNEL(...)                                  \
+  reinterpret_cast<void*>(                                               \
+      &::custom_kernel::StreamOrderedKernel<decltype(&__VA_ARGS__),      \
+                                            &__VA_ARGS__>::VariadicCompute)
@@ -0,0 +1,95 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/sort.h"
+#include "kernels/kernels.h"
+#include "kernels/phi_funcs.h"
+#include "kernels/stream_ordered_kernel.h"
+#include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
+
+namespace custom_kernel {
+
+template <typename T>
+void TopkKernel(const phi::Context& dev_ctx,
+                const phi::DenseTensor& x,
+                const phi::Scalar& k_scalar,
+                int axis,
+                bool largest,
+                bool sorted,
+                phi::DenseTensor* out,
+                phi::DenseTensor* indices) {
+  custom_cpu::TraceScope trace("topk");
+  if (trace.active()) {
+    trace.set_cost(
+        0,
+        x.numel() * sizeof(T) + out->numel() * (sizeof(T) + sizeof(int64_t)));
+  }
+  auto in_dims = x.dims();
+  const int rank = in_dims.size();
+  const int64_t k = k_scalar.to<int64_t>();
+  if (rank == 0) {
+    PD_CHECK(k == 0 || k == 1,
+             "k must be 0 or 1 for a 0-D input, but received ",
+             k,
+             ".");
+    out->Resize(in_dims);
+    indices->Resize(in_dims);
+    T* out_data = dev_ctx.template Alloc<T>(out);
+    int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+    out_data[0] = x.data<T>()[0];
+    ids_data[0] = 0;
+    return;
+  }
+
+  axis = phi::funcs::CanonicalAxis(axis, rank);
+  PD_CHECK(k >= 1 && k <= in_dims[axis],
+           "k must be in [1, ",
+           in_dims[axis],
+           "] along axis ",
+           axis,
+           ", but received ",
+           k,
+           ".");
+  // k may come from a tensor, in which case the inferred shape is unknown.
+  auto out_dims = in_dims;
+  out_dims[axis] = k;
+  out->Resize(out_dims);
+  indices->Resize(out_dims);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+
+  const int64_t outer = phi::product(phi::slice_ddim(in_dims, 0, axis));
+  const int64_t inner = phi::product(phi::slice_ddim(in_dims, axis + 1, rank));
+  funcs::Topk(x.data<T>(),
+              out_data,
+              ids_data,
+              outer,
+              in_dims[axis],
+              inner,
+              k,
+              largest,
+              sorted);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(topk,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::TopkKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t) {}
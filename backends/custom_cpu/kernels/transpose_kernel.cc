@@ -12,8 +12,11 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/strided_copy.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
@@ -22,46 +25,26 @@ void TransposeKernel(const phi::Context& ctx,
                      const phi::DenseTensor& x,
                      const std::vector<int>& axis,
                      phi::DenseTensor* out) {
+  custom_cpu::TraceScope trace("transpose");
+  if (trace.active()) {
+    trace.set_cost(0, 2 * x.numel() * sizeof(T));
+  }
   auto x_dims = x.dims();
-  auto out_dims = out->dims();
-
-  auto x_data = x.data<T>();
   auto out_data = ctx.template Alloc<T>(out);
   if (out->numel() == 0) {
     return;
   }
   auto rank = x_dims.size();
-  if (rank == 1) {
-    memcpy(out_data, x_data, x.numel() * sizeof(T));
-  }
   PD_CHECK(axis.size() == rank,
            "axis.size (%d) must be equal the rank of input (%d).",
            axis.size(),
            rank);
 
-  std::vector<size_t> step(out_dims.size(), 1);
-  for (auto i = out_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * out_dims[i];
-  }
-
-  std::vector<size_t> index(rank, 0);
-  for (auto i = 0; i < x.numel(); ++i) {
-    std::vector<size_t> dst_index(rank, 0);
-    for (auto j = 0; j < rank; ++j) {
-      dst_index[j] = index[axis[j]];
-    }
-    out_data[phi::vec_product(dst_index, step)] = x_data[i];
-
-    index.back()++;
-    for (auto j = rank - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j - 1]++;
-        index[j] = 0;
-      } else {
-        break;
-      }
-    }
+  std::vector<int> perm(axis.size());
+  for (size_t i = 0; i < axis.size(); ++i) {
+    perm[i] = phi::funcs::CanonicalAxis(axis[i], rank);
   }
+  funcs::Transpose<T>(x_dims, x.data<T>(), perm, out_data);
 }
 
 }  // namespace custom_kernel
@@ -12,23 +12,23 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
-#include <random>
-
+#include "kernels/funcs/philox.h"
+#include "kernels/kernels.h"
+#include "kernels/stream_ordered_kernel.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/profiler.h"
 
 namespace custom_kernel {
 
-template <typename T>
-inline void UniformRealDistribution(T *data,
-                                    const int64_t &size,
-                                    const float &min,
-                                    const float &max,
-                                    std::shared_ptr<std::mt19937_64> engine) {
-  std::uniform_real_distribution<T> dist(static_cast<T>(min),
-                                         static_cast<T>(max));
-  for (int64_t i = 0; i < size; ++i) {
-    data[i] = dist(*engine);
+funcs::PhiloxState GetPhiloxState(const phi::Context &dev_ctx, int seed) {
+  // A seed attribute pins the stream, so such an op returns the same numbers
+  // on every run. Otherwise the stream is keyed by the seed of the device
+  // generator and a fresh offset is drawn from it, which advances the
+  // generator and is reproduced after paddle.seed().
+  if (seed != 0) {
+    return {static_cast<uint64_t>(seed), 0};
   }
+  return {dev_ctx.seed(), dev_ctx.random()};
 }
 
 template <typename T>
@@ -44,16 +44,19 @@ void UniformRawKernel(const phi::Context &dev_ctx,
                       phi::DenseTensor *out) {
   auto shape_data = shape.GetData();
 
+  custom_cpu::TraceScope trace("uniform");
   out->Resize(std::vector<int64_t>(shape_data.begin(), shape_data.end()));
   T *data = dev_ctx.template Alloc<T>(out);
   auto size = out->numel();
-  std::shared_ptr<std::mt19937_64> engine;
-
-  engine = std::make_shared<std::mt19937_64>();
-  engine->seed(seed);
+  if (trace.active()) {
+    trace.set_cost(0, size * sizeof(T));
+  }
 
-  UniformRealDistribution<T>(
-      data, size, min.to<float>(), max.to<float>(), engine);
+  funcs::UniformFill(GetPhiloxState(dev_ctx, seed),
+                     data,
+                     size,
+                     min.to<float>(),
+                     max.to<float>());
   if (diag_num > 0) {
     PD_CHECK(size > (diag_num - 1) * (diag_step + 1),
              "ShapeInvalid: the diagonal's elements is equal (num-1) "
@@ -65,7 +68,7 @@ void UniformRawKernel(const phi::Context &dev_ctx,
              size);
     for (int64_t i = 0; i < diag_num; ++i) {
       int64_t pos = i * diag_step + i;
-      data[pos] = diag_val;
+      data[pos] = static_cast<T>(diag_val);
     }
   }
 }
@@ -88,11 +91,15 @@ PD_BUILD_PHI_KERNEL(uniform_raw,
                     ALL_LAYOUT,
                     custom_kernel::UniformRawKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(uniform,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::UniformKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,300 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+
+import paddle
+from paddle.base import core
+
+# Opcodes of the fused_elementwise bytecode, must match FusedOp in
+# kernels/funcs/fused_elementwise.h.
+LOAD = 0
+CONST = 1
+
+BINARY_OPS = {
+    "elementwise_add": 2,
+    "elementwise_sub": 3,
+    "elementwise_mul": 4,
+    "elementwise_div": 5,
+    "elementwise_max": 6,
+    "elementwise_min": 7,
+    "elementwise_pow": 8,
+}
+
+COMPARE_OPS = {
+    "equal": 9,
+    "not_equal": 10,
+    "less_than": 11,
+    "less_equal": 12,
+    "greater_than": 13,
+    "greater_equal": 14,
+}
+
+UNARY_OPS = {
+    "relu": 15,
+    "abs": 16,
+    "exp": 17,
+    "sqrt": 18,
+    "sigmoid": 19,
+    "tanh": 20,
+}
+
+MUL = BINARY_OPS["elementwise_mul"]
+ADD = BINARY_OPS["elementwise_add"]
+POW = BINARY_OPS["elementwise_pow"]
+TO_BOOL = 21
+
+VarType = core.VarDesc.VarType
+FLOAT_TYPES = {VarType.FP32: "float32", VarType.FP64: "float64"}
+
+
+def _dtype(block, name):
+    return block._var_recursive(name).dtype
+
+
+def _operands(op):
+    """Input var names of a fusible op, None when op cannot be fused."""
+    if op.type in BINARY_OPS or op.type in COMPARE_OPS:
+        if op.has_attr("axis") and op.attr("axis") != -1:
+            return None
+        return [op.input("X")[0], op.input("Y")[0]]
+    if op.type in UNARY_OPS or op.type == "cast":
+        return [op.input("X")[0]]
+    if op.type == "scale":
+        if op.input("ScaleTensor"):
+            return None
+        return [op.input("X")[0]]
+    if op.type == "pow":
+        if op.input("FactorTensor"):
+            return None
+        return [op.input("X")[0]]
+    return None
+
+
+def _float_type(block, op, operands):
+    """The floating point type op computes in, None if it only sees bools,
+    False when op mixes float types or touches anything else."""
+    float_type = None
+    for name in operands + [op.output("Out")[0]]:
+        dtype = _dtype(block, name)
+        if dtype == VarType.BOOL:
+            continue
+        if dtype not in FLOAT_TYPES or float_type not in (None, dtype):
+            return False
+        float_type = dtype
+    out_is_bool = _dtype(block, op.output("Out")[0]) == VarType.BOOL
+    # Arithmetic on bools (e.g. add of two masks) saturates in paddle, but
+    # not in a float chain.
+    if op.type not in COMPARE_OPS and op.type != "cast" and out_is_bool:
+        return False
+    if op.type == "cast" and float_type is not None and not out_is_bool:
+        # float -> bool and bool -> float are exact, float -> float only
+        # when it is the identity.
+        in_dtype = _dtype(block, operands[0])
+        if in_dtype != VarType.BOOL and in_dtype != float_type:
+            return False
+    return float_type
+
+
+class _Chain:
+    def __init__(self):
+        self.ops = []
+        self.float_type = None
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _collect_chains(block, reads, skip_vars):
+    """Groups the fusible ops of block into trees that only communicate
+    through vars read exactly once, so every tree has a single output."""
+    ops = list(block.ops)
+    writes = collections.Counter(n for op in ops for n in op.output_arg_names)
+    operands = {}
+    float_types = {}
+    producer = {}
+    for i, op in enumerate(ops):
+        names = _operands(op)
+        if names is None:
+            continue
+        float_type = _float_type(block, op, names)
+        if float_type is False:
+            continue
+        operands[i] = names
+        float_types[i] = float_type
+        out = op.output("Out")[0]
+        if writes[out] == 1:
+            producer[out] = i
+
+    parent = {i: i for i in operands}
+    chain_type = dict(float_types)
+    for i, names in operands.items():
+        for name in names:
+            j = producer.get(name)
+            if j is None or j >= i or reads[name] != 1 or name in skip_vars:
+                continue
+            if block._var_recursive(name).persistable:
+                continue
+            ri, rj = _find(parent, i), _find(parent, j)
+            ti, tj = chain_type[ri], chain_type[rj]
+            if ri == rj or (ti is not None and tj is not None and ti != tj):
+                continue
+            parent[rj] = ri
+            chain_type[ri] = ti if ti is not None else tj
+
+    chains = collections.defaultdict(_Chain)
+    for i in sorted(operands):
+        chain = chains[_find(parent, i)]
+        chain.ops.append(ops[i])
+        chain.float_type = chain_type[_find(parent, i)]
+    return [c for c in chains.values()], operands, ops
+
+
+def _compile(block, chain, operands_of):
+    """Bytecode of a chain, evaluated from its last op (the only one whose
+    output leaves the chain) down to the chain inputs."""
+    members = {op.output("Out")[0]: op for op in chain.ops}
+    inputs = []
+    constants = []
+    program = []
+
+    def emit(opcode, arg=0):
+        program.extend([opcode, arg])
+
+    def emit_const(value):
+        constants.append(float(value))
+        emit(CONST, len(constants) - 1)
+
+    def emit_var(name):
+        if name in members:
+            emit_op(members[name])
+            return
+        if name not in inputs:
+            inputs.append(name)
+        emit(LOAD, inputs.index(name))
+
+    def emit_op(op):
+        names = operands_of(op)
+        for name in names:
+            emit_var(name)
+        if op.type in BINARY_OPS:
+            emit(BINARY_OPS[op.type])
+        elif op.type in COMPARE_OPS:
+            emit(COMPARE_OPS[op.type])
+        elif op.type in UNARY_OPS:
+            emit(UNARY_OPS[op.type])
+        elif op.type == "cast":
+            if _dtype(block, op.output("Out")[0]) == VarType.BOOL:
+                emit(TO_BOOL)
+        elif op.type == "pow":
+            emit_const(op.attr("factor"))
+            emit(POW)
+        elif op.type == "scale":
+            scale, bias = op.attr("scale"), op.attr("bias")
+            if op.attr("bias_after_scale"):
+                if scale != 1.0:
+                    emit_const(scale)
+                    emit(MUL)
+                if bias != 0.0:
+                    emit_const(bias)
+                    emit(ADD)
+            else:
+                if bias != 0.0:
+                    emit_const(bias)
+                    emit(ADD)
+                if scale != 1.0:
+                    emit_const(scale)
+                    emit(MUL)
+
+    emit_op(chain.ops[-1])
+    return inputs, program, constants
+
+
+def custom_cpu_fuse_elementwise(program, skip_vars=(), min_ops=2):
+    """Rewrites chains of elementwise, compare, cast and activation ops of a
+    static program into fused_elementwise ops, which custom_cpu runs as a
+    single loop with a single output allocation instead of one pass over
+    memory per op.
+
+    Ops are chained through vars that have one writer and one reader and are
+    neither persistable nor in `skip_vars`, so fetch targets, parameters and
+    anything the backward reads stay materialized. A chain computes in one
+    floating point type; bool values from compares and casts ride along as
+    0 / 1. Chains shorter than `min_ops` are left alone.
+
+    The fused_elementwise op must be registered first, see setUp(). The pass
+    works on legacy programs only; Paddle 3.x builds PIR programs unless
+    they are built under paddle.pir_utils.OldIrGuard().
+
+    Returns:
+        The number of fused_elementwise ops inserted.
+    """
+    if isinstance(program, paddle.pir.Program):
+        raise TypeError(
+            "custom_cpu_fuse_elementwise only rewrites legacy Programs, but "
+            "received a PIR program. Build the program under "
+            "paddle.pir_utils.OldIrGuard()."
+        )
+    skip_vars = set(skip_vars)
+    reads = collections.Counter(
+        name
+        for block in program.blocks
+        for op in block.ops
+        for name in op.input_arg_names
+    )
+    fused = 0
+    for block in program.blocks:
+        chains, operands, ops = _collect_chains(block, reads, skip_vars)
+        index_of = {id(op): i for i, op in enumerate(ops)}
+
+        def operands_of(op):
+            return operands[index_of[id(op)]]
+
+        for chain in chains:
+            if len(chain.ops) < min_ops:
+                continue
+            inputs, code, constants = _compile(block, chain, operands_of)
+            out = chain.ops[-1].output("Out")[0]
+            out_dtype = _dtype(block, out)
+            intermediates = [op.output("Out")[0] for op in chain.ops[:-1]]
+            logging.info(
+                "fuse %s into fused_elementwise",
+                [op.type for op in chain.ops],
+            )
+
+            position = block.ops.index(chain.ops[-1])
+            block._insert_op(
+                position + 1,
+                type="fused_elementwise",
+                inputs={"X@VECTOR": [block._var_recursive(n) for n in inputs]},
+                outputs={"Out": [block._var_recursive(out)]},
+                attrs={
+                    "program": code,
+                    "constants": constants,
+                    "out_dtype": "bool"
+                    if out_dtype == VarType.BOOL
+                    else FLOAT_TYPES[out_dtype],
+                },
+            )
+            for op in reversed(chain.ops):
+                block._remove_op(block.ops.index(op))
+            for name in intermediates:
+                block._remove_var(name)
+            fused += 1
+    return fused
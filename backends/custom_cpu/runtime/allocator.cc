@@ -0,0 +1,301 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/allocator.h"
+
+#include <algorithm>
+#include <cstdlib>
+#include <cstring>
+#include <iostream>
+
+namespace custom_cpu {
+
+namespace {
+
+constexpr size_t kLargeRounding = 4096;
+constexpr int kNumTinyClasses = 8;  // 64, 128, ..., 512 bytes
+constexpr int kSubClassesPerPow2 = 4;
+constexpr int kFirstPow2 = 9;  // 512
+
+size_t RoundUp(size_t size, size_t multiple) {
+  return (size + multiple - 1) / multiple * multiple;
+}
+
+int FloorLog2(size_t value) {
+  int log = 0;
+  while (value >>= 1) {
+    ++log;
+  }
+  return log;
+}
+
+}  // namespace
+
+constexpr size_t CachingAllocator::kAlignment;
+constexpr size_t CachingAllocator::kSmallSize;
+constexpr size_t CachingAllocator::kSegmentGranularity;
+
+CachingAllocator& CachingAllocator::Instance() {
+  // Leaked on purpose, tensors may still be released after static
+  // destruction has started.
+  static CachingAllocator* allocator = []() {
+    bool caching = true;
+    const char* strategy = std::getenv("FLAGS_custom_cpu_allocator_strategy");
+    if (strategy && std::strcmp(strategy, "naive") == 0) {
+      caching = false;
+    } else if (strategy && std::strcmp(strategy, "caching") != 0) {
+      std::cerr << "custom_cpu: unknown allocator strategy " << strategy
+                << ", fall back to caching.\n";
+    }
+    size_t max_cached_bytes = 0;
+    const char* max_cached =
+        std::getenv("FLAGS_custom_cpu_allocator_max_cached_mb");
+    if (max_cached) {
+      max_cached_bytes = std::strtoull(max_cached, nullptr, 10) << 20;
+    }
+    return new CachingAllocator(caching, max_cached_bytes);
+  }();
+  return *allocator;
+}
+
+CachingAllocator::CachingAllocator(bool caching, size_t max_cached_bytes)
+    : caching_(caching), max_cached_bytes_(max_cached_bytes) {
+  small_free_.resize(SizeClass(kSmallSize) + 1);
+}
+
+CachingAllocator::~CachingAllocator() {
+  std::lock_guard<std::mutex> guard(mutex_);
+  ReleaseAllCached();
+}
+
+int CachingAllocator::SizeClass(size_t size) {
+  if (size <= (kNumTinyClasses << 6)) {
+    return size == 0 ? 0 : static_cast<int>((size - 1) >> 6);
+  }
+  const int pow2 = FloorLog2(size - 1);
+  const size_t base = static_cast<size_t>(1) << pow2;
+  const size_t step = base / kSubClassesPerPow2;
+  const int sub = static_cast<int>((size - base + step - 1) / step) - 1;
+  return kNumTinyClasses + (pow2 - kFirstPow2) * kSubClassesPerPow2 + sub;
+}
+
+size_t CachingAllocator::ClassSize(int size_class) {
+  if (size_class < kNumTinyClasses) {
+    return static_cast<size_t>(size_class + 1) << 6;
+  }
+  const int rel = size_class - kNumTinyClasses;
+  const size_t base = static_cast<size_t>(1)
+                      << (kFirstPow2 + rel / kSubClassesPerPow2);
+  return base + (rel % kSubClassesPerPow2 + 1) * (base / kSubClassesPerPow2);
+}
+
+void* CachingAllocator::Allocate(size_t size) {
+  std::lock_guard<std::mutex> guard(mutex_);
+  ++stats_.num_allocs;
+  return size <= kSmallSize ? AllocateSmall(size) : AllocateLarge(size);
+}
+
+void CachingAllocator::Free(void* ptr) {
+  if (ptr == nullptr) {
+    return;
+  }
+  std::lock_guard<std::mutex> guard(mutex_);
+  auto it = live_blocks_.find(ptr);
+  if (it == live_blocks_.end()) {
+    std::cerr << "custom_cpu: free of unknown pointer " << ptr << "\n";
+    return;
+  }
+  Block* block = it->second;
+  live_blocks_.erase(it);
+  block->allocated = false;
+  UpdateAllocated(-static_cast<int64_t>(block->size));
+
+  if (block->size_class >= 0) {
+    if (caching_) {
+      small_free_[block->size_class].push_back(block);
+    } else {
+      SystemFree(block->ptr, block->size);
+      delete block;
+    }
+  } else {
+    FreeLarge(block);
+  }
+
+  if (!caching_) {
+    ReleaseAllCached();
+  } else if (max_cached_bytes_ > 0 && stats_.cached_bytes > max_cached_bytes_) {
+    ReleaseCached(max_cached_bytes_);
+  }
+}
+
+void* CachingAllocator::AllocateSmall(size_t size) {
+  const int size_class = SizeClass(size);
+  auto& free_list = small_free_[size_class];
+  Block* block = nullptr;
+  if (!free_list.empty()) {
+    block = free_list.back();
+    free_list.pop_back();
+  } else {
+    const size_t class_size = ClassSize(size_class);
+    char* ptr = static_cast<char*>(SystemAllocate(class_size));
+    if (ptr == nullptr) {
+      return nullptr;
+    }
+    block = new Block{ptr, class_size, size_class, false, nullptr, nullptr};
+  }
+  block->allocated = true;
+  live_blocks_[block->ptr] = block;
+  UpdateAllocated(block->size);
+  return block->ptr;
+}
+
+void* CachingAllocator::AllocateLarge(size_t size) {
+  size = RoundUp(size, kLargeRounding);
+  Block key{nullptr, size, -1, false, nullptr, nullptr};
+  auto it = large_free_.lower_bound(&key);
+  Block* block = nullptr;
+  if (it != large_free_.end()) {
+    block = *it;
+    large_free_.erase(it);
+  } else {
+    const size_t segment_size =
+        caching_ ? RoundUp(size, kSegmentGranularity) : size;
+    char* ptr = static_cast<char*>(SystemAllocate(segment_size));
+    if (ptr == nullptr) {
+      return nullptr;
+    }
+    block = new Block{ptr, segment_size, -1, false, nullptr, nullptr};
+  }
+
+  // Split off the tail when it is big enough to serve another large request,
+  // smaller remainders stay attached to avoid fragmenting the segment.
+  if (block->size - size >= kSmallSize) {
+    Block* remaining = new Block{
+        block->ptr + size, block->size - size, -1, false, block, block->next};
+    if (block->next) {
+      block->next->prev = remaining;
+    }
+    block->next = remaining;
+    block->size = size;
+    large_free_.insert(remaining);
+  }
+
+  block->allocated = true;
+  live_blocks_[block->ptr] = block;
+  UpdateAllocated(block->size);
+  return block->ptr;
+}
+
+void CachingAllocator::FreeLarge(Block* block) {
+  Block* prev = block->prev;
+  if (prev && !prev->allocated) {
+    large_free_.erase(prev);
+    prev->size += block->size;
+    prev->next = block->next;
+    if (block->next) {
+      block->next->prev = prev;
+    }
+    delete block;
+    block = prev;
+  }
+  Block* next = block->next;
+  if (next && !next->allocated) {
+    large_free_.erase(next);
+    block->size += next->size;
+    block->next = next->next;
+    if (next->next) {
+      next->next->prev = block;
+    }
+    delete next;
+  }
+  large_free_.insert(block);
+}
+
+void* CachingAllocator::SystemAllocate(size_t size) {
+  void* ptr = nullptr;
+  if (posix_memalign(&ptr, kAlignment, size) != 0) {
+    // Release on pressure: give back everything cached and retry once.
+    ReleaseAllCached();
+    if (posix_memalign(&ptr, kAlignment, size) != 0) {
+      return nullptr;
+    }
+  }
+  ++stats_.num_system_allocs;
+  stats_.reserved_bytes += size;
+  stats_.cached_bytes += size;
+  stats_.peak_reserved_bytes =
+      std::max(stats_.peak_reserved_bytes, stats_.reserved_bytes);
+  return ptr;
+}
+
+void CachingAllocator::SystemFree(void* ptr, size_t size) {
+  std::free(ptr);
+  ++stats_.num_system_frees;
+  stats_.reserved_bytes -= size;
+  stats_.cached_bytes -= size;
+}
+
+void CachingAllocator::ReleaseCached(size_t target_bytes) {
+  for (int c = static_cast<int>(small_free_.size()) - 1;
+       c >= 0 && stats_.cached_bytes > target_bytes;
+       --c) {
+    auto& free_list = small_free_[c];
+    while (!free_list.empty() && stats_.cached_bytes > target_bytes) {
+      Block* block = free_list.back();
+      free_list.pop_back();
+      SystemFree(block->ptr, block->size);
+      delete block;
+    }
+  }
+  // Only segments without any live block can be returned, i.e. free blocks
+  // that have no neighbours left after coalescing.
+  for (auto it = large_free_.rbegin();
+       it != large_free_.rend() && stats_.cached_bytes > target_bytes;) {
+    Block* block = *it;
+    if (block->prev == nullptr && block->next == nullptr) {
+      it = decltype(it)(large_free_.erase(std::next(it).base()));
+      SystemFree(block->ptr, block->size);
+      delete block;
+    } else {
+      ++it;
+    }
+  }
+}
+
+void CachingAllocator::ReleaseAllCached() { ReleaseCached(0); }
+
+void CachingAllocator::EmptyCache() {
+  std::lock_guard<std::mutex> guard(mutex_);
+  ReleaseAllCached();
+}
+
+void CachingAllocator::UpdateAllocated(int64_t delta) {
+  stats_.allocated_bytes += delta;
+  stats_.cached_bytes -= delta;
+  stats_.peak_allocated_bytes =
+      std::max(stats_.peak_allocated_bytes, stats_.allocated_bytes);
+}
+
+MemoryStats CachingAllocator::GetStats() {
+  std::lock_guard<std::mutex> guard(mutex_);
+  return stats_;
+}
+
+void CachingAllocator::ResetPeakStats() {
+  std::lock_guard<std::mutex> guard(mutex_);
+  stats_.peak_allocated_bytes = stats_.allocated_bytes;
+  stats_.peak_reserved_bytes = stats_.reserved_bytes;
+}
+
+}  // namespace custom_cpu
@@ -0,0 +1,117 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <mutex>
+#include <set>
+#include <unordered_map>
+#include <vector>
+
+namespace custom_cpu {
+
+struct MemoryStats {
+  size_t allocated_bytes = 0;       // bytes handed out to callers
+  size_t peak_allocated_bytes = 0;  // high-water mark of allocated_bytes
+  size_t reserved_bytes = 0;        // bytes obtained from the system
+  size_t peak_reserved_bytes = 0;   // high-water mark of reserved_bytes
+  size_t cached_bytes = 0;          // reserved but currently unused bytes
+  uint64_t num_allocs = 0;          // Allocate calls
+  uint64_t num_system_allocs = 0;   // allocations that reached the system
+  uint64_t num_system_frees = 0;    // blocks returned to the system
+};
+
+// Caching allocator behind the device, host and unified memory hooks of the
+// plugin. All blocks are 64-byte aligned.
+//
+// * Small requests (<= 1 MiB) are rounded up to a size class (64-byte steps up
+//   to 512 bytes, then 4 classes per power of two) and recycled through per
+//   class free lists.
+// * Large requests are carved out of segments of at least 2 MiB with best-fit
+//   splitting; freed blocks are coalesced with free neighbours of the same
+//   segment.
+// * When cached (free but reserved) bytes exceed the retention cap, free small
+//   blocks and fully free segments are returned to the system. A failing
+//   system allocation releases the whole cache and retries once.
+//
+// Environment variables:
+//   FLAGS_custom_cpu_allocator_strategy   "caching" (default) or "naive"
+//   FLAGS_custom_cpu_allocator_max_cached_mb  retention cap, 0 = unlimited
+class CachingAllocator {
+ public:
+  // The allocator of the plugin, configured by the environment variables.
+  static CachingAllocator& Instance();
+
+  // max_cached_bytes of 0 keeps every freed block. Live blocks must be freed
+  // before the allocator is destroyed.
+  CachingAllocator(bool caching, size_t max_cached_bytes);
+  ~CachingAllocator();
+
+  CachingAllocator(const CachingAllocator&) = delete;
+  CachingAllocator& operator=(const CachingAllocator&) = delete;
+
+  void* Allocate(size_t size);
+  void Free(void* ptr);
+
+  // Returns every cached block to the system.
+  void EmptyCache();
+
+  MemoryStats GetStats();
+  void ResetPeakStats();
+
+  static constexpr size_t kAlignment = 64;
+  static constexpr size_t kSmallSize = 1 << 20;
+  static constexpr size_t kSegmentGranularity = 2 << 20;
+
+  // Size class of a small request, and the block size of a class.
+  static int SizeClass(size_t size);
+  static size_t ClassSize(int size_class);
+
+ private:
+  struct Block {
+    char* ptr;
+    size_t size;
+    int size_class;  // -1 for blocks of a large segment
+    bool allocated;
+    Block* prev;  // neighbours inside a large segment
+    Block* next;
+  };
+
+  struct BlockComparator {
+    bool operator()(const Block* a, const Block* b) const {
+      return a->size != b->size ? a->size < b->size : a->ptr < b->ptr;
+    }
+  };
+
+  void* AllocateSmall(size_t size);
+  void* AllocateLarge(size_t size);
+  void FreeLarge(Block* block);
+  void* SystemAllocate(size_t size);
+  void SystemFree(void* ptr, size_t size);
+  void ReleaseCached(size_t target_bytes);
+  void ReleaseAllCached();
+  void UpdateAllocated(int64_t delta);
+
+  bool caching_;
+  size_t max_cached_bytes_;
+  std::mutex mutex_;
+  std::vector<std::vector<Block*>> small_free_;
+  std::set<Block*, BlockComparator> large_free_;
+  std::unordered_map<void*, Block*> live_blocks_;
+  MemoryStats stats_;
+};
+
+}  // namespace custom_cpu
@@ -0,0 +1,899 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/collective.h"
+
+#include <fcntl.h>
+#include <sched.h>
+#include <signal.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <atomic>
+#include <cerrno>
+#include <chrono>  // NOLINT
+#include <complex>
+#include <cstdlib>
+#include <cstring>
+#include <fstream>
+#include <iostream>
+#include <memory>
+
+#include "kernels/funcs/cast.h"
+
+namespace custom_cpu {
+
+namespace {
+
+static_assert(ATOMIC_LLONG_LOCK_FREE == 2,
+              "shared memory synchronization needs lock-free 64-bit atomics");
+
+constexpr size_t kPageBytes = 4096;
+constexpr size_t kDefaultSlotBytes = 512 << 10;
+constexpr size_t kP2PSlotBytes = 64 << 10;
+// Chunks up to this size use the one-level tree allreduce.
+constexpr size_t kTreeAllReduceBytes = 64 << 10;
+constexpr size_t kCombineBlock = 256;
+constexpr double kDefaultTimeoutSeconds = 1800;
+
+// The pid lets the other ranks notice that this rank exited.
+struct alignas(64) Control {
+  std::atomic<uint64_t> step;
+  std::atomic<int64_t> pid;
+  std::atomic<uint64_t> pid_namespace;
+};
+
+struct alignas(64) Channel {
+  std::atomic<uint64_t> sent;
+  alignas(64) std::atomic<uint64_t> acked;
+};
+
+size_t AlignUp(size_t n, size_t alignment) {
+  return (n + alignment - 1) / alignment * alignment;
+}
+
+size_t SlotBytesFromEnv() {
+  const char* value = std::getenv("FLAGS_custom_cpu_ccl_buffer_kb");
+  if (value == nullptr) {
+    return kDefaultSlotBytes;
+  }
+  const long kb = std::atol(value);  // NOLINT
+  // Slots hold whole elements of every data type for every rank.
+  return kb > 0 ? AlignUp(static_cast<size_t>(kb) << 10, kPageBytes)
+                : kDefaultSlotBytes;
+}
+
+enum class AllReduceAlgo { kAuto, kTree, kRing };
+
+AllReduceAlgo AllReduceAlgoFromEnv() {
+  static const AllReduceAlgo algo = []() {
+    const char* value = std::getenv("FLAGS_custom_cpu_ccl_allreduce_algo");
+    if (value != nullptr && std::strcmp(value, "tree") == 0) {
+      return AllReduceAlgo::kTree;
+    }
+    if (value != nullptr && std::strcmp(value, "ring") == 0) {
+      return AllReduceAlgo::kRing;
+    }
+    return AllReduceAlgo::kAuto;
+  }();
+  return algo;
+}
+
+// Seconds a rank waits for the others before the collective fails, 0 waits
+// forever.
+double TimeoutFromEnv() {
+  static const double timeout = []() {
+    const char* value = std::getenv("FLAGS_custom_cpu_ccl_timeout_s");
+    if (value == nullptr) {
+      return kDefaultTimeoutSeconds;
+    }
+    const double seconds = std::atof(value);
+    return seconds > 0 ? seconds : 0.0;
+  }();
+  return timeout;
+}
+
+// Whether process `pid` exited. A zombie counts as exited, its parent just
+// did not reap it yet.
+bool ProcessExited(int64_t pid) {
+  if (kill(static_cast<pid_t>(pid), 0) != 0) {
+    return errno == ESRCH;
+  }
+  std::ifstream stat("/proc/" + std::to_string(pid) + "/stat");
+  std::string line;
+  std::getline(stat, line);
+  // The state follows the command name, which is in parentheses.
+  const size_t end = line.rfind(')');
+  return end != std::string::npos && end + 2 < line.size() &&
+         line[end + 2] == 'Z';
+}
+
+// Inode of the pid namespace of this process, 0 if unknown.
+uint64_t PidNamespace() {
+  struct stat st;
+  return stat("/proc/self/ns/pid", &st) == 0 ? st.st_ino : 0;
+}
+
+enum class WaitStatus { kReady, kTimeout, kPeerDied };
+
+// Spins, then yields, then sleeps until ready() holds. Once sleeping, checks
+// about every 50 ms whether the timeout has passed or peer_died() reports a
+// rank that exited, in which case ready() would never hold.
+template <typename Pred, typename Died>
+WaitStatus WaitUntil(const Pred& ready, const Died& peer_died) {
+  using Clock = std::chrono::steady_clock;
+  const double timeout = TimeoutFromEnv();
+  const Clock::time_point start = Clock::now();
+  for (uint64_t spin = 0; !ready(); ++spin) {
+    if (spin < 64) {
+#if defined(__x86_64__) || defined(__i386__)
+      __builtin_ia32_pause();
+#endif
+    } else if (spin < (1 << 14)) {
+      sched_yield();
+    } else {
+      usleep(50);
+      if (spin % 1024 != 0) {
+        continue;
+      }
+      if (peer_died()) {
+        return WaitStatus::kPeerDied;
+      }
+      const std::chrono::duration<double> waited = Clock::now() - start;
+      if (timeout > 0 && waited.count() > timeout) {
+        return ready() ? WaitStatus::kReady : WaitStatus::kTimeout;
+      }
+    }
+  }
+  return WaitStatus::kReady;
+}
+
+// float16 and bfloat16 are reduced in float and rounded to nearest even once.
+struct Half {
+  uint16_t bits;
+};
+
+struct BFloat16 {
+  uint16_t bits;
+};
+
+template <typename T>
+struct Elem {
+  using Acc = T;
+  static Acc Load(T v) { return v; }
+  static T Store(Acc v) { return v; }
+};
+
+// Sum and product of bools act as logical or / and.
+template <>
+struct Elem<bool> {
+  using Acc = int;
+  static Acc Load(bool v) { return v ? 1 : 0; }
+  static bool Store(Acc v) { return v != 0; }
+};
+
+template <>
+struct Elem<Half> {
+  using Acc = float;
+  static Acc Load(Half v) {
+    return custom_kernel::funcs::Float16BitsToFloat(v.bits);
+  }
+  static Half Store(Acc v) {
+    return Half{custom_kernel::funcs::FloatToFloat16Bits(v)};
+  }
+};
+
+template <>
+struct Elem<BFloat16> {
+  using Acc = float;
+  static Acc Load(BFloat16 v) {
+    return custom_kernel::funcs::BFloat16BitsToFloat(v.bits);
+  }
+  static BFloat16 Store(Acc v) {
+    return BFloat16{custom_kernel::funcs::FloatToBFloat16Bits(v)};
+  }
+};
+
+struct SumOp {
+  template <typename Acc>
+  static Acc Apply(Acc a, Acc b) {
+    return a + b;
+  }
+};
+
+struct ProdOp {
+  template <typename Acc>
+  static Acc Apply(Acc a, Acc b) {
+    return a * b;
+  }
+};
+
+struct MaxOp {
+  template <typename Acc>
+  static Acc Apply(Acc a, Acc b) {
+    return b > a ? b : a;
+  }
+};
+
+struct MinOp {
+  template <typename Acc>
+  static Acc Apply(Acc a, Acc b) {
+    return b < a ? b : a;
+  }
+};
+
+// dst[i] = op over ranks r of src[r][offset + i], combined in rank order and
+// divided by nranks when averaging. Works on blocks that stay in L1.
+template <typename T, typename Op>
+void CombineRanks(const char* const* src,
+                  int nranks,
+                  size_t offset,
+                  char* dst_bytes,
+                  size_t len,
+                  bool average) {
+  using Acc = typename Elem<T>::Acc;
+  T* dst = reinterpret_cast<T*>(dst_bytes);
+  Acc acc[kCombineBlock];
+  for (size_t b0 = 0; b0 < len; b0 += kCombineBlock) {
+    const size_t m = std::min(kCombineBlock, len - b0);
+    const T* s0 = reinterpret_cast<const T*>(src[0]) + offset + b0;
+    for (size_t i = 0; i < m; ++i) {
+      acc[i] = Elem<T>::Load(s0[i]);
+    }
+    for (int r = 1; r < nranks; ++r) {
+      const T* sr = reinterpret_cast<const T*>(src[r]) + offset + b0;
+      for (size_t i = 0; i < m; ++i) {
+        acc[i] = static_cast<Acc>(Op::Apply(acc[i], Elem<T>::Load(sr[i])));
+      }
+    }
+    if (average) {
+      for (size_t i = 0; i < m; ++i) {
+        acc[i] = static_cast<Acc>(acc[i] / static_cast<Acc>(nranks));
+      }
+    }
+    for (size_t i = 0; i < m; ++i) {
+      dst[b0 + i] = Elem<T>::Store(acc[i]);
+    }
+  }
+}
+
+template <typename T>
+void CombineOrdered(CclReduceOp op,
+                    const char* const* src,
+                    int nranks,
+                    size_t offset,
+                    char* dst,
+                    size_t len) {
+  switch (op) {
+    case CclReduceOp::kSum:
+      return CombineRanks<T, SumOp>(src, nranks, offset, dst, len, false);
+    case CclReduceOp::kAvg:
+      return CombineRanks<T, SumOp>(src, nranks, offset, dst, len, true);
+    case CclReduceOp::kProd:
+      return CombineRanks<T, ProdOp>(src, nranks, offset, dst, len, false);
+    case CclReduceOp::kMax:
+      return CombineRanks<T, MaxOp>(src, nranks, offset, dst, len, false);
+    case CclReduceOp::kMin:
+      return CombineRanks<T, MinOp>(src, nranks, offset, dst, len, false);
+  }
+}
+
+// Complex numbers have no ordering, Supported() rejects kMax and kMin.
+template <typename T>
+void CombineUnordered(CclReduceOp op,
+                      const char* const* src,
+                      int nranks,
+                      size_t offset,
+                      char* dst,
+                      size_t len) {
+  if (op == CclReduceOp::kProd) {
+    CombineRanks<T, ProdOp>(src, nranks, offset, dst, len, false);
+  } else {
+    CombineRanks<T, SumOp>(
+        src, nranks, offset, dst, len, op == CclReduceOp::kAvg);
+  }
+}
+
+bool Supported(CclDataType dtype, CclReduceOp op) {
+  switch (dtype) {
+    case CclDataType::kBool:
+      return op != CclReduceOp::kAvg;
+    case CclDataType::kComplex64:
+    case CclDataType::kComplex128:
+      return op != CclReduceOp::kMax && op != CclReduceOp::kMin;
+    default:
+      return true;
+  }
+}
+
+void Combine(CclDataType dtype,
+             CclReduceOp op,
+             const char* const* src,
+             int nranks,
+             size_t offset,
+             char* dst,
+             size_t len) {
+  switch (dtype) {
+    case CclDataType::kBool:
+      return CombineOrdered<bool>(op, src, nranks, offset, dst, len);
+    case CclDataType::kInt8:
+      return CombineOrdered<int8_t>(op, src, nranks, offset, dst, len);
+    case CclDataType::kUInt8:
+      return CombineOrdered<uint8_t>(op, src, nranks, offset, dst, len);
+    case CclDataType::kInt16:
+      return CombineOrdered<int16_t>(op, src, nranks, offset, dst, len);
+    case CclDataType::kInt32:
+      return CombineOrdered<int32_t>(op, src, nranks, offset, dst, len);
+    case CclDataType::kInt64:
+      return CombineOrdered<int64_t>(op, src, nranks, offset, dst, len);
+    case CclDataType::kFloat16:
+      return CombineOrdered<Half>(op, src, nranks, offset, dst, len);
+    case CclDataType::kBFloat16:
+      return CombineOrdered<BFloat16>(op, src, nranks, offset, dst, len);
+    case CclDataType::kFloat32:
+      return CombineOrdered<float>(op, src, nranks, offset, dst, len);
+    case CclDataType::kFloat64:
+      return CombineOrdered<double>(op, src, nranks, offset, dst, len);
+    case CclDataType::kComplex64:
+      return CombineUnordered<std::complex<float>>(
+          op, src, nranks, offset, dst, len);
+    case CclDataType::kComplex128:
+      return CombineUnordered<std::complex<double>>(
+          op, src, nranks, offset, dst, len);
+  }
+}
+
+}  // namespace
+
+size_t CclDataTypeSize(CclDataType dtype) {
+  switch (dtype) {
+    case CclDataType::kBool:
+    case CclDataType::kInt8:
+    case CclDataType::kUInt8:
+      return 1;
+    case CclDataType::kInt16:
+    case CclDataType::kFloat16:
+    case CclDataType::kBFloat16:
+      return 2;
+    case CclDataType::kInt32:
+    case CclDataType::kFloat32:
+      return 4;
+    case CclDataType::kInt64:
+    case CclDataType::kFloat64:
+    case CclDataType::kComplex64:
+      return 8;
+    case CclDataType::kComplex128:
+      return 16;
+  }
+  return 0;
+}
+
+// Layout of the mapping: this header, one Control per rank, one Channel per
+// (src, dst) pair, then page aligned data: four collective slots per rank
+// (input and output, double buffered) and two p2p slots per channel.
+struct Communicator::Segment {
+  std::atomic<uint32_t> attached;
+  std::atomic<uint32_t> nranks;
+  std::atomic<uint64_t> slot_bytes;
+};
+
+struct Communicator::P2POp {
+  Communicator* comm;
+  char* buf;
+  size_t bytes;
+  size_t done;
+  int peer;
+  bool send;
+};
+
+namespace {
+
+size_t ControlOffset() {
+  return AlignUp(sizeof(Communicator::Segment), kPageBytes);
+}
+
+size_t ChannelOffset(int nranks) {
+  return ControlOffset() + nranks * sizeof(Control);
+}
+
+size_t DataOffset(int nranks) {
+  return AlignUp(ChannelOffset(nranks) + nranks * nranks * sizeof(Channel),
+                 kPageBytes);
+}
+
+size_t P2POffset(int nranks, size_t slot_bytes) {
+  return DataOffset(nranks) + 4 * nranks * slot_bytes;
+}
+
+}  // namespace
+
+bool Communicator::PeerDied() {
+  for (int r = 0; r < nranks_; ++r) {
+    if (peer_pids_[r] > 0 && ProcessExited(peer_pids_[r])) {
+      dead_rank_ = r;
+      return true;
+    }
+  }
+  return false;
+}
+
+template <typename Pred>
+bool Communicator::Wait(const Pred& ready, const char* what) {
+  if (failed_) {
+    return false;
+  }
+  switch (WaitUntil(ready, [this]() { return PeerDied(); })) {
+    case WaitStatus::kReady:
+      return true;
+    case WaitStatus::kTimeout:
+      std::cerr << "[custom_cpu] rank " << rank_ << " of communicator " << name_
+                << " timed out after " << TimeoutFromEnv() << " s waiting for "
+                << what << ", see FLAGS_custom_cpu_ccl_timeout_s" << std::endl;
+      break;
+    case WaitStatus::kPeerDied:
+      std::cerr << "[custom_cpu] rank " << rank_ << " of communicator " << name_
+                << " stopped waiting for " << what << ": rank " << dead_rank_
+                << " exited" << std::endl;
+      break;
+  }
+  // The ranks no longer agree on the step count, fail every later call.
+  failed_ = true;
+  return false;
+}
+
+Communicator* Communicator::Create(const std::string& id,
+                                   int nranks,
+                                   int rank) {
+  if (nranks <= 0 || rank < 0 || rank >= nranks || id.empty()) {
+    return nullptr;
+  }
+  std::unique_ptr<Communicator> comm(new Communicator());
+  comm->name_ = "/paddle_custom_cpu_ccl_" + id;
+  comm->rank_ = rank;
+  comm->nranks_ = nranks;
+  comm->slot_bytes_ = SlotBytesFromEnv();
+  comm->p2p_slot_bytes_ = kP2PSlotBytes;
+  comm->map_bytes_ = P2POffset(nranks, comm->slot_bytes_) +
+                     2 * nranks * nranks * comm->p2p_slot_bytes_;
+  comm->send_seq_.assign(nranks, 0);
+  comm->recv_seq_.assign(nranks, 0);
+  comm->peer_pids_.assign(nranks, 0);
+
+  // Pages of a fresh segment read as zero, which is the initial state of
+  // every counter. ftruncate to the same size is idempotent, so every rank
+  // may size the segment before mapping it.
+  const int fd = shm_open(comm->name_.c_str(), O_CREAT | O_RDWR, 0600);
+  if (fd < 0) {
+    std::cerr << "[custom_cpu] shm_open " << comm->name_
+              << " failed: " << std::strerror(errno) << std::endl;
+    return nullptr;
+  }
+  void* base = MAP_FAILED;
+  if (ftruncate(fd, comm->map_bytes_) == 0) {
+    base = mmap(
+        nullptr, comm->map_bytes_, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  }
+  close(fd);
+  if (base == MAP_FAILED) {
+    std::cerr << "[custom_cpu] mapping " << comm->name_
+              << " failed: " << std::strerror(errno) << std::endl;
+    shm_unlink(comm->name_.c_str());
+    return nullptr;
+  }
+  comm->base_ = static_cast<char*>(base);
+  comm->segment_ = reinterpret_cast<Segment*>(base);
+
+  uint32_t expected_ranks = 0;
+  uint64_t expected_slot = 0;
+  const bool ranks_ok = comm->segment_->nranks.compare_exchange_strong(
+                            expected_ranks, static_cast<uint32_t>(nranks)) ||
+                        expected_ranks == static_cast<uint32_t>(nranks);
+  const bool slot_ok = comm->segment_->slot_bytes.compare_exchange_strong(
+                           expected_slot, comm->slot_bytes_) ||
+                       expected_slot == comm->slot_bytes_;
+  if (!ranks_ok || !slot_ok) {
+    std::cerr << "[custom_cpu] ranks of communicator " << comm->name_
+              << " disagree on nranks or FLAGS_custom_cpu_ccl_buffer_kb"
+              << std::endl;
+    return nullptr;
+  }
+  auto* control = reinterpret_cast<Control*>(comm->base_ + ControlOffset());
+  const uint64_t pid_namespace = PidNamespace();
+  control[rank].pid.store(getpid());
+  control[rank].pid_namespace.store(pid_namespace);
+  comm->segment_->attached.fetch_add(1);
+  const bool joined = comm->Wait(
+      [&]() {
+        return comm->segment_->attached.load() == static_cast<uint32_t>(nranks);
+      },
+      "the other ranks to join");
+  // Every rank holds a mapping now, drop the name so that nothing is left
+  // behind in /dev/shm even if a process dies.
+  if (rank == 0 || !joined) {
+    shm_unlink(comm->name_.c_str());
+  }
+  if (!joined) {
+    return nullptr;
+  }
+  // Pids only mean something within the same pid namespace.
+  for (int r = 0; r < nranks; ++r) {
+    if (r != rank && pid_namespace != 0 &&
+        control[r].pid_namespace.load() == pid_namespace) {
+      comm->peer_pids_[r] = control[r].pid.load();
+    }
+  }
+  return comm.release();
+}
+
+Communicator::~Communicator() {
+  if (base_ != nullptr) {
+    munmap(base_, map_bytes_);
+  }
+}
+
+char* Communicator::InSlot(int rank, uint64_t chunk) {
+  return base_ + DataOffset(nranks_) + (4 * rank + chunk % 2) * slot_bytes_;
+}
+
+char* Communicator::OutSlot(int rank, uint64_t chunk) {
+  return InSlot(rank, chunk) + 2 * slot_bytes_;
+}
+
+// Slot reuse: data of chunk c is read only between the first step of chunk c
+// and the first step of chunk c + 1, and slots of the same parity are written
+// again for chunk c + 2 only after that step, so two slots per rank suffice.
+bool Communicator::Step() {
+  if (failed_) {
+    return false;
+  }
+  auto* control = reinterpret_cast<Control*>(base_ + ControlOffset());
+  ++step_;
+  control[rank_].step.store(step_, std::memory_order_release);
+  for (int r = 0; r < nranks_; ++r) {
+    if (!Wait(
+            [&]() {
+              return control[r].step.load(std::memory_order_acquire) >= step_;
+            },
+            "a collective step of the other ranks")) {
+      return false;
+    }
+  }
+  return true;
+}
+
+bool Communicator::AllReduce(const void* send,
+                             void* recv,
+                             size_t count,
+                             CclDataType dtype,
+                             CclReduceOp op) {
+  if (!Supported(dtype, op)) {
+    return false;
+  }
+  const size_t elem = CclDataTypeSize(dtype);
+  const char* in = static_cast<const char*>(send);
+  char* out = static_cast<char*>(recv);
+  const size_t chunk_elems = slot_bytes_ / elem;
+  std::vector<const char*> src(nranks_);
+  for (size_t off = 0; off < count; off += chunk_elems, ++chunk_) {
+    const size_t len = std::min(chunk_elems, count - off);
+    std::memcpy(InSlot(rank_, chunk_), in + off * elem, len * elem);
+    if (!Step()) {
+      return false;
+    }
+    for (int r = 0; r < nranks_; ++r) {
+      src[r] = InSlot(r, chunk_);
+    }
+    const AllReduceAlgo algo = AllReduceAlgoFromEnv();
+    const bool tree =
+        algo == AllReduceAlgo::kTree ||
+        (algo == AllReduceAlgo::kAuto && len * elem <= kTreeAllReduceBytes);
+    if (tree) {
+      // One-level tree: every rank is a direct child of every other one,
+      // so each rank reduces the whole chunk itself.
+      Combine(dtype, op, src.data(), nranks_, 0, out + off * elem, len);
+      continue;
+    }
+    // Ring allreduce as reduce-scatter + all-gather. All slots are directly
+    // readable, so each phase takes one step instead of nranks - 1 hops.
+    const size_t begin = len * rank_ / nranks_;
+    const size_t end = len * (rank_ + 1) / nranks_;
+    Combine(dtype,
+            op,
+            src.data(),
+            nranks_,
+            begin,
+            OutSlot(rank_, chunk_) + begin * elem,
+            end - begin);
+    if (!Step()) {
+      return false;
+    }
+    for (int r = 0; r < nranks_; ++r) {
+      const size_t b = len * r / nranks_;
+      const size_t e = len * (r + 1) / nranks_;
+      std::memcpy(out + (off + b) * elem,
+                  OutSlot(r, chunk_) + b * elem,
+                  (e - b) * elem);
+    }
+  }
+  return true;
+}
+
+bool Communicator::Broadcast(void* buf,
+                             size_t count,
+                             CclDataType dtype,
+                             int root) {
+  if (root < 0 || root >= nranks_) {
+    return false;
+  }
+  const size_t elem = CclDataTypeSize(dtype);
+  char* data = static_cast<char*>(buf);
+  const size_t chunk_elems = slot_bytes_ / elem;
+  for (size_t off = 0; off < count; off += chunk_elems, ++chunk_) {
+    const size_t len = std::min(chunk_elems, count - off);
+    if (rank_ == root) {
+      std::memcpy(InSlot(rank_, chunk_), data + off * elem, len * elem);
+    }
+    if (!Step()) {
+      return false;
+    }
+    if (rank_ != root) {
+      std::memcpy(data + off * elem, InSlot(root, chunk_), len * elem);
+    }
+  }
+  return true;
+}
+
+bool Communicator::Reduce(const void* send,
+                          void* recv,
+                          size_t count,
+                          CclDataType dtype,
+                          CclReduceOp op,
+                          int root) {
+  if (!Supported(dtype, op) || root < 0 || root >= nranks_) {
+    return false;
+  }
+  const size_t elem = CclDataTypeSize(dtype);
+  const char* in = static_cast<const char*>(send);
+  char* out = static_cast<char*>(recv);
+  const size_t chunk_elems = slot_bytes_ / elem;
+  std::vector<const char*> src(nranks_);
+  for (size_t off = 0; off < count; off += chunk_elems, ++chunk_) {
+    const size_t len = std::min(chunk_elems, count - off);
+    std::memcpy(InSlot(rank_, chunk_), in + off * elem, len * elem);
+    if (!Step()) {
+      return false;
+    }
+    for (int r = 0; r < nranks_; ++r) {
+      src[r] = InSlot(r, chunk_);
+    }
+    if (len * elem <= kTreeAllReduceBytes) {
+      if (rank_ == root) {
+        Combine(dtype, op, src.data(), nranks_, 0, out + off * elem, len);
+      }
+      continue;
+    }
+    // Spread the reduction over all ranks, the root only gathers.
+    const size_t begin = len * rank_ / nranks_;
+    const size_t end = len * (rank_ + 1) / nranks_;
+    Combine(dtype,
+            op,
+            src.data(),
+            nranks_,
+            begin,
+            OutSlot(rank_, chunk_) + begin * elem,
+            end - begin);
+    if (!Step()) {
+      return false;
+    }
+    if (rank_ == root) {
+      for (int r = 0; r < nranks_; ++r) {
+        const size_t b = len * r / nranks_;
+        const size_t e = len * (r + 1) / nranks_;
+        std::memcpy(out + (off + b) * elem,
+                    OutSlot(r, chunk_) + b * elem,
+                    (e - b) * elem);
+      }
+    }
+  }
+  return true;
+}
+
+bool Communicator::AllGather(const void* send,
+                             void* recv,
+                             size_t count,
+                             CclDataType dtype) {
+  const size_t elem = CclDataTypeSize(dtype);
+  const char* in = static_cast<const char*>(send);
+  char* out = static_cast<char*>(recv);
+  const size_t chunk_elems = slot_bytes_ / elem;
+  for (size_t off = 0; off < count; off += chunk_elems, ++chunk_) {
+    const size_t len = std::min(chunk_elems, count - off);
+    std::memcpy(InSlot(rank_, chunk_), in + off * elem, len * elem);
+    if (!Step()) {
+      return false;
+    }
+    for (int r = 0; r < nranks_; ++r) {
+      std::memcpy(
+          out + (r * count + off) * elem, InSlot(r, chunk_), len * elem);
+    }
+  }
+  return true;
+}
+
+bool Communicator::ReduceScatter(const void* send,
+                                 void* recv,
+                                 size_t count,
+                                 CclDataType dtype,
+                                 CclReduceOp op) {
+  if (!Supported(dtype, op)) {
+    return false;
+  }
+  const size_t elem = CclDataTypeSize(dtype);
+  const char* in = static_cast<const char*>(send);
+  char* out = static_cast<char*>(recv);
+  // A chunk carries len elements of every destination block.
+  const size_t chunk_elems = slot_bytes_ / (elem * nranks_);
+  std::vector<const char*> src(nranks_);
+  for (size_t off = 0; off < count; off += chunk_elems, ++chunk_) {
+    const size_t len = std::min(chunk_elems, count - off);
+    char* slot = InSlot(rank_, chunk_);
+    for (int r = 0; r < nranks_; ++r) {
+      std::memcpy(
+          slot + r * len * elem, in + (r * count + off) * elem, len * elem);
+    }
+    if (!Step()) {
+      return false;
+    }
+    for (int r = 0; r < nranks_; ++r) {
+      src[r] = InSlot(r, chunk_);
+    }
+    Combine(dtype, op, src.data(), nranks_, rank_ * len, out + off * elem, len);
+  }
+  return true;
+}
+
+// Channel (src, dst) has two slots; chunk k of the channel goes to slot k % 2
+// and is published by sent = k + 1, its slot is free again once acked > k.
+bool Communicator::Progress(P2POp* op) {
+  auto* channels = reinterpret_cast<Channel*>(base_ + ChannelOffset(nranks_));
+  const int src = op->send ? rank_ : op->peer;
+  const int dst = op->send ? op->peer : rank_;
+  Channel& channel = channels[src * nranks_ + dst];
+  char* slots = base_ + P2POffset(nranks_, slot_bytes_) +
+                2 * (src * nranks_ + dst) * p2p_slot_bytes_;
+  while (op->done < op->bytes) {
+    const size_t n = std::min(p2p_slot_bytes_, op->bytes - op->done);
+    if (op->send) {
+      const uint64_t k = send_seq_[op->peer];
+      if (k >= 2 && channel.acked.load(std::memory_order_acquire) < k - 1) {
+        return false;
+      }
+      std::memcpy(slots + (k % 2) * p2p_slot_bytes_, op->buf + op->done, n);
+      channel.sent.store(k + 1, std::memory_order_release);
+      ++send_seq_[op->peer];
+    } else {
+      const uint64_t k = recv_seq_[op->peer];
+      if (channel.sent.load(std::memory_order_acquire) < k + 1) {
+        return false;
+      }
+      std::memcpy(op->buf + op->done, slots + (k % 2) * p2p_slot_bytes_, n);
+      channel.acked.store(k + 1, std::memory_order_release);
+      ++recv_seq_[op->peer];
+    }
+    op->done += n;
+  }
+  return true;
+}
+
+int& Communicator::GroupDepth() {
+  thread_local int depth = 0;
+  return depth;
+}
+
+std::vector<Communicator::P2POp>& Communicator::PendingOps() {
+  thread_local std::vector<P2POp> ops;
+  return ops;
+}
+
+bool Communicator::RunP2P(P2POp op) {
+  if (op.peer < 0 || op.peer >= nranks_) {
+    return false;
+  }
+  if (failed_) {
+    return false;
+  }
+  if (GroupDepth() > 0) {
+    PendingOps().push_back(op);
+    return true;
+  }
+  return Wait([&]() { return Progress(&op); }, op.send ? "a send" : "a recv");
+}
+
+bool Communicator::Send(const void* buf, size_t bytes, int peer) {
+  return RunP2P(P2POp{this,
+                      const_cast<char*>(static_cast<const char*>(buf)),
+                      bytes,
+                      0,
+                      peer,
+                      true});
+}
+
+bool Communicator::Recv(void* buf, size_t bytes, int peer) {
+  return RunP2P(P2POp{this, static_cast<char*>(buf), bytes, 0, peer, false});
+}
+
+void Communicator::GroupStart() { ++GroupDepth(); }
+
+bool Communicator::GroupEnd() {
+  if (GroupDepth() == 0) {
+    return false;
+  }
+  if (--GroupDepth() > 0) {
+    return true;
+  }
+  std::vector<P2POp> ops;
+  ops.swap(PendingOps());
+  std::vector<bool> done(ops.size(), false);
+  size_t remaining = ops.size();
+  Communicator* dead = nullptr;
+  auto peer_died = [&]() {
+    for (const auto& op : ops) {
+      if (op.comm->PeerDied()) {
+        dead = op.comm;
+        return true;
+      }
+    }
+    return false;
+  };
+  const WaitStatus status = WaitUntil(
+      [&]() {
+        for (size_t i = 0; i < ops.size(); ++i) {
+          if (done[i]) {
+            continue;
+          }
+          // Operations on the same channel complete in call order.
+          bool blocked = false;
+          for (size_t j = 0; j < i && !blocked; ++j) {
+            blocked = !done[j] && ops[j].comm == ops[i].comm &&
+                      ops[j].peer == ops[i].peer && ops[j].send == ops[i].send;
+          }
+          if (!blocked && ops[i].comm->Progress(&ops[i])) {
+            done[i] = true;
+            --remaining;
+          }
+        }
+        return remaining == 0;
+      },
+      peer_died);
+  if (status == WaitStatus::kReady) {
+    return true;
+  }
+  if (status == WaitStatus::kTimeout) {
+    std::cerr << "[custom_cpu] grouped send/recv timed out after "
+              << TimeoutFromEnv() << " s, see FLAGS_custom_cpu_ccl_timeout_s"
+              << std::endl;
+  } else {
+    std::cerr << "[custom_cpu] grouped send/recv of rank " << dead->rank_
+              << " of communicator " << dead->name_ << " failed: rank "
+              << dead->dead_rank_ << " exited" << std::endl;
+  }
+  for (const auto& op : ops) {
+    op.comm->failed_ = true;
+  }
+  return false;
+}
+
+}  // namespace custom_cpu
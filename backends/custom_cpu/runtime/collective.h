@@ -0,0 +1,154 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace custom_cpu {
+
+enum class CclDataType {
+  kBool,
+  kInt8,
+  kUInt8,
+  kInt16,
+  kInt32,
+  kInt64,
+  kFloat16,
+  kBFloat16,
+  kFloat32,
+  kFloat64,
+  kComplex64,
+  kComplex128,
+};
+
+enum class CclReduceOp { kSum, kAvg, kMax, kMin, kProd };
+
+size_t CclDataTypeSize(CclDataType dtype);
+
+// Intra-node collectives between processes that share a POSIX shared memory
+// segment named after the communicator id.
+//
+// Every rank owns a control block with a step counter and two staging slots
+// (double buffering), so a rank may start copying chunk c + 1 while slower
+// ranks still read chunk c. Large messages are processed in slot-sized chunks.
+// Within a collective all ranks advance the same sequence of steps; a step is
+// complete once every rank has published it.
+//
+// * AllReduce uses a one-level tree for small chunks (every rank reduces the
+//   whole chunk from all slots) and a ring allreduce for large chunks. The
+//   ring's reduce-scatter and all-gather phases each take a single step, as
+//   every slot is directly readable, instead of nranks - 1 hops.
+// * Reductions always combine ranks in rank order, so every rank obtains
+//   bit-identical results.
+// * Send/Recv use a dedicated two-slot channel per (src, dst) pair. Calls made
+//   between GroupStart and GroupEnd are progressed together, so exchanges
+//   that would deadlock when run one by one complete.
+//
+// A rank that waits for the others gives up once FLAGS_custom_cpu_ccl_timeout_s
+// passed or another rank exited, its pid is kept in the shared segment. The
+// call fails and so does every later call on the communicator, since its
+// ranks no longer agree on the step count.
+//
+// Environment variables:
+//   FLAGS_custom_cpu_ccl_buffer_kb      staging slot size, default 512
+//   FLAGS_custom_cpu_ccl_allreduce_algo "auto" (default), "tree" or "ring"
+//   FLAGS_custom_cpu_ccl_timeout_s      wait limit in seconds, default 1800,
+//                                       0 waits forever
+class Communicator {
+ public:
+  // Joins communicator `id` as `rank` and blocks until all ranks joined.
+  // Returns nullptr on failure, e.g. when not all ranks joined in time.
+  static Communicator* Create(const std::string& id, int nranks, int rank);
+  ~Communicator();
+
+  int rank() const { return rank_; }
+  int nranks() const { return nranks_; }
+
+  // All functions return false for unsupported data type / op combinations
+  // and when a rank timed out or exited.
+  bool AllReduce(const void* send,
+                 void* recv,
+                 size_t count,
+                 CclDataType dtype,
+                 CclReduceOp op);
+  bool Broadcast(void* buf, size_t count, CclDataType dtype, int root);
+  bool Reduce(const void* send,
+              void* recv,
+              size_t count,
+              CclDataType dtype,
+              CclReduceOp op,
+              int root);
+  // recv holds nranks * count elements, ordered by rank.
+  bool AllGather(const void* send, void* recv, size_t count, CclDataType dtype);
+  // send holds nranks * count elements, rank r receives the reduction of
+  // block r.
+  bool ReduceScatter(const void* send,
+                     void* recv,
+                     size_t count,
+                     CclDataType dtype,
+                     CclReduceOp op);
+  bool Send(const void* buf, size_t bytes, int peer);
+  bool Recv(void* buf, size_t bytes, int peer);
+
+  // Point-to-point calls of the calling thread between GroupStart and
+  // GroupEnd are deferred and progressed together by GroupEnd.
+  static void GroupStart();
+  static bool GroupEnd();
+
+  struct Segment;
+
+ private:
+  struct P2POp;
+
+  Communicator() = default;
+
+  char* InSlot(int rank, uint64_t chunk);
+  char* OutSlot(int rank, uint64_t chunk);
+  // Publishes the next step of this rank and waits for all ranks to reach it.
+  bool Step();
+  // Waits until ready() holds, `what` names it in the error message. Returns
+  // false and marks the communicator failed on a timeout or a dead rank.
+  template <typename Pred>
+  bool Wait(const Pred& ready, const char* what);
+  // Whether another rank of the communicator exited, sets dead_rank_.
+  bool PeerDied();
+  // Advances op without blocking, returns true once it has completed.
+  bool Progress(P2POp* op);
+  bool RunP2P(P2POp op);
+  static int& GroupDepth();
+  static std::vector<P2POp>& PendingOps();
+
+  std::string name_;
+  int rank_ = 0;
+  int nranks_ = 0;
+  size_t slot_bytes_ = 0;
+  size_t p2p_slot_bytes_ = 0;
+  size_t map_bytes_ = 0;
+  char* base_ = nullptr;
+  Segment* segment_ = nullptr;
+  uint64_t step_ = 0;
+  uint64_t chunk_ = 0;
+  std::vector<uint64_t> send_seq_;
+  std::vector<uint64_t> recv_seq_;
+  // Pids of the other ranks that are watched, 0 for the rest.
+  std::vector<int64_t> peer_pids_;
+  bool failed_ = false;
+  int dead_rank_ = -1;
+};
+
+}  // namespace custom_cpu
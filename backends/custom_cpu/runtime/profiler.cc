@@ -0,0 +1,228 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/profiler.h"
+
+#include <sys/syscall.h>
+#include <time.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cstdio>
+#include <cstdlib>
+#include <fstream>
+
+namespace custom_cpu {
+
+namespace {
+
+const char* TraceKindName(TraceKind kind) {
+  switch (kind) {
+    case TraceKind::kKernel:
+      return "Kernel";
+    case TraceKind::kMemcpyH2D:
+    case TraceKind::kMemcpyD2H:
+    case TraceKind::kMemcpyD2D:
+    case TraceKind::kMemcpyP2P:
+      return "Memcpy";
+  }
+  return "Unknown";
+}
+
+size_t RoundUpPow2(size_t n) {
+  size_t p = 1;
+  while (p < n) {
+    p <<= 1;
+  }
+  return p;
+}
+
+}  // namespace
+
+TraceRing::TraceRing(size_t capacity)
+    : slots_(RoundUpPow2(capacity)),
+      mask_(slots_.size() - 1),
+      head_(0),
+      tail_(0),
+      dropped_(0) {}
+
+bool TraceRing::Push(const TraceRecord& record) {
+  const uint64_t head = head_.load(std::memory_order_relaxed);
+  if (head - tail_.load(std::memory_order_acquire) == slots_.size()) {
+    dropped_.fetch_add(1, std::memory_order_relaxed);
+    return false;
+  }
+  slots_[head & mask_] = record;
+  head_.store(head + 1, std::memory_order_release);
+  return true;
+}
+
+void TraceRing::Drain(std::vector<TraceRecord>* out) {
+  const uint64_t tail = tail_.load(std::memory_order_relaxed);
+  const uint64_t head = head_.load(std::memory_order_acquire);
+  for (uint64_t i = tail; i < head; ++i) {
+    out->push_back(slots_[i & mask_]);
+  }
+  tail_.store(head, std::memory_order_release);
+}
+
+std::atomic<bool> Profiler::enabled_(false);
+std::atomic<int> Profiler::current_device_(0);
+
+Profiler& Profiler::Instance() {
+  // Leaked on purpose, kernels may still run during static destruction.
+  static Profiler* profiler = new Profiler();
+  return *profiler;
+}
+
+Profiler::Profiler() : ring_size_(16384), sample_rate_(1) {
+  const char* ring_size = std::getenv("FLAGS_custom_cpu_profiler_ring_size");
+  if (ring_size && std::strtoull(ring_size, nullptr, 10) > 0) {
+    ring_size_ = std::strtoull(ring_size, nullptr, 10);
+  }
+  const char* sample_rate =
+      std::getenv("FLAGS_custom_cpu_profiler_sample_rate");
+  if (sample_rate && std::strtoull(sample_rate, nullptr, 10) > 0) {
+    sample_rate_ = std::strtoull(sample_rate, nullptr, 10);
+  }
+  const char* trace_file = std::getenv("FLAGS_custom_cpu_profiler_trace_file");
+  if (trace_file) {
+    trace_file_ = trace_file;
+  }
+}
+
+void Profiler::Start() {
+  // Spans left over from an earlier session are discarded.
+  uint64_t dropped = 0;
+  Collect(&dropped);
+  enabled_.store(true, std::memory_order_relaxed);
+}
+
+void Profiler::Stop() { enabled_.store(false, std::memory_order_relaxed); }
+
+bool Profiler::Sample() {
+  if (sample_rate_ == 1) {
+    return true;
+  }
+  static thread_local uint64_t counter = 0;
+  return ++counter % sample_rate_ == 0;
+}
+
+struct Profiler::LocalRingOwner {
+  ~LocalRingOwner() {
+    if (ring != nullptr) {
+      Profiler::Instance().ReleaseRing(ring);
+    }
+  }
+
+  TraceRing* ring = nullptr;
+};
+
+TraceRing* Profiler::LocalRing() {
+  static thread_local LocalRingOwner owner;
+  if (owner.ring == nullptr) {
+    std::lock_guard<std::mutex> guard(mutex_);
+    if (free_rings_.empty()) {
+      rings_.emplace_back(new TraceRing(ring_size_));
+      owner.ring = rings_.back().get();
+    } else {
+      owner.ring = free_rings_.back();
+      free_rings_.pop_back();
+    }
+  }
+  return owner.ring;
+}
+
+void Profiler::ReleaseRing(TraceRing* ring) {
+  std::vector<TraceRecord> records;
+  std::lock_guard<std::mutex> guard(mutex_);
+  ring->Drain(&records);
+  exited_dropped_ += ring->TakeDropped();
+  const size_t keep =
+      std::min(records.size(), ring_size_ - exited_records_.size());
+  exited_records_.insert(
+      exited_records_.end(), records.begin(), records.begin() + keep);
+  exited_dropped_ += records.size() - keep;
+  free_rings_.push_back(ring);
+}
+
+void Profiler::Record(const TraceRecord& record) { LocalRing()->Push(record); }
+
+std::vector<TraceRecord> Profiler::Collect(uint64_t* dropped) {
+  std::vector<TraceRecord> records;
+  *dropped = 0;
+  std::lock_guard<std::mutex> guard(mutex_);
+  for (auto& ring : rings_) {
+    ring->Drain(&records);
+    *dropped += ring->TakeDropped();
+  }
+  records.insert(
+      records.end(), exited_records_.begin(), exited_records_.end());
+  exited_records_.clear();
+  *dropped += exited_dropped_;
+  exited_dropped_ = 0;
+  return records;
+}
+
+size_t Profiler::NumRings() {
+  std::lock_guard<std::mutex> guard(mutex_);
+  return rings_.size();
+}
+
+bool Profiler::WriteChromeTrace(const std::string& path,
+                                const std::vector<TraceRecord>& records) {
+  std::ofstream out(path);
+  if (!out) {
+    return false;
+  }
+  const int pid = static_cast<int>(getpid());
+  out << "{\"traceEvents\": [";
+  for (size_t i = 0; i < records.size(); ++i) {
+    const TraceRecord& r = records[i];
+    char buffer[512];
+    // Timestamps of the Chrome trace format are in microseconds.
+    std::snprintf(buffer,
+                  sizeof(buffer),
+                  "%s\n{\"name\": \"%s\", \"cat\": \"%s\", \"ph\": \"X\", "
+                  "\"ts\": %.3f, \"dur\": %.3f, \"pid\": %d, \"tid\": %llu, "
+                  "\"args\": {\"device\": %d, \"flops\": %llu, "
+                  "\"bytes\": %llu}}",
+                  i == 0 ? "" : ",",
+                  r.name,
+                  TraceKindName(r.kind),
+                  r.start_ns / 1000.0,
+                  (r.end_ns - r.start_ns) / 1000.0,
+                  pid,
+                  static_cast<unsigned long long>(r.thread_id),  // NOLINT
+                  r.device_id,
+                  static_cast<unsigned long long>(r.flops),   // NOLINT
+                  static_cast<unsigned long long>(r.bytes));  // NOLINT
+    out << buffer;
+  }
+  out << "\n]}\n";
+  return static_cast<bool>(out);
+}
+
+uint64_t Profiler::NowNs() {
+  struct timespec ts;
+  clock_gettime(CLOCK_REALTIME, &ts);
+  return static_cast<uint64_t>(ts.tv_sec) * 1000000000ull + ts.tv_nsec;
+}
+
+uint64_t Profiler::ThreadId() {
+  static thread_local uint64_t tid = syscall(SYS_gettid);
+  return tid;
+}
+
+}  // namespace custom_cpu
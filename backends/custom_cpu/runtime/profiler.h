@@ -0,0 +1,196 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <atomic>
+#include <cstdint>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <vector>
+
+namespace custom_cpu {
+
+enum class TraceKind : uint8_t {
+  kKernel,
+  kMemcpyH2D,
+  kMemcpyD2H,
+  kMemcpyD2D,
+  kMemcpyP2P,
+};
+
+// One span of device activity. `name` must point to storage that outlives
+// the profiler session, e.g. a string literal.
+struct TraceRecord {
+  const char* name;
+  uint64_t start_ns;
+  uint64_t end_ns;
+  // Estimated arithmetic of a kernel, 0 when unknown.
+  uint64_t flops;
+  // Bytes read and written by a kernel, or copied by a memcpy.
+  uint64_t bytes;
+  uint64_t thread_id;
+  int device_id;
+  TraceKind kind;
+};
+
+// A bounded single-producer single-consumer queue of trace records. Only the
+// owning thread pushes, Push never blocks and drops the record when the ring
+// is full.
+class TraceRing {
+ public:
+  explicit TraceRing(size_t capacity);
+
+  bool Push(const TraceRecord& record);
+  // Moves every pending record to `out`, must not run concurrently with
+  // another Drain.
+  void Drain(std::vector<TraceRecord>* out);
+  uint64_t TakeDropped() { return dropped_.exchange(0); }
+
+ private:
+  std::vector<TraceRecord> slots_;
+  uint64_t mask_;
+  alignas(64) std::atomic<uint64_t> head_;
+  alignas(64) std::atomic<uint64_t> tail_;
+  std::atomic<uint64_t> dropped_;
+};
+
+// Records kernel and memcpy spans of the plugin while a paddle.profiler
+// session traces the device. Every thread appends to its own TraceRing, so
+// recording a span costs two clock reads and a few stores, with no lock or
+// shared cache line; ProfilerCollectData drains the rings and hands the spans
+// to paddle as device trace events. When a thread exits, its pending records
+// move to a shared buffer of ring size and its ring goes back to a free list
+// for the next new thread, so threads that come and go keep no more rings
+// than the peak number of live threads.
+//
+// Environment variables:
+//   FLAGS_custom_cpu_profiler_ring_size    records per thread, default 16384
+//   FLAGS_custom_cpu_profiler_sample_rate  record one of every N spans of a
+//                                          thread, default 1 (every span)
+//   FLAGS_custom_cpu_profiler_trace_file   if set, every collection also
+//                                          writes the spans to this file as a
+//                                          Chrome trace, with flops, bytes and
+//                                          thread id as event arguments
+class Profiler {
+ public:
+  static Profiler& Instance();
+
+  static bool Enabled() { return enabled_.load(std::memory_order_relaxed); }
+
+  void Start();
+  void Stop();
+
+  // Whether the calling thread should record its next span, advances the
+  // sampling counter.
+  bool Sample();
+  void Record(const TraceRecord& record);
+  // Returns the spans recorded since the last call and the number of spans
+  // dropped because a ring was full.
+  std::vector<TraceRecord> Collect(uint64_t* dropped);
+  // Number of rings allocated so far.
+  size_t NumRings();
+
+  // Writes `records` to `path` in the Chrome trace event format.
+  static bool WriteChromeTrace(const std::string& path,
+                               const std::vector<TraceRecord>& records);
+
+  const std::string& trace_file() const { return trace_file_; }
+
+  // Device the kernels of the calling process run on.
+  static void SetCurrentDevice(int device_id) {
+    current_device_.store(device_id, std::memory_order_relaxed);
+  }
+  static int CurrentDevice() {
+    return current_device_.load(std::memory_order_relaxed);
+  }
+
+  // Wall clock in ns, the time base of paddle's profiler.
+  static uint64_t NowNs();
+  static uint64_t ThreadId();
+
+ private:
+  Profiler();
+
+  // Returns the ring of the calling thread to the profiler when it exits.
+  struct LocalRingOwner;
+
+  TraceRing* LocalRing();
+  void ReleaseRing(TraceRing* ring);
+
+  static std::atomic<bool> enabled_;
+  static std::atomic<int> current_device_;
+
+  size_t ring_size_;
+  uint64_t sample_rate_;
+  std::string trace_file_;
+  std::mutex mutex_;
+  std::vector<std::unique_ptr<TraceRing>> rings_;
+  // Drained rings of exited threads, handed to the next new thread.
+  std::vector<TraceRing*> free_rings_;
+  // Records left by exited threads until the next Collect.
+  std::vector<TraceRecord> exited_records_;
+  uint64_t exited_dropped_ = 0;
+};
+
+// Records the lifetime of the scope as a span when profiling is enabled. The
+// cost of a span is only needed when it is recorded, callers estimate it
+// behind active():
+//
+//   custom_cpu::TraceScope trace("matmul");
+//   if (trace.active()) {
+//     trace.set_cost(2 * m * n * k, (m * k + k * n + m * n) * sizeof(T));
+//   }
+class TraceScope {
+ public:
+  explicit TraceScope(const char* name,
+                      TraceKind kind = TraceKind::kKernel,
+                      int device_id = -1)
+      : active_(Profiler::Enabled() && Profiler::Instance().Sample()) {
+    if (active_) {
+      record_.name = name;
+      record_.flops = 0;
+      record_.bytes = 0;
+      record_.kind = kind;
+      record_.device_id =
+          device_id < 0 ? Profiler::CurrentDevice() : device_id;
+      record_.start_ns = Profiler::NowNs();
+    }
+  }
+
+  ~TraceScope() {
+    if (active_) {
+      record_.end_ns = Profiler::NowNs();
+      record_.thread_id = Profiler::ThreadId();
+      Profiler::Instance().Record(record_);
+    }
+  }
+
+  TraceScope(const TraceScope&) = delete;
+  TraceScope& operator=(const TraceScope&) = delete;
+
+  bool active() const { return active_; }
+
+  void set_cost(uint64_t flops, uint64_t bytes) {
+    record_.flops = flops;
+    record_.bytes = bytes;
+  }
+
+ private:
+  bool active_;
+  TraceRecord record_;
+};
+
+}  // namespace custom_cpu
@@ -14,17 +14,30 @@
 
 #include <errno.h>
 #include <fcntl.h>
-#include <semaphore.h>
 #include <sys/types.h>
 #include <sys/wait.h>
 #include <unistd.h>
 
+#include <algorithm>
 #include <cstdint>
 #include <cstdio>
 #include <cstring>
+#include <functional>
 #include <iostream>
-
+#include <iterator>
+#include <mutex>
+#include <random>
+#include <string>
+#include <utility>
+#include <vector>
+
+#include "kernels/funcs/thread_pool.h"
+#include "paddle/phi/api/profiler/trace_event.h"
 #include "paddle/phi/backends/device_ext.h"
+#include "runtime/allocator.h"
+#include "runtime/collective.h"
+#include "runtime/profiler.h"
+#include "runtime/stream.h"
 
 #define MEMORY_FRACTION 0.5f
 
@@ -42,11 +55,13 @@ C_Status Init() {
 
 C_Status InitDevice(const C_Device device) {
   global_current_device = device->id;
+  custom_cpu::Profiler::SetCurrentDevice(device->id);
   return C_SUCCESS;
 }
 
 C_Status SetDevice(const C_Device device) {
   global_current_device = device->id;
+  custom_cpu::Profiler::SetCurrentDevice(device->id);
   return C_SUCCESS;
 }
 
@@ -70,20 +85,161 @@ C_Status GetDevicesList(size_t *devices) {
   return C_SUCCESS;
 }
 
-C_Status MemCpy(const C_Device device,
-                void *dst,
-                const void *src,
-                size_t size) {
-  memcpy(dst, src, size);
+static void TracedMemCpy(custom_cpu::TraceKind kind,
+                         const char *name,
+                         int device_id,
+                         void *dst,
+                         const void *src,
+                         size_t size) {
+  custom_cpu::TraceScope trace(name, kind, device_id);
+  trace.set_cost(0, size);
+  custom_kernel::funcs::ParallelMemcpy(dst, src, size);
+}
+
+C_Status MemCpyH2D(const C_Device device,
+                   void *dst,
+                   const void *src,
+                   size_t size) {
+  custom_cpu::Stream::SynchronizeDevice(device->id);
+  TracedMemCpy(custom_cpu::TraceKind::kMemcpyH2D,
+               "MEMCPY_HtoD",
+               device->id,
+               dst,
+               src,
+               size);
   return C_SUCCESS;
 }
 
-C_Status AsyncMemCpy(const C_Device device,
-                     C_Stream stream,
-                     void *dst,
-                     const void *src,
-                     size_t size) {
-  memcpy(dst, src, size);
+C_Status MemCpyD2H(const C_Device device,
+                   void *dst,
+                   const void *src,
+                   size_t size) {
+  custom_cpu::Stream::SynchronizeDevice(device->id);
+  TracedMemCpy(custom_cpu::TraceKind::kMemcpyD2H,
+               "MEMCPY_DtoH",
+               device->id,
+               dst,
+               src,
+               size);
+  return C_SUCCESS;
+}
+
+C_Status MemCpyD2D(const C_Device device,
+                   void *dst,
+                   const void *src,
+                   size_t size) {
+  custom_cpu::Stream::SynchronizeDevice(device->id);
+  TracedMemCpy(custom_cpu::TraceKind::kMemcpyD2D,
+               "MEMCPY_DtoD",
+               device->id,
+               dst,
+               src,
+               size);
+  return C_SUCCESS;
+}
+
+static custom_cpu::Stream *ToStream(C_Stream stream) {
+  return reinterpret_cast<custom_cpu::Stream *>(stream);
+}
+
+static custom_cpu::Event *ToEvent(C_Event event) {
+  return reinterpret_cast<custom_cpu::Event *>(event);
+}
+
+// Runs `task` in order on `stream`, or right away for the null stream.
+static void EnqueueOrRun(C_Stream stream, std::function<void()> task) {
+  if (stream) {
+    ToStream(stream)->Enqueue(std::move(task));
+  } else {
+    task();
+  }
+}
+
+// The span of an async copy covers the copy itself, not its time in the queue.
+static void AsyncTracedMemCpy(C_Stream stream,
+                              custom_cpu::TraceKind kind,
+                              const char *name,
+                              int device_id,
+                              void *dst,
+                              const void *src,
+                              size_t size) {
+  EnqueueOrRun(stream,
+               [=]() { TracedMemCpy(kind, name, device_id, dst, src, size); });
+}
+
+// The source of a copy from host memory may be pageable and reused as soon
+// as the call returns. An idle stream copies right away; otherwise the source
+// is staged in a plugin block and the copy out of it is queued behind the
+// work already on the stream.
+static void StagedTracedMemCpy(C_Stream stream,
+                               custom_cpu::TraceKind kind,
+                               const char *name,
+                               int device_id,
+                               void *dst,
+                               const void *src,
+                               size_t size) {
+  if (stream == nullptr || ToStream(stream)->Query()) {
+    TracedMemCpy(kind, name, device_id, dst, src, size);
+    return;
+  }
+  auto &allocator = custom_cpu::CachingAllocator::Instance();
+  void *staging = allocator.Allocate(size);
+  if (staging == nullptr) {
+    ToStream(stream)->Synchronize();
+    TracedMemCpy(kind, name, device_id, dst, src, size);
+    return;
+  }
+  custom_kernel::funcs::ParallelMemcpy(staging, src, size);
+  ToStream(stream)->Enqueue([=, &allocator]() {
+    TracedMemCpy(kind, name, device_id, dst, staging, size);
+    allocator.Free(staging);
+  });
+}
+
+C_Status AsyncMemCpyH2D(const C_Device device,
+                        C_Stream stream,
+                        void *dst,
+                        const void *src,
+                        size_t size) {
+  StagedTracedMemCpy(stream,
+                     custom_cpu::TraceKind::kMemcpyH2D,
+                     "MEMCPY_HtoD",
+                     device->id,
+                     dst,
+                     src,
+                     size);
+  return C_SUCCESS;
+}
+
+C_Status AsyncMemCpyD2H(const C_Device device,
+                        C_Stream stream,
+                        void *dst,
+                        const void *src,
+                        size_t size) {
+  // The destination must stay alive until the stream is synchronized, as
+  // with device runtimes.
+  AsyncTracedMemCpy(stream,
+                    custom_cpu::TraceKind::kMemcpyD2H,
+                    "MEMCPY_DtoH",
+                    device->id,
+                    dst,
+                    src,
+                    size);
+  return C_SUCCESS;
+}
+
+C_Status AsyncMemCpyD2D(const C_Device device,
+                        C_Stream stream,
+                        void *dst,
+                        const void *src,
+                        size_t size) {
+  AsyncTracedMemCpy(stream,
+                    custom_cpu::TraceKind::kMemcpyD2D,
+                    "MEMCPY_DtoD",
+                    device->id,
+                    dst,
+                    src,
+                    size);
   return C_SUCCESS;
 }
 
@@ -92,7 +248,12 @@ C_Status MemCpyP2P(const C_Device dst_device,
                    void *dst,
                    const void *src,
                    size_t size) {
-  memcpy(dst, src, size);
+  TracedMemCpy(custom_cpu::TraceKind::kMemcpyP2P,
+               "MEMCPY_PtoP",
+               dst_device->id,
+               dst,
+               src,
+               size);
   return C_SUCCESS;
 }
 
@@ -102,12 +263,83 @@ C_Status AsyncMemCpyP2P(const C_Device dst_device,
                         void *dst,
                         const void *src,
                         size_t size) {
-  memcpy(dst, src, size);
+  AsyncTracedMemCpy(stream,
+                    custom_cpu::TraceKind::kMemcpyP2P,
+                    "MEMCPY_PtoP",
+                    dst_device->id,
+                    dst,
+                    src,
+                    size);
   return C_SUCCESS;
 }
 
+// Blocks freed while the streams of their device have pending work, which
+// may still read or write them. Each waits for the events recorded at the
+// time of its free and goes back to the allocator once they have completed,
+// so a free never blocks on the streams.
+class PendingFrees {
+ public:
+  static PendingFrees &Instance() {
+    static PendingFrees *frees = new PendingFrees();
+    return *frees;
+  }
+
+  void Add(void *ptr, std::vector<custom_cpu::Event> events) {
+    std::lock_guard<std::mutex> guard(mutex_);
+    entries_.push_back({ptr, std::move(events)});
+  }
+
+  // Returns the blocks whose events have completed to the allocator, or
+  // every block with `wait`.
+  bool Release(bool wait) {
+    if (!custom_cpu::Stream::AsyncEnabled()) {
+      return false;
+    }
+    std::vector<Entry> done;
+    {
+      std::lock_guard<std::mutex> guard(mutex_);
+      if (entries_.empty()) {
+        return false;
+      }
+      auto pending = std::partition(
+          entries_.begin(), entries_.end(), [wait](Entry &entry) {
+            return !wait && !std::all_of(entry.events.begin(),
+                                         entry.events.end(),
+                                         [](custom_cpu::Event &event) {
+                                           return event.Query();
+                                         });
+          });
+      done.assign(std::make_move_iterator(pending),
+                  std::make_move_iterator(entries_.end()));
+      entries_.erase(pending, entries_.end());
+    }
+    for (auto &entry : done) {
+      for (auto &event : entry.events) {
+        event.Synchronize();
+      }
+      custom_cpu::CachingAllocator::Instance().Free(entry.ptr);
+    }
+    return !done.empty();
+  }
+
+ private:
+  struct Entry {
+    void *ptr;
+    std::vector<custom_cpu::Event> events;
+  };
+
+  std::mutex mutex_;
+  std::vector<Entry> entries_;
+};
+
 C_Status Allocate(const C_Device device, void **ptr, size_t size) {
-  auto data = malloc(size);
+  auto &allocator = custom_cpu::CachingAllocator::Instance();
+  auto &pending = PendingFrees::Instance();
+  pending.Release(false);
+  auto data = allocator.Allocate(size);
+  if (data == nullptr && pending.Release(true)) {
+    data = allocator.Allocate(size);
+  }
   if (data) {
     *ptr = data;
     return C_SUCCESS;
@@ -118,68 +350,160 @@ C_Status Allocate(const C_Device device, void **ptr, size_t size) {
 }
 
 C_Status Deallocate(const C_Device device, void *ptr, size_t size) {
-  free(ptr);
+  std::vector<custom_cpu::Event> events;
+  custom_cpu::Stream::RecordDevice(device->id, &events);
+  if (events.empty()) {
+    custom_cpu::CachingAllocator::Instance().Free(ptr);
+  } else {
+    PendingFrees::Instance().Add(ptr, std::move(events));
+  }
   return C_SUCCESS;
 }
 
 C_Status CreateStream(const C_Device device, C_Stream *stream) {
-  stream = nullptr;
+  *stream = reinterpret_cast<C_Stream>(new custom_cpu::Stream(device->id));
   return C_SUCCESS;
 }
 
 C_Status DestroyStream(const C_Device device, C_Stream stream) {
+  // Pending tasks are drained before the worker exits.
+  delete ToStream(stream);
+  return C_SUCCESS;
+}
+
+C_Status QueryStream(const C_Device device, C_Stream stream) {
+  if (stream == nullptr) {
+    return C_SUCCESS;
+  }
+  return ToStream(stream)->Query() ? C_SUCCESS : C_FAILED;
+}
+
+C_Status AddCallback(const C_Device device,
+                     C_Stream stream,
+                     C_Callback callback,
+                     void *user_data) {
+  // The device handle of the caller may be gone by the time the callback
+  // runs, hand a copy to it.
+  C_Device_st device_copy = *device;
+  EnqueueOrRun(stream, [device_copy, stream, callback, user_data]() mutable {
+    C_Status status = C_SUCCESS;
+    callback(&device_copy, stream, user_data, &status);
+    if (status != C_SUCCESS) {
+      std::cerr << "custom_cpu: stream callback failed.\n";
+    }
+  });
   return C_SUCCESS;
 }
 
 C_Status CreateEvent(const C_Device device, C_Event *event) {
+  *event = reinterpret_cast<C_Event>(new custom_cpu::Event());
   return C_SUCCESS;
 }
 
 C_Status RecordEvent(const C_Device device, C_Stream stream, C_Event event) {
+  if (stream) {
+    ToEvent(event)->Record(ToStream(stream));
+  } else {
+    // Work on the null stream is already complete.
+    custom_cpu::Stream::SynchronizeDevice(device->id);
+  }
   return C_SUCCESS;
 }
 
+C_Status QueryEvent(const C_Device device, C_Event event) {
+  return ToEvent(event)->Query() ? C_SUCCESS : C_FAILED;
+}
+
 C_Status DestroyEvent(const C_Device device, C_Event event) {
+  delete ToEvent(event);
   return C_SUCCESS;
 }
 
-C_Status SyncDevice(const C_Device device) { return C_SUCCESS; }
+C_Status SyncDevice(const C_Device device) {
+  custom_cpu::Stream::SynchronizeDevice(device->id);
+  return C_SUCCESS;
+}
 
 C_Status SyncStream(const C_Device device, C_Stream stream) {
+  if (stream) {
+    ToStream(stream)->Synchronize();
+  }
   return C_SUCCESS;
 }
 
-C_Status SyncEvent(const C_Device device, C_Event event) { return C_SUCCESS; }
+C_Status SyncEvent(const C_Device device, C_Event event) {
+  ToEvent(event)->Synchronize();
+  return C_SUCCESS;
+}
 
 C_Status StreamWaitEvent(const C_Device device,
                          C_Stream stream,
                          C_Event event) {
+  if (stream) {
+    ToStream(stream)->WaitEvent(*ToEvent(event));
+  } else {
+    ToEvent(event)->Synchronize();
+  }
   return C_SUCCESS;
 }
 
 C_Status VisibleDevices(size_t *devices) { return C_SUCCESS; }
 
+// device_memory_stats only carries total and free bytes, the C interface has
+// no hook for allocated, peak or cached counters. Paddle counts its own
+// allocated and reserved bytes on top of the runtime, see
+// paddle.device.memory_allocated(); the counters of the plugin allocator are
+// exported through CustomCPUGetMemoryStats below.
 C_Status DeviceMemStats(const C_Device device,
                         size_t *total_memory,
                         size_t *free_memory) {
-  float memusage;
   FILE *fp;
   char buffer[1024];
   size_t byte_read;
   char *pos;
 
   fp = fopen("/proc/meminfo", "r");
-  byte_read = fread(buffer, 1, sizeof(buffer), fp);
+  if (fp == nullptr) {
+    return C_FAILED;
+  }
+  byte_read = fread(buffer, 1, sizeof(buffer) - 1, fp);
   fclose(fp);
   buffer[byte_read] = '\0';
   pos = strstr(buffer, "MemTotal:");
-  sscanf(pos, "MemTotal: %lu kB", total_memory);
+  if (pos == nullptr || sscanf(pos, "MemTotal: %lu kB", total_memory) != 1) {
+    return C_FAILED;
+  }
   pos = strstr(pos, "MemFree:");
-  sscanf(pos, "MemFree: %lu kB", free_memory);
+  if (pos == nullptr || sscanf(pos, "MemFree: %lu kB", free_memory) != 1) {
+    return C_FAILED;
+  }
   *total_memory = *total_memory * 1024;
   *free_memory = *free_memory * 1024;
   *free_memory = *free_memory * MEMORY_FRACTION;
+  // Blocks cached by the plugin allocator are immediately reusable.
+  *free_memory +=
+      custom_cpu::CachingAllocator::Instance().GetStats().cached_bytes;
+
+  return C_SUCCESS;
+}
+
+// Allocator counters of the plugin, for tools that load the library directly
+// (e.g. through ctypes), since device_memory_stats cannot carry them. Any of
+// the pointers may be null.
+extern "C" C_Status CustomCPUGetMemoryStats(size_t *allocated,
+                                            size_t *peak_allocated,
+                                            size_t *reserved,
+                                            size_t *cached) {
+  auto stats = custom_cpu::CachingAllocator::Instance().GetStats();
+  if (allocated) *allocated = stats.allocated_bytes;
+  if (peak_allocated) *peak_allocated = stats.peak_allocated_bytes;
+  if (reserved) *reserved = stats.reserved_bytes;
+  if (cached) *cached = stats.cached_bytes;
+  return C_SUCCESS;
+}
 
+extern "C" C_Status CustomCPUEmptyCache() {
+  custom_cpu::CachingAllocator::Instance().EmptyCache();
   return C_SUCCESS;
 }
 
@@ -188,25 +512,90 @@ C_Status DeviceMinChunkSize(const C_Device device, size_t *size) {
   return C_SUCCESS;
 }
 
-struct C_CCLComm_st {
-  size_t rank;
-  size_t nranks;
-  sem_t *sig;
-  sem_t *sig_2;
-  std::string sig_name;
-  std::string sig_2_name;
-};
+static custom_cpu::Communicator *ToComm(C_CCLComm comm) {
+  return reinterpret_cast<custom_cpu::Communicator *>(comm);
+}
+
+static bool ToCclDataType(C_DataType data_type,
+                          custom_cpu::CclDataType *dtype) {
+  switch (data_type) {
+    case C_DataType::BOOL:
+      *dtype = custom_cpu::CclDataType::kBool;
+      return true;
+    case C_DataType::INT8:
+      *dtype = custom_cpu::CclDataType::kInt8;
+      return true;
+    case C_DataType::UINT8:
+      *dtype = custom_cpu::CclDataType::kUInt8;
+      return true;
+    case C_DataType::INT16:
+      *dtype = custom_cpu::CclDataType::kInt16;
+      return true;
+    case C_DataType::INT32:
+      *dtype = custom_cpu::CclDataType::kInt32;
+      return true;
+    case C_DataType::INT64:
+      *dtype = custom_cpu::CclDataType::kInt64;
+      return true;
+    case C_DataType::FLOAT16:
+      *dtype = custom_cpu::CclDataType::kFloat16;
+      return true;
+    case C_DataType::BFLOAT16:
+      *dtype = custom_cpu::CclDataType::kBFloat16;
+      return true;
+    case C_DataType::FLOAT32:
+      *dtype = custom_cpu::CclDataType::kFloat32;
+      return true;
+    case C_DataType::FLOAT64:
+      *dtype = custom_cpu::CclDataType::kFloat64;
+      return true;
+    case C_DataType::COMPLEX64:
+      *dtype = custom_cpu::CclDataType::kComplex64;
+      return true;
+    case C_DataType::COMPLEX128:
+      *dtype = custom_cpu::CclDataType::kComplex128;
+      return true;
+    default:
+      return false;
+  }
+}
+
+static bool ToCclReduceOp(C_CCLReduceOp op, custom_cpu::CclReduceOp *ccl_op) {
+  switch (op) {
+    case C_CCLReduceOp::SUM:
+      *ccl_op = custom_cpu::CclReduceOp::kSum;
+      return true;
+    case C_CCLReduceOp::AVG:
+      *ccl_op = custom_cpu::CclReduceOp::kAvg;
+      return true;
+    case C_CCLReduceOp::MAX:
+      *ccl_op = custom_cpu::CclReduceOp::kMax;
+      return true;
+    case C_CCLReduceOp::MIN:
+      *ccl_op = custom_cpu::CclReduceOp::kMin;
+      return true;
+    case C_CCLReduceOp::PRODUCT:
+      *ccl_op = custom_cpu::CclReduceOp::kProd;
+      return true;
+    default:
+      return false;
+  }
+}
 
-// for unittest
 C_Status XcclGetUniqueIdSize(size_t *sz) {
-  *sz = sizeof(size_t);
+  *sz = 32;
   return C_SUCCESS;
 }
 
+// The id names the shared memory segment of the communicator.
 C_Status XcclGetUniqueId(C_CCLRootId *unique_id) {
-  auto ptr = reinterpret_cast<int8_t *>(unique_id->data);
-  for (auto i = 0; i < unique_id->sz - 1; ++i) {
-    ptr[i] = static_cast<int8_t>(std::rand() % ('z' - 'a') + 'a');
+  static const char kChars[] = "abcdefghijklmnopqrstuvwxyz0123456789";
+  std::random_device device;
+  std::mt19937_64 engine(device());
+  std::uniform_int_distribution<size_t> pick(0, sizeof(kChars) - 2);
+  auto ptr = reinterpret_cast<char *>(unique_id->data);
+  for (size_t i = 0; i + 1 < unique_id->sz; ++i) {
+    ptr[i] = kChars[pick(engine)];
   }
   ptr[unique_id->sz - 1] = '\0';
   return C_SUCCESS;
@@ -216,25 +605,20 @@ C_Status XcclCommInitRank(size_t ranks,
                           C_CCLRootId *unique_id,
                           size_t rank,
                           C_CCLComm *comm) {
-  auto sig = sem_open(static_cast<char *>(unique_id->data), O_CREAT, 0644, 0);
-  auto sig_2 =
-      sem_open(static_cast<char *>(unique_id->data) + 1, O_CREAT, 0644, 0);
-  *comm =
-      new C_CCLComm_st({rank,
-                        ranks,
-                        sig,
-                        sig_2,
-                        std::string(static_cast<char *>(unique_id->data)),
-                        std::string(static_cast<char *>(unique_id->data) + 1)});
+  const std::string id(
+      reinterpret_cast<char *>(unique_id->data),
+      strnlen(reinterpret_cast<char *>(unique_id->data), unique_id->sz));
+  auto communicator = custom_cpu::Communicator::Create(
+      id, static_cast<int>(ranks), static_cast<int>(rank));
+  if (communicator == nullptr) {
+    return C_FAILED;
+  }
+  *comm = reinterpret_cast<C_CCLComm>(communicator);
   return C_SUCCESS;
 }
 
 C_Status XcclDestroyComm(C_CCLComm comm) {
-  if (comm) {
-    sem_unlink(comm->sig_name.c_str());
-    sem_unlink(comm->sig_2_name.c_str());
-    delete comm;
-  }
+  delete ToComm(comm);
   return C_SUCCESS;
 }
 
@@ -245,20 +629,15 @@ C_Status XcclAllReduce(void *send_buf,
                        C_CCLReduceOp op,
                        C_CCLComm comm,
                        C_Stream stream) {
-  sem_post(comm->sig);
-
-  if (comm->rank == 0) {
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_wait(comm->sig);
-    }
-
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_post(comm->sig_2);
-    }
+  custom_cpu::CclDataType dtype;
+  custom_cpu::CclReduceOp ccl_op;
+  if (!ToCclDataType(data_type, &dtype) || !ToCclReduceOp(op, &ccl_op)) {
+    return C_FAILED;
   }
-
-  sem_wait(comm->sig_2);
-  return C_SUCCESS;
+  custom_cpu::WaitStream(stream);
+  return ToComm(comm)->AllReduce(send_buf, recv_buf, count, dtype, ccl_op)
+             ? C_SUCCESS
+             : C_FAILED;
 }
 
 C_Status XcclBroadcast(void *buf,
@@ -267,22 +646,114 @@ C_Status XcclBroadcast(void *buf,
                        size_t root,
                        C_CCLComm comm,
                        C_Stream stream) {
-  sem_post(comm->sig);
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
+  }
+  custom_cpu::WaitStream(stream);
+  return ToComm(comm)->Broadcast(buf, count, dtype, static_cast<int>(root))
+             ? C_SUCCESS
+             : C_FAILED;
+}
 
-  if (comm->rank == 0) {
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_wait(comm->sig);
-    }
+C_Status XcclReduce(void *send_buf,
+                    void *recv_buf,
+                    size_t count,
+                    C_DataType data_type,
+                    C_CCLReduceOp op,
+                    size_t root,
+                    C_CCLComm comm,
+                    C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  custom_cpu::CclReduceOp ccl_op;
+  if (!ToCclDataType(data_type, &dtype) || !ToCclReduceOp(op, &ccl_op)) {
+    return C_FAILED;
+  }
+  custom_cpu::WaitStream(stream);
+  return ToComm(comm)->Reduce(
+             send_buf, recv_buf, count, dtype, ccl_op, static_cast<int>(root))
+             ? C_SUCCESS
+             : C_FAILED;
+}
 
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_post(comm->sig_2);
-    }
+C_Status XcclAllGather(void *send_buf,
+                       void *recv_buf,
+                       size_t count,
+                       C_DataType data_type,
+                       C_CCLComm comm,
+                       C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
   }
+  custom_cpu::WaitStream(stream);
+  return ToComm(comm)->AllGather(send_buf, recv_buf, count, dtype) ? C_SUCCESS
+                                                                   : C_FAILED;
+}
+
+C_Status XcclReduceScatter(void *send_buf,
+                           void *recv_buf,
+                           size_t count,
+                           C_DataType data_type,
+                           C_CCLReduceOp op,
+                           C_CCLComm comm,
+                           C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  custom_cpu::CclReduceOp ccl_op;
+  if (!ToCclDataType(data_type, &dtype) || !ToCclReduceOp(op, &ccl_op)) {
+    return C_FAILED;
+  }
+  custom_cpu::WaitStream(stream);
+  return ToComm(comm)->ReduceScatter(send_buf, recv_buf, count, dtype, ccl_op)
+             ? C_SUCCESS
+             : C_FAILED;
+}
 
-  sem_wait(comm->sig_2);
+C_Status XcclGroupStart() {
+  custom_cpu::Communicator::GroupStart();
   return C_SUCCESS;
 }
 
+C_Status XcclGroupEnd() {
+  return custom_cpu::Communicator::GroupEnd() ? C_SUCCESS : C_FAILED;
+}
+
+C_Status XcclSend(void *send_buf,
+                  size_t count,
+                  C_DataType data_type,
+                  size_t dest_rank,
+                  C_CCLComm comm,
+                  C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
+  }
+  custom_cpu::WaitStream(stream);
+  return ToComm(comm)->Send(send_buf,
+                            count * custom_cpu::CclDataTypeSize(dtype),
+                            static_cast<int>(dest_rank))
+             ? C_SUCCESS
+             : C_FAILED;
+}
+
+C_Status XcclRecv(void *recv_buf,
+                  size_t count,
+                  C_DataType data_type,
+                  size_t src_rank,
+                  C_CCLComm comm,
+                  C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
+  }
+  custom_cpu::WaitStream(stream);
+  return ToComm(comm)->Recv(recv_buf,
+                            count * custom_cpu::CclDataTypeSize(dtype),
+                            static_cast<int>(src_rank))
+             ? C_SUCCESS
+             : C_FAILED;
+}
+
 C_Status ProfilerInitialize(C_Profiler prof, void **user_data) {
   return C_SUCCESS;
 }
@@ -293,13 +764,73 @@ C_Status ProfilerFinalize(C_Profiler prof, void *user_data) {
 
 C_Status ProfilerPrepare(C_Profiler prof, void *user_data) { return C_SUCCESS; }
 
-C_Status ProfilerStart(C_Profiler prof, void *user_data) { return C_SUCCESS; }
+C_Status ProfilerStart(C_Profiler prof, void *user_data) {
+  custom_cpu::Profiler::Instance().Start();
+  return C_SUCCESS;
+}
 
-C_Status ProfilerStop(C_Profiler prof, void *user_data) { return C_SUCCESS; }
+C_Status ProfilerStop(C_Profiler prof, void *user_data) {
+  custom_cpu::Profiler::Instance().Stop();
+  return C_SUCCESS;
+}
 
 C_Status ProfilerCollectData(C_Profiler prof,
                              uint64_t start_ns,
                              void *user_data) {
+  auto &profiler = custom_cpu::Profiler::Instance();
+  uint64_t dropped = 0;
+  auto records = profiler.Collect(&dropped);
+  if (dropped > 0) {
+    std::cerr << "custom_cpu profiler dropped " << dropped
+              << " trace records, raise FLAGS_custom_cpu_profiler_ring_size"
+              << std::endl;
+  }
+  // paddle only keeps a device event below the runtime event of the same
+  // correlation id, which in turn is placed below the host op that encloses
+  // it on its thread. Kernels run synchronously, so every span is reported
+  // as both. The thread id also stands in for the stream id, the timeline
+  // shows one row per thread running kernels.
+  static uint32_t correlation_id = 0;
+  const uint64_t pid = getpid();
+  for (const auto &record : records) {
+    if (record.start_ns < start_ns) {
+      continue;
+    }
+    ++correlation_id;
+    phi::RuntimeTraceEvent launch(record.name,
+                                  record.start_ns,
+                                  record.end_ns,
+                                  pid,
+                                  record.thread_id,
+                                  correlation_id,
+                                  0);
+    profiler_add_runtime_trace_event(prof, &launch);
+
+    phi::DeviceTraceEvent event;
+    event.name = record.name;
+    event.start_ns = record.start_ns;
+    event.end_ns = record.end_ns;
+    event.device_id = record.device_id;
+    event.context_id = 0;
+    event.stream_id = record.thread_id;
+    event.correlation_id = correlation_id;
+    if (record.kind == custom_cpu::TraceKind::kKernel) {
+      event.type = phi::TracerEventType::Kernel;
+      event.kernel_info = phi::KernelEventInfo();
+    } else {
+      event.type = phi::TracerEventType::Memcpy;
+      event.memcpy_info = phi::MemcpyEventInfo();
+      event.memcpy_info.num_bytes = record.bytes;
+      snprintf(
+          event.memcpy_info.copy_kind, phi::kMemKindMaxLen, "%s", record.name);
+    }
+    profiler_add_device_trace_event(prof, &event);
+  }
+  if (!profiler.trace_file().empty() &&
+      !custom_cpu::Profiler::WriteChromeTrace(profiler.trace_file(), records)) {
+    std::cerr << "custom_cpu profiler failed to write " << profiler.trace_file()
+              << std::endl;
+  }
   return C_SUCCESS;
 }
 
@@ -322,23 +853,26 @@ void InitPlugin(CustomRuntimeParams *params) {
 
   params->interface->create_stream = CreateStream;
   params->interface->destroy_stream = DestroyStream;
+  params->interface->query_stream = QueryStream;
 
   params->interface->create_event = CreateEvent;
   params->interface->destroy_event = DestroyEvent;
   params->interface->record_event = RecordEvent;
+  params->interface->query_event = QueryEvent;
 
   params->interface->synchronize_device = SyncDevice;
   params->interface->synchronize_stream = SyncStream;
   params->interface->synchronize_event = SyncEvent;
   params->interface->stream_wait_event = StreamWaitEvent;
+  params->interface->stream_add_callback = AddCallback;
 
-  params->interface->memory_copy_h2d = MemCpy;
-  params->interface->memory_copy_d2d = MemCpy;
-  params->interface->memory_copy_d2h = MemCpy;
+  params->interface->memory_copy_h2d = MemCpyH2D;
+  params->interface->memory_copy_d2d = MemCpyD2D;
+  params->interface->memory_copy_d2h = MemCpyD2H;
   params->interface->memory_copy_p2p = MemCpyP2P;
-  params->interface->async_memory_copy_h2d = AsyncMemCpy;
-  params->interface->async_memory_copy_d2d = AsyncMemCpy;
-  params->interface->async_memory_copy_d2h = AsyncMemCpy;
+  params->interface->async_memory_copy_h2d = AsyncMemCpyH2D;
+  params->interface->async_memory_copy_d2d = AsyncMemCpyD2D;
+  params->interface->async_memory_copy_d2h = AsyncMemCpyD2H;
   params->interface->async_memory_copy_p2p = AsyncMemCpyP2P;
   params->interface->device_memory_allocate = Allocate;
   params->interface->host_memory_allocate = Allocate;
@@ -358,6 +892,13 @@ void InitPlugin(CustomRuntimeParams *params) {
   params->interface->xccl_destroy_comm = XcclDestroyComm;
   params->interface->xccl_all_reduce = XcclAllReduce;
   params->interface->xccl_broadcast = XcclBroadcast;
+  params->interface->xccl_reduce = XcclReduce;
+  params->interface->xccl_all_gather = XcclAllGather;
+  params->interface->xccl_reduce_scatter = XcclReduceScatter;
+  params->interface->xccl_group_start = XcclGroupStart;
+  params->interface->xccl_group_end = XcclGroupEnd;
+  params->interface->xccl_send = XcclSend;
+  params->interface->xccl_recv = XcclRecv;
 
   params->interface->profiler_collect_trace_data = ProfilerCollectData;
   params->interface->profiler_initialize = ProfilerInitialize;
@@ -0,0 +1,208 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/stream.h"
+
+#include <cstdlib>
+#include <cstring>
+#include <iostream>
+#include <unordered_set>
+#include <vector>
+
+namespace custom_cpu {
+
+namespace {
+
+std::mutex& RegistryMutex() {
+  static std::mutex* mutex = new std::mutex();
+  return *mutex;
+}
+
+std::unordered_set<Stream*>& Registry() {
+  static std::unordered_set<Stream*>* streams =
+      new std::unordered_set<Stream*>();
+  return *streams;
+}
+
+// The stream whose worker runs on this thread, if any.
+thread_local Stream* worker_stream = nullptr;
+
+}  // namespace
+
+void EventState::Complete(uint64_t generation) {
+  {
+    std::lock_guard<std::mutex> guard(mutex);
+    if (generation > completed) {
+      completed = generation;
+    }
+  }
+  cv.notify_all();
+}
+
+void EventState::WaitFor(uint64_t generation) {
+  std::unique_lock<std::mutex> lock(mutex);
+  cv.wait(lock, [&]() { return completed >= generation; });
+}
+
+void Event::Record(Stream* stream) {
+  uint64_t generation;
+  {
+    std::lock_guard<std::mutex> guard(state_->mutex);
+    generation = ++state_->recorded;
+  }
+  auto state = state_;
+  stream->Enqueue([state, generation]() { state->Complete(generation); });
+}
+
+void Event::Synchronize() {
+  uint64_t generation;
+  {
+    std::lock_guard<std::mutex> guard(state_->mutex);
+    generation = state_->recorded;
+  }
+  state_->WaitFor(generation);
+}
+
+bool Event::Query() {
+  std::lock_guard<std::mutex> guard(state_->mutex);
+  return state_->completed >= state_->recorded;
+}
+
+bool Stream::AsyncEnabled() {
+  static const bool enabled = []() {
+    const char* value = std::getenv("FLAGS_custom_cpu_async_stream");
+    return value != nullptr &&
+           (std::strcmp(value, "1") == 0 || std::strcmp(value, "true") == 0);
+  }();
+  return enabled;
+}
+
+Stream::Stream(int device_id) : device_id_(device_id), async_(AsyncEnabled()) {
+  if (async_) {
+    worker_ = std::thread([this]() { WorkerLoop(); });
+  }
+  std::lock_guard<std::mutex> guard(RegistryMutex());
+  Registry().insert(this);
+}
+
+Stream::~Stream() {
+  {
+    std::lock_guard<std::mutex> guard(RegistryMutex());
+    Registry().erase(this);
+  }
+  if (async_) {
+    {
+      std::lock_guard<std::mutex> guard(mutex_);
+      stop_ = true;
+    }
+    task_cv_.notify_one();
+    worker_.join();
+  }
+}
+
+void Stream::Enqueue(std::function<void()> task) {
+  if (!async_) {
+    task();
+    return;
+  }
+  {
+    std::lock_guard<std::mutex> guard(mutex_);
+    tasks_.push_back(std::move(task));
+    ++enqueued_;
+  }
+  task_cv_.notify_one();
+}
+
+void Stream::WaitEvent(const Event& event) {
+  uint64_t generation;
+  {
+    std::lock_guard<std::mutex> guard(event.state_->mutex);
+    generation = event.state_->recorded;
+  }
+  auto state = event.state_;
+  Enqueue([state, generation]() { state->WaitFor(generation); });
+}
+
+void Stream::Synchronize() {
+  // A task of the stream, e.g. a host callback that frees memory, is itself
+  // the last work enqueued before it.
+  if (!async_ || worker_stream == this) {
+    return;
+  }
+  std::unique_lock<std::mutex> lock(mutex_);
+  const uint64_t target = enqueued_;
+  idle_cv_.wait(lock, [&]() { return finished_ >= target; });
+}
+
+bool Stream::Query() {
+  std::lock_guard<std::mutex> guard(mutex_);
+  return finished_ == enqueued_;
+}
+
+void Stream::SynchronizeDevice(int device_id) {
+  if (!AsyncEnabled()) {
+    return;
+  }
+  std::vector<Stream*> streams;
+  {
+    std::lock_guard<std::mutex> guard(RegistryMutex());
+    for (auto* stream : Registry()) {
+      if (device_id < 0 || stream->device_id() == device_id) {
+        streams.push_back(stream);
+      }
+    }
+  }
+  // Destroying a stream that another thread is synchronizing is a caller
+  // error, the same as with device runtimes.
+  for (auto* stream : streams) {
+    stream->Synchronize();
+  }
+}
+
+void Stream::RecordDevice(int device_id, std::vector<Event>* events) {
+  if (!AsyncEnabled()) {
+    return;
+  }
+  std::lock_guard<std::mutex> guard(RegistryMutex());
+  for (auto* stream : Registry()) {
+    if (stream->device_id() == device_id && !stream->Query()) {
+      events->emplace_back();
+      events->back().Record(stream);
+    }
+  }
+}
+
+void Stream::WorkerLoop() {
+  worker_stream = this;
+  while (true) {
+    std::function<void()> task;
+    {
+      std::unique_lock<std::mutex> lock(mutex_);
+      task_cv_.wait(lock, [this]() { return stop_ || !tasks_.empty(); });
+      if (tasks_.empty()) {
+        return;
+      }
+      task = std::move(tasks_.front());
+      tasks_.pop_front();
+    }
+    task();
+    {
+      std::lock_guard<std::mutex> guard(mutex_);
+      ++finished_;
+    }
+    idle_cv_.notify_all();
+  }
+}
+
+}  // namespace custom_cpu
@@ -0,0 +1,126 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <condition_variable>
+#include <cstdint>
+#include <deque>
+#include <functional>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+namespace custom_cpu {
+
+// Completion state of an event, shared with the stream tasks that complete
+// or wait for it so that an event may be destroyed while still pending.
+struct EventState {
+  std::mutex mutex;
+  std::condition_variable cv;
+  uint64_t recorded = 0;   // generation of the latest Record
+  uint64_t completed = 0;  // highest generation reached by its stream
+
+  void Complete(uint64_t generation);
+  void WaitFor(uint64_t generation);
+};
+
+class Stream;
+
+// An event marks a point in a stream. Like a device event, it is complete
+// once all work enqueued on the stream before the last Record has finished;
+// an event that was never recorded is complete.
+class Event {
+ public:
+  Event() : state_(std::make_shared<EventState>()) {}
+
+  void Record(Stream* stream);
+  // Blocks the caller until the event completes.
+  void Synchronize();
+  bool Query();
+
+ private:
+  friend class Stream;
+  std::shared_ptr<EventState> state_;
+};
+
+// An in-order queue of host tasks executed by a dedicated worker thread.
+//
+// When asynchronous execution is disabled (the default, see
+// FLAGS_custom_cpu_async_stream) tasks run inline on the enqueuing thread,
+// which keeps the stream, event and callback semantics intact while matching
+// the behaviour of kernels, which always run on the calling thread.
+//
+// Asynchronous mode queues copies, event waits and host callbacks. Kernels
+// still run on the calling thread; their registration wrapper (see
+// kernels/stream_ordered_kernel.h) calls WaitStream first, so a kernel sees
+// every task enqueued on its stream before it. Freed device memory is reused
+// only once the streams of its device are past the free, see RecordDevice.
+class Stream {
+ public:
+  explicit Stream(int device_id);
+  ~Stream();
+
+  Stream(const Stream&) = delete;
+  Stream& operator=(const Stream&) = delete;
+
+  int device_id() const { return device_id_; }
+
+  void Enqueue(std::function<void()> task);
+  // Makes all tasks enqueued after this call wait for the last Record of
+  // `event`.
+  void WaitEvent(const Event& event);
+  // Blocks until every enqueued task has finished.
+  void Synchronize();
+  // Returns true when no enqueued task is pending.
+  bool Query();
+
+  // Synchronizes every live stream of the device, -1 for all devices.
+  static void SynchronizeDevice(int device_id);
+
+  // Records an event on every stream of the device with pending tasks and
+  // appends it to `events`. Once they have completed, no task enqueued
+  // before the call is left on the device.
+  static void RecordDevice(int device_id, std::vector<Event>* events);
+
+  // Whether streams run tasks on worker threads.
+  static bool AsyncEnabled();
+
+ private:
+  void WorkerLoop();
+
+  const int device_id_;
+  const bool async_;
+  std::mutex mutex_;
+  std::condition_variable task_cv_;
+  std::condition_variable idle_cv_;
+  std::deque<std::function<void()>> tasks_;
+  uint64_t enqueued_ = 0;
+  uint64_t finished_ = 0;
+  bool stop_ = false;
+  std::thread worker_;
+};
+
+// Blocks until the tasks enqueued on `stream` so far have finished. Kernels
+// and collectives, which run on the calling thread, wait on entry for the
+// stream of their context. A no-op for the null stream and when streams run
+// tasks inline.
+inline void WaitStream(void* stream) {
+  if (stream != nullptr) {
+    static_cast<Stream*>(stream)->Synchronize();
+  }
+}
+
+}  // namespace custom_cpu
@@ -0,0 +1,416 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Forks 2 to 16 ranks that share a custom_cpu communicator, checks every
+// collective against a reference and reports the bandwidth of allreduce,
+// broadcast, allgather, reduce_scatter and send/recv. Also checks that a
+// collective fails when a rank exits or stalls past the timeout.
+//
+// algbw is bytes / time, busbw scales it by the data each rank has to move
+// (2 * (n - 1) / n for allreduce, (n - 1) / n for allgather and
+// reduce_scatter), so it is comparable across rank counts. As in nccl-tests,
+// the size of allgather and reduce_scatter is that of the whole gathered
+// buffer, so every rank holds two buffers of at most max_bytes and the
+// default 16 ranks x 16 MB sweep needs about 512 MB.
+//
+// Usage: collective_benchmark [--quick] [nranks ...]
+
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <chrono>
+#include <cmath>
+#include <complex>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <functional>
+#include <string>
+#include <vector>
+
+#include "runtime/collective.h"
+
+namespace {
+
+using custom_cpu::CclDataType;
+using custom_cpu::CclReduceOp;
+using custom_cpu::Communicator;
+
+bool Check(bool ok, const char* what, int rank) {
+  if (!ok) {
+    fprintf(stderr, "rank %d: %s mismatch\n", rank, what);
+  }
+  return ok;
+}
+
+// Value contributed by `rank` at index i, small integers keep every sum and
+// product exact.
+double Value(int rank, size_t i) { return static_cast<double>((rank + i) % 3); }
+
+template <typename T>
+bool CheckAllReduce(Communicator* comm,
+                    CclDataType dtype,
+                    CclReduceOp op,
+                    size_t count,
+                    const char* what) {
+  const int n = comm->nranks();
+  std::vector<T> send(count), recv(count);
+  for (size_t i = 0; i < count; ++i) {
+    send[i] = static_cast<T>(Value(comm->rank(), i));
+  }
+  if (!comm->AllReduce(send.data(), recv.data(), count, dtype, op)) {
+    return Check(false, what, comm->rank());
+  }
+  bool ok = true;
+  for (size_t i = 0; i < count && ok; ++i) {
+    double expect = op == CclReduceOp::kProd ? 1 : 0;
+    if (op == CclReduceOp::kMax) expect = -1e300;
+    if (op == CclReduceOp::kMin) expect = 1e300;
+    for (int r = 0; r < n; ++r) {
+      const double v = Value(r, i);
+      switch (op) {
+        case CclReduceOp::kSum:
+        case CclReduceOp::kAvg:
+          expect += v;
+          break;
+        case CclReduceOp::kProd:
+          expect *= v;
+          break;
+        case CclReduceOp::kMax:
+          expect = std::max(expect, v);
+          break;
+        case CclReduceOp::kMin:
+          expect = std::min(expect, v);
+          break;
+      }
+    }
+    if (op == CclReduceOp::kAvg) {
+      expect /= n;
+    }
+    ok = std::abs(static_cast<double>(recv[i]) - expect) <= 1e-6 * n;
+  }
+  return Check(ok, what, comm->rank());
+}
+
+bool CheckHalfSum(Communicator* comm, size_t count) {
+  // float16 1.0 and 2.0, the sum over ranks is exact up to 2048.
+  std::vector<uint16_t> send(count), recv(count);
+  for (size_t i = 0; i < count; ++i) {
+    send[i] = i % 2 ? 0x4000 : 0x3c00;
+  }
+  comm->AllReduce(send.data(),
+                  recv.data(),
+                  count,
+                  CclDataType::kFloat16,
+                  CclReduceOp::kSum);
+  bool ok = true;
+  const int n = comm->nranks();
+  for (size_t i = 0; i < count && ok; ++i) {
+    const double expect = (i % 2 ? 2.0 : 1.0) * n;
+    const int exponent = static_cast<int>(std::log2(expect));
+    const uint16_t bits = static_cast<uint16_t>(
+        ((exponent + 15) << 10) |
+        static_cast<int>((expect / std::ldexp(1.0, exponent) - 1) * 1024));
+    ok = recv[i] == bits;
+  }
+  return Check(ok, "float16 allreduce", comm->rank());
+}
+
+bool CheckCollectives(Communicator* comm, size_t count) {
+  const int n = comm->nranks();
+  const int rank = comm->rank();
+  bool ok = true;
+  ok &= CheckAllReduce<float>(
+      comm, CclDataType::kFloat32, CclReduceOp::kSum, count, "float sum");
+  ok &= CheckAllReduce<double>(
+      comm, CclDataType::kFloat64, CclReduceOp::kAvg, count, "double avg");
+  ok &= CheckAllReduce<int32_t>(
+      comm, CclDataType::kInt32, CclReduceOp::kMax, count, "int32 max");
+  ok &= CheckAllReduce<int64_t>(
+      comm, CclDataType::kInt64, CclReduceOp::kMin, count, "int64 min");
+  ok &= CheckAllReduce<int64_t>(
+      comm, CclDataType::kInt64, CclReduceOp::kProd, count, "int64 prod");
+  ok &= CheckHalfSum(comm, count);
+
+  std::vector<float> buf(count, static_cast<float>(rank));
+  comm->Broadcast(buf.data(), count, CclDataType::kFloat32, n - 1);
+  ok &= Check(buf.back() == n - 1 && buf.front() == n - 1, "broadcast", rank);
+
+  std::vector<int32_t> mine(count, rank), all(count * n);
+  comm->AllGather(mine.data(), all.data(), count, CclDataType::kInt32);
+  for (int r = 0; r < n; ++r) {
+    ok &= Check(all[r * count] == r && all[r * count + count - 1] == r,
+                "allgather",
+                rank);
+  }
+
+  std::vector<int32_t> blocks(count * n), block(count);
+  for (size_t i = 0; i < blocks.size(); ++i) {
+    blocks[i] = static_cast<int32_t>(i / count);
+  }
+  comm->ReduceScatter(blocks.data(),
+                      block.data(),
+                      count,
+                      CclDataType::kInt32,
+                      CclReduceOp::kSum);
+  ok &= Check(block.front() == rank * n && block.back() == rank * n,
+              "reduce_scatter",
+              rank);
+
+  std::vector<float> reduced(count, -1);
+  std::vector<float> ones(count, 1);
+  comm->Reduce(ones.data(),
+               reduced.data(),
+               count,
+               CclDataType::kFloat32,
+               CclReduceOp::kSum,
+               0);
+  if (rank == 0) {
+    ok &= Check(reduced.back() == n, "reduce", rank);
+  }
+
+  // Every rank exchanges with both neighbours in one group, which would
+  // deadlock without grouping once messages exceed the channel slots.
+  std::vector<int32_t> to_next(count, rank), from_prev(count, -1);
+  std::vector<int32_t> to_prev(count, rank), from_next(count, -1);
+  const int next = (rank + 1) % n;
+  const int prev = (rank + n - 1) % n;
+  const size_t bytes = count * sizeof(int32_t);
+  Communicator::GroupStart();
+  comm->Send(to_next.data(), bytes, next);
+  comm->Send(to_prev.data(), bytes, prev);
+  comm->Recv(from_prev.data(), bytes, prev);
+  comm->Recv(from_next.data(), bytes, next);
+  Communicator::GroupEnd();
+  ok &= Check(
+      from_prev.back() == prev && from_next.back() == next, "send/recv", rank);
+  return ok;
+}
+
+// Returns the slowest rank's average time per call in seconds.
+double Time(Communicator* comm, int iters, const std::function<void()>& fn) {
+  fn();
+  float sync = 0;
+  comm->AllReduce(&sync, &sync, 1, CclDataType::kFloat32, CclReduceOp::kSum);
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < iters; ++i) {
+    fn();
+  }
+  double seconds =
+      std::chrono::duration<double>(std::chrono::steady_clock::now() - start)
+          .count() /
+      iters;
+  comm->AllReduce(
+      &seconds, &seconds, 1, CclDataType::kFloat64, CclReduceOp::kMax);
+  return seconds;
+}
+
+void Report(Communicator* comm,
+            const char* op,
+            size_t bytes,
+            double seconds,
+            double bus_factor) {
+  if (comm->rank() == 0) {
+    const double algbw = bytes / seconds / 1e9;
+    printf("%-6d %-15s %10zu %12.1f %10.2f %10.2f\n",
+           comm->nranks(),
+           op,
+           bytes,
+           seconds * 1e6,
+           algbw,
+           algbw * bus_factor);
+  }
+}
+
+void Benchmark(Communicator* comm, size_t max_bytes) {
+  const int n = comm->nranks();
+  const int rank = comm->rank();
+  for (size_t bytes = 4 << 10; bytes <= max_bytes; bytes *= 8) {
+    const size_t count = bytes / sizeof(float);
+    // Elements each rank contributes to allgather and reduce_scatter.
+    const size_t block = std::max<size_t>(count / n, 1);
+    const int iters = static_cast<int>(
+        std::max<size_t>(3, std::min<size_t>(200, (64 << 20) / bytes / n)));
+    std::vector<float> send(std::max(count, block * n), 1.0f);
+    std::vector<float> recv(send.size());
+
+    double t = Time(comm, iters, [&]() {
+      comm->AllReduce(send.data(),
+                      recv.data(),
+                      count,
+                      CclDataType::kFloat32,
+                      CclReduceOp::kSum);
+    });
+    Report(comm, "allreduce", bytes, t, 2.0 * (n - 1) / n);
+
+    t = Time(comm, iters, [&]() {
+      comm->Broadcast(send.data(), count, CclDataType::kFloat32, 0);
+    });
+    Report(comm, "broadcast", bytes, t, 1.0);
+
+    t = Time(comm, iters, [&]() {
+      comm->AllGather(send.data(), recv.data(), block, CclDataType::kFloat32);
+    });
+    Report(comm, "allgather", block * n * sizeof(float), t, 1.0 * (n - 1) / n);
+
+    t = Time(comm, iters, [&]() {
+      comm->ReduceScatter(send.data(),
+                          recv.data(),
+                          block,
+                          CclDataType::kFloat32,
+                          CclReduceOp::kSum);
+    });
+    Report(comm,
+           "reduce_scatter",
+           block * n * sizeof(float),
+           t,
+           1.0 * (n - 1) / n);
+
+    // Ring exchange: every rank sends to its successor.
+    t = Time(comm, iters, [&]() {
+      Communicator::GroupStart();
+      comm->Send(send.data(), bytes, (rank + 1) % n);
+      comm->Recv(recv.data(), bytes, (rank + n - 1) % n);
+      Communicator::GroupEnd();
+    });
+    Report(comm, "sendrecv", bytes, t, 1.0);
+  }
+}
+
+int RunRank(const std::string& id, int nranks, int rank, size_t max_bytes) {
+  Communicator* comm = Communicator::Create(id, nranks, rank);
+  if (comm == nullptr) {
+    return 1;
+  }
+  // One size below and one above the tree/ring and slot thresholds.
+  bool ok = CheckCollectives(comm, 1000) && CheckCollectives(comm, 300001);
+  if (ok) {
+    Benchmark(comm, max_bytes);
+  }
+  delete comm;
+  return ok ? 0 : 1;
+}
+
+// Rank 1 of a two rank communicator exits right after joining, or stalls
+// for 3 s with a 1 s timeout. Rank 0 must see the allreduce fail instead of
+// waiting forever, and later calls fail right away.
+int RunFailureRank(const std::string& id, int rank, bool stall) {
+  if (stall) {
+    setenv("FLAGS_custom_cpu_ccl_timeout_s", "1", 1);
+  }
+  Communicator* comm = Communicator::Create(id, 2, rank);
+  if (comm == nullptr) {
+    return 1;
+  }
+  if (rank == 1) {
+    if (stall) {
+      sleep(3);
+    }
+    return 0;
+  }
+  float value = 1;
+  auto start = std::chrono::steady_clock::now();
+  bool ok =
+      Check(!comm->AllReduce(
+                &value, &value, 1, CclDataType::kFloat32, CclReduceOp::kSum),
+            stall ? "timeout" : "dead rank",
+            rank);
+  const double seconds =
+      std::chrono::duration<double>(std::chrono::steady_clock::now() - start)
+          .count();
+  ok &= Check(seconds < 2.5, "failure detection time", rank);
+  ok &= Check(!comm->Broadcast(&value, 1, CclDataType::kFloat32, 0),
+              "call after a failure",
+              rank);
+  delete comm;
+  return ok ? 0 : 1;
+}
+
+bool CheckFailures() {
+  bool ok = true;
+  for (bool stall : {false, true}) {
+    const std::string id = "bench_" + std::to_string(getpid()) + "_failure" +
+                           std::to_string(stall);
+    std::vector<pid_t> children;
+    for (int rank = 0; rank < 2; ++rank) {
+      const pid_t pid = fork();
+      if (pid == 0) {
+        _exit(RunFailureRank(id, rank, stall));
+      }
+      children.push_back(pid);
+    }
+    // Rank 0 is reaped first, so an exited rank 1 stays a zombie meanwhile.
+    for (pid_t pid : children) {
+      int status = 0;
+      waitpid(pid, &status, 0);
+      ok &= WIFEXITED(status) && WEXITSTATUS(status) == 0;
+    }
+  }
+  return ok;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = false;
+  std::vector<int> rank_counts;
+  for (int i = 1; i < argc; ++i) {
+    if (std::string(argv[i]) == "--quick") {
+      quick = true;
+    } else {
+      rank_counts.push_back(std::atoi(argv[i]));
+    }
+  }
+  if (rank_counts.empty()) {
+    rank_counts =
+        quick ? std::vector<int>{2, 4} : std::vector<int>{2, 4, 8, 16};
+  }
+  const size_t max_bytes = quick ? (256 << 10) : (16 << 20);
+
+  printf("%-6s %-15s %10s %12s %10s %10s\n",
+         "ranks",
+         "op",
+         "bytes",
+         "time(us)",
+         "algbw GB/s",
+         "busbw GB/s");
+  fflush(stdout);
+  bool ok = CheckFailures();
+  for (int nranks : rank_counts) {
+    if (nranks < 1) {
+      continue;
+    }
+    const std::string id =
+        "bench_" + std::to_string(getpid()) + "_" + std::to_string(nranks);
+    std::vector<pid_t> children;
+    for (int rank = 0; rank < nranks; ++rank) {
+      const pid_t pid = fork();
+      if (pid == 0) {
+        const int status = RunRank(id, nranks, rank, max_bytes);
+        fflush(stdout);
+        _exit(status);
+      }
+      children.push_back(pid);
+    }
+    for (pid_t pid : children) {
+      int status = 0;
+      waitpid(pid, &status, 0);
+      ok &= WIFEXITED(status) && WEXITSTATUS(status) == 0;
+    }
+  }
+  if (!ok) {
+    fprintf(stderr, "collective_benchmark: FAILED\n");
+  }
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,274 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Reports GFLOP/s of the packed GEMM engine against the naive triple loop the
+// custom_cpu matmul kernel used before, for square, skinny and batched shapes,
+// and of the int8 GEMM (int32 accumulation, dequantizing epilogue) against
+// the float GEMM of the same shape.
+//
+// Usage: gemm_benchmark [--quick]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstring>
+#include <functional>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/gemm.h"
+
+namespace {
+
+template <typename T>
+void NaiveBatchedGemm(bool trans_x,
+                      bool trans_y,
+                      int64_t M,
+                      int64_t K,
+                      int64_t N,
+                      const T* x,
+                      int64_t x_batch_stride,
+                      const T* y,
+                      int64_t y_batch_stride,
+                      T* out,
+                      int64_t batch_size) {
+  memset(out, 0, sizeof(T) * batch_size * M * N);
+  for (int64_t bs = 0; bs < batch_size; ++bs) {
+    const T* xb = x + bs * x_batch_stride;
+    const T* yb = y + bs * y_batch_stride;
+    T* ob = out + bs * M * N;
+    for (int64_t m = 0; m < M; ++m) {
+      for (int64_t n = 0; n < N; ++n) {
+        for (int64_t k = 0; k < K; ++k) {
+          auto x_dat = trans_x ? xb[k * M + m] : xb[m * K + k];
+          auto y_dat = trans_y ? yb[n * K + k] : yb[k * N + n];
+          ob[m * N + n] += x_dat * y_dat;
+        }
+      }
+    }
+  }
+}
+
+struct Case {
+  std::string name;
+  int64_t batch;
+  int64_t M;
+  int64_t K;
+  int64_t N;
+  bool trans_x;
+  bool trans_y;
+  bool broadcast_y;
+};
+
+double TimeIt(const std::function<void()>& fn, int min_iters) {
+  fn();
+  int iters = 0;
+  auto start = std::chrono::steady_clock::now();
+  double elapsed = 0;
+  while (iters < min_iters || elapsed < 0.2) {
+    fn();
+    ++iters;
+    elapsed =
+        std::chrono::duration<double>(std::chrono::steady_clock::now() - start)
+            .count();
+  }
+  return elapsed / iters;
+}
+
+template <typename T>
+bool RunCase(const Case& c, bool run_naive) {
+  std::mt19937 engine(2024);
+  std::uniform_real_distribution<float> dist(-1.f, 1.f);
+  const int64_t x_batch_stride = c.M * c.K;
+  const int64_t y_batch_stride = c.broadcast_y ? 0 : c.K * c.N;
+  std::vector<T> x(c.batch * c.M * c.K);
+  std::vector<T> y((c.broadcast_y ? 1 : c.batch) * c.K * c.N);
+  std::vector<T> out(c.batch * c.M * c.N);
+  std::vector<T> ref(out.size());
+  for (auto& v : x) v = dist(engine);
+  for (auto& v : y) v = dist(engine);
+
+  auto run_new = [&]() {
+    custom_kernel::funcs::BatchedGemm<T>(c.trans_x,
+                                         c.trans_y,
+                                         c.M,
+                                         c.K,
+                                         c.N,
+                                         x.data(),
+                                         x_batch_stride,
+                                         y.data(),
+                                         y_batch_stride,
+                                         out.data(),
+                                         c.batch);
+  };
+  auto run_old = [&]() {
+    NaiveBatchedGemm<T>(c.trans_x,
+                        c.trans_y,
+                        c.M,
+                        c.K,
+                        c.N,
+                        x.data(),
+                        x_batch_stride,
+                        y.data(),
+                        y_batch_stride,
+                        ref.data(),
+                        c.batch);
+  };
+
+  const double flops = 2.0 * c.batch * c.M * c.N * c.K;
+  double new_sec = TimeIt(run_new, 3);
+  double old_sec = run_naive ? TimeIt(run_old, 1) : 0;
+  if (!run_naive) {
+    run_old();
+  }
+
+  double max_err = 0;
+  for (size_t i = 0; i < out.size(); ++i) {
+    max_err = std::max(max_err, std::abs(static_cast<double>(out[i] - ref[i])));
+  }
+  const double tol = (sizeof(T) == 4 ? 1e-4 : 1e-10) * c.K;
+  bool ok = max_err <= tol;
+
+  printf("%-28s %-7s %10.2f",
+         c.name.c_str(),
+         sizeof(T) == 4 ? "float" : "double",
+         flops / new_sec * 1e-9);
+  if (run_naive) {
+    printf(" %10.2f %9.1fx", flops / old_sec * 1e-9, old_sec / new_sec);
+  } else {
+    printf(" %10s %10s", "-", "-");
+  }
+  printf("  max_err=%.2e %s\n", max_err, ok ? "" : "MISMATCH");
+  return ok;
+}
+
+// The int8 result is exact before dequantization, compare it against an
+// int32 reference with the same epilogue.
+bool RunInt8Case(const Case& c) {
+  std::mt19937 engine(2024);
+  std::uniform_int_distribution<int> dist(-127, 127);
+  std::vector<int8_t> x(c.M * c.K);
+  std::vector<int8_t> w(c.K * c.N);
+  std::vector<float> xf(x.size());
+  std::vector<float> wf(w.size());
+  std::vector<float> scale(c.N);
+  for (size_t i = 0; i < x.size(); ++i) xf[i] = x[i] = dist(engine);
+  for (size_t i = 0; i < w.size(); ++i) wf[i] = w[i] = dist(engine);
+  for (int64_t n = 0; n < c.N; ++n) scale[n] = 1.0f / (1 + n % 7);
+  std::vector<float> out(c.M * c.N);
+  std::vector<float> out_float(out.size());
+
+  const double int8_sec = TimeIt(
+      [&]() {
+        custom_kernel::funcs::Int8Gemm(c.trans_y,
+                                       c.M,
+                                       c.K,
+                                       c.N,
+                                       x.data(),
+                                       w.data(),
+                                       scale.data(),
+                                       nullptr,
+                                       out.data());
+      },
+      3);
+  const double float_sec = TimeIt(
+      [&]() {
+        custom_kernel::funcs::Gemm<float>(false,
+                                          c.trans_y,
+                                          c.M,
+                                          c.K,
+                                          c.N,
+                                          xf.data(),
+                                          wf.data(),
+                                          out_float.data());
+      },
+      3);
+
+  bool ok = true;
+  for (int64_t m = 0; m < c.M && ok; ++m) {
+    for (int64_t n = 0; n < c.N; ++n) {
+      int32_t acc = 0;
+      for (int64_t k = 0; k < c.K; ++k) {
+        acc += x[m * c.K + k] * (c.trans_y ? w[n * c.K + k] : w[k * c.N + n]);
+      }
+      if (out[m * c.N + n] != static_cast<float>(acc) * scale[n]) {
+        ok = false;
+        break;
+      }
+    }
+  }
+  const double ops = 2.0 * c.M * c.N * c.K;
+  printf("%-28s %-7s %10.2f %10.2f %9.1fx  %s\n",
+         c.name.c_str(),
+         "int8",
+         ops / int8_sec * 1e-9,
+         ops / float_sec * 1e-9,
+         float_sec / int8_sec,
+         ok ? "" : "MISMATCH");
+  return ok;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = argc > 1 && std::string(argv[1]) == "--quick";
+  std::vector<Case> cases = {
+      {"square 128", 1, 128, 128, 128, false, false, false},
+      {"square 512", 1, 512, 512, 512, false, false, false},
+      {"square 512 x^T y^T", 1, 512, 512, 512, true, true, false},
+      {"skinny 1x1024x1024 (gemv)", 1, 1, 1024, 1024, false, false, false},
+      {"skinny 64x1024x10", 1, 64, 1024, 10, false, true, false},
+      {"skinny 4096x64x64", 1, 4096, 64, 64, false, false, false},
+      {"batched 64x(64x64x64)", 64, 64, 64, 64, false, false, false},
+      {"batched 16x(128x256x64) bc", 16, 128, 256, 64, false, true, true},
+  };
+  if (!quick) {
+    cases.push_back({"square 1024", 1, 1024, 1024, 1024, false, false, false});
+  }
+
+  printf("threads: %d\n",
+         custom_kernel::funcs::ThreadPool::Instance().NumThreads());
+  printf("%-28s %-7s %10s %10s %10s\n",
+         "case",
+         "dtype",
+         "GFLOP/s",
+         "naive",
+         "speedup");
+  bool ok = true;
+  for (const auto& c : cases) {
+    // The naive loop needs seconds for the largest shapes, only time it where
+    // it finishes in reasonable time.
+    bool run_naive = 2.0 * c.batch * c.M * c.N * c.K <= 3e8 || !quick;
+    ok &= RunCase<float>(c, run_naive);
+    ok &= RunCase<double>(c, run_naive);
+  }
+
+  std::vector<Case> int8_cases = {
+      {"gemv 1x4096x4096", 1, 1, 4096, 4096, false, false, false},
+      {"skinny 8x4096x4096 w^T", 1, 8, 4096, 4096, false, true, false},
+      {"square 512", 1, 512, 512, 512, false, false, false},
+      {"odd 129x515x257 w^T", 1, 129, 515, 257, false, true, false},
+  };
+  printf("\n%-28s %-7s %10s %10s %10s\n",
+         "case",
+         "dtype",
+         "GOP/s",
+         "float",
+         "speedup");
+  for (const auto& c : int8_cases) {
+    ok &= RunInt8Case(c);
+  }
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,596 @@
+#  Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Latency and throughput of the custom_cpu kernels, run through paddle ops.
+
+Every case times one op on custom_cpu for a shape and dtype and reports the
+p50/p90/p99 latency together with GB/s and GFLOP/s derived from the p50. The
+results are compared against a baseline JSON file, a case regresses when its
+p50 is more than --tolerance slower than in the baseline.
+
+Usage:
+    python op_benchmark.py [--quick] [--filter REGEX] [--output FILE]
+                           [--baseline FILE] [--tolerance 0.25]
+                           [--update-baseline]
+
+The baseline is only meaningful on the machine it was recorded on. It stores
+the host it came from and regressions on another host are reported without
+failing, refresh it there with --update-baseline.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import time
+
+import numpy as np
+import paddle
+from paddle import _C_ops
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "op_benchmark_baseline.json"
+)
+
+DTYPE_SIZE = {
+    "bool": 1,
+    "float16": 2,
+    "bfloat16": 2,
+    "int32": 4,
+    "int64": 8,
+    "float32": 4,
+    "float64": 8,
+}
+
+
+class Case(object):
+    """One benchmark: `setup()` returns the op as a callable, run repeatedly.
+
+    `bytes` and `flops` count the memory traffic and arithmetic of one run.
+    Cases marked quick make up the --quick sweep used by ctest.
+    """
+
+    def __init__(self, op, dtype, shapes, setup, bytes, flops=0, quick=False):
+        self.op = op
+        self.dtype = dtype
+        self.shapes = shapes
+        self.setup = setup
+        self.bytes = bytes
+        self.flops = flops
+        self.quick = quick
+
+    @property
+    def name(self):
+        shapes = "+".join("x".join(map(str, shape)) for shape in self.shapes)
+        return "%s/%s/%s" % (self.op, self.dtype, shapes)
+
+
+def numel(shape):
+    return int(np.prod(shape))
+
+
+# 16-bit floating point types, compared against float32 to show the saving in
+# memory traffic.
+LOW_PRECISION = ("float16", "bfloat16")
+
+
+def rand(shape, dtype):
+    if dtype in ("int32", "int64"):
+        return paddle.to_tensor(np.random.randint(-1000, 1000, shape).astype(dtype))
+    if dtype in LOW_PRECISION:
+        return paddle.cast(rand(shape, "float32"), dtype)
+    return paddle.to_tensor(np.random.uniform(-1, 1, shape).astype(dtype))
+
+
+def binary_cases(op, fn, shapes, dtypes, out_size=None, flops_per_elem=1):
+    cases = []
+    for i, (x_shape, y_shape) in enumerate(shapes):
+        for dtype in dtypes:
+            n = max(numel(x_shape), numel(y_shape))
+            size = DTYPE_SIZE[dtype]
+
+            def setup(x_shape=x_shape, y_shape=y_shape, dtype=dtype):
+                x, y = rand(x_shape, dtype), rand(y_shape, dtype)
+                return lambda: fn(x, y)
+
+            cases.append(
+                Case(
+                    op,
+                    dtype,
+                    [x_shape, y_shape],
+                    setup,
+                    (numel(x_shape) + numel(y_shape)) * size + n * (out_size or size),
+                    flops_per_elem * n,
+                    quick=i == 0,
+                )
+            )
+    return cases
+
+
+def unary_cases(op, fn, shapes, dtypes, traffic=2, flops_per_elem=0):
+    cases = []
+    for i, shape in enumerate(shapes):
+        for dtype in dtypes:
+
+            def setup(shape=shape, dtype=dtype):
+                x = rand(shape, dtype)
+                return lambda: fn(x)
+
+            cases.append(
+                Case(
+                    op,
+                    dtype,
+                    [shape],
+                    setup,
+                    traffic * numel(shape) * DTYPE_SIZE[dtype],
+                    flops_per_elem * numel(shape),
+                    quick=i == 0,
+                )
+            )
+    return cases
+
+
+def matmul_cases():
+    cases = []
+    shapes = [
+        ([256, 256], [256, 256]),
+        ([1024, 1024], [1024, 1024]),
+        ([1, 4096], [4096, 1024]),
+        ([32, 128, 64], [32, 64, 128]),
+    ]
+    for i, (x_shape, y_shape) in enumerate(shapes):
+        for dtype in ("float32", "float64") + LOW_PRECISION:
+            m, k = x_shape[-2], x_shape[-1]
+            n = y_shape[-1]
+            batch = numel(x_shape[:-2])
+            size = DTYPE_SIZE[dtype]
+
+            def setup(x_shape=x_shape, y_shape=y_shape, dtype=dtype):
+                x, y = rand(x_shape, dtype), rand(y_shape, dtype)
+                return lambda: paddle.matmul(x, y)
+
+            cases.append(
+                Case(
+                    "matmul",
+                    dtype,
+                    [x_shape, y_shape],
+                    setup,
+                    (numel(x_shape) + numel(y_shape) + batch * m * n) * size,
+                    2 * batch * m * n * k,
+                    quick=i == 0,
+                )
+            )
+    return cases
+
+
+def int8_linear_cases():
+    """int8 x int8 -> int32 GEMM with a per channel dequant epilogue, the
+    float32 matmul cases of the same shapes are the reference."""
+    from paddle.base import core
+
+    import paddle_custom_device.custom_cpu.passes as passes
+
+    cases = []
+    shapes = [([1, 4096], [4096, 1024]), ([256, 1024], [1024, 1024])]
+    for i, (x_shape, w_shape) in enumerate(shapes):
+        m, k = x_shape
+        n = w_shape[1]
+
+        def setup(x_shape=x_shape, w_shape=w_shape):
+            passes.setUp()
+            x = paddle.to_tensor(np.random.randint(-127, 128, x_shape).astype("int8"))
+            w = paddle.to_tensor(np.random.randint(-127, 128, w_shape).astype("int8"))
+            w_scale = paddle.to_tensor(np.random.uniform(50, 100, [w_shape[1]]))
+            w_scale = paddle.cast(w_scale, "float32")
+            return lambda: core.eager._run_custom_op("int8_linear", x, w, w_scale, 64.0)
+
+        cases.append(
+            Case(
+                "int8_linear",
+                "int8",
+                [x_shape, w_shape],
+                setup,
+                m * k + k * n + 4 * (n + m * n),
+                2 * m * n * k,
+                quick=i == 0,
+            )
+        )
+    return cases
+
+
+def grad_cases():
+    """Forward and backward of ops that have a grad kernel."""
+    cases = []
+
+    def matmul_setup():
+        x = rand([512, 512], "float32")
+        y = rand([512, 512], "float32")
+        x.stop_gradient = False
+        y.stop_gradient = False
+        return lambda: paddle.matmul(x, y).backward()
+
+    cases.append(
+        Case(
+            "matmul+grad",
+            "float32",
+            [[512, 512], [512, 512]],
+            matmul_setup,
+            9 * 512 * 512 * 4,
+            3 * 2 * 512**3,
+            quick=True,
+        )
+    )
+
+    def softmax_setup():
+        x = rand([256, 4096], "float32")
+        x.stop_gradient = False
+        return lambda: paddle.nn.functional.softmax(x).backward()
+
+    cases.append(
+        Case(
+            "softmax+grad",
+            "float32",
+            [[256, 4096]],
+            softmax_setup,
+            5 * 256 * 4096 * 4,
+            9 * 256 * 4096,
+        )
+    )
+
+    def ce_setup():
+        logits = rand([512, 1000], "float32")
+        logits.stop_gradient = False
+        label = paddle.to_tensor(np.random.randint(0, 1000, [512, 1]).astype("int64"))
+
+        def run():
+            paddle.nn.functional.softmax_with_cross_entropy(logits, label).backward()
+
+        return run
+
+    cases.append(
+        Case(
+            "cross_entropy_with_softmax+grad",
+            "float32",
+            [[512, 1000]],
+            ce_setup,
+            4 * 512 * 1000 * 4,
+            8 * 512 * 1000,
+        )
+    )
+    return cases
+
+
+def optimizer_cases():
+    cases = []
+    for i, n in enumerate([1 << 16, 1 << 22]):
+
+        def adamw_setup(n=n):
+            param, grad = rand([n], "float32"), rand([n], "float32")
+            m1, m2 = paddle.zeros([n]), paddle.zeros([n])
+            lr = paddle.to_tensor([1e-3], "float32")
+            b1, b2 = paddle.to_tensor([0.9]), paddle.to_tensor([0.999])
+            return lambda: _C_ops.adamw_(
+                param, grad, lr, m1, m2, None, b1, b2, None, None,
+                0.9, 0.999, 1e-8, 1.0, 0.01, True, False, 1000, False, False,
+                False,
+            )  # fmt: skip
+
+        cases.append(
+            Case("adamw", "float32", [[n]], adamw_setup, 7 * n * 4, 16 * n, i == 0)
+        )
+
+        def momentum_setup(n=n):
+            param, grad = rand([n], "float32"), rand([n], "float32")
+            velocity = paddle.zeros([n])
+            lr = paddle.to_tensor([1e-3], "float32")
+            return lambda: _C_ops.momentum_(
+                param, grad, velocity, lr, None, 0.9, False, "", 0.0, False, 1.0
+            )
+
+        cases.append(
+            Case("momentum", "float32", [[n]], momentum_setup, 5 * n * 4, 5 * n, i == 0)
+        )
+    return cases
+
+
+def random_cases():
+    cases = []
+    for i, shape in enumerate([[1 << 16], [1 << 22]]):
+        for op, fn in (
+            ("uniform", lambda s, d: paddle.uniform(s, d)),
+            ("gaussian", lambda s, d: paddle.randn(s, d)),
+        ):
+            for dtype in ("float32", "float64"):
+
+                def setup(shape=shape, dtype=dtype, fn=fn):
+                    return lambda: fn(shape, dtype)
+
+                cases.append(
+                    Case(
+                        op,
+                        dtype,
+                        [shape],
+                        setup,
+                        numel(shape) * DTYPE_SIZE[dtype],
+                        quick=i == 0,
+                    )
+                )
+
+        def dropout_setup(shape=shape):
+            x = rand(shape, "float32")
+            return lambda: paddle.nn.functional.dropout(x, 0.5)
+
+        cases.append(
+            Case(
+                "dropout",
+                "float32",
+                [shape],
+                dropout_setup,
+                9 * numel(shape),
+                numel(shape),
+                i == 0,
+            )
+        )
+    return cases
+
+
+def all_cases():
+    elementwise_shapes = [
+        ([1 << 16], [1 << 16]),
+        ([1024, 1024], [1024, 1024]),
+        ([1024, 1024], [1024]),
+    ]
+    dtypes = ("float32", "float64")
+    cases = matmul_cases()
+    cases += int8_linear_cases()
+    cases += binary_cases("add", paddle.add, elementwise_shapes, dtypes + LOW_PRECISION)
+    cases += binary_cases(
+        "multiply", paddle.multiply, elementwise_shapes, dtypes + LOW_PRECISION
+    )
+    cases += binary_cases("maximum", paddle.maximum, elementwise_shapes, dtypes)
+    cases += binary_cases(
+        "less_than", paddle.less_than, elementwise_shapes, dtypes, out_size=1
+    )
+    reduce_shapes = [[1 << 16], [1024, 1024], [64, 256, 64]]
+    for op, fn in (
+        ("sum", lambda x: paddle.sum(x, axis=-1)),
+        ("mean", lambda x: paddle.mean(x, axis=0)),
+        ("max", lambda x: paddle.max(x, axis=-1)),
+    ):
+        cases += unary_cases(op, fn, reduce_shapes, dtypes + LOW_PRECISION, 1, 1)
+    cases += unary_cases(
+        "softmax",
+        lambda x: paddle.nn.functional.softmax(x, axis=-1),
+        [[64, 1000], [256, 4096], [64, 256, 64]],
+        dtypes + LOW_PRECISION,
+        flops_per_elem=5,
+    )
+    cases += unary_cases(
+        "transpose",
+        lambda x: paddle.transpose(x, list(range(x.ndim))[::-1]),
+        [[256, 256], [2048, 2048], [32, 64, 128]],
+        dtypes,
+    )
+    cases += unary_cases(
+        "concat",
+        lambda x: paddle.concat([x, x, x, x], axis=-1),
+        [[256, 256], [1024, 1024]],
+        dtypes,
+        traffic=8,
+    )
+    cases += unary_cases(
+        "slice",
+        lambda x: paddle.slice(x, [0], [1], [x.shape[0] - 1]),
+        [[256, 256], [1024, 1024]],
+        dtypes,
+    )
+    cases += unary_cases(
+        "cast_float16",
+        lambda x: paddle.cast(x, "float16"),
+        [[1 << 16], [1 << 22]],
+        ("float32",),
+        traffic=1.5,
+    )
+    cases += unary_cases(
+        "cast_int64",
+        lambda x: paddle.cast(x, "int64"),
+        [[1 << 16], [1 << 22]],
+        ("float32",),
+        traffic=3,
+    )
+    cases += unary_cases(
+        "argsort",
+        lambda x: paddle.argsort(x, axis=-1),
+        [[64, 1024], [16, 65536]],
+        ("float32", "int64"),
+        traffic=3,
+    )
+    cases += unary_cases(
+        "topk",
+        lambda x: paddle.topk(x, 10, axis=-1),
+        [[64, 1024], [16, 65536]],
+        ("float32",),
+        traffic=1,
+    )
+    cases += grad_cases()
+    cases += optimizer_cases()
+    cases += random_cases()
+    return cases
+
+
+def run_case(case, min_time, max_iters, warmup=3):
+    fn = case.setup()
+    for _ in range(warmup):
+        fn()
+    paddle.device.synchronize()
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_iters and (
+        len(samples) < 5 or time.perf_counter() - start < min_time
+    ):
+        t = time.perf_counter()
+        fn()
+        paddle.device.synchronize()
+        samples.append(time.perf_counter() - t)
+    samples = np.array(samples) * 1e6
+    p50 = float(np.percentile(samples, 50))
+    return {
+        "name": case.name,
+        "op": case.op,
+        "dtype": case.dtype,
+        "shapes": case.shapes,
+        "iters": len(samples),
+        "mean_us": float(samples.mean()),
+        "p50_us": p50,
+        "p90_us": float(np.percentile(samples, 90)),
+        "p99_us": float(np.percentile(samples, 99)),
+        "gbps": case.bytes / p50 * 1e-3,
+        "gflops": case.flops / p50 * 1e-3,
+    }
+
+
+def host_info():
+    model = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except IOError:
+        pass
+    return {
+        "cpu": model,
+        "cores": os.cpu_count(),
+        "paddle": paddle.__version__,
+    }
+
+
+def baseline_record(result):
+    keys = ("p50_us", "p90_us", "p99_us", "gbps", "gflops")
+    record = {k: round(result[k], 2) for k in keys}
+    record["name"] = result["name"]
+    return record
+
+
+def compare(results, baseline, tolerance):
+    """Returns the results more than `tolerance` slower than the baseline."""
+    base = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = base.get(r["name"])
+        if b is None:
+            r["baseline_p50_us"] = None
+            continue
+        r["baseline_p50_us"] = b["p50_us"]
+        r["change"] = r["p50_us"] / b["p50_us"] - 1
+        if r["change"] > tolerance:
+            regressions.append(r)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quick", action="store_true", help="small sweep")
+    parser.add_argument("--filter", default="", help="regex on case names")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed p50 slowdown against the baseline, 0.25 is 25%%",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="merge the results into the baseline instead of comparing",
+    )
+    parser.add_argument("--min-time", type=float, default=None)
+    parser.add_argument("--max-iters", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    paddle.disable_static()
+    paddle.set_device("custom_cpu")
+    np.random.seed(2024)
+    min_time = args.min_time or (0.05 if args.quick else 0.3)
+    pattern = re.compile(args.filter)
+    cases = [
+        c for c in all_cases() if (c.quick or not args.quick) and pattern.search(c.name)
+    ]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(
+        "%-44s %10s %10s %10s %9s %9s"
+        % ("case", "p50(us)", "p90(us)", "p99(us)", "GB/s", "GFLOP/s")
+    )
+    results = []
+    for case in cases:
+        r = run_case(case, min_time, args.max_iters)
+        results.append(r)
+        print(
+            "%-44s %10.1f %10.1f %10.1f %9.2f %9.2f"
+            % (r["name"], r["p50_us"], r["p90_us"], r["p99_us"], r["gbps"], r["gflops"])
+        )
+        sys.stdout.flush()
+
+    host = host_info()
+    report = {"host": host, "results": results}
+    status = 0
+    if args.update_baseline:
+        merged = {r["name"]: r for r in baseline.get("results", [])}
+        merged.update((r["name"], baseline_record(r)) for r in results)
+        baseline = {
+            "host": host,
+            "results": [merged[k] for k in sorted(merged)],
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print("baseline written to %s" % args.baseline)
+    elif baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        report["regressions"] = [r["name"] for r in regressions]
+        for r in regressions:
+            print(
+                "REGRESSION %s: p50 %.1fus vs baseline %.1fus (+%.0f%%)"
+                % (r["name"], r["p50_us"], r["baseline_p50_us"], 100 * r["change"])
+            )
+        if regressions:
+            base_host = baseline.get("host", {})
+            if (base_host.get("cpu"), base_host.get("cores")) == (
+                host["cpu"],
+                host["cores"],
+            ):
+                status = 1
+            else:
+                print("baseline was recorded on another host, not failing")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+            f.write("\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Checks that ParallelFor of the work-stealing pool visits every index
+// exactly once (odd ranges and grains, nested and concurrent calls, thrown
+// exceptions) and reports the speedup of a memory bound and a compute bound
+// loop for 1 to N threads.
+//
+// Usage: thread_pool_benchmark [--quick] [max_threads]
+
+#include <atomic>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <functional>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <vector>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace {
+
+using custom_kernel::funcs::ThreadPool;
+
+bool CheckCoverage(ThreadPool* pool,
+                   int64_t begin,
+                   int64_t end,
+                   int64_t grain) {
+  std::vector<std::atomic<int>> hits(end - begin);
+  for (auto& h : hits) h.store(0);
+  pool->ParallelFor(begin, end, grain, [&](int64_t b, int64_t e) {
+    for (int64_t i = b; i < e; ++i) hits[i - begin].fetch_add(1);
+  });
+  for (size_t i = 0; i < hits.size(); ++i) {
+    if (hits[i].load() != 1) {
+      printf("range [%ld, %ld) grain %ld: index %ld visited %d times\n",
+             static_cast<long>(begin),      // NOLINT
+             static_cast<long>(end),        // NOLINT
+             static_cast<long>(grain),      // NOLINT
+             static_cast<long>(begin + i),  // NOLINT
+             hits[i].load());
+      return false;
+    }
+  }
+  return true;
+}
+
+bool CheckCorrectness(ThreadPool* pool) {
+  bool ok = true;
+  for (int64_t range : {0, 1, 7, 64, 1000, 4097, 100003}) {
+    for (int64_t grain : {1, 3, 64, 1 << 20}) {
+      ok &= CheckCoverage(pool, 5, 5 + range, grain);
+    }
+  }
+
+  // A ParallelFor inside a chunk runs serially on that thread.
+  std::atomic<int64_t> nested(0);
+  pool->ParallelFor(0, 64, 1, [&](int64_t b, int64_t e) {
+    for (int64_t i = b; i < e; ++i) {
+      pool->ParallelFor(0, 100, 1, [&](int64_t ib, int64_t ie) {
+        nested.fetch_add(ie - ib);
+      });
+    }
+  });
+  if (nested.load() != 6400) {
+    printf("nested: %ld items instead of 6400\n",
+           static_cast<long>(nested.load()));  // NOLINT
+    ok = false;
+  }
+
+  // Callers racing for the pool either dispatch or run serially.
+  std::vector<std::thread> callers;
+  std::atomic<bool> concurrent_ok(true);
+  for (int t = 0; t < 4; ++t) {
+    callers.emplace_back([&]() {
+      for (int iter = 0; iter < 50; ++iter) {
+        if (!CheckCoverage(pool, 0, 10007, 16)) concurrent_ok = false;
+      }
+    });
+  }
+  for (auto& c : callers) c.join();
+  ok &= concurrent_ok.load();
+
+  // The first exception is rethrown on the caller after every chunk ran.
+  std::atomic<int64_t> done(0);
+  bool thrown = false;
+  try {
+    pool->ParallelFor(0, 1000, 1, [&](int64_t b, int64_t e) {
+      done.fetch_add(e - b);
+      if (b <= 500 && 500 < e) throw std::runtime_error("chunk failed");
+    });
+  } catch (const std::runtime_error&) {
+    thrown = true;
+  }
+  if (!thrown || done.load() != 1000) {
+    printf("exception: thrown=%d, %ld of 1000 items ran\n",
+           thrown,
+           static_cast<long>(done.load()));  // NOLINT
+    ok = false;
+  }
+  return ok;
+}
+
+double TimeIt(const std::function<void()>& fn, double min_seconds) {
+  fn();
+  int iters = 0;
+  auto start = std::chrono::steady_clock::now();
+  double elapsed = 0;
+  while (iters < 3 || elapsed < min_seconds) {
+    fn();
+    ++iters;
+    elapsed =
+        std::chrono::duration<double>(std::chrono::steady_clock::now() - start)
+            .count();
+  }
+  return elapsed / iters;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = false;
+  int max_threads =
+      static_cast<int>(custom_kernel::funcs::detail::AllowedCpus().size());
+  for (int i = 1; i < argc; ++i) {
+    if (std::string(argv[i]) == "--quick") {
+      quick = true;
+    } else {
+      max_threads = std::atoi(argv[i]);
+    }
+  }
+  max_threads = std::max(max_threads, 1);
+
+  bool ok = true;
+  for (int threads : {1, 2, 4}) {
+    ThreadPool pool(threads, false);
+    if (!CheckCorrectness(&pool)) {
+      printf("correctness check failed with %d threads\n", threads);
+      ok = false;
+    }
+  }
+  printf("correctness: %s\n", ok ? "ok" : "FAILED");
+
+  const int64_t n = quick ? (1 << 22) : (1 << 25);
+  std::vector<float> src(n, 1.f);
+  std::vector<float> dst(n);
+  const double min_seconds = quick ? 0.05 : 0.3;
+  printf("%-8s %12s %9s %14s %9s\n",
+         "threads",
+         "copy GB/s",
+         "speedup",
+         "exp Gelem/s",
+         "speedup");
+  double copy_base = 0;
+  double exp_base = 0;
+  for (int threads = 1; threads <= max_threads; threads *= 2) {
+    ThreadPool pool(threads, true);
+    const double copy_sec = TimeIt(
+        [&]() {
+          pool.ParallelFor(0, n, 1 << 16, [&](int64_t b, int64_t e) {
+            std::copy(src.data() + b, src.data() + e, dst.data() + b);
+          });
+        },
+        min_seconds);
+    const double exp_sec = TimeIt(
+        [&]() {
+          pool.ParallelFor(0, n, 1 << 12, [&](int64_t b, int64_t e) {
+            for (int64_t i = b; i < e; ++i) dst[i] = std::exp(src[i] * 0.5f);
+          });
+        },
+        min_seconds);
+    if (threads == 1) {
+      copy_base = copy_sec;
+      exp_base = exp_sec;
+    }
+    printf("%-8d %12.2f %8.2fx %14.3f %8.2fx\n",
+           threads,
+           2.0 * n * sizeof(float) / copy_sec * 1e-9,
+           copy_base / copy_sec,
+           n / exp_sec * 1e-9,
+           exp_base / exp_sec);
+  }
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,230 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Unit tests of the caching allocator of the runtime: size class rounding,
+// reuse of freed blocks, the retention cap, the naive strategy and
+// concurrent use from several threads.
+
+#include "runtime/allocator.h"
+
+#include <atomic>
+#include <cstdint>
+#include <cstdio>
+#include <cstring>
+#include <random>
+#include <thread>
+#include <utility>
+#include <vector>
+
+namespace {
+
+using custom_cpu::CachingAllocator;
+
+int g_failures = 0;
+
+void Expect(bool cond, const char* what) {
+  if (!cond) {
+    printf("allocator test failed: %s\n", what);
+    ++g_failures;
+  }
+}
+
+bool Aligned(void* ptr) {
+  return reinterpret_cast<uintptr_t>(ptr) % CachingAllocator::kAlignment == 0;
+}
+
+void TestSizeClasses() {
+  Expect(CachingAllocator::ClassSize(CachingAllocator::SizeClass(1)) == 64,
+         "1 byte rounds to 64");
+  Expect(CachingAllocator::ClassSize(CachingAllocator::SizeClass(64)) == 64,
+         "64 bytes stay 64");
+  Expect(CachingAllocator::ClassSize(CachingAllocator::SizeClass(65)) == 128,
+         "65 bytes round to 128");
+  Expect(CachingAllocator::ClassSize(CachingAllocator::SizeClass(512)) == 512,
+         "512 bytes stay 512");
+  Expect(CachingAllocator::ClassSize(CachingAllocator::SizeClass(513)) == 640,
+         "above 512 classes are a quarter of the power of two apart");
+  Expect(CachingAllocator::ClassSize(CachingAllocator::SizeClass(
+             CachingAllocator::kSmallSize)) == CachingAllocator::kSmallSize,
+         "the largest small request has a class of its own size");
+
+  // Every small size gets the smallest class that holds it, with at most 25%
+  // overhead above 512 bytes.
+  bool tight = true;
+  bool bounded = true;
+  int last_class = 0;
+  for (size_t size = 1; size <= CachingAllocator::kSmallSize;
+       size += size < 4096 ? 1 : 97) {
+    const int size_class = CachingAllocator::SizeClass(size);
+    const size_t class_size = CachingAllocator::ClassSize(size_class);
+    tight =
+        tight && class_size >= size && class_size % 64 == 0 &&
+        size_class >= last_class &&
+        (size_class == 0 || CachingAllocator::ClassSize(size_class - 1) < size);
+    bounded = bounded && (size <= 512 || class_size <= size + size / 4);
+    last_class = size_class;
+  }
+  Expect(tight, "sizes map to the smallest class that holds them");
+  Expect(bounded, "class overhead is at most 25%");
+}
+
+void TestReuse() {
+  CachingAllocator allocator(true, 0);
+  void* a = allocator.Allocate(1000);
+  Expect(a != nullptr && Aligned(a), "small allocation is aligned");
+  allocator.Free(a);
+  void* b = allocator.Allocate(900);
+  Expect(b == a, "a freed block serves a request of the same class");
+  void* c = allocator.Allocate(2000);
+  Expect(c != a, "another class gets another block");
+  auto stats = allocator.GetStats();
+  Expect(stats.num_system_allocs == 2, "reuse does not reach the system");
+  Expect(stats.allocated_bytes == 1024 + 2048, "allocated bytes by class");
+  allocator.Free(b);
+  allocator.Free(c);
+
+  // Large blocks are split from a segment and coalesced again on free.
+  const size_t mb = 1 << 20;
+  void* big = allocator.Allocate(3 * mb);
+  Expect(big != nullptr && Aligned(big), "large allocation is aligned");
+  allocator.Free(big);
+  void* first = allocator.Allocate(1 * mb + 1);
+  void* second = allocator.Allocate(2 * mb);
+  Expect(first == big, "a freed segment is reused");
+  Expect(static_cast<char*>(second) == static_cast<char*>(big) + mb + 4096,
+         "the tail of a segment serves the next large request");
+  Expect(allocator.GetStats().num_system_allocs == 3,
+         "a split segment does not reach the system");
+  allocator.Free(first);
+  allocator.Free(second);
+  void* whole = allocator.Allocate(4 * mb);
+  Expect(whole == big, "freed neighbours are coalesced");
+  allocator.Free(whole);
+
+  stats = allocator.GetStats();
+  Expect(
+      stats.allocated_bytes == 0 && stats.cached_bytes == stats.reserved_bytes,
+      "everything freed is cached");
+  Expect(stats.peak_allocated_bytes == 4 * mb, "peak allocated bytes");
+}
+
+void TestCacheLimit() {
+  const size_t kb = 1 << 10;
+  {
+    CachingAllocator allocator(true, 256 * kb);
+    std::vector<void*> blocks;
+    for (int i = 0; i < 8; ++i) {
+      blocks.push_back(allocator.Allocate(128 * kb));
+    }
+    for (void* block : blocks) {
+      allocator.Free(block);
+    }
+    auto stats = allocator.GetStats();
+    Expect(stats.cached_bytes <= 256 * kb, "cached bytes stay under the cap");
+    Expect(stats.num_system_frees == 6, "blocks above the cap are released");
+    Expect(stats.reserved_bytes == stats.cached_bytes,
+           "reserved bytes follow the released blocks");
+
+    allocator.EmptyCache();
+    stats = allocator.GetStats();
+    Expect(stats.cached_bytes == 0 && stats.reserved_bytes == 0,
+           "EmptyCache releases every cached block");
+  }
+  {
+    // A segment with a live block can not be released.
+    CachingAllocator allocator(true, 0);
+    const size_t mb = 1 << 20;
+    void* live = allocator.Allocate(2 * mb);
+    void* freed = allocator.Allocate(3 * mb);
+    allocator.Free(freed);
+    allocator.EmptyCache();
+    auto stats = allocator.GetStats();
+    Expect(stats.reserved_bytes == 2 * mb && stats.cached_bytes == 0,
+           "only fully free segments are released");
+    allocator.Free(live);
+  }
+  {
+    CachingAllocator allocator(false, 0);
+    void* small = allocator.Allocate(100);
+    void* large = allocator.Allocate(5 << 20);
+    allocator.Free(small);
+    allocator.Free(large);
+    auto stats = allocator.GetStats();
+    Expect(stats.reserved_bytes == 0 && stats.num_system_frees == 2,
+           "the naive strategy frees to the system");
+  }
+}
+
+void TestThreads() {
+  CachingAllocator allocator(true, 4 << 20);
+  const int kThreads = 8;
+  const int kIters = 20000;
+  std::atomic<int> corrupted(0);
+  std::atomic<int> misaligned(0);
+  std::vector<std::thread> threads;
+  for (int t = 0; t < kThreads; ++t) {
+    threads.emplace_back([&, t]() {
+      std::mt19937 rng(t);
+      std::vector<std::pair<unsigned char*, size_t>> live;
+      for (int i = 0; i < kIters; ++i) {
+        if (live.size() < 16 && (live.empty() || rng() % 2 == 0)) {
+          // Mostly small blocks, a few large ones.
+          size_t size = rng() % 64 == 0 ? (1 << 20) + rng() % (3 << 20)
+                                        : 1 + rng() % 8192;
+          auto* ptr = static_cast<unsigned char*>(allocator.Allocate(size));
+          if (!Aligned(ptr)) {
+            misaligned++;
+          }
+          std::memset(ptr, t + 1, size);
+          live.emplace_back(ptr, size);
+        } else {
+          size_t index = rng() % live.size();
+          auto block = live[index];
+          live[index] = live.back();
+          live.pop_back();
+          // Another thread writing into the block would change the pattern.
+          for (size_t j = 0; j < block.second; j += 61) {
+            if (block.first[j] != t + 1) {
+              corrupted++;
+              break;
+            }
+          }
+          allocator.Free(block.first);
+        }
+      }
+      for (auto& block : live) {
+        allocator.Free(block.first);
+      }
+    });
+  }
+  for (auto& thread : threads) {
+    thread.join();
+  }
+  auto stats = allocator.GetStats();
+  Expect(corrupted == 0, "blocks are never handed to two threads");
+  Expect(misaligned == 0, "blocks of all threads are aligned");
+  Expect(stats.allocated_bytes == 0, "every block is freed");
+  Expect(stats.cached_bytes <= 4 << 20, "the cap holds under concurrent frees");
+}
+
+}  // namespace
+
+int main() {
+  TestSizeClasses();
+  TestReuse();
+  TestCacheLimit();
+  TestThreads();
+  printf("allocator tests: %s\n", g_failures == 0 ? "ok" : "FAILED");
+  return g_failures == 0 ? 0 : 1;
+}
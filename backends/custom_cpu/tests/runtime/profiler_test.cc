@@ -0,0 +1,98 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Unit tests of the profiler rings: spans of exited threads are collected,
+// rings of exited threads are reused instead of piling up, and the records
+// left by exited threads are capped at the ring size.
+
+#include "runtime/profiler.h"
+
+#include <cstdint>
+#include <cstdio>
+#include <cstdlib>
+#include <thread>
+#include <vector>
+
+namespace {
+
+using custom_cpu::Profiler;
+using custom_cpu::TraceScope;
+
+constexpr int kRingSize = 64;
+
+int g_failures = 0;
+
+void Expect(bool cond, const char* what) {
+  if (!cond) {
+    printf("profiler test failed: %s\n", what);
+    ++g_failures;
+  }
+}
+
+void RecordSpans(int n) {
+  for (int i = 0; i < n; ++i) {
+    TraceScope trace("op");
+  }
+}
+
+void TestExitedThreads() {
+  auto& profiler = Profiler::Instance();
+  profiler.Start();
+  const size_t rings_before = profiler.NumRings();
+  for (int i = 0; i < 50; ++i) {
+    std::thread(RecordSpans, 1).join();
+  }
+  uint64_t dropped = 0;
+  auto records = profiler.Collect(&dropped);
+  Expect(records.size() == 50, "spans of exited threads are collected");
+  Expect(dropped == 0, "no span is dropped");
+  Expect(profiler.NumRings() <= rings_before + 1,
+         "threads that come and go share one ring");
+
+  std::vector<std::thread> threads;
+  for (int t = 0; t < 4; ++t) {
+    threads.emplace_back(RecordSpans, 10);
+  }
+  for (auto& thread : threads) {
+    thread.join();
+  }
+  records = profiler.Collect(&dropped);
+  Expect(records.size() == 40, "spans of concurrent threads are collected");
+  Expect(profiler.NumRings() <= rings_before + 4,
+         "rings are bounded by the live threads");
+  profiler.Stop();
+}
+
+void TestExitedRecordsCap() {
+  auto& profiler = Profiler::Instance();
+  profiler.Start();
+  for (int i = 0; i < 3; ++i) {
+    std::thread(RecordSpans, kRingSize / 2).join();
+  }
+  uint64_t dropped = 0;
+  auto records = profiler.Collect(&dropped);
+  Expect(records.size() == kRingSize, "exited threads keep one ring of spans");
+  Expect(dropped == kRingSize / 2, "spans beyond the cap count as dropped");
+  profiler.Stop();
+}
+
+}  // namespace
+
+int main() {
+  setenv("FLAGS_custom_cpu_profiler_ring_size", "64", 1);
+  TestExitedThreads();
+  TestExitedRecordsCap();
+  printf("profiler tests: %s\n", g_failures == 0 ? "ok" : "FAILED");
+  return g_failures == 0 ? 0 : 1;
+}
@@ -0,0 +1,198 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+from paddle import _C_ops
+
+
+def adamw_step(
+    param, grad, m1, m2, m2_max, lr, beta1, beta2, b1_pow, b2_pow, eps, coeff
+):
+    param = param * (1 - lr * coeff)
+    m1 = beta1 * m1 + (1 - beta1) * grad
+    m2 = beta2 * m2 + (1 - beta2) * grad * grad
+    m2_max = np.maximum(m2_max, m2)
+    param = param - lr / (1 - b1_pow) * m1 / (np.sqrt(m2_max / (1 - b2_pow)) + eps)
+    return param, m1, m2, m2_max
+
+
+class TestAdamOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+        self.shape = [300, 123]
+        self.param = np.random.random(self.shape).astype("float32")
+        self.grad = np.random.random(self.shape).astype("float32") - 0.5
+
+    def run_adamw(
+        self, dtype, coeff, multi_precision, skip_update=None, amsgrad=False
+    ):
+        param = paddle.to_tensor(self.param).astype(dtype)
+        master = paddle.to_tensor(self.param) if multi_precision else None
+        grad = paddle.to_tensor(self.grad).astype(dtype)
+        moment_dtype = "float32" if multi_precision else dtype
+        m1 = paddle.zeros(self.shape, moment_dtype)
+        m2 = paddle.zeros(self.shape, moment_dtype)
+        m2_max = paddle.zeros(self.shape, moment_dtype) if amsgrad else None
+        b1_pow = paddle.to_tensor([0.9], "float32")
+        b2_pow = paddle.to_tensor([0.999], "float32")
+        lr = paddle.to_tensor([0.01], "float32")
+        for _ in range(3):
+            _C_ops.adamw_(
+                param,
+                grad,
+                lr,
+                m1,
+                m2,
+                m2_max,
+                b1_pow,
+                b2_pow,
+                master,
+                skip_update,
+                0.9,
+                0.999,
+                1e-8,
+                1.0,
+                coeff,
+                True,
+                False,
+                1000,
+                multi_precision,
+                False,
+                amsgrad,
+            )
+        return param, master, b1_pow
+
+    def expected(self, coeff, grads=None):
+        param = self.param.astype("float64")
+        m1 = np.zeros_like(param)
+        m2 = np.zeros_like(param)
+        m2_max = np.zeros_like(param)
+        b1_pow, b2_pow = 0.9, 0.999
+        for grad in grads or [self.grad] * 3:
+            param, m1, m2, m2_max = adamw_step(
+                param, grad, m1, m2, m2_max, 0.01, 0.9, 0.999, b1_pow, b2_pow, 1e-8, coeff
+            )
+            b1_pow *= 0.9
+            b2_pow *= 0.999
+        return param
+
+    def test_adam(self):
+        param, _, b1_pow = self.run_adamw("float32", 0.0, False)
+        np.testing.assert_allclose(param.numpy(), self.expected(0.0), atol=1e-6)
+        np.testing.assert_allclose(b1_pow.numpy(), [0.9**4], rtol=1e-6)
+
+    def test_adamw(self):
+        param, _, _ = self.run_adamw("float32", 0.01, False)
+        np.testing.assert_allclose(param.numpy(), self.expected(0.01), atol=1e-6)
+
+    def test_float16_master_param(self):
+        param, master, _ = self.run_adamw("float16", 0.01, True)
+        expected = self.expected(0.01)
+        np.testing.assert_allclose(master.numpy(), expected, atol=1e-6)
+        np.testing.assert_allclose(param.astype("float32").numpy(), expected, atol=1e-3)
+
+    def test_amsgrad(self):
+        param, _, _ = self.run_adamw("float32", 0.01, False, amsgrad=True)
+        np.testing.assert_allclose(param.numpy(), self.expected(0.01), atol=1e-6)
+
+    def test_optimizer_matches_cpu(self):
+        # The grads shrink, so AMSGrad divides by an older, larger m2.
+        grads = [self.grad * scale for scale in (1.0, 0.1, 0.01)]
+        results = {}
+        for device in ("cpu", "custom_cpu"):
+            paddle.set_device(device)
+            for amsgrad in (False, True):
+                param = paddle.create_parameter(
+                    self.shape,
+                    "float32",
+                    default_initializer=paddle.nn.initializer.Assign(self.param),
+                )
+                opt = paddle.optimizer.AdamW(
+                    learning_rate=0.01,
+                    parameters=[param],
+                    weight_decay=0.01,
+                    amsgrad=amsgrad,
+                )
+                for grad in grads:
+                    param.grad = paddle.to_tensor(grad)
+                    opt.step()
+                results[device, amsgrad] = param.numpy()
+        for amsgrad in (False, True):
+            np.testing.assert_allclose(
+                results["custom_cpu", amsgrad], results["cpu", amsgrad], atol=1e-6
+            )
+        np.testing.assert_allclose(
+            results["custom_cpu", True], self.expected(0.01, grads), atol=1e-6
+        )
+
+    def test_skip_update(self):
+        skip_update = paddle.to_tensor([True])
+        param, _, b1_pow = self.run_adamw("float32", 0.01, False, skip_update)
+        np.testing.assert_array_equal(param.numpy(), self.param)
+        np.testing.assert_array_equal(b1_pow.numpy(), np.float32([0.9]))
+
+
+class TestMomentumOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+
+    def check_momentum(self, use_nesterov, regularization_method):
+        np.random.seed(2024)
+        param = np.random.random([1000, 17]).astype("float32")
+        grad = np.random.random([1000, 17]).astype("float32")
+        velocity = np.random.random([1000, 17]).astype("float32")
+        mu, lr, coeff = 0.9, 0.01, 0.001
+        param_t = paddle.to_tensor(param)
+        velocity_t = paddle.to_tensor(velocity)
+        _C_ops.momentum_(
+            param_t,
+            paddle.to_tensor(grad),
+            velocity_t,
+            paddle.to_tensor([lr], "float32"),
+            None,
+            mu,
+            use_nesterov,
+            regularization_method,
+            coeff,
+            False,
+            1.0,
+        )
+
+        if regularization_method == "l2_decay":
+            grad = grad + coeff * param
+        velocity = mu * velocity + grad
+        if use_nesterov:
+            param = param - lr * (grad + mu * velocity)
+        else:
+            param = param - lr * velocity
+        np.testing.assert_allclose(velocity_t.numpy(), velocity, rtol=1e-6)
+        np.testing.assert_allclose(param_t.numpy(), param, rtol=1e-6)
+
+    def test_momentum(self):
+        self.check_momentum(False, "")
+
+    def test_nesterov_l2_decay(self):
+        self.check_momentum(True, "l2_decay")
+
+
+if __name__ == "__main__":
+    unittest.main()
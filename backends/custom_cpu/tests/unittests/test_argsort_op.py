@@ -558,5 +558,37 @@ class TestStableArgsortImperative4(TestStableArgsortImperative):
         )
 
 
+class TestArgsortLongRowImperative(unittest.TestCase):
+    def setUp(self):
+        self.place = core.CustomPlace("custom_cpu", 0)
+
+    def check(self, data, axis):
+        paddle.disable_static(self.place)
+        var_x = paddle.to_tensor(data)
+        out = paddle.argsort(var_x, axis=axis, stable=True)
+        expect = np.argsort(data, axis=axis, kind="stable")
+        np.testing.assert_array_equal(out.numpy(), expect)
+
+        out2 = paddle.argsort(var_x, axis=axis, descending=True, stable=True)
+        key = -data
+        if data.dtype.kind == "f":
+            key[np.isnan(data)] = -np.inf
+        expect2 = np.argsort(key, axis=axis, kind="stable")
+        np.testing.assert_array_equal(out2.numpy(), expect2)
+        paddle.enable_static()
+
+    def test_float_with_nan(self):
+        data = np.random.randn(3, 1000, 5).astype("float32")
+        data[:, ::7] = np.nan
+        data[:, ::11] = 0.5
+        self.check(data, 1)
+        self.check(data, -1)
+
+    def test_int64(self):
+        data = np.random.randint(-1000, 1000, (4, 2000)).astype("int64")
+        self.check(data, 1)
+        self.check(data, 0)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,136 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+import paddle.nn.functional as F
+
+
+def numpy_batch_norm_train(x, scale, bias, dy, axes, eps):
+    """Training forward output and gradients, statistics reduced over axes."""
+    shape = [1] * x.ndim
+    channel_axis = [i for i in range(x.ndim) if i not in axes][0]
+    shape[channel_axis] = -1
+    mean = x.mean(axis=axes, keepdims=True)
+    var = x.var(axis=axes, keepdims=True)
+    x_hat = (x - mean) / np.sqrt(var + eps)
+    y = x_hat * scale.reshape(shape) + bias.reshape(shape)
+    dbias = dy.sum(axis=axes)
+    dscale = (dy * x_hat).sum(axis=axes)
+    m = x.size / x.shape[channel_axis]
+    dx = (
+        scale.reshape(shape)
+        / np.sqrt(var + eps)
+        * (dy - dbias.reshape(shape) / m - x_hat * dscale.reshape(shape) / m)
+    )
+    return y, mean.reshape(-1), var.reshape(-1), dx, dscale, dbias
+
+
+class TestBatchNormOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+        self.eps = 1e-5
+        self.momentum = 0.9
+
+    def check_train(self, shape, data_format, dtype="float32"):
+        x_np = np.random.random(shape).astype(dtype) * 4 + 10
+        c = shape[-1] if data_format == "NHWC" else shape[1]
+        scale_np = np.random.random([c]).astype(dtype)
+        bias_np = np.random.random([c]).astype(dtype)
+        dy_np = np.random.random(shape).astype(dtype) - 0.5
+        x = paddle.to_tensor(x_np, stop_gradient=False)
+        scale = paddle.to_tensor(scale_np, stop_gradient=False)
+        bias = paddle.to_tensor(bias_np, stop_gradient=False)
+        running_mean = paddle.zeros([c], dtype)
+        running_var = paddle.ones([c], dtype)
+        y = F.batch_norm(
+            x,
+            running_mean,
+            running_var,
+            scale,
+            bias,
+            training=True,
+            momentum=self.momentum,
+            epsilon=self.eps,
+            data_format=data_format,
+        )
+        y.backward(paddle.to_tensor(dy_np))
+
+        axes = tuple(i for i in range(len(shape)) if i != shape.index(c))
+        if data_format == "NHWC":
+            axes = tuple(range(len(shape) - 1))
+        expect_y, mean, var, dx, dscale, dbias = numpy_batch_norm_train(
+            x_np, scale_np, bias_np, dy_np, axes, self.eps
+        )
+        np.testing.assert_allclose(y.numpy(), expect_y, rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(
+            running_mean.numpy(), (1 - self.momentum) * mean, rtol=1e-5
+        )
+        np.testing.assert_allclose(
+            running_var.numpy(),
+            self.momentum + (1 - self.momentum) * var,
+            rtol=1e-5,
+        )
+        np.testing.assert_allclose(x.grad.numpy(), dx, rtol=1e-3, atol=1e-4)
+        np.testing.assert_allclose(scale.grad.numpy(), dscale, rtol=1e-3, atol=1e-4)
+        np.testing.assert_allclose(bias.grad.numpy(), dbias, rtol=1e-4, atol=1e-4)
+
+    def test_train_nchw(self):
+        self.check_train([4, 8, 5, 6], "NCHW")
+        self.check_train([4, 8, 5, 6], "NCHW", "float64")
+
+    def test_train_nhwc(self):
+        self.check_train([4, 5, 6, 8], "NHWC")
+
+    def test_train_2d(self):
+        self.check_train([200, 8], "NCHW")
+
+    def test_inference(self):
+        x_np = np.random.random([2, 3, 4, 5]).astype("float32")
+        mean_np = np.random.random([3]).astype("float32")
+        var_np = np.random.random([3]).astype("float32") + 0.5
+        scale_np = np.random.random([3]).astype("float32")
+        bias_np = np.random.random([3]).astype("float32")
+        x = paddle.to_tensor(x_np, stop_gradient=False)
+        y = F.batch_norm(
+            x,
+            paddle.to_tensor(mean_np),
+            paddle.to_tensor(var_np),
+            paddle.to_tensor(scale_np),
+            paddle.to_tensor(bias_np),
+            training=False,
+            epsilon=self.eps,
+        )
+        shape = [1, 3, 1, 1]
+        inv_std = 1 / np.sqrt(var_np + self.eps)
+        expect = (x_np - mean_np.reshape(shape)) * (inv_std * scale_np).reshape(
+            shape
+        ) + bias_np.reshape(shape)
+        np.testing.assert_allclose(y.numpy(), expect, rtol=1e-5, atol=1e-6)
+        y.sum().backward()
+        np.testing.assert_allclose(
+            x.grad.numpy(),
+            np.broadcast_to((inv_std * scale_np).reshape(shape), x_np.shape),
+            rtol=1e-5,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -125,6 +125,43 @@ class TestCastOpError(unittest.TestCase):
             self.assertRaises(TypeError, paddle.cast, x1, "int32")
 
 
+class TestCastDygraph(unittest.TestCase):
+    def setUp(self):
+        self.place = paddle.CustomPlace("custom_cpu", 0)
+
+    def test_fp16_round_trip(self):
+        with base.dygraph.guard(self.place):
+            bits = np.arange(65536, dtype=np.uint16).view(np.float16)
+            out = paddle.to_tensor(bits).astype("float32").numpy()
+            np.testing.assert_array_equal(out, bits.astype(np.float32))
+            x = np.random.standard_normal(100000).astype("float32") * 1000
+            out = paddle.to_tensor(x).astype("float16").numpy()
+            np.testing.assert_array_equal(out, x.astype(np.float16))
+
+    def test_bf16_round_to_nearest_even(self):
+        with base.dygraph.guard(self.place):
+            # 1 + 2^-8 is a tie and rounds down to even, 1 + 3 * 2^-8 rounds up.
+            x = np.array([1 + 2**-8, 1 + 3 * 2**-8, -(1 + 2**-7)], "float32")
+            out = paddle.to_tensor(x).astype("bfloat16").astype("float32")
+            np.testing.assert_array_equal(
+                out.numpy(), np.array([1.0, 1 + 2**-6, -(1 + 2**-7)], "float32")
+            )
+
+    def test_exact_int64(self):
+        with base.dygraph.guard(self.place):
+            x = np.array([2**53 + 2, -(2**62) + 3], "int64")
+            out = paddle.to_tensor(x).astype("float64").numpy()
+            np.testing.assert_array_equal(out, x.astype("float64"))
+            out = paddle.to_tensor(x).astype("int32").numpy()
+            np.testing.assert_array_equal(out, x.astype("int32"))
+
+    def test_saturate_to_int8(self):
+        with base.dygraph.guard(self.place):
+            x = np.array([300.5, -300.5, 127.9, -3.7, np.nan], "float32")
+            out = paddle.to_tensor(x).astype("int8").numpy()
+            np.testing.assert_array_equal(out, np.array([127, -128, 127, -3, 0]))
+
+
 if __name__ == "__main__":
     paddle.enable_static()
     unittest.main()
@@ -0,0 +1,153 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+import paddle.nn.functional as F
+
+
+def im2col(x, kh, kw, stride, pad, dilation, out_hw):
+    n, c = x.shape[:2]
+    xp = np.pad(
+        x,
+        (
+            (0, 0),
+            (0, 0),
+            (pad[0], pad[0] + kh * dilation),
+            (pad[1], pad[1] + kw * dilation),
+        ),
+    )
+    cols = np.zeros([n, c, kh, kw, out_hw[0], out_hw[1]], x.dtype)
+    for i in range(kh):
+        for j in range(kw):
+            h0, w0 = i * dilation, j * dilation
+            cols[:, :, i, j] = xp[
+                :,
+                :,
+                h0 : h0 + stride * out_hw[0] : stride,
+                w0 : w0 + stride * out_hw[1] : stride,
+            ]
+    return cols.reshape(n, c * kh * kw, -1), xp.shape
+
+
+def numpy_conv2d(x, w, dout, stride, pad, dilation, groups):
+    """Forward output and the gradients of x and w for a given dout."""
+    n, c, h, width = x.shape
+    oc, icg, kh, kw = w.shape
+    out_h = (h + 2 * pad[0] - dilation * (kh - 1) - 1) // stride + 1
+    out_w = (width + 2 * pad[1] - dilation * (kw - 1) - 1) // stride + 1
+    ocg = oc // groups
+    out = np.zeros([n, oc, out_h * out_w], x.dtype)
+    dx = np.zeros_like(x)
+    dw = np.zeros_like(w)
+    for g in range(groups):
+        xg = x[:, g * icg : (g + 1) * icg]
+        cols, padded_shape = im2col(xg, kh, kw, stride, pad, dilation, [out_h, out_w])
+        wg = w[g * ocg : (g + 1) * ocg].reshape(ocg, -1)
+        dg = dout[:, g * ocg : (g + 1) * ocg].reshape(n, ocg, -1)
+        out[:, g * ocg : (g + 1) * ocg] = np.einsum("ok,nkp->nop", wg, cols)
+        dw[g * ocg : (g + 1) * ocg] = np.einsum("nop,nkp->ok", dg, cols).reshape(
+            ocg, icg, kh, kw
+        )
+        dcols = np.einsum("ok,nop->nkp", wg, dg).reshape(n, icg, kh, kw, out_h, out_w)
+        dxp = np.zeros(padded_shape, x.dtype)
+        for i in range(kh):
+            for j in range(kw):
+                h0, w0 = i * dilation, j * dilation
+                dxp[
+                    :,
+                    :,
+                    h0 : h0 + stride * out_h : stride,
+                    w0 : w0 + stride * out_w : stride,
+                ] += dcols[:, :, i, j]
+        dx[:, g * icg : (g + 1) * icg] = dxp[
+            :, :, pad[0] : pad[0] + h, pad[1] : pad[1] + width
+        ]
+    return out.reshape(n, oc, out_h, out_w), dx, dw
+
+
+class TestConv2DOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+
+    def check(
+        self,
+        x_shape,
+        w_shape,
+        stride=1,
+        pad=(0, 0),
+        dilation=1,
+        groups=1,
+        data_format="NCHW",
+        dtype="float32",
+    ):
+        x_np = np.random.random(x_shape).astype(dtype) - 0.5
+        w_np = np.random.random(w_shape).astype(dtype) - 0.5
+        x_in = x_np.transpose(0, 2, 3, 1).copy() if data_format == "NHWC" else x_np
+        x = paddle.to_tensor(x_in, stop_gradient=False)
+        w = paddle.to_tensor(w_np, stop_gradient=False)
+        out = F.conv2d(
+            x,
+            w,
+            stride=stride,
+            padding=list(pad),
+            dilation=dilation,
+            groups=groups,
+            data_format=data_format,
+        )
+        dout_np = np.random.random(out.shape).astype(dtype)
+        out.backward(paddle.to_tensor(dout_np))
+
+        if data_format == "NHWC":
+            dout_np = dout_np.transpose(0, 3, 1, 2)
+        expect_out, expect_dx, expect_dw = numpy_conv2d(
+            x_np, w_np, dout_np, stride, pad, dilation, groups
+        )
+        out_np, dx_np = out.numpy(), x.grad.numpy()
+        if data_format == "NHWC":
+            out_np = out_np.transpose(0, 3, 1, 2)
+            dx_np = dx_np.transpose(0, 3, 1, 2)
+        np.testing.assert_allclose(out_np, expect_out, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(dx_np, expect_dx, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(w.grad.numpy(), expect_dw, rtol=1e-4, atol=1e-4)
+
+    def test_winograd_3x3(self):
+        self.check([2, 16, 9, 7], [32, 16, 3, 3], pad=(1, 1))
+        self.check([1, 24, 8, 8], [16, 24, 3, 3])
+
+    def test_im2col(self):
+        self.check([2, 3, 10, 11], [8, 3, 3, 3], stride=2, pad=(1, 0))
+        self.check([2, 4, 9, 9], [6, 2, 3, 3], dilation=2, groups=2)
+        self.check([2, 3, 10, 11], [8, 3, 5, 5], pad=(2, 2), dtype="float64")
+
+    def test_pointwise(self):
+        self.check([3, 8, 6, 5], [12, 8, 1, 1])
+
+    def test_depthwise(self):
+        self.check([2, 6, 8, 8], [12, 1, 3, 3], stride=2, pad=(1, 1), groups=6)
+
+    def test_nhwc(self):
+        self.check([2, 16, 7, 6], [16, 16, 3, 3], pad=(1, 1), data_format="NHWC")
+        self.check([2, 6, 7, 6], [6, 1, 3, 3], pad=(1, 1), groups=6, data_format="NHWC")
+
+
+if __name__ == "__main__":
+    unittest.main()
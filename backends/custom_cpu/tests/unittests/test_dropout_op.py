@@ -0,0 +1,63 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+import paddle.nn.functional as F
+
+
+class TestDropoutOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+
+    def test_upscale_in_train(self):
+        x = paddle.ones([1000, 1000])
+        x.stop_gradient = False
+        out = F.dropout(x, 0.3)
+        out.sum().backward()
+        out_np = out.numpy()
+        kept = out_np != 0
+        self.assertAlmostEqual(kept.mean(), 0.7, delta=0.01)
+        np.testing.assert_allclose(out_np[kept], 1 / 0.7, rtol=1e-6)
+        np.testing.assert_array_equal(x.grad.numpy(), out_np)
+
+    def test_downscale_in_infer(self):
+        x = paddle.ones([256, 256])
+        out = F.dropout(x, 0.25, mode="downscale_in_infer")
+        self.assertEqual(set(np.unique(out.numpy())), {0.0, 1.0})
+        out = F.dropout(x, 0.25, training=False, mode="downscale_in_infer")
+        np.testing.assert_allclose(out.numpy(), 0.75)
+
+    def test_extreme_probabilities(self):
+        x = paddle.rand([64, 64])
+        np.testing.assert_array_equal(F.dropout(x, 0.0).numpy(), x.numpy())
+        np.testing.assert_array_equal(F.dropout(x, 1.0).numpy(), 0)
+
+    def test_seed(self):
+        x = paddle.ones([4099])
+        paddle.seed(2024)
+        first = F.dropout(x, 0.5).numpy()
+        second = F.dropout(x, 0.5).numpy()
+        paddle.seed(2024)
+        np.testing.assert_array_equal(F.dropout(x, 0.5).numpy(), first)
+        self.assertFalse((first == second).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#  Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+
+from op_test import OpTest
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+class ElementwiseAddOp(OpTest):
+    def setUp(self):
+        self.op_type = "elementwise_add"
+        self.python_api = paddle.add
+        self.dtype = np.float32
+        self.axis = -1
+        self.init_dtype()
+        self.init_input_output()
+        self.init_axis()
+
+        self.inputs = {
+            "X": OpTest.np_dtype_to_base_dtype(self.x),
+            "Y": OpTest.np_dtype_to_base_dtype(self.y),
+        }
+        self.outputs = {"Out": self.out}
+        self.attrs = {"axis": self.axis}
+
+    def test_check_output(self):
+        self.check_output()
+
+    def init_input_output(self):
+        self.x = np.random.uniform(0.1, 1, [13, 17]).astype(self.dtype)
+        self.y = np.random.uniform(0.1, 1, [13, 17]).astype(self.dtype)
+        self.out = np.add(self.x, self.y)
+
+    def init_dtype(self):
+        pass
+
+    def init_axis(self):
+        pass
+
+
+class TestElementwiseAddOp_float64(ElementwiseAddOp):
+    def init_dtype(self):
+        self.dtype = np.float64
+
+
+class TestElementwiseAddOp_int64(ElementwiseAddOp):
+    def init_input_output(self):
+        self.x = np.random.randint(-100, 100, [13, 17]).astype(np.int64)
+        self.y = np.random.randint(-100, 100, [13, 17]).astype(np.int64)
+        self.out = np.add(self.x, self.y)
+
+
+class TestElementwiseAddOp_scalar(ElementwiseAddOp):
+    def init_input_output(self):
+        self.x = np.random.rand(10, 3, 4).astype(self.dtype)
+        self.y = np.random.rand(1).astype(self.dtype)
+        self.out = self.x + self.y
+
+
+class TestElementwiseAddOp_bias(ElementwiseAddOp):
+    def init_input_output(self):
+        self.x = np.random.rand(4, 16, 64).astype(self.dtype)
+        self.y = np.random.rand(64).astype(self.dtype)
+        self.out = self.x + self.y
+
+
+class TestElementwiseAddOp_broadcast_axis(ElementwiseAddOp):
+    def init_input_output(self):
+        self.x = np.random.rand(2, 10, 12, 3).astype(self.dtype)
+        self.y = np.random.rand(10, 12).astype(self.dtype)
+        self.out = self.x + self.y.reshape(1, 10, 12, 1)
+
+    def init_axis(self):
+        self.axis = 1
+
+
+class TestElementwiseAddOp_broadcast_both(ElementwiseAddOp):
+    def init_input_output(self):
+        self.x = np.random.rand(8, 1, 5).astype(self.dtype)
+        self.y = np.random.rand(1, 6, 5).astype(self.dtype)
+        self.out = self.x + self.y
+
+
+class TestElementwiseAddOp_middle_dim(ElementwiseAddOp):
+    def init_input_output(self):
+        self.x = np.random.rand(10, 4, 2, 3).astype(self.dtype)
+        self.y = np.random.rand(10, 4, 1, 3).astype(self.dtype)
+        self.out = self.x + self.y
+
+
+if __name__ == "__main__":
+    unittest.main()
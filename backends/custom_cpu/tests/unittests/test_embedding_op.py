@@ -0,0 +1,62 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+
+
+class TestEmbeddingOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+
+    def check(self, vocab, width, ids, padding_idx=None, dtype="float32"):
+        w = np.random.random([vocab, width]).astype(dtype)
+        weight = paddle.to_tensor(w, stop_gradient=False)
+        out = paddle.nn.functional.embedding(
+            paddle.to_tensor(ids), weight, padding_idx=padding_idx
+        )
+        expect = w[ids]
+        if padding_idx is not None:
+            expect[ids == padding_idx] = 0
+        np.testing.assert_array_equal(out.numpy(), expect)
+
+        dout = np.random.random(out.shape).astype(dtype)
+        (dw,) = paddle.grad([out], [weight], [paddle.to_tensor(dout)])
+        expect = np.zeros_like(w)
+        np.add.at(expect, ids.reshape([-1]), dout.reshape([-1, width]))
+        if padding_idx is not None:
+            expect[padding_idx] = 0
+        np.testing.assert_allclose(dw.numpy(), expect, rtol=1e-5)
+
+    def test_embedding(self):
+        ids = np.random.randint(0, 50, [8, 16]).astype("int64")
+        self.check(50, 32, ids)
+        self.check(50, 7, ids.astype("int32"), dtype="float64")
+
+    def test_repeated_ids(self):
+        self.check(1000, 16, np.array([[3, 3, 3], [999, 3, 0]], "int64"))
+
+    def test_padding_idx(self):
+        ids = np.array([[1, 2, 0], [2, 2, 4]], "int64")
+        self.check(5, 4, ids, padding_idx=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+from paddle.base import core
+from paddle.base.layer_helper import LayerHelper
+
+import paddle_custom_device.custom_cpu.passes as passes
+
+
+def legacy_unary(op_type, x):
+    """Appends a unary op to a legacy program. The python APIs of these ops
+    only build PIR programs in Paddle 3.x."""
+    helper = LayerHelper(op_type)
+    out = helper.create_variable_for_type_inference(x.dtype)
+    helper.append_op(type=op_type, inputs={"X": [x]}, outputs={"Out": [out]})
+    return out
+
+
+def run_fused(op, feed):
+    """Runs a fused_elementwise op of a static program eagerly."""
+    paddle.disable_static()
+    paddle.set_device("custom_cpu")
+    inputs = [paddle.to_tensor(feed[name]) for name in op.input("X@VECTOR")]
+    (out,) = core.eager._run_custom_op(
+        "fused_elementwise",
+        inputs,
+        op.attr("program"),
+        op.attr("constants"),
+        op.attr("out_dtype"),
+    )
+    paddle.enable_static()
+    return out.numpy()
+
+
+class TestFusedElementwisePass(unittest.TestCase):
+    def setUp(self):
+        passes.setUp()
+        paddle.enable_static()
+        np.random.seed(2024)
+        # The pass rewrites legacy programs.
+        self.old_ir_guard = paddle.pir_utils.OldIrGuard()
+        self.old_ir_guard.__enter__()
+
+    def tearDown(self):
+        self.old_ir_guard.__exit__(None, None, None)
+        paddle.disable_static()
+
+    def build(self):
+        main = paddle.static.Program()
+        with paddle.static.program_guard(main, paddle.static.Program()):
+            x = paddle.static.data("x", [-1, 8], "float32")
+            y = paddle.static.data("y", [8], "float32")
+            z = paddle.static.data("z", [-1, 1], "float32")
+            a = paddle.nn.functional.relu(paddle.scale(x, 2.0, bias=0.5) * y - z)
+            b = paddle.cast(x > z, "float32") * y
+        return main, a.name, b.name
+
+    def test_fuse_chains(self):
+        main, a, b = self.build()
+        self.assertEqual(passes.custom_cpu_fuse_elementwise(main), 2)
+        ops = main.global_block().ops
+        self.assertEqual([op.type for op in ops], ["fused_elementwise"] * 2)
+        self.assertEqual([op.output("Out")[0] for op in ops], [a, b])
+
+        feed = {
+            "x": np.random.uniform(-1, 1, [5, 8]).astype("float32"),
+            "y": np.random.uniform(-1, 1, [8]).astype("float32"),
+            "z": np.random.uniform(-1, 1, [5, 1]).astype("float32"),
+        }
+        expect_a = np.maximum((feed["x"] * 2 + 0.5) * feed["y"] - feed["z"], 0)
+        expect_b = (feed["x"] > feed["z"]).astype("float32") * feed["y"]
+        np.testing.assert_allclose(run_fused(ops[0], feed), expect_a, rtol=1e-6)
+        np.testing.assert_array_equal(run_fused(ops[1], feed), expect_b)
+
+    def test_keep_vars(self):
+        main = paddle.static.Program()
+        with paddle.static.program_guard(main, paddle.static.Program()):
+            x = paddle.static.data("x", [4], "float32")
+            a = x * x
+            b = legacy_unary("exp", a)
+            c = legacy_unary("tanh", a)
+            d = legacy_unary("sigmoid", b + 1.0)
+        # a is read twice, so it stays materialized and only
+        # exp -> + 1 -> sigmoid is fused.
+        self.assertEqual(passes.custom_cpu_fuse_elementwise(main), 1)
+        types = [op.type for op in main.global_block().ops]
+        self.assertEqual(types, ["elementwise_mul", "tanh", "fused_elementwise"])
+
+        main = paddle.static.Program()
+        with paddle.static.program_guard(main, paddle.static.Program()):
+            x = paddle.static.data("x", [4], "float32")
+            a = legacy_unary("abs", x)
+            b = legacy_unary("sqrt", a)
+        self.assertEqual(
+            passes.custom_cpu_fuse_elementwise(main, skip_vars=[a.name]), 0
+        )
+
+    def test_mixed_float_types(self):
+        main = paddle.static.Program()
+        with paddle.static.program_guard(main, paddle.static.Program()):
+            x = paddle.static.data("x", [4], "float32")
+            y = paddle.static.data("y", [4], "float64")
+            a = paddle.cast(legacy_unary("exp", x), "float64") + y
+        self.assertEqual(passes.custom_cpu_fuse_elementwise(main), 0)
+
+    def test_pir_program(self):
+        self.old_ir_guard.__exit__(None, None, None)
+        try:
+            main = paddle.static.Program()
+            with paddle.static.program_guard(main, paddle.static.Program()):
+                x = paddle.static.data("x", [4], "float32")
+                y = paddle.exp(x) + 1.0
+            with self.assertRaises(TypeError):
+                passes.custom_cpu_fuse_elementwise(main)
+        finally:
+            self.old_ir_guard.__enter__()
+
+
+class TestFusedElementwiseOp(unittest.TestCase):
+    def setUp(self):
+        passes.setUp()
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+
+    def run_op(self, inputs, program, constants, out_dtype):
+        (out,) = core.eager._run_custom_op(
+            "fused_elementwise",
+            [paddle.to_tensor(x) for x in inputs],
+            program,
+            constants,
+            out_dtype,
+        )
+        return out.numpy()
+
+    def test_broadcast_bool(self):
+        x = np.random.random([3, 1, 4]).astype("float64")
+        y = np.random.random([5, 1]).astype("float64")
+        mask = np.random.random([4]) > 0.5
+        # (x - y) * mask >= 0.1
+        out = self.run_op(
+            [x, y, mask], [0, 0, 0, 1, 3, 0, 0, 2, 4, 0, 1, 0, 14, 0], [0.1], "bool"
+        )
+        self.assertEqual(out.dtype, np.bool_)
+        np.testing.assert_array_equal(out, (x - y) * mask >= 0.1)
+
+    def test_large(self):
+        x = np.random.random([3, 100000]).astype("float32")
+        y = np.random.random([100000]).astype("float32")
+        # max(x, y) / (1 + min(x, y) ** 2)
+        program = [0, 0, 0, 1, 6, 0, 1, 0, 0, 0, 0, 1, 7, 0, 1, 1, 8, 0, 2, 0, 5, 0]
+        out = self.run_op([x, y], program, [1.0, 2.0], "float32")
+        expect = np.maximum(x, y) / (1 + np.minimum(x, y) ** 2)
+        np.testing.assert_allclose(out, expect, rtol=1e-6)
+
+    def test_malformed_program(self):
+        x = np.ones([2], "float32")
+        with self.assertRaises(OSError):
+            self.run_op([x], [0, 0, 2, 0], [], "float32")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+
+
+def grad_of(fn, x, *args):
+    x = paddle.to_tensor(x, stop_gradient=False)
+    out = fn(x, *args)
+    dout = np.random.random(out.shape).astype(x.numpy().dtype)
+    (dx,) = paddle.grad([out], [x], [paddle.to_tensor(dout)])
+    return out.numpy(), dout, dx.numpy()
+
+
+class TestGatherOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+
+    def test_gather(self):
+        x = np.random.random([4, 5, 6]).astype("float32")
+        for axis in [0, 1, -1]:
+            for dtype in ["int32", "int64"]:
+                index = np.array([3, 0, 3, 1], dtype)
+                out, dout, dx = grad_of(
+                    lambda t, i: paddle.gather(t, i, axis=axis),
+                    x,
+                    paddle.to_tensor(index),
+                )
+                np.testing.assert_array_equal(out, np.take(x, index, axis=axis))
+                # Repeated rows accumulate their gradients.
+                expect = np.zeros_like(x)
+                for k, row in enumerate(index):
+                    src = np.take(dout, [k], axis=axis)
+                    dst = [slice(None)] * x.ndim
+                    dst[axis] = slice(row, row + 1)
+                    expect[tuple(dst)] += src
+                np.testing.assert_allclose(dx, expect, rtol=1e-6)
+
+    def test_gather_int64(self):
+        x = np.arange(24).reshape([6, 4]).astype("int64")
+        index = paddle.to_tensor(np.array([5, 2], "int64"))
+        out = paddle.gather(paddle.to_tensor(x), index)
+        np.testing.assert_array_equal(out.numpy(), x[[5, 2]])
+
+    def test_gather_nd(self):
+        x = np.random.random([4, 5, 6]).astype("float64")
+        index = np.array([[[0, 4], [3, 2]], [[3, 2], [1, 1]]], "int64")
+        out, dout, dx = grad_of(paddle.gather_nd, x, paddle.to_tensor(index))
+        np.testing.assert_array_equal(out, x[index[..., 0], index[..., 1]])
+        expect = np.zeros_like(x)
+        np.add.at(expect, (index[..., 0], index[..., 1]), dout)
+        np.testing.assert_allclose(dx, expect, rtol=1e-12)
+
+    def test_index_select(self):
+        x = np.random.random([3, 7, 2]).astype("float32")
+        index = np.array([6, 0, 6, 6], "int64")
+        out, dout, dx = grad_of(
+            lambda t, i: paddle.index_select(t, i, axis=1),
+            x,
+            paddle.to_tensor(index),
+        )
+        np.testing.assert_array_equal(out, x[:, index])
+        expect = np.zeros_like(x)
+        np.add.at(expect, (slice(None), index), dout)
+        np.testing.assert_allclose(dx, expect, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
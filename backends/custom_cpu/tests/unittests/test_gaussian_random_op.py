@@ -0,0 +1,58 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+
+
+class TestGaussianRandomOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+
+    def check_moments(self, dtype):
+        out = paddle.normal(1.5, 2.0, [1000, 1000]).astype(dtype).numpy()
+        out = out.astype("float64")
+        self.assertTrue(np.isfinite(out).all())
+        self.assertAlmostEqual(out.mean(), 1.5, delta=0.01)
+        self.assertAlmostEqual(out.std(), 2.0, delta=0.01)
+        # P(|z| < 1) of a standard normal
+        inside = np.abs(out - 1.5) < 2.0
+        self.assertAlmostEqual(inside.mean(), 0.6827, delta=0.005)
+
+    def test_float32(self):
+        self.check_moments("float32")
+
+    def test_float64(self):
+        paddle.set_default_dtype("float64")
+        try:
+            self.check_moments("float64")
+        finally:
+            paddle.set_default_dtype("float32")
+
+    def test_seed(self):
+        paddle.seed(7)
+        first = paddle.randn([1001]).numpy()
+        second = paddle.randn([1001]).numpy()
+        paddle.seed(7)
+        np.testing.assert_array_equal(paddle.randn([1001]).numpy(), first)
+        self.assertFalse((first == second).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
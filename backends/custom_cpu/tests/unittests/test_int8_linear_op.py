@@ -0,0 +1,92 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+from paddle.base import core
+
+import paddle_custom_device.custom_cpu.passes as passes
+
+
+def quantize(x, scale):
+    return np.clip(np.round(x * scale), -128, 127).astype("int8")
+
+
+def int8_linear(x, w, w_scale, x_scale):
+    (out,) = core.eager._run_custom_op(
+        "int8_linear",
+        paddle.to_tensor(x),
+        paddle.to_tensor(w),
+        paddle.to_tensor(w_scale),
+        x_scale,
+    )
+    return out.numpy()
+
+
+class TestInt8Linear(unittest.TestCase):
+    def setUp(self):
+        passes.setUp()
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+        self.w = np.random.uniform(-1, 1, [96, 40]).astype("float32")
+        # Per output channel scales.
+        self.w_scale = (127 / np.abs(self.w).max(0)).astype("float32")
+        self.w_q = quantize(self.w, self.w_scale)
+
+    def expect(self, x_q, x_scale):
+        acc = x_q.astype("int32") @ self.w_q.astype("int32")
+        return acc.astype("float32") / (x_scale * self.w_scale)
+
+    def test_int8_input(self):
+        for shape in ([1, 96], [5, 96], [2, 33, 96]):
+            x_q = np.random.randint(-128, 128, shape).astype("int8")
+            out = int8_linear(x_q, self.w_q, self.w_scale, 20.0)
+            self.assertEqual(list(out.shape), shape[:-1] + [40])
+            np.testing.assert_allclose(out, self.expect(x_q, 20.0), rtol=1e-6)
+
+    def test_float_input(self):
+        x = np.random.uniform(-2, 2, [17, 96]).astype("float32")
+        out = int8_linear(x, self.w_q, self.w_scale, 50.0)
+        np.testing.assert_allclose(out, self.expect(quantize(x, 50.0), 50.0), rtol=1e-6)
+        # The quantized product stays close to the float32 one.
+        np.testing.assert_allclose(out, x @ self.w, atol=0.15)
+
+    def test_dynamic_scale(self):
+        x = np.random.uniform(-3, 3, [9, 96]).astype("float32")
+        x_scale = np.float32(127) / np.abs(x).max()
+        out = int8_linear(x, self.w_q, self.w_scale, 0.0)
+        np.testing.assert_allclose(
+            out, self.expect(quantize(x, x_scale), x_scale), rtol=1e-5
+        )
+
+    def test_shape_mismatch(self):
+        x_q = np.zeros([3, 95], "int8")
+        with self.assertRaises(OSError):
+            int8_linear(x_q, self.w_q, self.w_scale, 1.0)
+
+    def test_reduction_too_long(self):
+        # K = 2^17 can overflow the int32 accumulator.
+        x_q = np.zeros([1, 1 << 17], "int8")
+        w_q = np.zeros([1 << 17, 2], "int8")
+        with self.assertRaises(OSError):
+            int8_linear(x_q, w_q, self.w_scale[:2], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
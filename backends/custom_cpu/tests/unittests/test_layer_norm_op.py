@@ -0,0 +1,87 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+import paddle.nn.functional as F
+
+
+def numpy_layer_norm(x, scale, bias, dy, begin_norm_axis, eps):
+    rows = int(np.prod(x.shape[:begin_norm_axis]))
+    x2 = x.reshape(rows, -1).astype("float64")
+    dy2 = dy.reshape(rows, -1).astype("float64")
+    mean = x2.mean(axis=1, keepdims=True)
+    inv_std = 1 / np.sqrt(x2.var(axis=1, keepdims=True) + eps)
+    x_hat = (x2 - mean) * inv_std
+    y = x_hat * scale + bias
+    g = dy2 * scale
+    dx = inv_std * (
+        g
+        - g.mean(axis=1, keepdims=True)
+        - x_hat * (g * x_hat).mean(axis=1, keepdims=True)
+    )
+    dscale = (dy2 * x_hat).sum(axis=0)
+    dbias = dy2.sum(axis=0)
+    return y.reshape(x.shape), dx.reshape(x.shape), dscale, dbias
+
+
+class TestLayerNormOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+        self.eps = 1e-5
+
+    def check(self, shape, begin_norm_axis, dtype="float32"):
+        x_np = np.random.random(shape).astype(dtype) + 3
+        cols = int(np.prod(shape[begin_norm_axis:]))
+        scale_np = np.random.random([cols]).astype(dtype)
+        bias_np = np.random.random([cols]).astype(dtype)
+        dy_np = np.random.random(shape).astype(dtype) - 0.5
+        x = paddle.to_tensor(x_np, stop_gradient=False)
+        scale = paddle.to_tensor(scale_np, stop_gradient=False)
+        bias = paddle.to_tensor(bias_np, stop_gradient=False)
+        y = F.layer_norm(x, shape[begin_norm_axis:], scale, bias, self.eps)
+        y.backward(paddle.to_tensor(dy_np))
+
+        expect_y, dx, dscale, dbias = numpy_layer_norm(
+            x_np, scale_np, bias_np, dy_np, begin_norm_axis, self.eps
+        )
+        np.testing.assert_allclose(y.numpy(), expect_y, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(x.grad.numpy(), dx, rtol=1e-3, atol=1e-4)
+        np.testing.assert_allclose(scale.grad.numpy(), dscale, rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(bias.grad.numpy(), dbias, rtol=1e-4, atol=1e-4)
+
+    def test_last_axis(self):
+        self.check([16, 10, 64], 2)
+        self.check([300, 48], 1, "float64")
+
+    def test_multiple_axes(self):
+        self.check([6, 10, 24], 1)
+
+    def test_no_affine(self):
+        x_np = np.random.random([8, 32]).astype("float32")
+        y = F.layer_norm(paddle.to_tensor(x_np), 32, epsilon=self.eps)
+        expect = (x_np - x_np.mean(1, keepdims=True)) / np.sqrt(
+            x_np.var(1, keepdims=True) + self.eps
+        )
+        np.testing.assert_allclose(y.numpy(), expect, rtol=1e-4, atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
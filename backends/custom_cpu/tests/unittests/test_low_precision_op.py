@@ -0,0 +1,106 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+
+# Results are rounded once to the storage type, so they are within half an
+# ulp of the float32 result computed from the same (rounded) inputs.
+RTOL = {"float16": 1e-3, "bfloat16": 8e-3}
+
+
+class TestLowPrecisionOps(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+
+    def rand(self, shape, dtype):
+        """Returns the low precision tensor and its value in float32."""
+        x = paddle.cast(
+            paddle.to_tensor(np.random.uniform(-1, 1, shape).astype("float32")),
+            dtype,
+        )
+        return x, paddle.cast(x, "float32").numpy()
+
+    def check(self, out, expect, dtype, atol=0):
+        self.assertEqual(out.dtype, getattr(paddle, dtype))
+        np.testing.assert_allclose(
+            paddle.cast(out, "float32").numpy(),
+            expect,
+            rtol=RTOL[dtype],
+            atol=atol,
+        )
+
+    def test_elementwise(self):
+        for dtype in RTOL:
+            x, xf = self.rand([4, 33, 16], dtype)
+            y, yf = self.rand([16], dtype)
+            self.check(paddle.add(x, y), xf + yf, dtype, atol=1e-6)
+            # Small products are float16 subnormals, with fewer digits.
+            self.check(paddle.multiply(x, y), xf * yf, dtype, atol=1e-6)
+            self.check(paddle.maximum(x, y), np.maximum(xf, yf), dtype)
+
+    def test_matmul(self):
+        for dtype in RTOL:
+            x, xf = self.rand([3, 20, 70], dtype)
+            y, yf = self.rand([70, 24], dtype)
+            self.check(paddle.matmul(x, y), xf @ yf, dtype, atol=1e-2)
+            v, vf = self.rand([70], dtype)
+            self.check(paddle.matmul(x, v), xf @ vf, dtype, atol=1e-2)
+
+    def test_matmul_grad(self):
+        for dtype in RTOL:
+            x, xf = self.rand([16, 40], dtype)
+            y, yf = self.rand([40, 8], dtype)
+            x.stop_gradient = False
+            y.stop_gradient = False
+            paddle.matmul(x, y).sum().backward()
+            self.check(x.grad, np.tile(yf.sum(1), [16, 1]), dtype, atol=1e-2)
+            self.check(y.grad, np.tile(xf.sum(0)[:, None], [1, 8]), dtype, atol=1e-2)
+
+    def test_softmax(self):
+        for dtype in RTOL:
+            for shape, axis in (([7, 300], -1), ([4, 50, 6], 1)):
+                x, xf = self.rand(shape, dtype)
+                x.stop_gradient = False
+                e = np.exp(xf - xf.max(axis, keepdims=True))
+                expect = e / e.sum(axis, keepdims=True)
+                out = paddle.nn.functional.softmax(x, axis=axis)
+                self.check(out, expect, dtype, atol=1e-4)
+
+                dy, dyf = self.rand(shape, dtype)
+                (dx,) = paddle.grad(out, x, dy)
+                yf = paddle.cast(out, "float32").numpy()
+                expect_dx = yf * (dyf - (yf * dyf).sum(axis, keepdims=True))
+                self.check(dx, expect_dx, dtype, atol=1e-3)
+
+    def test_reduce(self):
+        for dtype in RTOL:
+            x, xf = self.rand([6, 1000], dtype)
+            # The sum accumulates in float, only the result is rounded.
+            self.check(paddle.sum(x, axis=-1), xf.sum(-1), dtype, atol=1e-2)
+            self.check(paddle.sum(x), xf.sum(), dtype, atol=1e-1)
+            self.check(paddle.mean(x, axis=0), xf.mean(0), dtype, atol=1e-3)
+            self.check(paddle.mean(x), xf.mean(), dtype, atol=1e-3)
+            self.check(paddle.max(x, axis=-1), xf.max(-1), dtype)
+            self.check(paddle.min(x, axis=0), xf.min(0), dtype)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+import paddle.nn.functional as F
+
+
+def pool_windows(size, out_size, kernel, stride, pad, adaptive):
+    """Clamped windows along one axis and the divisor of a non-exclusive avg."""
+    windows = []
+    for o in range(out_size):
+        if adaptive:
+            begin, end = o * size // out_size, -(-(o + 1) * size // out_size)
+            windows.append((begin, end, end - begin))
+        else:
+            start = o * stride - pad
+            stop = min(start + kernel, size + pad)
+            windows.append((max(start, 0), min(stop, size), stop - start))
+    return windows
+
+
+def numpy_pool2d(x, out_hw, kernel, stride, pad, pool_type, exclusive, adaptive):
+    """Pooled output and the gradient of its sum with respect to x."""
+    n, c = x.shape[:2]
+    out = np.zeros([n, c] + list(out_hw), x.dtype)
+    dx = np.zeros_like(x)
+    rows = pool_windows(x.shape[2], out_hw[0], kernel[0], stride[0], pad[0], adaptive)
+    cols = pool_windows(x.shape[3], out_hw[1], kernel[1], stride[1], pad[1], adaptive)
+    for i, (h0, h1, hn) in enumerate(rows):
+        for j, (w0, w1, wn) in enumerate(cols):
+            window = x[:, :, h0:h1, w0:w1]
+            if pool_type == "max":
+                out[:, :, i, j] = window.max(axis=(2, 3))
+                flat = window.reshape(n, c, -1).argmax(axis=2)
+                for b in range(n):
+                    for ch in range(c):
+                        h, w = divmod(flat[b, ch], w1 - w0)
+                        dx[b, ch, h0 + h, w0 + w] += 1
+            else:
+                count = (h1 - h0) * (w1 - w0) if exclusive or adaptive else hn * wn
+                out[:, :, i, j] = window.sum(axis=(2, 3)) / count
+                dx[:, :, h0:h1, w0:w1] += 1.0 / count
+    return out, dx
+
+
+class TestPool2DOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+        # Distinct values, so the max of every window is unique.
+        self.x_np = (
+            np.random.permutation(2 * 3 * 9 * 7).reshape([2, 3, 9, 7]).astype("float32")
+        )
+
+    def check(self, pool_type, kernel, stride, pad, **kwargs):
+        x = paddle.to_tensor(self.x_np, stop_gradient=False)
+        pool = F.max_pool2d if pool_type == "max" else F.avg_pool2d
+        out = pool(x, kernel, stride, pad, **kwargs)
+        expect, expect_dx = numpy_pool2d(
+            self.x_np,
+            out.shape[2:],
+            [kernel] * 2,
+            [stride] * 2,
+            [pad] * 2,
+            pool_type,
+            kwargs.get("exclusive", True),
+            False,
+        )
+        np.testing.assert_allclose(out.numpy(), expect, rtol=1e-6)
+        out.sum().backward()
+        np.testing.assert_allclose(x.grad.numpy(), expect_dx, rtol=1e-6)
+
+    def test_max(self):
+        self.check("max", 3, 2, 1)
+        self.check("max", 2, 2, 0, ceil_mode=True)
+
+    def test_avg(self):
+        self.check("avg", 3, 2, 1)
+        self.check("avg", 3, 2, 1, exclusive=False)
+        self.check("avg", 2, 2, 0, ceil_mode=True, exclusive=False)
+
+    def test_adaptive(self):
+        x = paddle.to_tensor(self.x_np, stop_gradient=False)
+        out = F.adaptive_avg_pool2d(x, [4, 3])
+        expect, expect_dx = numpy_pool2d(
+            self.x_np, [4, 3], [0, 0], [1, 1], [0, 0], "avg", True, True
+        )
+        np.testing.assert_allclose(out.numpy(), expect, rtol=1e-6)
+        out.sum().backward()
+        np.testing.assert_allclose(x.grad.numpy(), expect_dx, rtol=1e-6)
+        out = F.adaptive_max_pool2d(paddle.to_tensor(self.x_np), 1)
+        np.testing.assert_allclose(
+            out.numpy(), self.x_np.max(axis=(2, 3), keepdims=True)
+        )
+
+    def test_nhwc(self):
+        x_nhwc = paddle.to_tensor(self.x_np.transpose(0, 2, 3, 1).copy())
+        out = F.max_pool2d(x_nhwc, 3, 2, 1, data_format="NHWC")
+        expect, _ = numpy_pool2d(
+            self.x_np, [5, 4], [3, 3], [2, 2], [1, 1], "max", True, False
+        )
+        np.testing.assert_allclose(out.numpy().transpose(0, 3, 1, 2), expect)
+
+
+if __name__ == "__main__":
+    unittest.main()
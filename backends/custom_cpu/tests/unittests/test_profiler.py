@@ -0,0 +1,76 @@
+#  Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import json
+import os
+import tempfile
+import unittest
+
+# Also write the spans of the plugin as a Chrome trace, read when the plugin
+# profiler is first started.
+TRACE_DIR = tempfile.mkdtemp()
+PLUGIN_TRACE = os.path.join(TRACE_DIR, "custom_cpu_trace.json")
+os.environ["FLAGS_custom_cpu_profiler_trace_file"] = PLUGIN_TRACE
+
+import numpy as np
+import paddle
+import paddle.profiler as profiler
+
+
+class TestCustomCPUProfiler(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+
+    def test_kernel_and_memcpy_events(self):
+        x_np = np.random.random([64, 32]).astype("float32")
+        y_np = np.random.random([32, 16]).astype("float32")
+        export_dir = os.path.join(TRACE_DIR, "paddle")
+        prof = profiler.Profiler(
+            targets=[
+                profiler.ProfilerTarget.CPU,
+                profiler.ProfilerTarget.CUSTOM_DEVICE,
+            ],
+            on_trace_ready=profiler.export_chrome_tracing(export_dir),
+        )
+        prof.start()
+        x = paddle.to_tensor(x_np)
+        y = paddle.to_tensor(y_np)
+        out = paddle.matmul(x, y).numpy()
+        prof.stop()
+        np.testing.assert_allclose(out, x_np @ y_np, rtol=1e-5)
+
+        trace_file = os.path.join(export_dir, os.listdir(export_dir)[0])
+        with open(trace_file) as f:
+            events = json.load(f)["traceEvents"]
+        device_events = [
+            e["name"] for e in events if e.get("cat") in ("Kernel", "Memcpy")
+        ]
+        self.assertTrue(any(n.startswith("matmul") for n in device_events))
+        self.assertTrue(any(n.startswith("MEMCPY_HtoD") for n in device_events))
+        self.assertTrue(any(n.startswith("MEMCPY_DtoH") for n in device_events))
+
+        with open(PLUGIN_TRACE) as f:
+            spans = json.load(f)["traceEvents"]
+        matmul = [s for s in spans if s["name"] == "matmul"]
+        self.assertEqual(len(matmul), 1)
+        self.assertEqual(matmul[0]["args"]["flops"], 2 * 64 * 32 * 16)
+        h2d = [s for s in spans if s["name"] == "MEMCPY_HtoD"]
+        self.assertIn(x_np.nbytes, [s["args"]["bytes"] for s in h2d])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,6 +14,10 @@
 
 from __future__ import print_function
 
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
 import numpy as np
 from op_test import OpTest, skip_check_grad_ci
@@ -180,6 +184,62 @@ class TestSumOp8D(OpTest):
         self.check_grad(["X"], "Out", check_eager=False)
 
 
+class TestSumOpSeparatedDims(OpTest):
+    def setUp(self):
+        self.python_api = paddle.sum
+        self.op_type = "reduce_sum"
+        self.inputs = {"X": np.random.random((4, 3, 5, 7, 6)).astype("float64")}
+        self.attrs = {"dim": [0, 2, 4]}
+        self.outputs = {"Out": self.inputs["X"].sum(axis=(0, 2, 4))}
+
+    def test_check_output(self):
+        self.check_output(check_eager=False)
+
+
+class TestSumOpLongRow(OpTest):
+    def setUp(self):
+        self.python_api = paddle.sum
+        self.op_type = "reduce_sum"
+        self.inputs = {"X": np.random.random((3, 300, 2000)).astype("float32")}
+        self.attrs = {"dim": [1, 2]}
+        self.outputs = {
+            "Out": self.inputs["X"].astype("float64").sum(axis=(1, 2)).astype("float32")
+        }
+
+    def test_check_output(self):
+        self.check_output(check_eager=False)
+
+
+class TestSumThreadCountInvariance(unittest.TestCase):
+    # Few long rows and many short ones, reduced with 1 and 4 threads in
+    # separate processes, since the thread pool is sized once per process.
+    script = """
+import sys
+import numpy as np
+import paddle
+
+paddle.set_device("custom_cpu")
+rng = np.random.RandomState(2024)
+outs = []
+for shape, axis in [((3, 600000), 1), ((64, 70000), 1), ((2, 300, 700), 1)]:
+    x = paddle.to_tensor(rng.standard_normal(shape))
+    outs.append(paddle.sum(x, axis=axis).numpy())
+np.save(sys.argv[1], np.concatenate([o.ravel() for o in outs]))
+"""
+
+    def run_with_threads(self, num_threads, path):
+        env = dict(os.environ)
+        env["FLAGS_custom_cpu_num_threads"] = str(num_threads)
+        subprocess.check_call([sys.executable, "-c", self.script, path], env=env)
+        return np.load(path)
+
+    def test_bitwise_equal(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            single = self.run_with_threads(1, os.path.join(tmp, "single.npy"))
+            multi = self.run_with_threads(4, os.path.join(tmp, "multi.npy"))
+        self.assertTrue(np.array_equal(single, multi))
+
+
 @skip_check_grad_ci(
     reason="reduce_max is discontinuous non-derivable function,"
     " its gradient check is not supported by unittest framework."
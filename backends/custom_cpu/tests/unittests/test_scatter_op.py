@@ -0,0 +1,86 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+
+
+class TestScatterOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+
+    def check(self, overwrite, dtype="float32"):
+        x = np.random.random([6, 3]).astype(dtype)
+        updates = np.random.random([5, 3]).astype(dtype)
+        index = np.array([4, 1, 4, 0, 4], "int64")
+        tx = paddle.to_tensor(x, stop_gradient=False)
+        tu = paddle.to_tensor(updates, stop_gradient=False)
+        out = paddle.scatter(tx, paddle.to_tensor(index), tu, overwrite=overwrite)
+
+        expect = x.copy()
+        if overwrite:
+            # The last update of a repeated row wins.
+            for k, row in enumerate(index):
+                expect[row] = updates[k]
+        else:
+            expect[index] = 0
+            np.add.at(expect, index, updates)
+        np.testing.assert_allclose(out.numpy(), expect, rtol=1e-6)
+
+        dout = np.random.random(out.shape).astype(dtype)
+        dx, du = paddle.grad([out], [tx, tu], [paddle.to_tensor(dout)])
+        expect_dx = dout.copy()
+        expect_dx[index] = 0
+        np.testing.assert_array_equal(dx.numpy(), expect_dx)
+        np.testing.assert_array_equal(du.numpy(), dout[index])
+
+    def test_scatter_overwrite(self):
+        self.check(True)
+        self.check(True, "float64")
+
+    def test_scatter_add(self):
+        self.check(False)
+
+    def test_scatter_int64(self):
+        x = paddle.to_tensor(np.zeros([4, 2], "int64"))
+        index = paddle.to_tensor(np.array([[2], [2]], "int32"))
+        updates = paddle.to_tensor(np.array([[1, 2], [3, 4]], "int64"))
+        out = paddle.scatter(x, index, updates, overwrite=False)
+        np.testing.assert_array_equal(out.numpy(), [[0, 0], [0, 0], [4, 6], [0, 0]])
+
+    def test_scatter_nd_add(self):
+        x = np.random.random([3, 4, 5]).astype("float32")
+        index = np.array([[1, 2], [0, 3], [1, 2]], "int64")
+        updates = np.random.random([3, 5]).astype("float32")
+        tx = paddle.to_tensor(x, stop_gradient=False)
+        tu = paddle.to_tensor(updates, stop_gradient=False)
+        out = paddle.scatter_nd_add(tx, paddle.to_tensor(index), tu)
+        expect = x.copy()
+        np.add.at(expect, (index[:, 0], index[:, 1]), updates)
+        np.testing.assert_allclose(out.numpy(), expect, rtol=1e-6)
+
+        dout = np.random.random(out.shape).astype("float32")
+        dx, du = paddle.grad([out], [tx, tu], [paddle.to_tensor(dout)])
+        np.testing.assert_array_equal(dx.numpy(), dout)
+        np.testing.assert_array_equal(du.numpy(), dout[index[:, 0], index[:, 1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
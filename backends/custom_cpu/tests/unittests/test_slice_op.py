@@ -647,6 +647,35 @@ class TestImperativeVarBaseGetItem(unittest.TestCase):
         self.assertRaises(Exception, test_float_in_index)
 
 
+class TestSliceCopy(unittest.TestCase):
+    def test_slice_does_not_alias_input(self):
+        # slice is not a view op, so an inplace update of the input must not
+        # show through an earlier slice of it.
+        paddle.set_flags({"FLAGS_use_stride_kernel": False})
+        try:
+            with base.dygraph.guard(paddle.CustomPlace("custom_cpu", 0)):
+                data = np.random.random((6, 5, 4)).astype("float32")
+                var = paddle.to_tensor(data)
+                sliced = paddle.slice(var, [0], [2], [5])
+                row = var[3, 1:4]
+                var.add_(paddle.ones_like(var))
+                np.testing.assert_array_equal(sliced.numpy(), data[2:5])
+                np.testing.assert_array_equal(row.numpy(), data[3, 1:4])
+                np.testing.assert_array_equal(var.numpy(), data + 1)
+        finally:
+            paddle.set_flags({"FLAGS_use_stride_kernel": True})
+
+    def test_strided_slice(self):
+        with base.dygraph.guard(paddle.CustomPlace("custom_cpu", 0)):
+            data = np.random.random((6, 5, 4)).astype("float32")
+            var = paddle.to_tensor(data)
+            np.testing.assert_array_equal(var[:, 1:3].numpy(), data[:, 1:3])
+            np.testing.assert_array_equal(
+                var[1:4, 2:5, 1:3].numpy(), data[1:4, 2:5, 1:3]
+            )
+            np.testing.assert_array_equal(var[..., 2].numpy(), data[..., 2])
+
+
 # class TestInferShape(unittest.TestCase):
 #     def test(self):
 #         x = paddle.ones(shape=[3, 4, 5])
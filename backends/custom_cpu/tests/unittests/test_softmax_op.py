@@ -132,6 +132,22 @@ class TestSoftmaxOp6(TestSoftmaxOp):
         return 3
 
 
+class TestSoftmaxOpLongAxis(TestSoftmaxOp):
+    def get_x_shape(self):
+        return [3, 4097]
+
+    def test_check_grad(self):
+        pass
+
+
+class TestSoftmaxOpWideInner(TestSoftmaxOp):
+    def get_x_shape(self):
+        return [2, 7, 130]
+
+    def get_axis(self):
+        return 1
+
+
 class TestSoftmaxAPI(unittest.TestCase):
     def setUp(self):
         self.place = paddle.CustomPlace("custom_cpu", 0)
@@ -695,6 +695,21 @@ class TestSoftmaxWithCrossEntropyOpBoundary1(TestSoftmaxWithCrossEntropyOp):
         self.use_softmax = True
 
 
+class TestSoftmaxWithCrossEntropyEmptyTrailingDim(unittest.TestCase):
+    # A zero dim after the axis leaves nothing to compute in the backward.
+    def test_backward(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        logits = paddle.zeros([4, 5, 0], dtype="float32")
+        logits.stop_gradient = False
+        label = paddle.zeros([4, 1, 0], dtype="int64")
+        loss = paddle.nn.functional.softmax_with_cross_entropy(logits, label, axis=1)
+        loss.sum().backward()
+        self.assertEqual(list(loss.shape), [4, 1, 0])
+        self.assertEqual(list(logits.grad.shape), [4, 5, 0])
+        paddle.enable_static()
+
+
 if __name__ == "__main__":
     paddle.enable_static()
     unittest.main()
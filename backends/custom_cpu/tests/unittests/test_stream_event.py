@@ -0,0 +1,123 @@
+#  Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+import paddle
+
+
+class TestCustomCPUStreamEvent(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        self.device = "custom_cpu:0"
+
+    def test_record_and_wait(self):
+        s1 = paddle.device.Stream(self.device)
+        s2 = paddle.device.Stream(self.device)
+        # Events belong to the current device, see setUp.
+        event = paddle.device.Event()
+        x_np = np.random.random([64, 64]).astype("float32")
+        with paddle.device.stream_guard(s1):
+            x = paddle.to_tensor(x_np)
+            y = x * 2
+        event.record(s1)
+        s2.wait_event(event)
+        s2.synchronize()
+        self.assertTrue(event.query())
+        self.assertTrue(s2.query())
+        np.testing.assert_allclose(y.numpy(), x_np * 2)
+
+    def test_synchronize_device(self):
+        streams = [paddle.device.Stream(self.device) for _ in range(4)]
+        results = []
+        for i, stream in enumerate(streams):
+            with paddle.device.stream_guard(stream):
+                results.append(paddle.full([1024], float(i)))
+        paddle.device.synchronize(self.device)
+        for stream in streams:
+            self.assertTrue(stream.query())
+        for i, out in enumerate(results):
+            np.testing.assert_array_equal(out.numpy(), np.full([1024], float(i)))
+
+    def test_async_copy_then_kernel(self):
+        # Kernels wait for the copies queued on their stream before them.
+        stream = paddle.device.Stream(self.device)
+        x_np = np.arange(1 << 20, dtype="float32")
+        x = paddle.to_tensor(x_np, place=paddle.CPUPlace())
+        with paddle.device.stream_guard(stream):
+            y = x._copy_to(paddle.CustomPlace("custom_cpu", 0), False)
+            z = y * 2
+        np.testing.assert_array_equal(z.numpy(), x_np * 2)
+
+    def test_free_while_copy_queued(self):
+        # The copies on s1 wait behind the work on s2 while their sources go
+        # back to the plugin and their blocks are requested again.
+        s1 = paddle.device.Stream(self.device)
+        s2 = paddle.device.Stream(self.device)
+        place = paddle.CustomPlace("custom_cpu", 0)
+        big = paddle.full([1 << 24], 1.0)
+        with paddle.device.stream_guard(s2):
+            for _ in range(8):
+                big._copy_to(place, False)
+        event = paddle.device.Event()
+        event.record(s2)
+        s1.wait_event(event)
+        outs = []
+        for i in range(8):
+            x = paddle.full([1 << 18], float(i))
+            with paddle.device.stream_guard(s1):
+                outs.append(x._copy_to(place, False))
+            del x
+            paddle.device.empty_cache()
+            paddle.full([1 << 18], -1.0)
+        paddle.device.synchronize(self.device)
+        for i, out in enumerate(outs):
+            np.testing.assert_array_equal(out.numpy(), np.full([1 << 18], float(i)))
+
+    def to_tensor_kernel_numpy(self):
+        # Buffers are freed and reused between the iterations.
+        for i in range(8):
+            x_np = np.full([1 << 18], float(i), dtype="float32")
+            x = paddle.to_tensor(x_np)
+            np.testing.assert_array_equal((x + x).numpy(), x_np * 2)
+
+    def test_to_tensor_kernel_numpy(self):
+        self.to_tensor_kernel_numpy()
+        with paddle.device.stream_guard(paddle.device.Stream(self.device)):
+            self.to_tensor_kernel_numpy()
+
+    def test_unrecorded_event(self):
+        event = paddle.device.Event()
+        self.assertTrue(event.query())
+        event.synchronize()
+
+
+class TestCustomCPUAsyncStreamEvent(unittest.TestCase):
+    # The same cases with stream tasks on worker threads. The flag is read
+    # once, when the first stream is created, so they run in a child process.
+    def test_async_stream(self):
+        env = dict(os.environ, FLAGS_custom_cpu_async_stream="1")
+        subprocess.check_call(
+            [sys.executable, os.path.abspath(__file__), "TestCustomCPUStreamEvent"],
+            env=env,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import paddle
+
+
+def numpy_topk(x, k, axis, largest):
+    order = np.argsort(-x if largest else x, axis=axis, kind="stable")
+    indices = np.take(order, np.arange(k), axis=axis)
+    return np.take_along_axis(x, indices, axis=axis), indices
+
+
+class TestTopkOp(unittest.TestCase):
+    def setUp(self):
+        paddle.disable_static()
+        paddle.set_device("custom_cpu")
+        np.random.seed(2024)
+
+    def check(self, shape, k, axis, dtype="float32"):
+        x = np.random.permutation(np.prod(shape)).reshape(shape).astype(dtype)
+        for largest in [True, False]:
+            out, indices = paddle.topk(
+                paddle.to_tensor(x), k, axis=axis, largest=largest
+            )
+            expect_out, expect_indices = numpy_topk(x, k, axis, largest)
+            np.testing.assert_array_equal(out.numpy(), expect_out)
+            np.testing.assert_array_equal(indices.numpy(), expect_indices)
+
+    def test_last_axis(self):
+        self.check([8, 5000], 10, -1)
+        self.check([8, 300], 200, -1, "float64")
+
+    def test_middle_axis(self):
+        self.check([4, 100, 6], 7, 1, "int64")
+
+    def test_k_tensor(self):
+        x = np.random.random([6, 40]).astype("float32")
+        k = paddle.to_tensor(np.array([5], "int32"))
+        out, indices = paddle.topk(paddle.to_tensor(x), k)
+        expect_out, expect_indices = numpy_topk(x, 5, -1, True)
+        np.testing.assert_array_equal(out.numpy(), expect_out)
+        np.testing.assert_array_equal(indices.numpy(), expect_indices)
+
+    def test_nan_is_largest(self):
+        x = np.array([1.0, np.nan, 3.0, 2.0], "float32")
+        out, indices = paddle.topk(paddle.to_tensor(x), 2)
+        np.testing.assert_array_equal(out.numpy(), [np.nan, 3.0])
+        np.testing.assert_array_equal(indices.numpy(), [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -122,6 +122,24 @@ class TestCase9(TestTransposeOp):
         self.axis = (6, 1, 3, 5, 0, 2, 4, 7)
 
 
+class TestCase10(TestTransposeOp):
+    def initTestCase(self):
+        self.shape = (70, 133)
+        self.axis = (1, 0)
+
+
+class TestCase11(TestTransposeOp):
+    def initTestCase(self):
+        self.shape = (2, 37, 4, 65)
+        self.axis = (0, 2, 3, 1)
+
+
+class TestCase12(TestTransposeOp):
+    def initTestCase(self):
+        self.shape = (4, 33, 8, 16)
+        self.axis = (0, 2, 1, 3)
+
+
 class TestTransposeOpBool(TestTransposeOp):
     def test_check_grad(self):
         pass
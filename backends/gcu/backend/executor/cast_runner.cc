@@ -15,6 +15,7 @@
 #include "backend/executor/cast_runner.h"
 
 #include <algorithm>
+#include <chrono>  // NOLINT [build/c++11]
 #include <ctime>
 #include <iostream>
 #include <map>
@@ -25,7 +26,9 @@
 #include <vector>
 
 #include "backend/equivalence_trans/all_ops.h"
+#include "backend/executor/executable_cache.h"
 #include "backend/executor/gcu_node.h"
+#include "backend/executor/launch_tracker.h"
 #include "backend/executor/tops_compiler.h"
 #include "backend/utils/gcu_op_desc.h"
 #include "backend/utils/utils.h"
@@ -70,25 +73,19 @@ class CastExecutor {
 
 class CastExecutorManager {
  public:
-  ~CastExecutorManager() { ReleaseAll(); }
-  void ReleaseAll() {
-    for (const auto& p : cast_executors_) {
-      p.second->ReleaseResource();
-    }
-    cast_executors_.clear();
-  }
-  void Add(const std::string& key, const std::shared_ptr<CastExecutor>& exec) {
-    cast_executors_[key] = exec;
-  }
-  std::shared_ptr<CastExecutor> Find(const std::string& key) {
-    if (cast_executors_.count(key) == 0) {
-      return nullptr;
-    }
-    auto exec = cast_executors_[key];
+  using Cache = ExecutableCache<std::string, CastExecutor>;
+  using Handle = Cache::Handle;
+
+  void ReleaseAll() { cache_.Clear(); }
+  Handle Add(const std::string& key,
+             const std::shared_ptr<CastExecutor>& exec,
+             size_t bytes) {
     PADDLE_ENFORCE_NE(
-        exec, nullptr, phi::errors::NotFound("buffered exec is nullptr"));
-    return exec;
+        exec, nullptr, phi::errors::InvalidArgument("exec is nullptr"));
+    return cache_.Insert(key, exec, bytes);
   }
+  Handle Find(const std::string& key) { return cache_.Find(key); }
+  Cache* cache() { return &cache_; }
 
  public:
   static CastExecutorManager* GetInstance() {
@@ -97,7 +94,11 @@ class CastExecutorManager {
   }
 
  private:
-  std::map<std::string, std::shared_ptr<CastExecutor>> cast_executors_;
+  static constexpr size_t kNumShards = 4;
+
+  Cache cache_{kNumShards,
+               ExecutableCacheCapacityFromEnv(),
+               ExecutableCacheBytesFromEnv()};
 };
 
 CastExecutor::CastExecutor(topsExecutable_t exec,
@@ -111,6 +112,8 @@ CastExecutor::CastExecutor(topsExecutable_t exec,
 }
 
 void CastExecutor::ReleaseResource() {
+  // Every launch pins the executable until the launch tracker sees it done,
+  // an unpinned executable is not queued on any stream.
   RT_CHECK(topsDestroyExecutable(tops_exec_));
   tops_exec_ = nullptr;
 }
@@ -159,12 +162,14 @@ void CastExecutor::RunGcuOp(const topsStream_t stream,
   // RT_CHECK(topsStreamSynchronize(stream));
 }
 
-void CompileExecutable(const std::string& signature,
-                       const DataType src_data_type,
-                       const DataType dst_data_type,
-                       std::vector<int64_t> dims) {  // NOLINT
+CastExecutorManager::Handle CompileExecutable(
+    const std::string& signature,
+    const DataType src_data_type,
+    const DataType dst_data_type,
+    std::vector<int64_t> dims) {  // NOLINT
   std::string op_type = "cast";
   VLOG(10) << "OpType " << op_type << " strart compile. ";
+  auto compile_start = std::chrono::steady_clock::now();
 
   // build input output attrs
   TensorNameMap input_names;
@@ -221,8 +226,13 @@ void CompileExecutable(const std::string& signature,
   builder->Dump();
   auto hlir_module = builder->GetModule();
 
-  // compile
-  topsExecutable_t tops_executable = CompileTopsExecutable(hlir_module);
+  // compile, the signature also keys the persistent compile cache
+  GcuOpKey cache_key;
+  cache_key.AppendString("cast_runner");
+  cache_key.AppendString(signature);
+  uint64_t binary_size = 0;
+  topsExecutable_t tops_executable =
+      CompileTopsExecutable(hlir_module, cache_key, &binary_size);
   VLOG(6) << "Compiler CompileHLIR end for program " << signature;
 
   GcuNode input_node(phi::make_ddim(dims), src_data_type);
@@ -231,10 +241,15 @@ void CompileExecutable(const std::string& signature,
   auto manager = CastExecutorManager::GetInstance();
   auto gcu_exec =
       std::make_shared<CastExecutor>(tops_executable, input_node, output_nodes);
-  manager->Add(signature, gcu_exec);
+  manager->cache()->RecordCompile(
+      std::chrono::duration_cast<std::chrono::microseconds>(
+          std::chrono::steady_clock::now() - compile_start)
+          .count());
+  return manager->Add(signature, gcu_exec, binary_size);
 }
 
 void RunExecutableAsync(const std::string signature,
+                        CastExecutor* gcu_exec,
                         const topsStream_t stream,
                         const std::vector<int64_t> dims,
                         const DataType src_data_type,
@@ -243,9 +258,6 @@ void RunExecutableAsync(const std::string signature,
                         void* dst_buf) {
   VLOG(3) << "=== start RunExecutableSync ===";
 
-  auto manager = CastExecutorManager::GetInstance();
-  auto gcu_exec = manager->Find(signature);
-
   PADDLE_ENFORCE_NOT_NULL(
       gcu_exec,
       phi::errors::NotFound(" Not find executor for signature:%s",
@@ -276,14 +288,29 @@ void CastRunner(const topsStream_t stream,
 
   auto manager = CastExecutorManager::GetInstance();
   auto gcu_exec = manager->Find(signature);
-  if (gcu_exec == nullptr) {
-    CompileExecutable(signature, src_data_type, dst_data_type, dims);
+  if (!gcu_exec) {
+    gcu_exec = CompileExecutable(signature, src_data_type, dst_data_type, dims);
   }
 
-  RunExecutableAsync(
-      signature, stream, dims, src_data_type, dst_data_type, src_buf, dst_buf);
+  RunExecutableAsync(signature,
+                     gcu_exec.get(),
+                     stream,
+                     dims,
+                     src_data_type,
+                     dst_data_type,
+                     src_buf,
+                     dst_buf);
+  // Keep the executable pinned until the launch is done, the buffers belong
+  // to the caller.
+  GetLaunchTracker()->Track(
+      stream,
+      {std::make_shared<CastExecutorManager::Handle>(std::move(gcu_exec))});
 
   VLOG(6) << "end cast runner ";
 }
 
+ExecutableCacheBase* GetCastExecutableCache() {
+  return CastExecutorManager::GetInstance()->cache();
+}
+
 }  // namespace backend
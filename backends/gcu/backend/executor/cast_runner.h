@@ -15,6 +15,7 @@
 #pragma once
 #include <vector>
 
+#include "backend/executor/executable_cache.h"
 #include "backend/executor/gcu_node.h"
 #include "backend/utils/utils.h"
 #include "tops/tops_ext.h"
@@ -28,4 +29,7 @@ void CastRunner(const topsStream_t stream,
                 const void* src_buf,
                 void* dst_buf);
 
+// Cache of the compiled cast executables, for statistics and limits.
+ExecutableCacheBase* GetCastExecutableCache();
+
 }  // namespace backend
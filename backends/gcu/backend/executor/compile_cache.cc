@@ -0,0 +1,398 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#include "backend/executor/compile_cache.h"
+
+#include <dirent.h>
+#include <fcntl.h>
+#include <sys/file.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cerrno>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <ctime>
+#include <functional>
+#include <thread>  // NOLINT
+#include <utility>
+
+#include "common/gcu_env_list.h"
+
+namespace backend {
+namespace {
+
+constexpr char kEntryMagic[8] = {'G', 'C', 'U', 'E', 'X', 'E', 'C', '\0'};
+constexpr uint32_t kEntryVersion = 1;
+constexpr char kEntrySuffix[] = ".gcuexe";
+constexpr char kTempPrefix[] = ".tmp.";
+constexpr char kLockFile[] = ".lock";
+constexpr size_t kBinaryAlignment = 64;
+// Temporary files older than this were left by a process that died.
+constexpr time_t kStaleTempSeconds = 3600;
+
+// An entry is this header, the fingerprint, the key, padding to
+// kBinaryAlignment and the binary.
+struct EntryHeader {
+  char magic[8];
+  uint32_t version;
+  uint32_t fingerprint_size;
+  uint64_t key_size;
+  uint64_t binary_offset;
+  uint64_t binary_size;
+  uint64_t checksum;
+};
+
+uint64_t Checksum(const char* data, size_t size) {
+  uint64_t h = 0xcbf29ce484222325ULL;
+  for (; size >= 8; size -= 8, data += 8) {
+    uint64_t word;
+    std::memcpy(&word, data, 8);
+    h = (h ^ word) * 0x100000001b3ULL;
+    h ^= h >> 29;
+  }
+  for (; size > 0; --size, ++data) {
+    h = (h ^ static_cast<unsigned char>(*data)) * 0x100000001b3ULL;
+  }
+  return h;
+}
+
+bool HasSuffix(const std::string& s, const char* suffix) {
+  const size_t n = std::strlen(suffix);
+  return s.size() >= n && s.compare(s.size() - n, n, suffix) == 0;
+}
+
+bool MakeDirs(const std::string& dir) {
+  for (size_t pos = 1; pos <= dir.size(); ++pos) {
+    if (pos == dir.size() || dir[pos] == '/') {
+      const std::string sub = dir.substr(0, pos);
+      if (mkdir(sub.c_str(), 0755) != 0 && errno != EEXIST) {
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+bool WriteAll(int fd, const void* data, size_t size) {
+  const char* p = static_cast<const char*>(data);
+  while (size > 0) {
+    ssize_t n = write(fd, p, size);
+    if (n < 0) {
+      if (errno == EINTR) continue;
+      return false;
+    }
+    p += n;
+    size -= static_cast<size_t>(n);
+  }
+  return true;
+}
+
+// Maps a whole entry file and checks its header and sizes.
+struct MappedEntry {
+  void* map = MAP_FAILED;
+  size_t size = 0;
+  const EntryHeader* header = nullptr;
+
+  ~MappedEntry() {
+    if (map != MAP_FAILED) munmap(map, size);
+  }
+
+  bool Open(int fd) {
+    struct stat st;
+    if (fstat(fd, &st) != 0 ||
+        static_cast<size_t>(st.st_size) < sizeof(EntryHeader)) {
+      return false;
+    }
+    size = static_cast<size_t>(st.st_size);
+    map = mmap(nullptr, size, PROT_READ, MAP_SHARED, fd, 0);
+    if (map == MAP_FAILED) {
+      return false;
+    }
+    header = static_cast<const EntryHeader*>(map);
+    const uint64_t meta = sizeof(EntryHeader) + header->fingerprint_size;
+    return std::memcmp(header->magic, kEntryMagic, sizeof(kEntryMagic)) == 0 &&
+           header->version == kEntryVersion &&
+           header->key_size <= size - meta &&
+           header->binary_offset >= meta + header->key_size &&
+           header->binary_offset <= size &&
+           header->binary_size == size - header->binary_offset;
+  }
+
+  const char* base() const { return static_cast<const char*>(map); }
+  std::string fingerprint() const {
+    return std::string(base() + sizeof(EntryHeader), header->fingerprint_size);
+  }
+  const char* key() const {
+    return base() + sizeof(EntryHeader) + header->fingerprint_size;
+  }
+};
+
+}  // namespace
+
+CompileCache::MappedBinary::~MappedBinary() {
+  if (map_ != nullptr) {
+    munmap(map_, map_size_);
+  }
+}
+
+CompileCache::CompileCache(const std::string& dir, uint64_t max_bytes)
+    : dir_(dir), max_bytes_(max_bytes) {
+  while (dir_.size() > 1 && dir_.back() == '/') {
+    dir_.pop_back();
+  }
+  if (!dir_.empty() && !MakeDirs(dir_)) {
+    dir_.clear();
+  }
+}
+
+CompileCache* CompileCache::GetInstance() {
+  static CompileCache cache(
+      std::getenv(env::kCompileCacheDir) == nullptr
+          ? ""
+          : std::getenv(env::kCompileCacheDir),
+      std::getenv(env::kCompileCacheBytes) == nullptr
+          ? (4ULL << 30)
+          : std::strtoull(std::getenv(env::kCompileCacheBytes), nullptr, 10));
+  return &cache;
+}
+
+std::string CompileCache::EntryPath(const GcuOpKey& key,
+                                    const std::string& fingerprint) const {
+  GcuOpKey address;
+  address.AppendString(fingerprint);
+  address.Append(key.data(), key.size());
+  char name[32];
+  snprintf(name,
+           sizeof(name),
+           "%016llx",
+           static_cast<unsigned long long>(address.hash()));  // NOLINT
+  return dir_ + "/" + name + kEntrySuffix;
+}
+
+std::unique_ptr<CompileCache::MappedBinary> CompileCache::Load(
+    const GcuOpKey& key, const std::string& fingerprint) {
+  if (!enabled()) {
+    return nullptr;
+  }
+  const std::string path = EntryPath(key, fingerprint);
+  int fd = open(path.c_str(), O_RDONLY | O_CLOEXEC);
+  if (fd < 0) {
+    misses_++;
+    return nullptr;
+  }
+  MappedEntry entry;
+  bool valid = entry.Open(fd);
+  valid = valid && entry.fingerprint() == fingerprint &&
+          entry.header->key_size == key.size() &&
+          std::memcmp(entry.key(), key.data(), key.size()) == 0 &&
+          Checksum(entry.base() + entry.header->binary_offset,
+                   entry.header->binary_size) == entry.header->checksum;
+  if (valid) {
+    // The modification time orders the entries for the garbage collection.
+    futimens(fd, nullptr);
+  }
+  close(fd);
+  if (!valid) {
+    misses_++;
+    return nullptr;
+  }
+  hits_++;
+  std::unique_ptr<MappedBinary> binary(
+      new MappedBinary(entry.map,
+                       entry.size,
+                       entry.base() + entry.header->binary_offset,
+                       entry.header->binary_size));
+  entry.map = MAP_FAILED;
+  return binary;
+}
+
+bool CompileCache::Store(const GcuOpKey& key,
+                         const std::string& fingerprint,
+                         const void* binary,
+                         size_t size) {
+  if (!enabled()) {
+    return false;
+  }
+  std::call_once(scan_once_, [this]() { GarbageCollect(max_bytes_); });
+
+  EntryHeader header;
+  std::memset(&header, 0, sizeof(header));
+  std::memcpy(header.magic, kEntryMagic, sizeof(kEntryMagic));
+  header.version = kEntryVersion;
+  header.fingerprint_size = static_cast<uint32_t>(fingerprint.size());
+  header.key_size = key.size();
+  const uint64_t meta = sizeof(header) + fingerprint.size() + key.size();
+  header.binary_offset =
+      (meta + kBinaryAlignment - 1) / kBinaryAlignment * kBinaryAlignment;
+  header.binary_size = size;
+  header.checksum = Checksum(static_cast<const char*>(binary), size);
+  const std::vector<char> padding(header.binary_offset - meta, 0);
+
+  // Unique per process and thread, the rename publishes the entry atomically.
+  static std::atomic<uint64_t> counter(0);
+  char temp_name[96];
+  snprintf(temp_name,
+           sizeof(temp_name),
+           "%s%d.%zx.%llu",
+           kTempPrefix,
+           static_cast<int>(getpid()),
+           std::hash<std::thread::id>()(std::this_thread::get_id()),
+           static_cast<unsigned long long>(counter++));  // NOLINT
+  const std::string temp_path = dir_ + "/" + temp_name;
+  int fd =
+      open(temp_path.c_str(), O_WRONLY | O_CREAT | O_EXCL | O_CLOEXEC, 0644);
+  if (fd < 0) {
+    store_failures_++;
+    return false;
+  }
+  bool ok = WriteAll(fd, &header, sizeof(header)) &&
+            WriteAll(fd, fingerprint.data(), fingerprint.size()) &&
+            WriteAll(fd, key.data(), key.size()) &&
+            WriteAll(fd, padding.data(), padding.size()) &&
+            WriteAll(fd, binary, size) && fsync(fd) == 0;
+  ok = close(fd) == 0 && ok;
+  ok =
+      ok && rename(temp_path.c_str(), EntryPath(key, fingerprint).c_str()) == 0;
+  if (!ok) {
+    unlink(temp_path.c_str());
+    store_failures_++;
+    return false;
+  }
+  stores_++;
+  const uint64_t disk_bytes =
+      disk_bytes_.fetch_add(header.binary_offset + size) +
+      header.binary_offset + size;
+  if (max_bytes_ > 0 && disk_bytes > max_bytes_) {
+    GarbageCollect(max_bytes_);
+  }
+  return true;
+}
+
+size_t CompileCache::GarbageCollect(uint64_t max_bytes) {
+  if (!enabled()) {
+    return 0;
+  }
+  const std::string lock_path = dir_ + "/" + kLockFile;
+  int lock_fd = open(lock_path.c_str(), O_RDWR | O_CREAT | O_CLOEXEC, 0644);
+  if (lock_fd < 0) {
+    return 0;
+  }
+  if (flock(lock_fd, LOCK_EX | LOCK_NB) != 0) {
+    close(lock_fd);
+    return 0;
+  }
+
+  struct Entry {
+    std::string path;
+    uint64_t size;
+    struct timespec mtime;
+  };
+  std::vector<Entry> entries;
+  uint64_t total = 0;
+  const time_t now = time(nullptr);
+  if (DIR* dir = opendir(dir_.c_str())) {
+    while (struct dirent* ent = readdir(dir)) {
+      const std::string name = ent->d_name;
+      const std::string path = dir_ + "/" + name;
+      const bool is_entry = HasSuffix(name, kEntrySuffix);
+      const bool is_temp = name.compare(0, 5, kTempPrefix) == 0;
+      struct stat st;
+      if ((!is_entry && !is_temp) || stat(path.c_str(), &st) != 0) {
+        continue;
+      }
+      if (is_temp) {
+        if (now - st.st_mtime > kStaleTempSeconds) {
+          unlink(path.c_str());
+        }
+        continue;
+      }
+      entries.push_back({path, static_cast<uint64_t>(st.st_size), st.st_mtim});
+      total += static_cast<uint64_t>(st.st_size);
+    }
+    closedir(dir);
+  }
+
+  size_t removed = 0;
+  if (max_bytes > 0 && total > max_bytes) {
+    std::sort(
+        entries.begin(), entries.end(), [](const Entry& a, const Entry& b) {
+          return a.mtime.tv_sec != b.mtime.tv_sec
+                     ? a.mtime.tv_sec < b.mtime.tv_sec
+                     : a.mtime.tv_nsec < b.mtime.tv_nsec;
+        });
+    for (const auto& entry : entries) {
+      if (total <= max_bytes) {
+        break;
+      }
+      if (unlink(entry.path.c_str()) == 0) {
+        total -= entry.size;
+        ++removed;
+      }
+    }
+  }
+  disk_bytes_ = total;
+  evictions_ += removed;
+
+  flock(lock_fd, LOCK_UN);
+  close(lock_fd);
+  return removed;
+}
+
+std::vector<GcuOpKey> CompileCache::ListKeys(const std::string* fingerprint) {
+  std::vector<GcuOpKey> keys;
+  if (!enabled()) {
+    return keys;
+  }
+  DIR* dir = opendir(dir_.c_str());
+  if (dir == nullptr) {
+    return keys;
+  }
+  while (struct dirent* ent = readdir(dir)) {
+    const std::string name = ent->d_name;
+    if (!HasSuffix(name, kEntrySuffix)) {
+      continue;
+    }
+    const std::string path = dir_ + "/" + name;
+    int fd = open(path.c_str(), O_RDONLY | O_CLOEXEC);
+    if (fd < 0) {
+      continue;
+    }
+    MappedEntry entry;
+    if (entry.Open(fd) &&
+        (fingerprint == nullptr || entry.fingerprint() == *fingerprint)) {
+      keys.emplace_back();
+      keys.back().Append(entry.key(), entry.header->key_size);
+    }
+    close(fd);
+  }
+  closedir(dir);
+  return keys;
+}
+
+CompileCache::Stats CompileCache::GetStats() const {
+  Stats stats;
+  stats.hits = hits_;
+  stats.misses = misses_;
+  stats.stores = stores_;
+  stats.store_failures = store_failures_;
+  stats.evictions = evictions_;
+  stats.disk_bytes = disk_bytes_;
+  return stats;
+}
+
+}  // namespace backend
@@ -0,0 +1,117 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+
+#include <atomic>
+#include <cstdint>
+#include <memory>
+#include <mutex>  // NOLINT
+#include <string>
+#include <vector>
+
+#include "backend/executor/gcu_op_key.h"
+
+namespace backend {
+
+// Persistent cache of compiled executable binaries in a directory shared by
+// all processes that use it. An entry is content addressed by the op key and
+// a fingerprint of everything else the binary depends on (compiler options,
+// SDK version), and it stores both, so that a file name collision reads as a
+// miss. Entries are written to a temporary file and renamed into place, so
+// readers never see a partial entry and need no lock. Loads map the entry and
+// refresh its modification time, which orders the entries for the garbage
+// collection: when the directory grows over max_bytes, the least recently
+// used entries are removed by one process at a time, under an flock on the
+// lock file of the directory. Removing a file that another process has
+// mapped is safe, the mapping stays valid.
+class CompileCache {
+ public:
+  // A cached binary mapped into memory, unmapped on destruction.
+  class MappedBinary {
+   public:
+    MappedBinary(void* map, size_t map_size, const char* data, size_t size)
+        : map_(map), map_size_(map_size), data_(data), size_(size) {}
+    ~MappedBinary();
+    MappedBinary(const MappedBinary&) = delete;
+    MappedBinary& operator=(const MappedBinary&) = delete;
+
+    const char* data() const { return data_; }
+    size_t size() const { return size_; }
+
+   private:
+    void* map_;
+    size_t map_size_;
+    const char* data_;
+    size_t size_;
+  };
+
+  struct Stats {
+    uint64_t hits = 0;
+    uint64_t misses = 0;
+    uint64_t stores = 0;
+    uint64_t store_failures = 0;
+    uint64_t evictions = 0;
+    // Bytes of the directory as last seen by this process.
+    uint64_t disk_bytes = 0;
+  };
+
+  // An empty dir disables the cache, a max_bytes of 0 disables the garbage
+  // collection.
+  CompileCache(const std::string& dir, uint64_t max_bytes);
+
+  // The cache configured by PADDLE_GCU_COMPILE_CACHE_DIR and
+  // PADDLE_GCU_COMPILE_CACHE_BYTES.
+  static CompileCache* GetInstance();
+
+  bool enabled() const { return !dir_.empty(); }
+  const std::string& dir() const { return dir_; }
+
+  // Returns the binary of `key` compiled under `fingerprint`, or null.
+  std::unique_ptr<MappedBinary> Load(const GcuOpKey& key,
+                                     const std::string& fingerprint);
+
+  // Adds the binary of `key`, then collects garbage when the directory is
+  // over its size cap. Returns false when the entry could not be written.
+  bool Store(const GcuOpKey& key,
+             const std::string& fingerprint,
+             const void* binary,
+             size_t size);
+
+  // Removes the least recently used entries until the directory holds at
+  // most max_bytes, and stale temporary files. Returns the number of removed
+  // entries, 0 also when another process is collecting.
+  size_t GarbageCollect(uint64_t max_bytes);
+
+  // Keys of the entries, optionally only those compiled under `fingerprint`.
+  std::vector<GcuOpKey> ListKeys(const std::string* fingerprint = nullptr);
+
+  Stats GetStats() const;
+
+ private:
+  std::string EntryPath(const GcuOpKey& key,
+                        const std::string& fingerprint) const;
+
+  std::string dir_;
+  uint64_t max_bytes_;
+  std::once_flag scan_once_;
+  std::atomic<uint64_t> disk_bytes_{0};
+  std::atomic<uint64_t> hits_{0};
+  std::atomic<uint64_t> misses_{0};
+  std::atomic<uint64_t> stores_{0};
+  std::atomic<uint64_t> store_failures_{0};
+  std::atomic<uint64_t> evictions_{0};
+};
+
+}  // namespace backend
@@ -0,0 +1,278 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+
+#include <algorithm>
+#include <condition_variable>  // NOLINT
+#include <cstdint>
+#include <cstdlib>
+#include <deque>
+#include <exception>
+#include <functional>
+#include <future>  // NOLINT
+#include <memory>
+#include <mutex>  // NOLINT
+#include <stdexcept>
+#include <thread>  // NOLINT
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "common/gcu_env_list.h"
+
+namespace backend {
+
+struct CompileServiceStats {
+  // Compiles submitted to the workers.
+  uint64_t submitted = 0;
+  // Submit and Run calls that joined a compile of the same key in flight.
+  uint64_t deduplicated = 0;
+  // Queued compiles a caller needed and ran itself.
+  uint64_t taken_over = 0;
+  uint64_t completed = 0;
+  uint64_t failed = 0;
+  uint64_t queued = 0;
+};
+
+// Compiles executables on a pool of worker threads, at most one compile per
+// key at a time: a caller asking for a key that is compiling waits for that
+// compile instead of starting its own (single flight). Submit queues a
+// compile, for instance to warm the executable cache up at start up, Run
+// compiles on the calling thread for an op that is about to run. A caller
+// never waits behind the queue, Run takes a queued compile of its key over.
+//
+// A task compiles and inserts the executable of its key into a cache, the
+// service only orders the tasks, and a task must not Run its own key.
+// Workers are started by the first Submit.
+template <typename Key, typename Hash = std::hash<Key>>
+class CompileService {
+ public:
+  using Task = std::function<void()>;
+
+  explicit CompileService(size_t num_threads)
+      : num_threads_(std::max<size_t>(num_threads, 1)) {}
+
+  ~CompileService() { Shutdown(); }
+
+  CompileService(const CompileService&) = delete;
+  CompileService& operator=(const CompileService&) = delete;
+
+  // Queues `task` unless `key` is queued or compiling already. The future is
+  // ready when the compile of `key` is done, and holds what the task threw.
+  std::shared_future<void> Submit(const Key& key, Task task) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto it = flights_.find(key);
+    if (it != flights_.end()) {
+      deduplicated_++;
+      return it->second->done;
+    }
+    if (stopped_) {
+      std::promise<void> promise;
+      promise.set_exception(std::make_exception_ptr(
+          std::runtime_error("the compile service is shut down")));
+      return promise.get_future().share();
+    }
+    auto flight = std::make_shared<Flight>();
+    flight->task = std::move(task);
+    flight->done = flight->promise.get_future().share();
+    flights_.emplace(key, flight);
+    queue_.emplace_back(key, flight);
+    submitted_++;
+    while (workers_.size() < num_threads_) {
+      workers_.emplace_back([this]() { Work(); });
+    }
+    work_cv_.notify_one();
+    return flight->done;
+  }
+
+  // Runs `task` on the calling thread, or waits for the compile of `key` if
+  // it is running already. Returns true when `task` ran, false when another
+  // compile of `key` finished. Rethrows what the compile threw.
+  bool Run(const Key& key, const Task& task) {
+    std::shared_ptr<Flight> flight;
+    {
+      std::unique_lock<std::mutex> lock(mutex_);
+      auto it = flights_.find(key);
+      if (it != flights_.end() && it->second->started) {
+        deduplicated_++;
+        std::shared_future<void> done = it->second->done;
+        lock.unlock();
+        done.get();
+        return false;
+      }
+      if (it != flights_.end()) {
+        // Still queued, the worker skips it.
+        flight = it->second;
+        flight->task = nullptr;
+        taken_over_++;
+      } else {
+        flight = std::make_shared<Flight>();
+        flight->done = flight->promise.get_future().share();
+        flights_.emplace(key, flight);
+      }
+      flight->started = true;
+    }
+    Execute(key, flight, task, true);
+    return true;
+  }
+
+  // Waits until the queue is drained.
+  void Wait() {
+    std::unique_lock<std::mutex> lock(mutex_);
+    idle_cv_.wait(lock, [this]() { return queue_.empty() && running_ == 0; });
+  }
+
+  // Drops the queued compiles, their futures hold an error, and joins the
+  // workers once the running ones are done.
+  void Shutdown() {
+    std::vector<std::shared_ptr<Flight>> dropped;
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      stopped_ = true;
+      for (auto& item : queue_) {
+        if (!item.second->started) {
+          item.second->started = true;
+          flights_.erase(item.first);
+          dropped.push_back(std::move(item.second));
+        }
+      }
+      queue_.clear();
+    }
+    work_cv_.notify_all();
+    for (auto& worker : workers_) {
+      worker.join();
+    }
+    workers_.clear();
+    for (auto& flight : dropped) {
+      flight->promise.set_exception(std::make_exception_ptr(
+          std::runtime_error("the compile service is shut down")));
+    }
+    idle_cv_.notify_all();
+  }
+
+  size_t num_threads() const { return num_threads_; }
+
+  CompileServiceStats GetStats() const {
+    std::lock_guard<std::mutex> lock(mutex_);
+    CompileServiceStats stats;
+    stats.submitted = submitted_;
+    stats.deduplicated = deduplicated_;
+    stats.taken_over = taken_over_;
+    stats.completed = completed_;
+    stats.failed = failed_;
+    stats.queued = queue_.size();
+    return stats;
+  }
+
+ private:
+  struct Flight {
+    Task task;
+    // Set under the lock by the thread that runs the compile.
+    bool started = false;
+    std::promise<void> promise;
+    std::shared_future<void> done;
+  };
+
+  void Work() {
+    while (true) {
+      std::pair<Key, std::shared_ptr<Flight>> item;
+      {
+        std::unique_lock<std::mutex> lock(mutex_);
+        work_cv_.wait(lock, [this]() { return stopped_ || !queue_.empty(); });
+        if (stopped_) {
+          return;
+        }
+        item = std::move(queue_.front());
+        queue_.pop_front();
+        if (item.second->started) {
+          NotifyIfIdleLocked();
+          continue;
+        }
+        item.second->started = true;
+        running_++;
+      }
+      Task task = std::move(item.second->task);
+      Execute(item.first, item.second, task, false);
+      std::lock_guard<std::mutex> lock(mutex_);
+      running_--;
+      NotifyIfIdleLocked();
+    }
+  }
+
+  void NotifyIfIdleLocked() {
+    if (queue_.empty() && running_ == 0) {
+      idle_cv_.notify_all();
+    }
+  }
+
+  void Execute(const Key& key,
+               const std::shared_ptr<Flight>& flight,
+               const Task& task,
+               bool rethrow) {
+    std::exception_ptr error;
+    try {
+      task();
+    } catch (...) {
+      error = std::current_exception();
+    }
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      auto it = flights_.find(key);
+      if (it != flights_.end() && it->second == flight) {
+        flights_.erase(it);
+      }
+      if (error) {
+        failed_++;
+      } else {
+        completed_++;
+      }
+    }
+    if (error) {
+      flight->promise.set_exception(error);
+      if (rethrow) {
+        std::rethrow_exception(error);
+      }
+    } else {
+      flight->promise.set_value();
+    }
+  }
+
+  const size_t num_threads_;
+  mutable std::mutex mutex_;
+  std::condition_variable work_cv_;
+  std::condition_variable idle_cv_;
+  std::unordered_map<Key, std::shared_ptr<Flight>, Hash> flights_;
+  std::deque<std::pair<Key, std::shared_ptr<Flight>>> queue_;
+  std::vector<std::thread> workers_;
+  size_t running_ = 0;
+  bool stopped_ = false;
+  uint64_t submitted_ = 0;
+  uint64_t deduplicated_ = 0;
+  uint64_t taken_over_ = 0;
+  uint64_t completed_ = 0;
+  uint64_t failed_ = 0;
+};
+
+// Compile workers, from PADDLE_GCU_COMPILE_THREADS, by default one per core
+// up to 8.
+inline size_t CompileThreadsFromEnv() {
+  static const char* env = std::getenv(env::kCompileThreads);
+  if (env != nullptr && std::strtoull(env, nullptr, 10) > 0) {
+    return std::strtoull(env, nullptr, 10);
+  }
+  return std::min<size_t>(std::max(std::thread::hardware_concurrency(), 1U), 8);
+}
+
+}  // namespace backend
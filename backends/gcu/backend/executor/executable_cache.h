@@ -0,0 +1,355 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+
+#include <atomic>
+#include <cstdint>
+#include <cstdlib>
+#include <list>
+#include <memory>
+#include <mutex>  // NOLINT
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "common/gcu_env_list.h"
+
+namespace backend {
+
+// Counters of an executable cache. The order of the fields is the order of
+// the values returned by GcuGetExecutableCacheStats.
+struct ExecutableCacheStats {
+  uint64_t hits = 0;
+  uint64_t misses = 0;
+  uint64_t compiles = 0;
+  uint64_t compile_time_us = 0;
+  uint64_t evictions = 0;
+  uint64_t entries = 0;
+  uint64_t bytes = 0;
+  uint64_t pinned = 0;
+  uint64_t capacity = 0;
+  uint64_t byte_budget = 0;
+};
+
+constexpr size_t kNumExecutableCacheStats =
+    sizeof(ExecutableCacheStats) / sizeof(uint64_t);
+
+// Limits and counters of an executable cache, independent of its key type.
+class ExecutableCacheBase {
+ public:
+  virtual ~ExecutableCacheBase() = default;
+  virtual ExecutableCacheStats GetStats() const = 0;
+  virtual void ResetStats() = 0;
+  // A limit of 0 means unbounded.
+  virtual void SetLimits(size_t capacity, size_t byte_budget) = 0;
+  // Releases every executable that is not pinned.
+  virtual void Clear() = 0;
+};
+
+// Cache of compiled executables shared by all threads of the process.
+// Entries are spread over independently locked shards, each shard keeps its
+// entries in LRU order and evicts the least recently used ones when it holds
+// more than capacity / num_shards entries or byte_budget / num_shards bytes.
+// Lookups return pinned handles: an executable is never evicted while a
+// handle to it is alive, so launches in flight keep their device resources.
+// Evicted executables are freed with Value::ReleaseResource().
+template <typename Key, typename Value, typename Hash = std::hash<Key>>
+class ExecutableCache : public ExecutableCacheBase {
+  struct Entry {
+    Entry(const Key& k, std::shared_ptr<Value> v, size_t b)
+        : key(k), value(std::move(v)), bytes(b) {}
+    Key key;
+    std::shared_ptr<Value> value;
+    size_t bytes;
+    // Incremented under the shard lock, decremented without it.
+    std::atomic<size_t> pins{0};
+  };
+  using EntryList = std::list<Entry>;
+
+  struct Shard {
+    std::mutex mutex;
+    // Most recently used first.
+    EntryList lru;
+    std::unordered_map<Key, typename EntryList::iterator, Hash> index;
+    size_t bytes = 0;
+    // Set while pinned entries keep the shard over its limits.
+    std::atomic<bool> over_limit{false};
+  };
+
+ public:
+  // Pins one entry of the cache until it is destroyed or reset.
+  class Handle {
+   public:
+    Handle() = default;
+    Handle(const Handle&) = delete;
+    Handle& operator=(const Handle&) = delete;
+    Handle(Handle&& other) noexcept
+        : cache_(other.cache_), shard_(other.shard_), entry_(other.entry_) {
+      other.entry_ = nullptr;
+    }
+    Handle& operator=(Handle&& other) noexcept {
+      if (this != &other) {
+        Reset();
+        cache_ = other.cache_;
+        shard_ = other.shard_;
+        entry_ = other.entry_;
+        other.entry_ = nullptr;
+      }
+      return *this;
+    }
+    ~Handle() { Reset(); }
+
+    Value* get() const {
+      return entry_ == nullptr ? nullptr : entry_->value.get();
+    }
+    Value* operator->() const { return get(); }
+    explicit operator bool() const { return entry_ != nullptr; }
+
+    // Unpins the entry.
+    void Reset() {
+      if (entry_ != nullptr) {
+        cache_->Unpin(shard_, entry_);
+        entry_ = nullptr;
+      }
+    }
+
+   private:
+    friend class ExecutableCache;
+    Handle(ExecutableCache* cache, Shard* shard, Entry* entry)
+        : cache_(cache), shard_(shard), entry_(entry) {}
+
+    ExecutableCache* cache_ = nullptr;
+    Shard* shard_ = nullptr;
+    Entry* entry_ = nullptr;
+  };
+
+  ExecutableCache(size_t num_shards, size_t capacity, size_t byte_budget)
+      : shards_(num_shards == 0 ? 1 : num_shards) {
+    SetShardLimits(capacity, byte_budget);
+  }
+
+  ~ExecutableCache() override {
+    for (auto& shard : shards_) {
+      for (auto& entry : shard.lru) {
+        entry.value->ReleaseResource();
+      }
+    }
+  }
+
+  ExecutableCache(const ExecutableCache&) = delete;
+  ExecutableCache& operator=(const ExecutableCache&) = delete;
+
+  // Returns the pinned executable of `key`, or an empty handle on a miss.
+  Handle Find(const Key& key) {
+    Shard* shard = ShardOf(key);
+    std::lock_guard<std::mutex> lock(shard->mutex);
+    auto it = shard->index.find(key);
+    if (it == shard->index.end()) {
+      misses_.fetch_add(1, std::memory_order_relaxed);
+      return Handle();
+    }
+    hits_.fetch_add(1, std::memory_order_relaxed);
+    shard->lru.splice(shard->lru.begin(), shard->lru, it->second);
+    return PinLocked(shard, &*it->second);
+  }
+
+  // Adds the executable of `key`, which takes about `bytes` of memory, and
+  // returns it pinned. When another thread added `key` first, its executable
+  // is kept and `value` is released.
+  Handle Insert(const Key& key, std::shared_ptr<Value> value, size_t bytes) {
+    Shard* shard = ShardOf(key);
+    std::vector<std::shared_ptr<Value>> released;
+    Handle handle;
+    {
+      std::lock_guard<std::mutex> lock(shard->mutex);
+      auto it = shard->index.find(key);
+      if (it != shard->index.end()) {
+        released.emplace_back(std::move(value));
+        shard->lru.splice(shard->lru.begin(), shard->lru, it->second);
+        handle = PinLocked(shard, &*it->second);
+      } else {
+        shard->lru.emplace_front(key, std::move(value), bytes);
+        shard->index.emplace(key, shard->lru.begin());
+        shard->bytes += bytes;
+        handle = PinLocked(shard, &shard->lru.front());
+        EvictLocked(shard, &released);
+      }
+    }
+    ReleaseValues(&released);
+    return handle;
+  }
+
+  void RecordCompile(uint64_t micros) {
+    compiles_.fetch_add(1, std::memory_order_relaxed);
+    compile_time_us_.fetch_add(micros, std::memory_order_relaxed);
+  }
+
+  ExecutableCacheStats GetStats() const override {
+    ExecutableCacheStats stats;
+    stats.hits = hits_.load(std::memory_order_relaxed);
+    stats.misses = misses_.load(std::memory_order_relaxed);
+    stats.compiles = compiles_.load(std::memory_order_relaxed);
+    stats.compile_time_us = compile_time_us_.load(std::memory_order_relaxed);
+    stats.evictions = evictions_.load(std::memory_order_relaxed);
+    for (auto& shard : shards_) {
+      std::lock_guard<std::mutex> lock(shard.mutex);
+      stats.entries += shard.lru.size();
+      stats.bytes += shard.bytes;
+      for (const auto& entry : shard.lru) {
+        stats.pinned += entry.pins.load() > 0 ? 1 : 0;
+      }
+    }
+    stats.capacity = capacity_;
+    stats.byte_budget = byte_budget_;
+    return stats;
+  }
+
+  void ResetStats() override {
+    hits_ = 0;
+    misses_ = 0;
+    compiles_ = 0;
+    compile_time_us_ = 0;
+    evictions_ = 0;
+  }
+
+  void SetLimits(size_t capacity, size_t byte_budget) override {
+    SetShardLimits(capacity, byte_budget);
+    for (auto& shard : shards_) {
+      std::vector<std::shared_ptr<Value>> released;
+      {
+        std::lock_guard<std::mutex> lock(shard.mutex);
+        EvictLocked(&shard, &released);
+      }
+      ReleaseValues(&released);
+    }
+  }
+
+  void Clear() override {
+    for (auto& shard : shards_) {
+      std::vector<std::shared_ptr<Value>> released;
+      {
+        std::lock_guard<std::mutex> lock(shard.mutex);
+        for (auto it = shard.lru.begin(); it != shard.lru.end();) {
+          if (it->pins.load() > 0) {
+            ++it;
+            continue;
+          }
+          it = EraseLocked(&shard, it, &released);
+        }
+      }
+      ReleaseValues(&released);
+    }
+  }
+
+ private:
+  Shard* ShardOf(const Key& key) {
+    // Spread the high bits, the maps of the shards bucket by the low ones.
+    const uint64_t h = static_cast<uint64_t>(Hash()(key));
+    return &shards_[((h * 0x9e3779b97f4a7c15ULL) >> 32) % shards_.size()];
+  }
+
+  void SetShardLimits(size_t capacity, size_t byte_budget) {
+    const size_t n = shards_.size();
+    capacity_ = capacity;
+    byte_budget_ = byte_budget;
+    shard_capacity_ = capacity == 0 ? 0 : (capacity + n - 1) / n;
+    shard_byte_budget_ = byte_budget == 0 ? 0 : (byte_budget + n - 1) / n;
+  }
+
+  Handle PinLocked(Shard* shard, Entry* entry) {
+    entry->pins.fetch_add(1);
+    return Handle(this, shard, entry);
+  }
+
+  // Unpinning only locks the shard when it has to evict. An entry is only
+  // erased under the lock with no pins, so it outlives every handle.
+  void Unpin(Shard* shard, Entry* entry) {
+    if (entry->pins.fetch_sub(1) != 1 || !shard->over_limit.load()) {
+      return;
+    }
+    std::vector<std::shared_ptr<Value>> released;
+    {
+      std::lock_guard<std::mutex> lock(shard->mutex);
+      EvictLocked(shard, &released);
+    }
+    ReleaseValues(&released);
+  }
+
+  bool OverLimitLocked(const Shard& shard) const {
+    const size_t capacity = shard_capacity_;
+    const size_t byte_budget = shard_byte_budget_;
+    return (capacity > 0 && shard.lru.size() > capacity) ||
+           (byte_budget > 0 && shard.bytes > byte_budget);
+  }
+
+  // Evicts unpinned entries from the LRU end until the shard is within its
+  // limits. The evicted values are released by the caller after unlocking.
+  void EvictLocked(Shard* shard,
+                   std::vector<std::shared_ptr<Value>>* released) {
+    auto it = shard->lru.end();
+    while (OverLimitLocked(*shard) && it != shard->lru.begin()) {
+      --it;
+      if (it->pins.load() > 0) {
+        continue;
+      }
+      it = EraseLocked(shard, it, released);
+      evictions_.fetch_add(1, std::memory_order_relaxed);
+    }
+    shard->over_limit.store(OverLimitLocked(*shard));
+  }
+
+  typename EntryList::iterator EraseLocked(
+      Shard* shard,
+      typename EntryList::iterator it,
+      std::vector<std::shared_ptr<Value>>* released) {
+    shard->bytes -= it->bytes;
+    released->emplace_back(std::move(it->value));
+    shard->index.erase(it->key);
+    return shard->lru.erase(it);
+  }
+
+  // Frees device resources outside the shard locks.
+  static void ReleaseValues(std::vector<std::shared_ptr<Value>>* released) {
+    for (auto& value : *released) {
+      value->ReleaseResource();
+    }
+    released->clear();
+  }
+
+  mutable std::vector<Shard> shards_;
+  std::atomic<size_t> capacity_{0};
+  std::atomic<size_t> byte_budget_{0};
+  std::atomic<size_t> shard_capacity_{0};
+  std::atomic<size_t> shard_byte_budget_{0};
+  std::atomic<uint64_t> hits_{0};
+  std::atomic<uint64_t> misses_{0};
+  std::atomic<uint64_t> compiles_{0};
+  std::atomic<uint64_t> compile_time_us_{0};
+  std::atomic<uint64_t> evictions_{0};
+};
+
+// Limits of the executable caches, from PADDLE_GCU_EXECUTABLE_CACHE_CAPACITY
+// (entries) and PADDLE_GCU_EXECUTABLE_CACHE_BYTES.
+inline size_t ExecutableCacheCapacityFromEnv() {
+  static const char* env = std::getenv(env::kExecutableCacheCapacity);
+  return env == nullptr ? 8192 : std::strtoull(env, nullptr, 10);
+}
+
+inline size_t ExecutableCacheBytesFromEnv() {
+  static const char* env = std::getenv(env::kExecutableCacheBytes);
+  return env == nullptr ? 0 : std::strtoull(env, nullptr, 10);
+}
+
+}  // namespace backend
@@ -0,0 +1,468 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <string>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
+#include "paddle/utils/blank.h"
+#include "paddle/utils/variant.h"
+
+namespace backend {
+
+// Compile cache key of a JIT op: a binary serialization of everything the
+// compiled program depends on. The hash is one word-wise pass over the bytes,
+// so it does not depend on how they were appended. Keys compare
+// equal only when the full serializations match, so a hash collision can not
+// return the executable of another op. Serializations up to kInlineBytes
+// are stored inline, building a key then does not allocate.
+class GcuOpKey {
+ public:
+  static constexpr size_t kInlineBytes = 1024;
+
+  GcuOpKey() = default;
+  GcuOpKey(const GcuOpKey& other) { *this = other; }
+
+  GcuOpKey& operator=(const GcuOpKey& other) {
+    if (this != &other) {
+      Clear();
+      Append(other.data(), other.size_);
+    }
+    return *this;
+  }
+
+  void Clear() {
+    size_ = 0;
+    heap_.clear();
+  }
+
+  void Append(const void* data, size_t size) {
+    const char* bytes = static_cast<const char*>(data);
+    if (heap_.empty() && size_ + size <= kInlineBytes) {
+      std::memcpy(inline_ + size_, bytes, size);
+    } else {
+      if (heap_.empty()) {
+        heap_.assign(inline_, inline_ + size_);
+      }
+      heap_.insert(heap_.end(), bytes, bytes + size);
+    }
+    size_ += size;
+  }
+
+  template <typename T>
+  void AppendPod(const T& value) {
+    static_assert(std::is_trivially_copyable<T>::value,
+                  "AppendPod expects a trivially copyable type.");
+    Append(&value, sizeof(T));
+  }
+
+  // Strings and sequences are length prefixed, so adjacent fields can not
+  // run into each other.
+  void AppendString(const std::string& value) {
+    AppendPod(static_cast<uint32_t>(value.size()));
+    Append(value.data(), value.size());
+  }
+
+  size_t hash() const {
+    const char* bytes = data();
+    size_t size = size_;
+    uint64_t h = kSeed;
+    for (; size >= 8; size -= 8, bytes += 8) {
+      uint64_t word;
+      std::memcpy(&word, bytes, 8);
+      h = Mix(h, word);
+    }
+    if (size > 0) {
+      uint64_t word = 0;
+      std::memcpy(&word, bytes, size);
+      h = Mix(h, word ^ (static_cast<uint64_t>(size) << 56));
+    }
+    return static_cast<size_t>(h ^ (h >> 29));
+  }
+
+  size_t size() const { return size_; }
+  const char* data() const { return heap_.empty() ? inline_ : heap_.data(); }
+
+  // Short printable form for logs and error messages.
+  std::string ToString() const { return std::to_string(hash()); }
+
+  // Full serialization as hex text, one line of a signature list.
+  std::string ToHex() const {
+    static const char kDigits[] = "0123456789abcdef";
+    std::string hex(size_ * 2, '0');
+    const unsigned char* bytes = reinterpret_cast<const unsigned char*>(data());
+    for (size_t i = 0; i < size_; ++i) {
+      hex[2 * i] = kDigits[bytes[i] >> 4];
+      hex[2 * i + 1] = kDigits[bytes[i] & 0xf];
+    }
+    return hex;
+  }
+
+  bool FromHex(const std::string& hex) {
+    auto nibble = [](char c) -> int {
+      if (c >= '0' && c <= '9') return c - '0';
+      if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+      if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+      return -1;
+    };
+    Clear();
+    if (hex.size() % 2 != 0) {
+      return false;
+    }
+    for (size_t i = 0; i < hex.size(); i += 2) {
+      const int hi = nibble(hex[i]);
+      const int lo = nibble(hex[i + 1]);
+      if (hi < 0 || lo < 0) {
+        Clear();
+        return false;
+      }
+      const char byte = static_cast<char>((hi << 4) | lo);
+      Append(&byte, 1);
+    }
+    return true;
+  }
+
+  bool operator==(const GcuOpKey& other) const {
+    return size_ == other.size_ &&
+           std::memcmp(data(), other.data(), size_) == 0;
+  }
+  bool operator!=(const GcuOpKey& other) const { return !(*this == other); }
+
+ private:
+  static constexpr uint64_t kSeed = 0x2545f4914f6cdd1dULL;
+
+  static uint64_t Mix(uint64_t h, uint64_t word) {
+    h ^= word * 0x9e3779b97f4a7c15ULL;
+    h = (h << 31) | (h >> 33);
+    return h * 0xff51afd7ed558ccdULL;
+  }
+
+  size_t size_ = 0;
+  char inline_[kInlineBytes];
+  std::vector<char> heap_;
+};
+
+struct GcuOpKeyHash {
+  size_t operator()(const GcuOpKey& key) const { return key.hash(); }
+};
+
+namespace detail {
+
+// Appends one attribute value. The caller prefixes the variant index, so
+// values of different types never compare equal.
+struct GcuOpKeyAttrVisitor {
+  GcuOpKey* key;
+
+  void operator()(const paddle::blank&) const {}
+
+  void operator()(const std::string& value) const { key->AppendString(value); }
+
+  template <typename T>
+  void operator()(const T& value) const {
+    static_assert(std::is_arithmetic<T>::value,
+                  "Unsupported attribute type for GcuOpKey.");
+    key->AppendPod(value);
+  }
+
+  template <typename T>
+  void operator()(const std::vector<T>& value) const {
+    static_assert(std::is_arithmetic<T>::value,
+                  "Unsupported attribute type for GcuOpKey.");
+    key->AppendPod(static_cast<uint32_t>(value.size()));
+    key->Append(value.data(), value.size() * sizeof(T));
+  }
+
+  void operator()(const std::vector<bool>& value) const {
+    key->AppendPod(static_cast<uint32_t>(value.size()));
+    for (bool v : value) {
+      key->AppendPod(v);
+    }
+  }
+
+  void operator()(const std::vector<std::string>& value) const {
+    key->AppendPod(static_cast<uint32_t>(value.size()));
+    for (const auto& v : value) {
+      key->AppendString(v);
+    }
+  }
+};
+
+template <typename NameMap, typename ValueMap>
+bool AppendGcuOpKeyTensors(const NameMap& tensor_names,
+                           const ValueMap& tensor_values,
+                           bool with_initialized,
+                           GcuOpKey* key) {
+  key->AppendPod(static_cast<uint32_t>(tensor_names.size()));
+  for (const auto& slot : tensor_names) {
+    const auto& tensors = tensor_values.at(slot.first);
+    const size_t num = slot.second.size();
+    key->AppendString(slot.first);
+    key->AppendPod(static_cast<uint32_t>(num));
+    for (size_t i = 0; i < num; ++i) {
+      const auto* tensor = tensors[i];
+      if (tensor == nullptr) {
+        return false;
+      }
+      const auto& dims = tensor->dims();
+      const int32_t rank = static_cast<int32_t>(dims.size());
+      key->AppendPod(static_cast<int32_t>(tensor->dtype()));
+      key->AppendPod(rank);
+      for (int32_t d = 0; d < rank; ++d) {
+        key->AppendPod(static_cast<int64_t>(dims[d]));
+      }
+      if (with_initialized) {
+        key->AppendPod(tensor->initialized());
+      }
+    }
+  }
+  return true;
+}
+
+class GcuOpKeyReader {
+ public:
+  GcuOpKeyReader(const char* data, size_t size) : data_(data), size_(size) {}
+
+  bool Read(void* out, size_t size) {
+    if (size > size_ - pos_) {
+      return false;
+    }
+    std::memcpy(out, data_ + pos_, size);
+    pos_ += size;
+    return true;
+  }
+
+  template <typename T>
+  bool ReadPod(T* value) {
+    return Read(value, sizeof(T));
+  }
+
+  bool ReadString(std::string* value) {
+    uint32_t size = 0;
+    if (!ReadPod(&size) || size > size_ - pos_) {
+      return false;
+    }
+    value->assign(data_ + pos_, size);
+    pos_ += size;
+    return true;
+  }
+
+  bool done() const { return pos_ == size_; }
+
+ private:
+  const char* data_;
+  size_t size_;
+  size_t pos_ = 0;
+};
+
+// Reads attribute values written by GcuOpKeyAttrVisitor.
+inline bool ReadGcuOpKeyAttr(GcuOpKeyReader*, paddle::blank*) { return true; }
+
+inline bool ReadGcuOpKeyAttr(GcuOpKeyReader* reader, std::string* value) {
+  return reader->ReadString(value);
+}
+
+template <typename T>
+bool ReadGcuOpKeyAttr(GcuOpKeyReader* reader, T* value) {
+  static_assert(std::is_arithmetic<T>::value,
+                "Unsupported attribute type for GcuOpKey.");
+  return reader->ReadPod(value);
+}
+
+template <typename T>
+bool ReadGcuOpKeyAttr(GcuOpKeyReader* reader, std::vector<T>* value) {
+  uint32_t size = 0;
+  if (!reader->ReadPod(&size)) {
+    return false;
+  }
+  value->resize(size);
+  for (auto& v : *value) {
+    if (!ReadGcuOpKeyAttr(reader, &v)) {
+      return false;
+    }
+  }
+  return true;
+}
+
+inline bool ReadGcuOpKeyAttr(GcuOpKeyReader* reader, std::vector<bool>* value) {
+  uint32_t size = 0;
+  if (!reader->ReadPod(&size)) {
+    return false;
+  }
+  value->resize(size);
+  for (uint32_t i = 0; i < size; ++i) {
+    bool v = false;
+    if (!reader->ReadPod(&v)) {
+      return false;
+    }
+    (*value)[i] = v;
+  }
+  return true;
+}
+
+// Reads the alternative `index` of the attribute variant.
+template <typename Attribute, size_t I = 0>
+typename std::enable_if<(I == paddle::variant_size<Attribute>::value),
+                        bool>::type
+ReadGcuOpKeyVariant(GcuOpKeyReader*, uint32_t, Attribute*) {
+  return false;
+}
+
+template <typename Attribute, size_t I = 0>
+typename std::enable_if<(I < paddle::variant_size<Attribute>::value),
+                        bool>::type
+ReadGcuOpKeyVariant(GcuOpKeyReader* reader, uint32_t index, Attribute* attr) {
+  if (index != I) {
+    return ReadGcuOpKeyVariant<Attribute, I + 1>(reader, index, attr);
+  }
+  paddle::variant_alternative_t<I, Attribute> value;
+  if (!ReadGcuOpKeyAttr(reader, &value)) {
+    return false;
+  }
+  *attr = std::move(value);
+  return true;
+}
+
+template <typename Signature>
+bool ReadGcuOpKeyTensors(GcuOpKeyReader* reader,
+                         bool with_initialized,
+                         typename Signature::Slots* slots) {
+  uint32_t num_slots = 0;
+  if (!reader->ReadPod(&num_slots)) {
+    return false;
+  }
+  slots->resize(num_slots);
+  for (auto& slot : *slots) {
+    uint32_t num = 0;
+    if (!reader->ReadString(&slot.first) || !reader->ReadPod(&num)) {
+      return false;
+    }
+    slot.second.resize(num);
+    for (auto& tensor : slot.second) {
+      int32_t rank = 0;
+      if (!reader->ReadPod(&tensor.dtype) || !reader->ReadPod(&rank) ||
+          rank < 0) {
+        return false;
+      }
+      tensor.dims.resize(rank);
+      for (auto& d : tensor.dims) {
+        if (!reader->ReadPod(&d)) {
+          return false;
+        }
+      }
+      if (with_initialized && !reader->ReadPod(&tensor.initialized)) {
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+}  // namespace detail
+
+// An op run decoded from its key, enough to compile the op again ahead of
+// time. Variable names are not part of the key.
+template <typename Attribute>
+struct GcuOpSignature {
+  struct Tensor {
+    int32_t dtype = 0;
+    std::vector<int64_t> dims;
+    bool initialized = false;
+  };
+  using Slots = std::vector<std::pair<std::string, std::vector<Tensor>>>;
+
+  std::string op_type;
+  Slots inputs;
+  Slots outputs;
+  std::vector<std::pair<std::string, Attribute>> attrs;
+};
+
+// Inverse of BuildGcuOpKey. Returns false on a malformed key.
+template <typename Attribute>
+bool ParseGcuOpKey(const GcuOpKey& key, GcuOpSignature<Attribute>* sig) {
+  using Signature = GcuOpSignature<Attribute>;
+  detail::GcuOpKeyReader reader(key.data(), key.size());
+  uint32_t num_attrs = 0;
+  if (!reader.ReadString(&sig->op_type) ||
+      !detail::ReadGcuOpKeyTensors<Signature>(&reader, true, &sig->inputs) ||
+      !detail::ReadGcuOpKeyTensors<Signature>(&reader, false, &sig->outputs) ||
+      !reader.ReadPod(&num_attrs)) {
+    return false;
+  }
+  sig->attrs.resize(num_attrs);
+  for (auto& attr : sig->attrs) {
+    uint32_t index = 0;
+    if (!reader.ReadString(&attr.first) || !reader.ReadPod(&index) ||
+        !detail::ReadGcuOpKeyVariant(&reader, index, &attr.second)) {
+      return false;
+    }
+  }
+  return reader.done();
+}
+
+// Builds the key of a single op run: the op type, the dtype and dims of every
+// input and output slot, whether each input is initialized (uninitialized
+// inputs are compiled as constants), and the attributes sorted by name.
+// Works on the paddle tensor maps and on anything with the same interface.
+// Returns false when a tensor of a slot is missing.
+template <typename NameMap, typename ValueMap, typename AttrMap>
+bool BuildGcuOpKey(const std::string& op_type,
+                   const NameMap& input_names,
+                   const ValueMap& inputs,
+                   const NameMap& output_names,
+                   const ValueMap& outputs,
+                   const AttrMap& attrs,
+                   GcuOpKey* key) {
+  key->Clear();
+  key->AppendString(op_type);
+  if (!detail::AppendGcuOpKeyTensors(input_names, inputs, true, key) ||
+      !detail::AppendGcuOpKeyTensors(output_names, outputs, false, key)) {
+    return false;
+  }
+
+  // Attribute maps are unordered, sort them so that equal maps give equal
+  // keys. Ops have a few dozen attributes at most, sort on the stack then.
+  using Entry = typename AttrMap::value_type;
+  constexpr size_t kMaxStackAttrs = 64;
+  const Entry* stack_entries[kMaxStackAttrs];
+  std::vector<const Entry*> heap_entries;
+  const Entry** entries = stack_entries;
+  if (attrs.size() > kMaxStackAttrs) {
+    heap_entries.resize(attrs.size());
+    entries = heap_entries.data();
+  }
+  size_t num_attrs = 0;
+  for (const auto& attr : attrs) {
+    entries[num_attrs++] = &attr;
+  }
+  std::sort(entries, entries + num_attrs, [](const Entry* a, const Entry* b) {
+    return a->first < b->first;
+  });
+
+  key->AppendPod(static_cast<uint32_t>(num_attrs));
+  const detail::GcuOpKeyAttrVisitor visitor{key};
+  for (size_t i = 0; i < num_attrs; ++i) {
+    key->AppendString(entries[i]->first);
+    key->AppendPod(static_cast<uint32_t>(entries[i]->second.index()));
+    paddle::visit(visitor, entries[i]->second);
+  }
+  return true;
+}
+
+}  // namespace backend
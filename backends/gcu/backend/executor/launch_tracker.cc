@@ -0,0 +1,53 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#include "backend/executor/launch_tracker.h"
+
+#include "runtime/runtime.h"
+
+namespace backend {
+
+TopsEventApi::Event TopsEventApi::Create() {
+  topsEvent_t event;
+  RT_CHECK(topsEventCreate(&event));
+  return event;
+}
+
+void TopsEventApi::Destroy(Event event) { RT_CHECK(topsEventDestroy(event)); }
+
+void TopsEventApi::Record(Event event, Stream stream) {
+  RT_CHECK(topsEventRecord(event, stream));
+}
+
+bool TopsEventApi::Query(Event event) {
+  topsError_t ret = topsEventQuery(event);
+  if (ret == topsErrorNotReady) {
+    return false;
+  }
+  RT_CHECK(ret);
+  return true;
+}
+
+void TopsEventApi::Wait(Event event) { RT_CHECK(topsEventSynchronize(event)); }
+
+LaunchTracker* GetLaunchTracker() {
+  // Never destroyed: the tracked objects include handles of the executable
+  // caches, and the runtime may be gone at exit. Finalize releases the
+  // tracked launches.
+  static LaunchTracker* tracker =
+      new LaunchTracker(MaxInFlightLaunchesFromEnv());
+  return tracker;
+}
+
+}  // namespace backend
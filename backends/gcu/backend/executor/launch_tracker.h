@@ -0,0 +1,38 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+#include <tops/tops_ext.h>
+
+#include "backend/executor/stream_lifetime.h"
+
+namespace backend {
+
+struct TopsEventApi {
+  using Stream = topsStream_t;
+  using Event = topsEvent_t;
+  static Event Create();
+  static void Destroy(Event event);
+  static void Record(Event event, Stream stream);
+  static bool Query(Event event);
+  static void Wait(Event event);
+};
+
+using LaunchTracker = StreamLifetimeTracker<TopsEventApi>;
+
+// Tracks the JIT executable launches of the process. The runtime releases a
+// stream when it synchronizes or destroys it.
+LaunchTracker* GetLaunchTracker();
+
+}  // namespace backend
@@ -0,0 +1,120 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+
+#include <atomic>
+#include <cstdlib>
+#include <fstream>
+#include <mutex>  // NOLINT
+#include <string>
+#include <unordered_set>
+#include <vector>
+
+#include "backend/executor/gcu_op_key.h"
+#include "common/gcu_env_list.h"
+
+namespace backend {
+
+// Records the op keys of the JIT kernels a run hits, in the order they are
+// first seen. The key file written by Save is compiled ahead of time by the
+// warmup of a later run, before its first batch needs the executables.
+// PADDLE_GCU_RECORD_OPS_FILE records from the start and saves at exit.
+class OpKeyRecorder {
+ public:
+  static OpKeyRecorder* GetInstance() {
+    static OpKeyRecorder* recorder = []() {
+      auto* recorder = new OpKeyRecorder();
+      const char* file = std::getenv(env::kRecordOpsFile);
+      if (file != nullptr && file[0] != '\0') {
+        recorder->Start();
+      }
+      return recorder;
+    }();
+    return recorder;
+  }
+
+  // Checked for every JIT launch.
+  bool recording() const { return recording_.load(std::memory_order_relaxed); }
+
+  // Drops the keys of an earlier recording.
+  void Start() {
+    std::lock_guard<std::mutex> lock(mutex_);
+    seen_.clear();
+    keys_.clear();
+    recording_ = true;
+  }
+
+  void Stop() { recording_ = false; }
+
+  void Record(const GcuOpKey& key) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (seen_.insert(key).second) {
+      keys_.push_back(key);
+    }
+  }
+
+  std::vector<GcuOpKey> Keys() const {
+    std::lock_guard<std::mutex> lock(mutex_);
+    return keys_;
+  }
+
+  // Writes the recorded keys to `path`, one hex key per line. Returns false
+  // when the file can not be written.
+  bool Save(const std::string& path, size_t* count) const {
+    auto keys = Keys();
+    std::ofstream out(path);
+    for (const auto& key : keys) {
+      out << key.ToHex() << "\n";
+    }
+    if (count != nullptr) *count = keys.size();
+    return static_cast<bool>(out);
+  }
+
+ private:
+  std::atomic<bool> recording_{false};
+  mutable std::mutex mutex_;
+  std::unordered_set<GcuOpKey, GcuOpKeyHash> seen_;
+  std::vector<GcuOpKey> keys_;
+};
+
+// Reads a key file written by OpKeyRecorder::Save or by the compile cache
+// tool. Empty lines and lines starting with '#' are skipped, lines that are
+// not a hex key are counted in `malformed`. Returns false when the file can
+// not be read.
+inline bool LoadOpKeys(const std::string& path,
+                       std::vector<GcuOpKey>* keys,
+                       size_t* malformed) {
+  std::ifstream in(path);
+  if (!in) {
+    return false;
+  }
+  size_t num_malformed = 0;
+  std::string line;
+  while (std::getline(in, line)) {
+    if (line.empty() || line[0] == '#') {
+      continue;
+    }
+    GcuOpKey key;
+    if (key.FromHex(line)) {
+      keys->push_back(std::move(key));
+    } else {
+      ++num_malformed;
+    }
+  }
+  if (malformed != nullptr) *malformed = num_malformed;
+  return true;
+}
+
+}  // namespace backend
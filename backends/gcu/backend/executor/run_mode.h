@@ -0,0 +1,106 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+
+#include <atomic>
+#include <cstdlib>
+#include <cstring>
+#include <mutex>  // NOLINT
+#include <string>
+#include <unordered_map>
+
+#include "common/gcu_env_list.h"
+
+namespace backend {
+
+// kSync waits for the stream after each launch of the op, kAsync only
+// enqueues it and leaves the lifetime of its buffers to the launch tracker.
+enum class GcuRunMode { kSync, kAsync };
+
+// Run mode of the JIT executables per op type. The default comes from
+// PADDLE_RUN_ASYNC (async unless it is "false"), PADDLE_GCU_SYNC_OPS and
+// PADDLE_GCU_ASYNC_OPS list op types that override it, separated by commas.
+class GcuRunModes {
+ public:
+  explicit GcuRunModes(GcuRunMode default_mode) : default_(default_mode) {}
+
+  static GcuRunModes* GetInstance() {
+    static GcuRunModes* modes = []() {
+      const char* async = std::getenv(env::kStreamAsync);
+      auto* modes =
+          new GcuRunModes(async != nullptr && std::strcmp(async, "false") == 0
+                              ? GcuRunMode::kSync
+                              : GcuRunMode::kAsync);
+      modes->SetList(std::getenv(env::kSyncOps), GcuRunMode::kSync);
+      modes->SetList(std::getenv(env::kAsyncOps), GcuRunMode::kAsync);
+      return modes;
+    }();
+    return modes;
+  }
+
+  // Called for every launch, only locks when there are overrides.
+  GcuRunMode Get(const std::string& op_type) const {
+    if (!has_overrides_.load(std::memory_order_acquire)) {
+      return default_.load(std::memory_order_relaxed);
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto it = overrides_.find(op_type);
+    return it == overrides_.end() ? default_.load(std::memory_order_relaxed)
+                                  : it->second;
+  }
+
+  void SetDefault(GcuRunMode mode) { default_ = mode; }
+
+  void Set(const std::string& op_type, GcuRunMode mode) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    overrides_[op_type] = mode;
+    has_overrides_.store(true, std::memory_order_release);
+  }
+
+  // Drops the override of op_type, it runs in the default mode again.
+  void Reset(const std::string& op_type) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    overrides_.erase(op_type);
+    has_overrides_.store(!overrides_.empty(), std::memory_order_release);
+  }
+
+  // Sets the mode of the op types of a comma separated list.
+  void SetList(const char* op_types, GcuRunMode mode) {
+    if (op_types == nullptr) {
+      return;
+    }
+    std::string list(op_types);
+    size_t begin = 0;
+    while (begin <= list.size()) {
+      size_t end = list.find(',', begin);
+      if (end == std::string::npos) {
+        end = list.size();
+      }
+      const std::string op_type = list.substr(begin, end - begin);
+      if (!op_type.empty()) {
+        Set(op_type, mode);
+      }
+      begin = end + 1;
+    }
+  }
+
+ private:
+  std::atomic<GcuRunMode> default_;
+  std::atomic<bool> has_overrides_{false};
+  mutable std::mutex mutex_;
+  std::unordered_map<std::string, GcuRunMode> overrides_;
+};
+
+}  // namespace backend
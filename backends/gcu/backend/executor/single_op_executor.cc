@@ -61,6 +61,8 @@ SingleOpGcuExecutor::SingleOpGcuExecutor(
 
 void SingleOpGcuExecutor::ReleaseResource() {
   if (tops_exec_ != nullptr) {
+    // Every launch pins the executable until the launch tracker sees it
+    // done or the stream is synchronized, see GcuOpRunner::RunExecutable.
     RT_CHECK(topsDestroyExecutable(tops_exec_));
     tops_exec_ = nullptr;
   }
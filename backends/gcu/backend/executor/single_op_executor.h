@@ -15,12 +15,14 @@ limitations under the License. */
 #pragma once
 #include <tops/tops_ext.h>
 
-#include <map>
 #include <memory>
 #include <string>
 #include <vector>
 
+#include "backend/executor/compile_service.h"
+#include "backend/executor/executable_cache.h"
 #include "backend/executor/gcu_node.h"
+#include "backend/executor/gcu_op_key.h"
 #include "paddle/phi/backends/custom/custom_context.h"
 #include "paddle/phi/core/dense_tensor.h"
 
@@ -57,32 +59,31 @@ class SingleOpGcuExecutor {
   std::vector<GcuNode> output_nodes_;
 };
 
+// Process-wide cache of the compiled single op executables, keyed by the op
+// key. Safe to use from several threads, see ExecutableCache. Misses are
+// compiled through the compile service, one compile per key at a time.
 class SingleOpGcuExecutorManager {
  public:
-  ~SingleOpGcuExecutorManager() { ReleaseAll(); }
+  using Cache = ExecutableCache<GcuOpKey, SingleOpGcuExecutor, GcuOpKeyHash>;
+  using Handle = Cache::Handle;
+  using Compiler = CompileService<GcuOpKey, GcuOpKeyHash>;
 
-  void ReleaseAll() {
-    for (const auto& p : single_executors_) {
-      p.second->ReleaseResource();
-    }
-    single_executors_.clear();
-  }
-
-  void Add(const std::string& key,
-           const std::shared_ptr<SingleOpGcuExecutor>& exec) {
-    single_executors_[key] = exec;
-  }
+  void ReleaseAll() { cache_.Clear(); }
 
-  std::shared_ptr<SingleOpGcuExecutor> Find(const std::string& key) {
-    if (single_executors_.count(key) == 0) {
-      return nullptr;
-    }
-    auto exec = single_executors_[key];
+  Handle Add(const GcuOpKey& key,
+             const std::shared_ptr<SingleOpGcuExecutor>& exec,
+             size_t bytes) {
     PADDLE_ENFORCE_NE(
-        exec, nullptr, phi::errors::NotFound("buffered exec is nullptr"));
-    return exec;
+        exec, nullptr, phi::errors::InvalidArgument("exec is nullptr"));
+    return cache_.Insert(key, exec, bytes);
   }
 
+  Handle Find(const GcuOpKey& key) { return cache_.Find(key); }
+
+  Cache* cache() { return &cache_; }
+
+  Compiler* compile_service() { return &compile_service_; }
+
  public:
   static SingleOpGcuExecutorManager* GetInstance() {
     static SingleOpGcuExecutorManager manager;
@@ -90,7 +91,13 @@ class SingleOpGcuExecutorManager {
   }
 
  private:
-  std::map<std::string, std::shared_ptr<SingleOpGcuExecutor>> single_executors_;
+  static constexpr size_t kNumShards = 16;
+
+  Cache cache_{kNumShards,
+               ExecutableCacheCapacityFromEnv(),
+               ExecutableCacheBytesFromEnv()};
+  // Destroyed first, running compiles still insert into the cache.
+  Compiler compile_service_{CompileThreadsFromEnv()};
 };
 
 }  // namespace backend
@@ -0,0 +1,251 @@
+/* Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License. */
+
+#pragma once
+
+#include <atomic>
+#include <cstdint>
+#include <cstdlib>
+#include <deque>
+#include <memory>
+#include <mutex>  // NOLINT
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "common/gcu_env_list.h"
+
+namespace backend {
+
+struct StreamLifetimeStats {
+  uint64_t tracked = 0;
+  uint64_t released = 0;
+  uint64_t in_flight = 0;
+  // Launches that had to wait for the device because a stream had
+  // max_in_flight launches queued.
+  uint64_t throttled = 0;
+};
+
+// Keeps the host objects a launch uses (the pinned executable, the
+// allocations of its inputs and outputs) alive until the device has run the
+// launch, without blocking the host. Track records an event on the stream
+// after the launch, the objects are released once a later Track, Poll or
+// Release sees the event complete. Work on one stream completes in order, so
+// only the oldest launches of a stream are queried.
+//
+// Api is the event interface of the runtime:
+//   using Stream, Event;
+//   static Event Create();
+//   static void Destroy(Event);
+//   static void Record(Event, Stream);
+//   static bool Query(Event);  // true when complete
+//   static void Wait(Event);
+template <typename Api>
+class StreamLifetimeTracker {
+ public:
+  using Stream = typename Api::Stream;
+  using Event = typename Api::Event;
+  using KeepAlive = std::vector<std::shared_ptr<void>>;
+
+  // At most max_in_flight launches of a stream are tracked, the oldest one is
+  // waited for beyond that. 0 means unbounded.
+  explicit StreamLifetimeTracker(size_t max_in_flight)
+      : id_(NextId()), max_in_flight_(max_in_flight) {}
+
+  ~StreamLifetimeTracker() {
+    ReleaseAll();
+    for (auto& it : queues_) {
+      for (auto event : it.second->free_events) {
+        Api::Destroy(event);
+      }
+    }
+  }
+
+  StreamLifetimeTracker(const StreamLifetimeTracker&) = delete;
+  StreamLifetimeTracker& operator=(const StreamLifetimeTracker&) = delete;
+
+  // Keeps `objects` alive until the work enqueued on `stream` so far is done.
+  void Track(Stream stream, KeepAlive objects) {
+    Queue* queue = QueueOf(stream);
+    std::vector<KeepAlive> done;
+    {
+      std::lock_guard<std::mutex> lock(queue->mutex);
+      Event event;
+      if (queue->free_events.empty()) {
+        event = Api::Create();
+      } else {
+        event = queue->free_events.back();
+        queue->free_events.pop_back();
+      }
+      Api::Record(event, stream);
+      queue->launches.push_back({event, std::move(objects)});
+      tracked_++;
+      PopCompletedLocked(queue, &done);
+      if (max_in_flight_ > 0 && queue->launches.size() > max_in_flight_) {
+        throttled_++;
+        Api::Wait(queue->launches.front().event);
+        PopCompletedLocked(queue, &done);
+      }
+    }
+    Finish(&done);
+  }
+
+  // Releases the objects of the completed launches of `stream`.
+  void Poll(Stream stream) {
+    Queue* queue = FindQueue(stream);
+    if (queue == nullptr) {
+      return;
+    }
+    std::vector<KeepAlive> done;
+    {
+      std::lock_guard<std::mutex> lock(queue->mutex);
+      PopCompletedLocked(queue, &done);
+    }
+    Finish(&done);
+  }
+
+  // Waits for the tracked launches of `stream` and releases their objects.
+  // Cheap after the stream was synchronized.
+  void Release(Stream stream) {
+    Queue* queue = FindQueue(stream);
+    if (queue == nullptr) {
+      return;
+    }
+    std::vector<KeepAlive> done;
+    {
+      std::lock_guard<std::mutex> lock(queue->mutex);
+      if (!queue->launches.empty()) {
+        Api::Wait(queue->launches.back().event);
+      }
+      PopCompletedLocked(queue, &done);
+    }
+    Finish(&done);
+  }
+
+  void ReleaseAll() {
+    std::vector<Stream> streams;
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      for (auto& it : queues_) {
+        streams.push_back(it.first);
+      }
+    }
+    for (auto stream : streams) {
+      Release(stream);
+    }
+  }
+
+  StreamLifetimeStats GetStats() const {
+    StreamLifetimeStats stats;
+    stats.tracked = tracked_;
+    stats.released = released_;
+    stats.in_flight = stats.tracked - stats.released;
+    stats.throttled = throttled_;
+    return stats;
+  }
+
+ private:
+  struct Launch {
+    Event event;
+    KeepAlive objects;
+  };
+
+  // The launches of a stream in enqueue order, and the events of completed
+  // launches for reuse.
+  struct Queue {
+    std::mutex mutex;
+    std::deque<Launch> launches;
+    std::vector<Event> free_events;
+  };
+
+  // The last queue a thread used, a thread mostly launches on one stream.
+  // Trackers are told apart by an id, a new one may reuse the address of a
+  // destroyed one.
+  struct LastQueue {
+    uint64_t tracker_id = 0;
+    Stream stream;
+    Queue* queue = nullptr;
+  };
+
+  static uint64_t NextId() {
+    static std::atomic<uint64_t> next_id(1);
+    return next_id++;
+  }
+
+  static LastQueue* ThreadLastQueue() {
+    static thread_local LastQueue last;
+    return &last;
+  }
+
+  Queue* FindQueue(Stream stream) {
+    LastQueue* last = ThreadLastQueue();
+    if (last->tracker_id == id_ && last->stream == stream) {
+      return last->queue;
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto it = queues_.find(stream);
+    return it == queues_.end() ? nullptr : it->second.get();
+  }
+
+  // Queues are never erased, a program uses a handful of streams.
+  Queue* QueueOf(Stream stream) {
+    LastQueue* last = ThreadLastQueue();
+    if (last->tracker_id == id_ && last->stream == stream) {
+      return last->queue;
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto& queue = queues_[stream];
+    if (queue == nullptr) {
+      queue.reset(new Queue());
+    }
+    last->tracker_id = id_;
+    last->stream = stream;
+    last->queue = queue.get();
+    return queue.get();
+  }
+
+  void PopCompletedLocked(Queue* queue, std::vector<KeepAlive>* done) {
+    while (!queue->launches.empty() &&
+           Api::Query(queue->launches.front().event)) {
+      queue->free_events.push_back(queue->launches.front().event);
+      done->push_back(std::move(queue->launches.front().objects));
+      queue->launches.pop_front();
+    }
+  }
+
+  // Releasing the objects may evict executables or free device memory, it
+  // is done outside the locks.
+  void Finish(std::vector<KeepAlive>* done) {
+    if (!done->empty()) {
+      released_ += done->size();
+      done->clear();
+    }
+  }
+
+  const uint64_t id_;
+  const size_t max_in_flight_;
+  std::mutex mutex_;
+  std::unordered_map<Stream, std::unique_ptr<Queue>> queues_;
+  std::atomic<uint64_t> tracked_{0};
+  std::atomic<uint64_t> released_{0};
+  std::atomic<uint64_t> throttled_{0};
+};
+
+// Max queued launches per stream, from PADDLE_GCU_MAX_INFLIGHT_LAUNCHES.
+inline size_t MaxInFlightLaunchesFromEnv() {
+  static const char* env = std::getenv(env::kMaxInFlightLaunches);
+  return env == nullptr ? 1024 : std::strtoull(env, nullptr, 10);
+}
+
+}  // namespace backend
@@ -19,6 +19,7 @@ limitations under the License. */
 #include <string>
 #include <vector>
 
+#include "backend/executor/compile_cache.h"
 #include "common/utils.h"
 #include "gcu/tops_graph_compiler/tops_graph_compiler.h"
 #include "gcu/tops_graph_compiler/tops_graph_compiler_option.h"
@@ -76,8 +77,11 @@ std::vector<std::string> GetTopsCompileOptions() {
   return opts;
 }
 
-topsExecutable_t CompileTopsExecutable(
-    const std::shared_ptr<hlir::Module>& module) {
+namespace {
+
+topsExecutable_t CompileAndCache(const std::shared_ptr<hlir::Module>& module,
+                                 const GcuOpKey* cache_key,
+                                 uint64_t* binary_size_out) {
   std::vector<const char*> options;
   auto compile_options = GetTopsCompileOptions();
   for (auto& option : compile_options) {
@@ -103,8 +107,64 @@ topsExecutable_t CompileTopsExecutable(
 
   topsExecutable_t exe;
   RT_CHECK(topsCreateExecutable(&exe, binary.get(), binary_size));
+  if (binary_size_out != nullptr) {
+    *binary_size_out = binary_size;
+  }
+
+  auto cache = CompileCache::GetInstance();
+  if (cache_key != nullptr && cache->enabled() &&
+      !cache->Store(*cache_key,
+                    GetCompileCacheFingerprint(),
+                    binary.get(),
+                    binary_size)) {
+    VLOG(3) << "Failed to store the executable in the compile cache "
+            << cache->dir();
+  }
 
   return exe;
 }
 
+}  // namespace
+
+const std::string& GetCompileCacheFingerprint() {
+  static const std::string fingerprint = []() {
+    std::string s = "format=1;target=" + custom_kernel::GetTargetName();
+#ifdef PADDLE_GCU_TOPS_VERSION
+    s += ";tops=" PADDLE_GCU_TOPS_VERSION;
+#endif
+    s += ";options=";
+    for (const auto& option : GetTopsCompileOptions()) {
+      s += option + " ";
+    }
+    return s;
+  }();
+  return fingerprint;
+}
+
+topsExecutable_t CompileTopsExecutable(
+    const std::shared_ptr<hlir::Module>& module, uint64_t* binary_size) {
+  return CompileAndCache(module, nullptr, binary_size);
+}
+
+topsExecutable_t CompileTopsExecutable(
+    const std::shared_ptr<hlir::Module>& module,
+    const GcuOpKey& cache_key,
+    uint64_t* binary_size) {
+  auto cache = CompileCache::GetInstance();
+  if (cache->enabled()) {
+    auto binary = cache->Load(cache_key, GetCompileCacheFingerprint());
+    if (binary != nullptr) {
+      VLOG(6) << "Load the executable from the compile cache, binary size: "
+              << binary->size();
+      topsExecutable_t exe;
+      RT_CHECK(topsCreateExecutable(&exe, binary->data(), binary->size()));
+      if (binary_size != nullptr) {
+        *binary_size = binary->size();
+      }
+      return exe;
+    }
+  }
+  return CompileAndCache(module, &cache_key, binary_size);
+}
+
 }  // namespace backend
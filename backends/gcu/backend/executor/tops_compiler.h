@@ -16,14 +16,32 @@ limitations under the License. */
 
 #include <tops/tops_ext.h>
 
+#include <cstdint>
 #include <memory>
+#include <string>
+
+#include "backend/executor/gcu_op_key.h"
 
 namespace hlir {
 class Module;
 }
 
 namespace backend {
+// Compiles the module, the size of the executable binary is stored in
+// binary_size when it is not null.
+topsExecutable_t CompileTopsExecutable(
+    const std::shared_ptr<hlir::Module> &module,
+    uint64_t *binary_size = nullptr);
+
+// Same as above, but first looks the binary of `cache_key` up in the
+// persistent compile cache, and stores the compiled binary there on a miss.
 topsExecutable_t CompileTopsExecutable(
-    const std::shared_ptr<hlir::Module> &module);
+    const std::shared_ptr<hlir::Module> &module,
+    const GcuOpKey &cache_key,
+    uint64_t *binary_size = nullptr);
+
+// Everything besides the op key that a compiled binary depends on: the cache
+// format, the target, the compile options and the TopsPlatform version.
+const std::string &GetCompileCacheFingerprint();
 
 }  // namespace backend
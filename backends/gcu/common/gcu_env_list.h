@@ -21,4 +21,15 @@ namespace env {
 const char *const kUseJitKernels = "PADDLE_GCU_USE_JIT_KERNELS_ONLY";
 const char *const kProfiler = "PADDLE_GCU_PROFILE";
 const char *const kStreamAsync = "PADDLE_RUN_ASYNC";
+const char *const kExecutableCacheCapacity =
+    "PADDLE_GCU_EXECUTABLE_CACHE_CAPACITY";
+const char *const kExecutableCacheBytes = "PADDLE_GCU_EXECUTABLE_CACHE_BYTES";
+const char *const kCompileCacheDir = "PADDLE_GCU_COMPILE_CACHE_DIR";
+const char *const kCompileCacheBytes = "PADDLE_GCU_COMPILE_CACHE_BYTES";
+const char *const kSyncOps = "PADDLE_GCU_SYNC_OPS";
+const char *const kAsyncOps = "PADDLE_GCU_ASYNC_OPS";
+const char *const kMaxInFlightLaunches = "PADDLE_GCU_MAX_INFLIGHT_LAUNCHES";
+const char *const kCompileThreads = "PADDLE_GCU_COMPILE_THREADS";
+const char *const kWarmupFile = "PADDLE_GCU_WARMUP_FILE";
+const char *const kRecordOpsFile = "PADDLE_GCU_RECORD_OPS_FILE";
 }  // namespace env
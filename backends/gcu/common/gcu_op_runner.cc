@@ -14,20 +14,30 @@
 
 #include "common/gcu_op_runner.h"
 
+#include <chrono>  // NOLINT [build/c++11]
+#include <cstdlib>
+#include <future>  // NOLINT [build/c++11]
+#include <list>
 #include <map>
 #include <memory>
+#include <mutex>  // NOLINT [build/c++11]
 #include <set>
 #include <string>
 #include <utility>
 #include <vector>
 
 #include "backend/equivalence_trans/all_ops.h"
+#include "backend/executor/launch_tracker.h"
+#include "backend/executor/op_key_recorder.h"
+#include "backend/executor/run_mode.h"
 #include "backend/executor/single_op_executor.h"
 #include "backend/executor/tops_compiler.h"
 #include "backend/utils/gcu_op_desc.h"
 #include "backend/utils/utils.h"
+#include "common/gcu_env_list.h"
 #include "common/gcu_funcs.h"
 #include "runtime/flags.h"
+#include "runtime/runtime.h"
 
 namespace custom_kernel {
 namespace {
@@ -36,6 +46,36 @@ const char* const kRunningModeSerial = "serial";
 const char* const kPlaceHolder = " ";
 
 static std::set<std::string> kUnusedArchetype = {"ReserveSpace"};
+
+void SplitNamesAndValues(const std::vector<TensorNameValuePair>& vars,
+                         std::vector<std::string>* names,
+                         std::vector<LoDTensor*>* values) {
+  for (const auto& name_value : vars) {
+    names->push_back(name_value.first);
+    values->push_back(name_value.second);
+  }
+}
+
+// Queues the compiles of the key file of PADDLE_GCU_WARMUP_FILE once, on the
+// device of the first JIT op.
+void WarmupFromEnv(const phi::DeviceContext& device_context) {
+  static std::once_flag once;
+  std::call_once(once, [&device_context]() {
+    const char* file = std::getenv(env::kWarmupFile);
+    if (file == nullptr || file[0] == '\0') {
+      return;
+    }
+    std::vector<backend::GcuOpKey> keys;
+    size_t malformed = 0;
+    if (!backend::LoadOpKeys(file, &keys, &malformed)) {
+      LOG(WARNING) << "Can not read the warmup file " << file;
+      return;
+    }
+    VLOG(0) << "Warming up " << keys.size() << " GCU op signatures from "
+            << file << " (" << malformed << " malformed lines)";
+    WarmupGcuOps(keys, device_context, false);
+  });
+}
 }  // namespace
 
 using GcuOpDesc = backend::GcuOpDesc;
@@ -134,12 +174,10 @@ std::string GcuOpRunner::AttrString(const GcuExecutionContext& ctx) {
     } else if (value.type() == typeid(std::vector<double>)) {
       os << backend::VectorToString(
           PADDLE_GET_CONST(std::vector<double>, attrs_map.at(iter.first)));
+    } else if (value.type() == typeid(double)) {
+      os << PADDLE_GET_CONST(double, attrs_map.at(iter.first));
     } else {
-      // BlockDesc* std::vector<BlockDesc*> unsupport for string
-      uint64_t ms = std::chrono::duration_cast<std::chrono::milliseconds>(
-                        std::chrono::system_clock::now().time_since_epoch())
-                        .count();
-      os << std::to_string(ms);
+      os << "unknown";
     }
     os << "; ";
   }
@@ -190,6 +228,22 @@ std::string GcuOpRunner::BuildSignature(const GcuExecutionContext& ctx) {
   return os.str();
 }
 
+void GcuOpRunner::BuildOpKey(const GcuExecutionContext& ctx,
+                             backend::GcuOpKey* key) {
+  bool complete = backend::BuildGcuOpKey(ctx.Type(),
+                                         ctx.AllInputNames(),
+                                         ctx.AllInputs(),
+                                         ctx.AllOutputNames(),
+                                         ctx.AllOutputs(),
+                                         ctx.Attrs(),
+                                         key);
+  PADDLE_ENFORCE_EQ(
+      complete,
+      true,
+      phi::errors::InvalidArgument(
+          "op type:%s has a null input or output tensor.", ctx.Type()));
+}
+
 void GcuOpRunner::CompileAndRun(
     const GcuExecutionContext& ctx,
     const std::vector<TensorNameValuePair>& input_vars,
@@ -198,49 +252,83 @@ void GcuOpRunner::CompileAndRun(
 
   VLOG(3) << "op " << ctx.Type() << " start to run program ";
 
-  std::hash<std::string> hasher;
-  std::string signature = BuildSignature(ctx);
-
-  VLOG(3) << "[JIT_KERNEL] " << ctx.Type() << " signature: " << signature;
+  backend::GcuOpKey program_key;
+  BuildOpKey(ctx, &program_key);
 
-  auto program_key = std::to_string(hasher(signature + ctx.Type()));
+  if (VLOG_IS_ON(3)) {
+    VLOG(3) << "[JIT_KERNEL] " << ctx.Type()
+            << " key: " << program_key.ToString()
+            << " signature: " << BuildSignature(ctx);
+  }
 
   std::vector<LoDTensor*> inputs;
   std::vector<LoDTensor*> outputs;
   std::vector<std::string> input_names;
   std::vector<std::string> output_names;
-
-  for (auto name_value : input_vars) {
-    input_names.push_back(name_value.first);
-    inputs.push_back(name_value.second);
-  }
-  for (auto name_value : output_vars) {
-    output_names.push_back(name_value.first);
-    outputs.push_back(name_value.second);
-  }
+  SplitNamesAndValues(input_vars, &input_names, &inputs);
+  SplitNamesAndValues(output_vars, &output_names, &outputs);
 
   VLOG(6) << "op " << ctx.Type() << ", input_names: " << input_names.size()
           << ", output_names: " << output_names.size()
           << ", inputs: " << inputs.size() << ", outputs: " << outputs.size();
 
+  auto* recorder = backend::OpKeyRecorder::GetInstance();
+  if (recorder->recording()) {
+    recorder->Record(program_key);
+  }
+
   auto manager = backend::SingleOpGcuExecutorManager::GetInstance();
   auto gcu_exec = manager->Find(program_key);
-  if (gcu_exec == nullptr) {
-    CompileExecutable(
-        ctx, program_key, inputs, outputs, input_names, output_names);
+  if (!gcu_exec) {
+    // A compile of the key in flight, from another thread or the warmup, is
+    // waited for instead of compiling it twice.
+    bool compiled = manager->compile_service()->Run(program_key, [&]() {
+      gcu_exec = CompileExecutable(
+          ctx, program_key, inputs, outputs, input_names, output_names);
+    });
+    if (!compiled) {
+      gcu_exec = manager->Find(program_key);
+    }
+    // Refreshed dynamic shape keys are cached under the refreshed key.
+    if (!gcu_exec) {
+      gcu_exec = CompileExecutable(
+          ctx, program_key, inputs, outputs, input_names, output_names);
+    }
   }
 
-  RunExecutableSync(ctx,
-                    program_key,
-                    inputs,
-                    outputs,
-                    input_names,
-                    output_names,
-                    tensor_split);
+  // The handle pins the executable, it can not be evicted while running.
+  RunExecutable(ctx,
+                std::move(gcu_exec),
+                inputs,
+                outputs,
+                input_names,
+                output_names,
+                tensor_split);
 
   VLOG(3) << "op " << ctx.Type() << " run program finished.";
 }
 
+void GcuOpRunner::Compile(const GcuExecutionContext& ctx) {
+  std::vector<TensorNameValuePair> input_vars;
+  std::vector<TensorNameValuePair> output_vars;
+  GetInputsAndOutputs(ctx, input_vars, output_vars);
+
+  backend::GcuOpKey program_key;
+  BuildOpKey(ctx, &program_key);
+  if (backend::SingleOpGcuExecutorManager::GetInstance()->Find(program_key)) {
+    return;
+  }
+
+  std::vector<LoDTensor*> inputs;
+  std::vector<LoDTensor*> outputs;
+  std::vector<std::string> input_names;
+  std::vector<std::string> output_names;
+  SplitNamesAndValues(input_vars, &input_names, &inputs);
+  SplitNamesAndValues(output_vars, &output_names, &outputs);
+  CompileExecutable(
+      ctx, program_key, inputs, outputs, input_names, output_names);
+}
+
 GcuOpPtr GcuOpRunner::AddGteOp(const LoDTensor* tensor,
                                const std::string& tensor_name,
                                const GcuOpPtr& input) {
@@ -267,24 +355,25 @@ GcuOpPtr GcuOpRunner::AddGteOp(const LoDTensor* tensor,
   return std::make_shared<GcuOp>(builder::GetTupleElement(*input, idx));
 }
 
-void GcuOpRunner::CompileExecutable(
+backend::SingleOpGcuExecutorManager::Handle GcuOpRunner::CompileExecutable(
     const GcuExecutionContext& ctx,
-    const std::string& program_key_in,
+    const backend::GcuOpKey& program_key_in,
     const std::vector<LoDTensor*>& inputs,
     const std::vector<LoDTensor*>& outputs,
     const std::vector<std::string>& input_names,
     const std::vector<std::string>& output_names) {  // NOLINT
   auto op_type = ctx.Type();
   VLOG(3) << "OpType " << op_type << " start to compile. ";
-  std::string program_key = program_key_in;
+  auto compile_start = std::chrono::steady_clock::now();
+  backend::GcuOpKey program_key = program_key_in;
   std::map<std::string, GcuOpPtr> gcu_op_cache;
   std::map<std::string, LoDTensor*> tensor_cache;
 
   GcuBuilderPtr builder = std::make_shared<GcuBuilder>();
-  PADDLE_ENFORCE_NE(
-      builder,
-      nullptr,
-      phi::errors::Fatal("builfer is nullptr, graph:%s", program_key.c_str()));
+  PADDLE_ENFORCE_NE(builder,
+                    nullptr,
+                    phi::errors::Fatal("builfer is nullptr, graph:%s",
+                                       program_key.ToString().c_str()));
   builder->SetShapeInference(true);
 
   auto func =
@@ -611,17 +700,17 @@ void GcuOpRunner::CompileExecutable(
   }
 
   if (refresh_program_key) {
-    std::hash<std::string> hasher;
-    std::string signature = BuildSignature(ctx);
+    BuildOpKey(ctx, &program_key);
 
-    VLOG(3) << "[JIT_KERNEL] " << ctx.Type()
-            << " signature(refreshed): " << signature;
-
-    program_key = std::to_string(hasher(signature + ctx.Type()));
+    if (VLOG_IS_ON(3)) {
+      VLOG(3) << "[JIT_KERNEL] " << ctx.Type()
+              << " key(refreshed): " << program_key.ToString()
+              << " signature(refreshed): " << BuildSignature(ctx);
+    }
     auto manager = backend::SingleOpGcuExecutorManager::GetInstance();
     auto gcu_exec = manager->Find(program_key);
-    if (gcu_exec != nullptr) {
-      return;
+    if (gcu_exec) {
+      return gcu_exec;
     }
   }
 
@@ -640,33 +729,37 @@ void GcuOpRunner::CompileExecutable(
 
   auto hlir_module = builder->GetModule();
 
-  VLOG(3) << "Compiler begin to CompileHLIR for program " << program_key;
+  VLOG(3) << "Compiler begin to CompileHLIR for program "
+          << program_key.ToString();
+  uint64_t binary_size = 0;
   topsExecutable_t tops_executable =
-      backend::CompileTopsExecutable(hlir_module);
-  VLOG(3) << "Compiler CompileHLIR end for program " << program_key;
+      backend::CompileTopsExecutable(hlir_module, program_key, &binary_size);
+  VLOG(3) << "Compiler CompileHLIR end for program " << program_key.ToString()
+          << ", binary size: " << binary_size;
 
   auto gcu_exec = std::make_shared<backend::SingleOpGcuExecutor>(
       op_type, tops_executable, input_nodes, output_nodes);
-  manager->Add(program_key, gcu_exec);
+  manager->cache()->RecordCompile(
+      std::chrono::duration_cast<std::chrono::microseconds>(
+          std::chrono::steady_clock::now() - compile_start)
+          .count());
+  return manager->Add(program_key, gcu_exec, binary_size);
 }
 
-void GcuOpRunner::RunExecutableSync(
+void GcuOpRunner::RunExecutable(
     const GcuExecutionContext& ctx,
-    const std::string& program_key,
+    backend::SingleOpGcuExecutorManager::Handle gcu_exec,
     const std::vector<LoDTensor*>& inputs,
     const std::vector<LoDTensor*>& outputs,
     const std::vector<std::string>& input_names,
     const std::vector<std::string>& output_names,
     bool tensor_split) {
-  VLOG(3) << "=== start RunExecutableSync ===";
+  VLOG(3) << "=== start RunExecutable ===";
 
-  auto manager = backend::SingleOpGcuExecutorManager::GetInstance();
-  auto gcu_exec = manager->Find(program_key);
-
-  PADDLE_ENFORCE_NOT_NULL(
-      gcu_exec,
-      phi::errors::NotFound("Not found executor for program_key:%s",
-                            program_key.c_str()));
+  PADDLE_ENFORCE_EQ(
+      static_cast<bool>(gcu_exec),
+      true,
+      phi::errors::NotFound("Not found executor for op %s", ctx.Type()));
 
   auto device_context =
       static_cast<const phi::CustomContext*>(&ctx.GetDeviceContext());
@@ -684,16 +777,39 @@ void GcuOpRunner::RunExecutableSync(
 
   gcu_exec->RunGcuOp(device_context, inputs, outputs, tensor_split);
 
+  // Reading the outputs on the host needs them to be computed.
+  if (print_tensor || backend::GcuRunModes::GetInstance()->Get(ctx.Type()) ==
+                          backend::GcuRunMode::kSync) {
+    device_context->Wait();
+  } else {
+    backend::LaunchTracker::KeepAlive objects;
+    objects.reserve(inputs.size() + outputs.size() + 1);
+    objects.push_back(
+        std::make_shared<backend::SingleOpGcuExecutorManager::Handle>(
+            std::move(gcu_exec)));
+    for (const auto* tensors : {&inputs, &outputs}) {
+      for (const auto* tensor : *tensors) {
+        if (tensor->initialized()) {
+          objects.push_back(tensor->Holder());
+        }
+      }
+    }
+    backend::GetLaunchTracker()->Track(
+        static_cast<topsStream_t>(device_context->stream()),
+        std::move(objects));
+  }
+
   if (print_tensor) {
     for (size_t i = 0; i < outputs.size(); ++i) {
       std::vector<float> output_vct;
-      TensorToVector(*device_context, *inputs[i], *device_context, &output_vct);
+      TensorToVector(
+          *device_context, *outputs[i], *device_context, &output_vct);
       VLOG(6) << "run exec outputs " << i << " name " << output_names[i] << " "
               << backend::VectorToString(output_vct);
     }
   }
 
-  VLOG(3) << "=== end RunExecutableSync ===";
+  VLOG(3) << "=== end RunExecutable ===";
 }
 
 void GcuRunner(const TensorNameMap& input_names,
@@ -712,8 +828,106 @@ void GcuRunner(const TensorNameMap& input_names,
                           op_type,
                           device_context);
 
+  WarmupFromEnv(device_context);
+
   GcuOpRunner gcu_op;
   gcu_op.Compute(ctx, tensor_split);
 }
 
+bool CompileGcuOpKey(const backend::GcuOpKey& key,
+                     const phi::DeviceContext& device_context) {
+  backend::GcuOpSignature<GcuAttribute> sig;
+  if (!backend::ParseGcuOpKey(key, &sig)) {
+    return false;
+  }
+
+  // Variable names are not part of the key, every tensor gets a name of its
+  // own. The compiled graph reads initialized inputs as parameters and
+  // compiles uninitialized ones as constants. Compiling only reads the meta
+  // of the inputs, an initialized one gets a placeholder allocation instead
+  // of device memory.
+  static char placeholder;
+  std::list<DenseTensor> tensors;
+  auto make_slots =
+      [&](const backend::GcuOpSignature<GcuAttribute>::Slots& slots,
+          bool allocate,
+          TensorNameMap* names,
+          TensorValueMap* values) {
+        for (const auto& slot : slots) {
+          auto& slot_names = (*names)[slot.first];
+          auto& slot_values = (*values)[slot.first];
+          for (const auto& t : slot.second) {
+            tensors.emplace_back();
+            auto& tensor = tensors.back();
+            tensor.set_meta(phi::DenseTensorMeta(
+                static_cast<phi::DataType>(t.dtype), phi::make_ddim(t.dims)));
+            if (allocate && t.initialized) {
+              tensor.ResetHolder(std::make_shared<phi::Allocation>(
+                  &placeholder,
+                  tensor.numel() * phi::SizeOf(tensor.dtype()),
+                  device_context.GetPlace()));
+            }
+            slot_names.push_back(slot.first + "." +
+                                 std::to_string(slot_values.size()));
+            slot_values.push_back(&tensor);
+          }
+        }
+      };
+  TensorNameMap input_names;
+  TensorValueMap inputs;
+  TensorNameMap output_names;
+  TensorValueMap outputs;
+  make_slots(sig.inputs, true, &input_names, &inputs);
+  make_slots(sig.outputs, false, &output_names, &outputs);
+  GcuAttributeMap attrs(sig.attrs.begin(), sig.attrs.end());
+
+  GcuExecutionContext ctx(input_names,
+                          inputs,
+                          output_names,
+                          outputs,
+                          attrs,
+                          sig.op_type,
+                          device_context);
+  GcuOpRunner gcu_op;
+  gcu_op.Compile(ctx);
+  return true;
+}
+
+size_t WarmupGcuOps(const std::vector<backend::GcuOpKey>& keys,
+                    const phi::DeviceContext& device_context,
+                    bool wait) {
+  auto* service =
+      backend::SingleOpGcuExecutorManager::GetInstance()->compile_service();
+  const int device_id = device_context.GetPlace().GetDeviceId();
+  std::vector<std::shared_future<void>> compiles;
+  compiles.reserve(keys.size());
+  for (const auto& key : keys) {
+    compiles.push_back(
+        service->Submit(key, [key, device_id, &device_context]() {
+          try {
+            RT_CHECK(topsSetDevice(device_id));
+            PADDLE_ENFORCE_EQ(CompileGcuOpKey(key, device_context),
+                              true,
+                              phi::errors::InvalidArgument(
+                                  "Malformed op key %s.", key.ToHex()));
+          } catch (const std::exception& e) {
+            LOG(WARNING) << "Failed to warm up " << key.ToHex() << ": "
+                         << e.what();
+            throw;
+          }
+        }));
+  }
+  size_t failed = 0;
+  if (wait) {
+    for (auto& compile : compiles) {
+      try {
+        compile.get();
+      } catch (const std::exception&) {
+        ++failed;
+      }
+    }
+  }
+  return failed;
+}
+
 }  // namespace custom_kernel
@@ -20,6 +20,8 @@
 #include <utility>
 #include <vector>
 
+#include "backend/executor/gcu_op_key.h"
+#include "backend/executor/single_op_executor.h"
 #include "backend/utils/utils.h"
 #include "common/gcu_funcs.h"
 
@@ -234,6 +236,9 @@ class GcuOpRunner {
     CompileAndRun(ctx, input_vars, output_vars, tensor_split);
   }
 
+  // Compiles the op into the executable cache without running it.
+  void Compile(const GcuExecutionContext& ctx);
+
   virtual ~GcuOpRunner() = default;
 
  private:
@@ -242,8 +247,10 @@ class GcuOpRunner {
       std::vector<TensorNameValuePair>& input_vars,    // NOLINT
       std::vector<TensorNameValuePair>& output_vars);  // NOLINT
 
+  // Readable signature of the op, only built for logging.
   std::string AttrString(const GcuExecutionContext& ctx);
   std::string BuildSignature(const GcuExecutionContext& ctx);
+  void BuildOpKey(const GcuExecutionContext& ctx, backend::GcuOpKey* key);
   void CompileAndRun(const GcuExecutionContext& ctx,
                      const std::vector<TensorNameValuePair>& input_vars,
                      const std::vector<TensorNameValuePair>& output_vars,
@@ -251,21 +258,24 @@ class GcuOpRunner {
   GcuOpPtr AddGteOp(const LoDTensor* tensor,
                     const std::string& tensor_name,
                     const GcuOpPtr& input);
-  void CompileExecutable(const GcuExecutionContext& ctx,
-                         const std::string& program_key_in,
-                         const std::vector<LoDTensor*>& inputs,
-                         const std::vector<LoDTensor*>& outputs,
-                         const std::vector<std::string>& input_names,
-                         const std::vector<std::string>& output_names);
-  void RunExecutableSync(const GcuExecutionContext& ctx,
-                         const std::string& program_key,
-                         const std::vector<LoDTensor*>& inputs,
-                         const std::vector<LoDTensor*>& outputs,
-                         const std::vector<std::string>& input_names,
-                         const std::vector<std::string>& output_names,
-                         bool tensor_split);
-
-  std::map<size_t, topsExecutable_t> executable_cache_;
+  // Returns the compiled executable pinned in the executable cache.
+  backend::SingleOpGcuExecutorManager::Handle CompileExecutable(
+      const GcuExecutionContext& ctx,
+      const backend::GcuOpKey& program_key_in,
+      const std::vector<LoDTensor*>& inputs,
+      const std::vector<LoDTensor*>& outputs,
+      const std::vector<std::string>& input_names,
+      const std::vector<std::string>& output_names);
+  // Launches the executable on the stream of the context. In the sync run
+  // mode of the op it waits for the stream, in the async mode the executable
+  // and the buffers are kept alive by the launch tracker until it is done.
+  void RunExecutable(const GcuExecutionContext& ctx,
+                     backend::SingleOpGcuExecutorManager::Handle gcu_exec,
+                     const std::vector<LoDTensor*>& inputs,
+                     const std::vector<LoDTensor*>& outputs,
+                     const std::vector<std::string>& input_names,
+                     const std::vector<std::string>& output_names,
+                     bool tensor_split);
 };
 
 void GcuRunner(const TensorNameMap& input_names,
@@ -277,4 +287,18 @@ void GcuRunner(const TensorNameMap& input_names,
                const phi::DeviceContext& device_context,
                bool tensor_split = true);
 
+// Compiles the op run encoded by `key` ahead of time, for instance from a key
+// listed by the persistent compile cache. Returns false on a malformed key.
+bool CompileGcuOpKey(const backend::GcuOpKey& key,
+                     const phi::DeviceContext& device_context);
+
+// Compiles the op keys on the workers of the compile service, for instance
+// the keys recorded by backend::OpKeyRecorder in an earlier run. An op that
+// needs a key before its warmup compile is done waits for it or, while it is
+// queued, compiles it itself. With `wait` returns the number of keys that
+// failed once all are compiled, otherwise returns 0 right away.
+size_t WarmupGcuOps(const std::vector<backend::GcuOpKey>& keys,
+                    const phi::DeviceContext& device_context,
+                    bool wait);
+
 }  // namespace custom_kernel
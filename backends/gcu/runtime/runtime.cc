@@ -17,6 +17,7 @@
 #include <eccl.h>
 
 #include <cstring>
+#include <fstream>
 #include <iostream>
 #include <list>
 #include <memory>
@@ -27,7 +28,15 @@
 #include <vector>
 
 #include "backend/executor/cast_runner.h"
+#include "backend/executor/compile_cache.h"
+#include "backend/executor/launch_tracker.h"
+#include "backend/executor/op_key_recorder.h"
+#include "backend/executor/run_mode.h"
+#include "backend/executor/single_op_executor.h"
+#include "backend/executor/tops_compiler.h"
+#include "common/gcu_op_runner.h"
 #include "glog/logging.h"
+#include "paddle/phi/api/include/context_pool.h"
 #include "paddle/phi/capi/include/type_utils.h"
 #include "runtime/flags.h"
 
@@ -96,6 +105,22 @@ C_Status Init() {
 
 C_Status Finalize() {
   VLOG(0) << "Backend GCU Finalize";
+  // Warmup compiles still queued are not needed any more.
+  backend::SingleOpGcuExecutorManager::GetInstance()
+      ->compile_service()
+      ->Shutdown();
+  backend::GetLaunchTracker()->ReleaseAll();
+  const char *record_file = std::getenv(env::kRecordOpsFile);
+  if (record_file != nullptr && record_file[0] != '\0') {
+    size_t count = 0;
+    if (backend::OpKeyRecorder::GetInstance()->Save(record_file, &count)) {
+      VLOG(0) << "Recorded " << count << " GCU op signatures to "
+              << record_file;
+    } else {
+      LOG(WARNING) << "Can not write the recorded op signatures to "
+                   << record_file;
+    }
+  }
   return C_SUCCESS;
 }
 
@@ -141,6 +166,7 @@ C_Status CreateStream(const C_Device device, C_Stream *stream) {
 
 C_Status DestroyStream(const C_Device device, C_Stream stream) {
   GcuDeviceGuard guard(device->id);
+  backend::GetLaunchTracker()->Release(reinterpret_cast<topsStream_t>(stream));
   RT_CHECK(topsStreamDestroy(reinterpret_cast<topsStream_t>(stream)));
   VLOG(3) << "[GcuRuntime], DestroyStream:" << stream;
   return C_SUCCESS;
@@ -196,6 +222,7 @@ C_Status DestroyEvent(const C_Device device, C_Event event) {
 C_Status SyncDevice(const C_Device device) {
   GcuDeviceGuard guard(device->id);
   RT_CHECK(topsDeviceSynchronize());
+  backend::GetLaunchTracker()->ReleaseAll();
   VLOG(3) << "[GcuRuntime], SyncDevice:" << device->id;
   return C_SUCCESS;
 }
@@ -203,6 +230,7 @@ C_Status SyncDevice(const C_Device device) {
 C_Status SyncStream(const C_Device device, C_Stream stream) {
   GcuDeviceGuard guard(device->id);
   RT_CHECK(topsStreamSynchronize(reinterpret_cast<topsStream_t>(stream)));
+  backend::GetLaunchTracker()->Release(reinterpret_cast<topsStream_t>(stream));
   VLOG(3) << "[GcuRuntime], SyncStream:" << stream;
   return C_SUCCESS;
 }
@@ -709,6 +737,235 @@ C_Status XcclRecv(void *recv_buf,
   return C_SUCCESS;
 }
 
+static backend::ExecutableCacheBase *GetExecutableCache(const char *name) {
+  if (name == nullptr) {
+    return nullptr;
+  }
+  if (strcmp(name, "single_op") == 0) {
+    return backend::SingleOpGcuExecutorManager::GetInstance()->cache();
+  }
+  if (strcmp(name, "cast") == 0) {
+    return backend::GetCastExecutableCache();
+  }
+  return nullptr;
+}
+
+// Counters of the executable caches, for tools that load the library directly
+// (e.g. through ctypes). Fills up to num_stats values in the field order of
+// backend::ExecutableCacheStats.
+C_Status GcuGetExecutableCacheStats(const char *name,
+                                    uint64_t *stats,
+                                    size_t num_stats) {
+  auto *cache = GetExecutableCache(name);
+  if (cache == nullptr || stats == nullptr) {
+    return C_FAILED;
+  }
+  uint64_t values[backend::kNumExecutableCacheStats];
+  auto cache_stats = cache->GetStats();
+  memcpy(values, &cache_stats, sizeof(values));
+  for (size_t i = 0; i < num_stats && i < backend::kNumExecutableCacheStats;
+       ++i) {
+    stats[i] = values[i];
+  }
+  return C_SUCCESS;
+}
+
+C_Status GcuSetExecutableCacheLimits(const char *name,
+                                     size_t capacity,
+                                     size_t byte_budget) {
+  auto *cache = GetExecutableCache(name);
+  if (cache == nullptr) {
+    return C_FAILED;
+  }
+  cache->SetLimits(capacity, byte_budget);
+  return C_SUCCESS;
+}
+
+C_Status GcuClearExecutableCache(const char *name) {
+  auto *cache = GetExecutableCache(name);
+  if (cache == nullptr) {
+    return C_FAILED;
+  }
+  cache->Clear();
+  return C_SUCCESS;
+}
+
+C_Status GcuResetExecutableCacheStats(const char *name) {
+  auto *cache = GetExecutableCache(name);
+  if (cache == nullptr) {
+    return C_FAILED;
+  }
+  cache->ResetStats();
+  return C_SUCCESS;
+}
+
+// Compiles the op keys of key_file, one hex key per line as written by
+// GcuCompileCacheList, so that the persistent compile cache holds their
+// executables. They compile in parallel, see GcuWarmupCompile. Needs an
+// initialized gcu device.
+C_Status GcuCompileCachePopulate(const char *key_file,
+                                 size_t *compiled,
+                                 size_t *failed) {
+  return GcuWarmupCompile(key_file, 1, compiled, failed);
+}
+
+// Writes the op keys in the persistent compile cache that were compiled with
+// the current compiler options to out_file, one hex key per line.
+C_Status GcuCompileCacheList(const char *out_file, size_t *count) {
+  std::ofstream out(out_file == nullptr ? "" : out_file);
+  if (!out) {
+    return C_FAILED;
+  }
+  size_t num_keys = 0;
+  auto keys = backend::CompileCache::GetInstance()->ListKeys(
+      &backend::GetCompileCacheFingerprint());
+  for (const auto &key : keys) {
+    // Executables of the cast runner are not keyed by an op key.
+    backend::GcuOpSignature<backend::GcuAttribute> sig;
+    if (backend::ParseGcuOpKey(key, &sig)) {
+      out << key.ToHex() << "\n";
+      ++num_keys;
+    }
+  }
+  if (count != nullptr) *count = num_keys;
+  return out ? C_SUCCESS : C_FAILED;
+}
+
+C_Status GcuCompileCacheGarbageCollect(uint64_t max_bytes, size_t *removed) {
+  auto *cache = backend::CompileCache::GetInstance();
+  if (!cache->enabled()) {
+    return C_FAILED;
+  }
+  size_t num_removed = cache->GarbageCollect(max_bytes);
+  if (removed != nullptr) *removed = num_removed;
+  return C_SUCCESS;
+}
+
+// Counters of the persistent compile cache in the field order of
+// backend::CompileCache::Stats.
+C_Status GcuGetCompileCacheStats(uint64_t *stats, size_t num_stats) {
+  if (stats == nullptr) {
+    return C_FAILED;
+  }
+  auto cache_stats = backend::CompileCache::GetInstance()->GetStats();
+  const uint64_t values[] = {cache_stats.hits,
+                             cache_stats.misses,
+                             cache_stats.stores,
+                             cache_stats.store_failures,
+                             cache_stats.evictions,
+                             cache_stats.disk_bytes};
+  for (size_t i = 0; i < num_stats && i < sizeof(values) / sizeof(values[0]);
+       ++i) {
+    stats[i] = values[i];
+  }
+  return C_SUCCESS;
+}
+
+// Run mode of the JIT executables of op_type, or the default mode when
+// op_type is null. mode is 0 for sync, 1 for async and -1 to drop the
+// override of op_type.
+C_Status GcuSetOpRunMode(const char *op_type, int mode) {
+  auto *modes = backend::GcuRunModes::GetInstance();
+  if (mode < -1 || mode > 1 || (op_type == nullptr && mode == -1)) {
+    return C_FAILED;
+  }
+  if (mode == -1) {
+    modes->Reset(op_type);
+    return C_SUCCESS;
+  }
+  auto run_mode =
+      mode == 1 ? backend::GcuRunMode::kAsync : backend::GcuRunMode::kSync;
+  if (op_type == nullptr) {
+    modes->SetDefault(run_mode);
+  } else {
+    modes->Set(op_type, run_mode);
+  }
+  return C_SUCCESS;
+}
+
+// Counters of the launch tracker in the field order of
+// backend::StreamLifetimeStats.
+C_Status GcuGetLaunchStats(uint64_t *stats, size_t num_stats) {
+  if (stats == nullptr) {
+    return C_FAILED;
+  }
+  auto launch_stats = backend::GetLaunchTracker()->GetStats();
+  const uint64_t values[] = {launch_stats.tracked,
+                             launch_stats.released,
+                             launch_stats.in_flight,
+                             launch_stats.throttled};
+  for (size_t i = 0; i < num_stats && i < sizeof(values) / sizeof(values[0]);
+       ++i) {
+    stats[i] = values[i];
+  }
+  return C_SUCCESS;
+}
+
+// Compiles the op keys of key_file, one hex key per line as written by
+// GcuStopOpKeyRecording or GcuCompileCacheList, on the compile workers. With
+// wait == 0 returns once they are queued and leaves the counters untouched.
+C_Status GcuWarmupCompile(const char *key_file,
+                          int wait,
+                          size_t *compiled,
+                          size_t *failed) {
+  std::vector<backend::GcuOpKey> keys;
+  size_t malformed = 0;
+  if (key_file == nullptr ||
+      !backend::LoadOpKeys(key_file, &keys, &malformed)) {
+    return C_FAILED;
+  }
+  const auto *device_context =
+      paddle::experimental::DeviceContextPool::Instance().Get(
+          phi::CustomPlace(kDeviceType, get_current_device_id()));
+  size_t num_failed = custom_kernel::WarmupGcuOps(keys, *device_context, wait);
+  if (wait) {
+    if (compiled != nullptr) *compiled = keys.size() - num_failed;
+    if (failed != nullptr) *failed = num_failed + malformed;
+  }
+  return C_SUCCESS;
+}
+
+// Starts recording the op keys of the JIT kernels that run, see
+// backend::OpKeyRecorder.
+C_Status GcuStartOpKeyRecording() {
+  backend::OpKeyRecorder::GetInstance()->Start();
+  return C_SUCCESS;
+}
+
+// Stops recording and, unless out_file is null, writes the recorded keys to
+// it for GcuWarmupCompile.
+C_Status GcuStopOpKeyRecording(const char *out_file, size_t *count) {
+  auto *recorder = backend::OpKeyRecorder::GetInstance();
+  recorder->Stop();
+  if (out_file == nullptr) {
+    if (count != nullptr) *count = recorder->Keys().size();
+    return C_SUCCESS;
+  }
+  return recorder->Save(out_file, count) ? C_SUCCESS : C_FAILED;
+}
+
+// Counters of the compile service in the field order of
+// backend::CompileServiceStats.
+C_Status GcuGetCompileServiceStats(uint64_t *stats, size_t num_stats) {
+  if (stats == nullptr) {
+    return C_FAILED;
+  }
+  auto service_stats = backend::SingleOpGcuExecutorManager::GetInstance()
+                           ->compile_service()
+                           ->GetStats();
+  const uint64_t values[] = {service_stats.submitted,
+                             service_stats.deduplicated,
+                             service_stats.taken_over,
+                             service_stats.completed,
+                             service_stats.failed,
+                             service_stats.queued};
+  for (size_t i = 0; i < num_stats && i < sizeof(values) / sizeof(values[0]);
+       ++i) {
+    stats[i] = values[i];
+  }
+  return C_SUCCESS;
+}
+
 void InitPlugin(CustomRuntimeParams *params) {
   PADDLE_CUSTOM_RUNTIME_CHECK_VERSION(params);
   memset(reinterpret_cast<void *>(params->interface),
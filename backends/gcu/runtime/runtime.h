@@ -169,6 +169,37 @@ C_Status PinnedAllocate(void **ptr, size_t size);
 
 C_Status PinnedDeallocate(void *ptr, size_t size);
 
+// Executable caches of the plugin, `name` is "single_op" or "cast".
+C_Status GcuGetExecutableCacheStats(const char *name,
+                                    uint64_t *stats,
+                                    size_t num_stats);
+C_Status GcuSetExecutableCacheLimits(const char *name,
+                                     size_t capacity,
+                                     size_t byte_budget);
+C_Status GcuClearExecutableCache(const char *name);
+C_Status GcuResetExecutableCacheStats(const char *name);
+
+// Persistent compile cache, configured by PADDLE_GCU_COMPILE_CACHE_DIR.
+C_Status GcuCompileCachePopulate(const char *key_file,
+                                 size_t *compiled,
+                                 size_t *failed);
+C_Status GcuCompileCacheList(const char *out_file, size_t *count);
+C_Status GcuCompileCacheGarbageCollect(uint64_t max_bytes, size_t *removed);
+C_Status GcuGetCompileCacheStats(uint64_t *stats, size_t num_stats);
+
+// Background compiles and warmup of the JIT executables.
+C_Status GcuWarmupCompile(const char *key_file,
+                          int wait,
+                          size_t *compiled,
+                          size_t *failed);
+C_Status GcuStartOpKeyRecording();
+C_Status GcuStopOpKeyRecording(const char *out_file, size_t *count);
+C_Status GcuGetCompileServiceStats(uint64_t *stats, size_t num_stats);
+
+// Asynchronous execution of the JIT executables.
+C_Status GcuSetOpRunMode(const char *op_type, int mode);
+C_Status GcuGetLaunchStats(uint64_t *stats, size_t num_stats);
+
 void OpsInitialize();
 
 void OpsFinalize();
@@ -0,0 +1,281 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Checks the persistent compile cache (round trip, fingerprint and corruption
+// misses, LRU garbage collection, concurrent writers in several processes)
+// and measures a warm start, loading every binary from the cache, against a
+// cold one that compiles them. A busy loop stands in for the tops compiler,
+// so this builds and runs without the GCU SDK:
+//
+//   cd backends/gcu && g++ -std=c++14 -O2 -I . -pthread
+//       tests/benchmark/compile_cache_benchmark.cc
+//       backend/executor/compile_cache.cc -o compile_cache_benchmark
+//
+// Usage: compile_cache_benchmark [--quick] [--compile-ms N]
+
+#include <sys/stat.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include "backend/executor/compile_cache.h"
+
+namespace {
+
+using backend::CompileCache;
+using backend::GcuOpKey;
+
+GcuOpKey Key(int64_t id) {
+  GcuOpKey key;
+  key.AppendString("conv2d");
+  key.AppendPod(id);
+  return key;
+}
+
+std::string Binary(int64_t id, size_t size) {
+  std::string binary(size, '\0');
+  for (size_t i = 0; i < size; ++i) {
+    binary[i] = static_cast<char>((id * 131 + i * 7) & 0xff);
+  }
+  return binary;
+}
+
+std::string MakeTempDir() {
+  char path[] = "/tmp/gcu_compile_cache.XXXXXX";
+  if (mkdtemp(path) == nullptr) {
+    perror("mkdtemp");
+    exit(1);
+  }
+  return path;
+}
+
+void RemoveDir(const std::string& dir) {
+  std::string cmd = "rm -rf '" + dir + "'";
+  if (system(cmd.c_str()) != 0) {
+    printf("could not remove %s\n", dir.c_str());
+  }
+}
+
+bool Same(const std::unique_ptr<CompileCache::MappedBinary>& binary,
+          const std::string& expected) {
+  return binary != nullptr && binary->size() == expected.size() &&
+         std::memcmp(binary->data(), expected.data(), expected.size()) == 0;
+}
+
+bool CheckCache() {
+  bool ok = true;
+  auto expect = [&ok](bool cond, const char* what) {
+    if (!cond) {
+      printf("cache check failed: %s\n", what);
+      ok = false;
+    }
+  };
+  const std::string fingerprint = "v1;-O2;sdk-3.1";
+  const std::string dir = MakeTempDir();
+  {
+    CompileCache cache(dir + "/nested/cache", 0);
+    expect(cache.enabled(), "creates the directory");
+    const std::string binary = Binary(1, 1000);
+    expect(cache.Load(Key(1), fingerprint) == nullptr, "cold miss");
+    expect(cache.Store(Key(1), fingerprint, binary.data(), binary.size()),
+           "store");
+    auto loaded = cache.Load(Key(1), fingerprint);
+    expect(Same(loaded, binary), "round trip");
+    expect(reinterpret_cast<uintptr_t>(loaded->data()) % 64 == 0,
+           "aligned binary");
+    expect(cache.Load(Key(1), "v1;-O3;sdk-3.1") == nullptr,
+           "other compiler options miss");
+    expect(cache.Load(Key(2), fingerprint) == nullptr, "other key misses");
+
+    // Another process opening the same directory sees the entry.
+    CompileCache other(dir + "/nested/cache/", 0);
+    expect(Same(other.Load(Key(1), fingerprint), binary), "shared directory");
+    auto keys = other.ListKeys(&fingerprint);
+    expect(keys.size() == 1 && keys[0] == Key(1), "list keys");
+    const std::string other_fingerprint = "v2";
+    expect(other.ListKeys(&other_fingerprint).empty(),
+           "list keys by fingerprint");
+
+    // A corrupt entry reads as a miss.
+    loaded.reset();
+    std::string entry;
+    FILE* ls = popen(("ls " + dir + "/nested/cache/*.gcuexe").c_str(), "r");
+    char line[512];
+    if (ls != nullptr && fgets(line, sizeof(line), ls) != nullptr) {
+      entry = std::string(line, std::strlen(line) - 1);
+    }
+    if (ls != nullptr) pclose(ls);
+    FILE* f = fopen(entry.c_str(), "r+b");
+    if (f != nullptr) {
+      fseek(f, -10, SEEK_END);
+      fputc('x', f);
+      fclose(f);
+    }
+    expect(cache.Load(Key(1), fingerprint) == nullptr, "corrupt entry misses");
+    auto stats = cache.GetStats();
+    expect(stats.hits == 1 && stats.misses == 4 && stats.stores == 1,
+           "counters");
+  }
+  {
+    // The least recently used entries are collected first.
+    CompileCache cache(dir + "/lru", 0);
+    for (int64_t i = 0; i < 4; ++i) {
+      const std::string binary = Binary(i, 4000);
+      cache.Store(Key(i), fingerprint, binary.data(), binary.size());
+      // Modification times must differ for the LRU order.
+      usleep(20000);
+    }
+    cache.Load(Key(0), fingerprint);
+    expect(cache.GarbageCollect(2 * 4200) == 2, "gc removes two entries");
+    expect(cache.Load(Key(0), fingerprint) && cache.Load(Key(3), fingerprint),
+           "recently used entries survive");
+    expect(!cache.Load(Key(1), fingerprint) && !cache.Load(Key(2), fingerprint),
+           "least recently used entries are removed");
+    expect(cache.GetStats().evictions == 2, "eviction counter");
+
+    // A store over the size cap collects.
+    CompileCache capped(dir + "/lru", 2 * 4200);
+    const std::string binary = Binary(9, 4000);
+    capped.Store(Key(9), fingerprint, binary.data(), binary.size());
+    expect(capped.ListKeys().size() == 2 && capped.Load(Key(9), fingerprint),
+           "size cap");
+  }
+  {
+    // Several processes storing the same and different keys concurrently.
+    const std::string shared = dir + "/multi";
+    const int kProcs = 4;
+    const int64_t kKeys = 64;
+    std::vector<pid_t> children;
+    for (int p = 0; p < kProcs; ++p) {
+      pid_t pid = fork();
+      if (pid == 0) {
+        CompileCache cache(shared, 40 * 2100);
+        bool child_ok = true;
+        for (int64_t i = 0; i < kKeys; ++i) {
+          const int64_t id = (i + p * 16) % kKeys;
+          const std::string binary = Binary(id, 2000);
+          auto loaded = cache.Load(Key(id), fingerprint);
+          if (loaded != nullptr && !Same(loaded, binary)) {
+            child_ok = false;
+          }
+          cache.Store(Key(id), fingerprint, binary.data(), binary.size());
+        }
+        _exit(child_ok ? 0 : 1);
+      }
+      children.push_back(pid);
+    }
+    bool children_ok = true;
+    for (pid_t pid : children) {
+      int status = 0;
+      waitpid(pid, &status, 0);
+      children_ok =
+          children_ok && WIFEXITED(status) && WEXITSTATUS(status) == 0;
+    }
+    expect(children_ok, "concurrent processes read complete entries");
+    CompileCache cache(shared, 0);
+    auto keys = cache.ListKeys(&fingerprint);
+    bool intact = true;
+    for (const auto& key : keys) {
+      int64_t id = 0;
+      std::memcpy(&id, key.data() + key.size() - sizeof(id), sizeof(id));
+      intact = intact && Same(cache.Load(key, fingerprint), Binary(id, 2000));
+    }
+    expect(!keys.empty() && keys.size() <= kKeys && intact,
+           "concurrent stores leave valid entries");
+    cache.GarbageCollect(40 * 2100);
+    expect(cache.GetStats().disk_bytes <= 40 * 2100, "size cap after writers");
+  }
+  RemoveDir(dir);
+  return ok;
+}
+
+void FakeCompile(double ms) {
+  auto end = std::chrono::steady_clock::now() +
+             std::chrono::duration<double, std::milli>(ms);
+  volatile uint64_t x = 0;
+  while (std::chrono::steady_clock::now() < end) {
+    x = x + 1;
+  }
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = false;
+  double compile_ms = 20.0;
+  for (int i = 1; i < argc; ++i) {
+    if (std::string(argv[i]) == "--quick") {
+      quick = true;
+    } else if (std::string(argv[i]) == "--compile-ms" && i + 1 < argc) {
+      compile_ms = std::atof(argv[++i]);
+    }
+  }
+
+  bool ok = CheckCache();
+  printf("cache checks: %s\n", ok ? "ok" : "FAILED");
+
+  // Start up of a process that runs kOps signatures with 1 MiB binaries.
+  const int64_t kOps = quick ? 16 : 200;
+  const size_t kBinaryBytes = 1 << 20;
+  const std::string fingerprint = "v1;-O2;sdk-3.1";
+  const std::string dir = MakeTempDir();
+  std::vector<std::string> binaries;
+  for (int64_t i = 0; i < kOps; ++i) {
+    binaries.push_back(Binary(i, kBinaryBytes));
+  }
+  auto run = [&](CompileCache* cache) {
+    auto start = std::chrono::steady_clock::now();
+    uint64_t checksum = 0;
+    for (int64_t i = 0; i < kOps; ++i) {
+      auto binary = cache->Load(Key(i), fingerprint);
+      if (binary == nullptr) {
+        FakeCompile(compile_ms);
+        cache->Store(Key(i), fingerprint, binaries[i].data(), kBinaryBytes);
+        checksum += static_cast<unsigned char>(binaries[i][i]);
+      } else {
+        checksum += static_cast<unsigned char>(binary->data()[i]);
+      }
+    }
+    if (checksum == 0) printf(" ");
+    return std::chrono::duration<double, std::milli>(
+               std::chrono::steady_clock::now() - start)
+        .count();
+  };
+  CompileCache cold(dir, 0);
+  double cold_ms = run(&cold);
+  CompileCache warm(dir, 0);
+  double warm_ms = run(&warm);
+  auto stats = warm.GetStats();
+  printf(
+      "%ld signatures, %.0f ms compile, 1 MiB binaries: cold start %.1f ms, "
+      "warm start %.1f ms (%.3f ms per load, %lu hits)\n",
+      static_cast<long>(kOps),  // NOLINT
+      compile_ms,
+      cold_ms,
+      warm_ms,
+      warm_ms / kOps,
+      static_cast<unsigned long>(stats.hits));  // NOLINT
+  if (stats.hits != static_cast<uint64_t>(kOps)) {
+    printf("warm start missed the cache\n");
+    ok = false;
+  }
+  RemoveDir(dir);
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,353 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Checks the background compile service (single flight, taking over queued
+// compiles, errors, shutdown) and the op key recorder, and measures the
+// first batch of a run that compiles its signatures on demand against one
+// that warms them up from a recorded key file, and the compiles saved by the
+// single flight when several threads miss the same keys. A busy loop stands
+// in for the tops compiler, so this builds and runs without the GCU SDK:
+//
+//   cd backends/gcu && g++ -std=c++14 -O2 -I . -I <paddle>/include -pthread
+//       tests/benchmark/compile_service_benchmark.cc
+//       -o compile_service_benchmark
+//
+// Usage: compile_service_benchmark [--quick] [--compile-ms N] [--threads N]
+
+#include <unistd.h>
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <mutex>  // NOLINT
+#include <stdexcept>
+#include <string>
+#include <thread>  // NOLINT
+#include <unordered_set>
+#include <vector>
+
+#include "backend/executor/compile_service.h"
+#include "backend/executor/op_key_recorder.h"
+
+namespace {
+
+using backend::GcuOpKey;
+using Service = backend::CompileService<GcuOpKey, backend::GcuOpKeyHash>;
+using Clock = std::chrono::steady_clock;
+
+GcuOpKey Key(int64_t id) {
+  GcuOpKey key;
+  key.AppendString("conv2d");
+  key.AppendPod(id);
+  return key;
+}
+
+void FakeCompile(double ms) {
+  auto end = Clock::now() + std::chrono::duration<double, std::milli>(ms);
+  volatile uint64_t x = 0;
+  while (Clock::now() < end) {
+    x = x + 1;
+  }
+}
+
+double Ms(Clock::time_point start) {
+  return std::chrono::duration<double, std::milli>(Clock::now() - start)
+      .count();
+}
+
+// Stands in for the executable cache.
+class FakeCache {
+ public:
+  bool Find(const GcuOpKey& key) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    return keys_.count(key) > 0;
+  }
+  void Add(const GcuOpKey& key) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    keys_.insert(key);
+    compiles_++;
+  }
+  int64_t compiles() const { return compiles_; }
+
+ private:
+  std::mutex mutex_;
+  std::unordered_set<GcuOpKey, backend::GcuOpKeyHash> keys_;
+  std::atomic<int64_t> compiles_{0};
+};
+
+// The miss path of GcuOpRunner::CompileAndRun.
+void Lookup(Service* service,
+            FakeCache* cache,
+            const GcuOpKey& key,
+            double compile_ms) {
+  if (cache->Find(key)) {
+    return;
+  }
+  bool compiled = service->Run(key, [&]() {
+    FakeCompile(compile_ms);
+    cache->Add(key);
+  });
+  if (!compiled && !cache->Find(key)) {
+    printf("waited for a compile that did not insert the key\n");
+  }
+}
+
+bool CheckService() {
+  bool ok = true;
+  auto expect = [&ok](bool cond, const char* what) {
+    if (!cond) {
+      printf("service check failed: %s\n", what);
+      ok = false;
+    }
+  };
+  {
+    // Concurrent misses of one key compile once.
+    Service service(2);
+    FakeCache cache;
+    std::vector<std::thread> threads;
+    for (int i = 0; i < 8; ++i) {
+      threads.emplace_back([&]() { Lookup(&service, &cache, Key(1), 20.0); });
+    }
+    for (auto& t : threads) {
+      t.join();
+    }
+    auto stats = service.GetStats();
+    expect(cache.compiles() == 1, "single flight compiles once");
+    expect(stats.completed == 1 && stats.deduplicated + 1 <= 8,
+           "single flight counters");
+
+    std::atomic<int> runs(0);
+    auto task = [&]() {
+      FakeCompile(10.0);
+      runs++;
+    };
+    auto first = service.Submit(Key(2), task);
+    auto second = service.Submit(Key(2), task);
+    first.get();
+    second.get();
+    expect(runs == 1, "submit deduplicates");
+    service.Submit(Key(2), task).get();
+    expect(runs == 2, "a finished key compiles again");
+  }
+  {
+    // A caller does not wait behind the queue for its key.
+    Service service(1);
+    std::atomic<bool> release(false);
+    std::atomic<bool> worker_ran(false);
+    auto blocker = service.Submit(Key(1), [&]() {
+      while (!release) {
+        std::this_thread::yield();
+      }
+    });
+    auto queued = service.Submit(Key(2), [&]() { worker_ran = true; });
+    bool caller_ran = false;
+    expect(service.Run(Key(2), [&]() { caller_ran = true; }) && caller_ran,
+           "run takes a queued compile over");
+    expect(
+        queued.wait_for(std::chrono::seconds(0)) == std::future_status::ready,
+        "the queued future is fulfilled by the caller");
+    release = true;
+    blocker.get();
+    service.Wait();
+    expect(!worker_ran && service.GetStats().taken_over == 1,
+           "the worker skips a compile taken over");
+  }
+  {
+    // Errors reach the caller and the waiters.
+    Service service(1);
+    bool threw = false;
+    try {
+      service.Run(Key(1), []() { throw std::runtime_error("compile failed"); });
+    } catch (const std::runtime_error&) {
+      threw = true;
+    }
+    expect(threw, "run rethrows");
+    auto failed =
+        service.Submit(Key(2), []() { throw std::runtime_error("bad key"); });
+    threw = false;
+    try {
+      failed.get();
+    } catch (const std::runtime_error&) {
+      threw = true;
+    }
+    expect(threw && service.GetStats().failed == 2, "submit error");
+
+    // Shutdown drops the queue.
+    std::atomic<bool> release(false);
+    auto blocker = service.Submit(Key(3), [&]() {
+      while (!release) {
+        std::this_thread::yield();
+      }
+    });
+    auto dropped = service.Submit(Key(4), []() {});
+    std::thread stop([&]() { service.Shutdown(); });
+    std::this_thread::sleep_for(std::chrono::milliseconds(10));
+    release = true;
+    stop.join();
+    threw = false;
+    try {
+      dropped.get();
+    } catch (const std::runtime_error&) {
+      threw = true;
+    }
+    expect(threw, "shutdown fails the queued compiles");
+    bool ran = false;
+    expect(service.Run(Key(4), [&]() { ran = true; }) && ran,
+           "run works after shutdown");
+  }
+  {
+    // Recorded keys round trip through a key file.
+    backend::OpKeyRecorder recorder;
+    recorder.Start();
+    for (int64_t id : {3, 1, 3, 2, 1}) {
+      recorder.Record(Key(id));
+    }
+    recorder.Stop();
+    char path[] = "/tmp/gcu_warmup.XXXXXX";
+    int fd = mkstemp(path);
+    if (fd >= 0) close(fd);
+    size_t count = 0;
+    expect(recorder.Save(path, &count) && count == 3, "save");
+    FILE* f = fopen(path, "a");
+    if (f != nullptr) {
+      fputs("# comment\n\nnot-a-key\n", f);
+      fclose(f);
+    }
+    std::vector<GcuOpKey> keys;
+    size_t malformed = 0;
+    expect(backend::LoadOpKeys(path, &keys, &malformed), "load");
+    expect(keys.size() == 3 && keys[0] == Key(3) && keys[1] == Key(1) &&
+               keys[2] == Key(2) && malformed == 1,
+           "keys in first seen order");
+    unlink(path);
+  }
+  return ok;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = false;
+  double compile_ms = 20.0;
+  size_t threads = backend::CompileThreadsFromEnv();
+  for (int i = 1; i < argc; ++i) {
+    std::string arg = argv[i];
+    if (arg == "--quick") {
+      quick = true;
+    } else if (arg == "--compile-ms" && i + 1 < argc) {
+      compile_ms = std::atof(argv[++i]);
+    } else if (arg == "--threads" && i + 1 < argc) {
+      threads = std::strtoull(argv[++i], nullptr, 10);
+    }
+  }
+
+  bool ok = CheckService();
+  printf("service checks: %s\n", ok ? "ok" : "FAILED");
+
+  // The first batch of a run that hits kOps signatures, with host work
+  // between the ops. Without warmup every miss compiles on the calling
+  // thread, with it the recorded keys compile on the workers from start up,
+  // while the run is loading the model (modeled by load_ms).
+  const int64_t kOps = quick ? 16 : 64;
+  const double load_ms = quick ? 50.0 : 200.0;
+  std::vector<GcuOpKey> keys;
+  for (int64_t i = 0; i < kOps; ++i) {
+    keys.push_back(Key(i));
+  }
+  double cold_ms = 0;
+  {
+    Service service(threads);
+    FakeCache cache;
+    FakeCompile(load_ms);
+    auto start = Clock::now();
+    for (const auto& key : keys) {
+      Lookup(&service, &cache, key, compile_ms);
+    }
+    cold_ms = Ms(start);
+  }
+  double warm_ms = 0;
+  backend::CompileServiceStats warm_stats;
+  {
+    Service service(threads);
+    FakeCache cache;
+    for (const auto& key : keys) {
+      service.Submit(key, [&cache, key, compile_ms]() {
+        FakeCompile(compile_ms);
+        cache.Add(key);
+      });
+    }
+    FakeCompile(load_ms);
+    auto start = Clock::now();
+    for (const auto& key : keys) {
+      Lookup(&service, &cache, key, compile_ms);
+    }
+    warm_ms = Ms(start);
+    service.Wait();
+    warm_stats = service.GetStats();
+    if (cache.compiles() != kOps) {
+      printf("warmup compiled %ld of %ld keys\n",
+             static_cast<long>(cache.compiles()),  // NOLINT
+             static_cast<long>(kOps));             // NOLINT
+      ok = false;
+    }
+  }
+  printf(
+      "%ld signatures, %.0f ms compile, %.0f ms model load, %zu compile "
+      "threads (%u cores): first batch %.1f ms on demand, %.1f ms with "
+      "warmup (%lu compiles taken over, %lu joined)\n",
+      static_cast<long>(kOps),  // NOLINT
+      compile_ms,
+      load_ms,
+      threads,
+      std::thread::hardware_concurrency(),
+      cold_ms,
+      warm_ms,
+      static_cast<unsigned long>(warm_stats.taken_over),     // NOLINT
+      static_cast<unsigned long>(warm_stats.deduplicated));  // NOLINT
+
+  // Several threads running the same model miss the same keys.
+  const int kCallers = 4;
+  int64_t compiles[2] = {0, 0};
+  for (int single_flight = 0; single_flight < 2; ++single_flight) {
+    Service service(threads);
+    FakeCache cache;
+    std::vector<std::thread> callers;
+    for (int c = 0; c < kCallers; ++c) {
+      callers.emplace_back([&]() {
+        for (const auto& key : keys) {
+          if (single_flight) {
+            Lookup(&service, &cache, key, compile_ms / 4);
+          } else if (!cache.Find(key)) {
+            FakeCompile(compile_ms / 4);
+            cache.Add(key);
+          }
+        }
+      });
+    }
+    for (auto& t : callers) {
+      t.join();
+    }
+    compiles[single_flight] = cache.compiles();
+  }
+  printf("%d threads missing %ld keys: %ld compiles, %ld with single flight\n",
+         kCallers,
+         static_cast<long>(kOps),          // NOLINT
+         static_cast<long>(compiles[0]),   // NOLINT
+         static_cast<long>(compiles[1]));  // NOLINT
+  if (compiles[1] != kOps) {
+    ok = false;
+  }
+  return ok ? 0 : 1;
+}
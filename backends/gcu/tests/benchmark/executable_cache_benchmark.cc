@@ -0,0 +1,254 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Checks the eviction and pinning rules of the executable cache and measures
+// its lookup cost against a single mutex protected map, from several threads
+// and for a dynamic shape workload that keeps producing new executables. A
+// fake executable stands in for topsExecutable_t, so this builds and runs
+// without the GCU SDK:
+//
+//   cd backends/gcu && g++ -std=c++14 -O2 -I . -pthread
+//       tests/benchmark/executable_cache_benchmark.cc
+//       -o executable_cache_benchmark
+//
+// Usage: executable_cache_benchmark [--quick]
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <memory>
+#include <mutex>  // NOLINT
+#include <string>
+#include <thread>  // NOLINT
+#include <unordered_map>
+#include <vector>
+
+#include "backend/executor/executable_cache.h"
+
+namespace {
+
+std::atomic<int64_t> g_created(0);
+std::atomic<int64_t> g_released(0);
+
+struct FakeExecutable {
+  explicit FakeExecutable(int64_t id) : id(id) { g_created++; }
+  void ReleaseResource() {
+    if (!released) {
+      released = true;
+      g_released++;
+    }
+  }
+  int64_t id;
+  bool released = false;
+};
+
+using Cache = backend::ExecutableCache<std::string, FakeExecutable>;
+
+std::shared_ptr<FakeExecutable> Make(int64_t id) {
+  return std::make_shared<FakeExecutable>(id);
+}
+
+std::string Key(int64_t id) {
+  return "cast:float32->float16:" + std::to_string(id);
+}
+
+bool CheckCache() {
+  bool ok = true;
+  auto expect = [&ok](bool cond, const char* what) {
+    if (!cond) {
+      printf("cache check failed: %s\n", what);
+      ok = false;
+    }
+  };
+  const int64_t created_before = g_created.load();
+  const int64_t released_before = g_released.load();
+  {
+    // Least recently used entries go first.
+    Cache cache(1, 3, 0);
+    for (int64_t i = 0; i < 3; ++i) {
+      cache.Insert(Key(i), Make(i), 1);
+    }
+    expect(static_cast<bool>(cache.Find(Key(0))), "hit");
+    cache.Insert(Key(3), Make(3), 1);
+    expect(!cache.Find(Key(1)), "lru eviction");
+    expect(cache.Find(Key(0)) && cache.Find(Key(2)) && cache.Find(Key(3)),
+           "lru survivors");
+    auto stats = cache.GetStats();
+    expect(stats.entries == 3 && stats.evictions == 1, "lru stats");
+    expect(stats.hits == 4 && stats.misses == 1, "hit and miss counters");
+  }
+  {
+    // A pinned entry is never evicted, the shard stays over its limit until
+    // the entry is unpinned.
+    Cache cache(1, 1, 0);
+    auto a = cache.Insert(Key(0), Make(0), 1);
+    auto b = cache.Insert(Key(1), Make(1), 1);
+    expect(cache.GetStats().entries == 2 && cache.GetStats().pinned == 2,
+           "pinned entries are kept");
+    b.Reset();
+    expect(cache.GetStats().entries == 1 && a && a->id == 0 && !a->released,
+           "unpinned entry evicted");
+    cache.Insert(Key(2), Make(2), 1);
+    expect(!a->released && cache.GetStats().entries == 1,
+           "pinned entry survives inserts");
+    a.Reset();
+    auto c = cache.Insert(Key(3), Make(3), 1);
+    expect(!cache.Find(Key(0)) && cache.Find(Key(3)), "unpinned entry evicted");
+
+    // Unpinning an entry that kept the shard over its limit evicts.
+    auto d = cache.Insert(Key(4), Make(4), 1);
+    expect(cache.GetStats().entries == 2, "over limit while pinned");
+    c.Reset();
+    d.Reset();
+    expect(cache.GetStats().entries == 1, "unpin evicts");
+  }
+  {
+    // Byte budget.
+    Cache cache(1, 0, 100);
+    for (int64_t i = 0; i < 3; ++i) {
+      cache.Insert(Key(i), Make(i), 40);
+    }
+    auto stats = cache.GetStats();
+    expect(stats.entries == 2 && stats.bytes == 80, "byte budget");
+    cache.SetLimits(0, 50);
+    expect(cache.GetStats().bytes == 40, "lowered byte budget");
+  }
+  {
+    // Two threads compiling the same key: the first executable wins.
+    Cache cache(4, 0, 0);
+    auto first = cache.Insert(Key(0), Make(0), 1);
+    auto second_value = Make(1);
+    auto second = cache.Insert(Key(0), second_value, 1);
+    expect(second.get() == first.get() && second_value->released,
+           "duplicate insert");
+    first.Reset();
+    second.Reset();
+    cache.Clear();
+    expect(cache.GetStats().entries == 0, "clear");
+  }
+  expect(
+      g_released.load() - released_before == g_created.load() - created_before,
+      "every executable released");
+  return ok;
+}
+
+// The map guarded by one lock, the simplest thread safe form of the managers.
+class LockedMap {
+ public:
+  std::shared_ptr<FakeExecutable> Find(const std::string& key) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto it = map_.find(key);
+    return it == map_.end() ? nullptr : it->second;
+  }
+  void Add(const std::string& key, std::shared_ptr<FakeExecutable> value) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    map_[key] = std::move(value);
+  }
+  size_t size() {
+    std::lock_guard<std::mutex> lock(mutex_);
+    return map_.size();
+  }
+
+ private:
+  std::mutex mutex_;
+  std::unordered_map<std::string, std::shared_ptr<FakeExecutable>> map_;
+};
+
+template <typename Lookup>
+double MeasureNsPerLookup(int threads, int64_t lookups, Lookup lookup) {
+  auto start = std::chrono::steady_clock::now();
+  std::vector<std::thread> workers;
+  for (int t = 0; t < threads; ++t) {
+    workers.emplace_back([&, t]() {
+      for (int64_t i = 0; i < lookups; ++i) {
+        lookup(t, i);
+      }
+    });
+  }
+  for (auto& w : workers) {
+    w.join();
+  }
+  return std::chrono::duration<double, std::nano>(
+             std::chrono::steady_clock::now() - start)
+             .count() /
+         (threads * lookups);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = argc > 1 && std::string(argv[1]) == "--quick";
+  const int64_t lookups = quick ? 20000 : 1000000;
+
+  bool ok = CheckCache();
+  printf("cache checks: %s\n", ok ? "ok" : "FAILED");
+
+  // Steady state: every lookup hits one of 256 executables.
+  const int64_t kKeys = 256;
+  std::vector<std::string> keys;
+  for (int64_t i = 0; i < kKeys; ++i) {
+    keys.push_back(Key(i));
+  }
+  printf("%-8s %16s %16s\n", "threads", "locked map ns", "sharded ns");
+  for (int threads : {1, 2, 4, 8}) {
+    LockedMap map;
+    Cache cache(16, 0, 0);
+    for (int64_t i = 0; i < kKeys; ++i) {
+      map.Add(keys[i], Make(i));
+      cache.Insert(keys[i], Make(i), 1);
+    }
+    double map_ns = MeasureNsPerLookup(threads, lookups, [&](int t, int64_t i) {
+      auto exec = map.Find(keys[(i * 7 + t) % kKeys]);
+      if (exec == nullptr) abort();
+    });
+    double cache_ns =
+        MeasureNsPerLookup(threads, lookups, [&](int t, int64_t i) {
+          auto exec = cache.Find(keys[(i * 7 + t) % kKeys]);
+          if (!exec) abort();
+        });
+    printf("%-8d %16.1f %16.1f\n", threads, map_ns, cache_ns);
+  }
+
+  // Dynamic shapes: a new executable every 16 launches, 4 threads.
+  const int threads = 4;
+  const int64_t launches = quick ? 20000 : 400000;
+  LockedMap map;
+  Cache cache(16, 1024, 0);
+  std::atomic<int64_t> next_id(0);
+  MeasureNsPerLookup(threads, launches, [&](int t, int64_t i) {
+    const std::string key = Key((t * launches + i) / 16);
+    if (map.Find(key) == nullptr) {
+      map.Add(key, Make(next_id++));
+    }
+    if (!cache.Find(key)) {
+      cache.Insert(key, Make(next_id++), 1);
+    }
+  });
+  auto stats = cache.GetStats();
+  printf(
+      "dynamic shapes: locked map holds %zu executables, cache holds %lu "
+      "(capacity %lu, %lu evictions, %lu hits, %lu misses)\n",
+      map.size(),
+      static_cast<unsigned long>(stats.entries),    // NOLINT
+      static_cast<unsigned long>(stats.capacity),   // NOLINT
+      static_cast<unsigned long>(stats.evictions),  // NOLINT
+      static_cast<unsigned long>(stats.hits),       // NOLINT
+      static_cast<unsigned long>(stats.misses));    // NOLINT
+  if (stats.entries > stats.capacity) {
+    printf("cache exceeds its capacity\n");
+    ok = false;
+  }
+  return ok ? 0 : 1;
+}
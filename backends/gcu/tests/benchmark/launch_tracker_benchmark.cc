@@ -0,0 +1,327 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Checks the stream ordered lifetime tracking of the asynchronous JIT
+// launches and the per op run modes, and measures the host overhead of a
+// tracked launch and the end to end time of a sequence of ops run in the
+// sync and in the async mode. A fake runtime stands in for the tops streams
+// and events: a device thread runs the enqueued kernels in order, so this
+// builds and runs without the GCU SDK:
+//
+//   cd backends/gcu && g++ -std=c++14 -O2 -I . -pthread
+//       tests/benchmark/launch_tracker_benchmark.cc
+//       -o launch_tracker_benchmark
+//
+// Usage: launch_tracker_benchmark [--quick] [--kernel-us N] [--host-us N]
+
+#include <atomic>
+#include <chrono>
+#include <condition_variable>  // NOLINT
+#include <cstdio>
+#include <cstdlib>
+#include <memory>
+#include <mutex>  // NOLINT
+#include <string>
+#include <thread>  // NOLINT
+#include <vector>
+
+#include "backend/executor/run_mode.h"
+#include "backend/executor/stream_lifetime.h"
+
+namespace {
+
+using Clock = std::chrono::steady_clock;
+
+// A stream of the fake device. Kernels complete in order, a kernel completes
+// when the device thread has run it or, without a device thread, when the
+// test says so.
+struct FakeStream {
+  std::atomic<uint64_t> enqueued{0};
+  std::atomic<uint64_t> completed{0};
+};
+
+struct FakeEvent {
+  FakeStream* stream = nullptr;
+  uint64_t target = 0;
+};
+
+std::atomic<int64_t> g_events_created(0);
+
+struct FakeEventApi {
+  using Stream = FakeStream*;
+  using Event = FakeEvent*;
+  static Event Create() {
+    g_events_created++;
+    return new FakeEvent();
+  }
+  static void Destroy(Event event) { delete event; }
+  static void Record(Event event, Stream stream) {
+    event->stream = stream;
+    event->target = stream->enqueued.load();
+  }
+  static bool Query(Event event) {
+    return event->stream->completed.load() >= event->target;
+  }
+  static void Wait(Event event) {
+    while (!Query(event)) {
+      std::this_thread::yield();
+    }
+  }
+};
+
+using Tracker = backend::StreamLifetimeTracker<FakeEventApi>;
+
+// Runs the kernels of one stream, each takes kernel_us.
+class FakeDevice {
+ public:
+  FakeDevice(FakeStream* stream, double kernel_us)
+      : stream_(stream), kernel_us_(kernel_us), thread_([this]() { Run(); }) {}
+
+  ~FakeDevice() {
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      stop_ = true;
+    }
+    cv_.notify_one();
+    thread_.join();
+  }
+
+  void Launch() {
+    stream_->enqueued++;
+    cv_.notify_one();
+  }
+
+  void Sync() {
+    FakeEvent event;
+    FakeEventApi::Record(&event, stream_);
+    FakeEventApi::Wait(&event);
+  }
+
+ private:
+  void Run() {
+    std::unique_lock<std::mutex> lock(mutex_);
+    while (true) {
+      cv_.wait(lock, [this]() {
+        return stop_ || stream_->completed.load() < stream_->enqueued.load();
+      });
+      if (stop_) {
+        return;
+      }
+      lock.unlock();
+      std::this_thread::sleep_for(
+          std::chrono::duration<double, std::micro>(kernel_us_));
+      stream_->completed++;
+      lock.lock();
+    }
+  }
+
+  FakeStream* stream_;
+  double kernel_us_;
+  std::mutex mutex_;
+  std::condition_variable cv_;
+  bool stop_ = false;
+  std::thread thread_;
+};
+
+struct Buffer {
+  explicit Buffer(std::atomic<int>* live) : live(live) { (*live)++; }
+  ~Buffer() { (*live)--; }
+  std::atomic<int>* live;
+};
+
+bool CheckTracker() {
+  bool ok = true;
+  auto expect = [&ok](bool cond, const char* what) {
+    if (!cond) {
+      printf("tracker check failed: %s\n", what);
+      ok = false;
+    }
+  };
+  std::atomic<int> live(0);
+  auto launch = [&](Tracker* tracker, FakeStream* stream) {
+    stream->enqueued++;
+    tracker->Track(
+        stream,
+        {std::make_shared<Buffer>(&live), std::make_shared<Buffer>(&live)});
+  };
+  {
+    Tracker tracker(0);
+    FakeStream stream;
+    launch(&tracker, &stream);
+    launch(&tracker, &stream);
+    expect(live == 4, "buffers alive while queued");
+    stream.completed = 1;
+    tracker.Poll(&stream);
+    expect(live == 2, "completed launch released");
+    auto stats = tracker.GetStats();
+    expect(stats.tracked == 2 && stats.released == 1 && stats.in_flight == 1,
+           "counters");
+    stream.completed = 2;
+    launch(&tracker, &stream);
+    expect(live == 2, "track releases completed launches");
+
+    // Another stream is independent.
+    FakeStream other;
+    launch(&tracker, &other);
+    stream.completed = 3;
+    tracker.Poll(&stream);
+    expect(live == 2, "streams are tracked apart");
+    other.completed = 1;
+    tracker.Release(&other);
+    expect(live == 0, "release");
+    expect(g_events_created <= 3, "events are reused");
+  }
+  {
+    // Beyond max_in_flight the oldest launch is waited for.
+    Tracker tracker(2);
+    FakeStream stream;
+    launch(&tracker, &stream);
+    launch(&tracker, &stream);
+    std::thread device([&stream]() {
+      std::this_thread::sleep_for(std::chrono::milliseconds(20));
+      stream.completed = 1;
+    });
+    launch(&tracker, &stream);
+    device.join();
+    auto stats = tracker.GetStats();
+    expect(stats.throttled == 1 && stats.in_flight == 2, "throttle");
+    stream.completed = 3;
+  }
+  expect(live == 0, "destructor releases everything");
+
+  // Run modes.
+  backend::GcuRunModes modes(backend::GcuRunMode::kAsync);
+  expect(modes.Get("conv2d") == backend::GcuRunMode::kAsync, "default mode");
+  modes.SetList("nonzero,,masked_select", backend::GcuRunMode::kSync);
+  expect(modes.Get("nonzero") == backend::GcuRunMode::kSync &&
+             modes.Get("masked_select") == backend::GcuRunMode::kSync &&
+             modes.Get("conv2d") == backend::GcuRunMode::kAsync,
+         "sync list");
+  modes.SetDefault(backend::GcuRunMode::kSync);
+  modes.Set("conv2d", backend::GcuRunMode::kAsync);
+  modes.Reset("nonzero");
+  expect(modes.Get("conv2d") == backend::GcuRunMode::kAsync &&
+             modes.Get("nonzero") == backend::GcuRunMode::kSync &&
+             modes.Get("relu") == backend::GcuRunMode::kSync,
+         "overrides");
+  return ok;
+}
+
+void Spin(double us) {
+  auto end = Clock::now() + std::chrono::duration<double, std::micro>(us);
+  while (Clock::now() < end) {
+  }
+}
+
+double Ms(Clock::time_point start) {
+  return std::chrono::duration<double, std::milli>(Clock::now() - start)
+      .count();
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = false;
+  double kernel_us = 200.0;
+  double host_us = 100.0;
+  for (int i = 1; i < argc; ++i) {
+    std::string arg = argv[i];
+    if (arg == "--quick") {
+      quick = true;
+    } else if (arg == "--kernel-us" && i + 1 < argc) {
+      kernel_us = std::atof(argv[++i]);
+    } else if (arg == "--host-us" && i + 1 < argc) {
+      host_us = std::atof(argv[++i]);
+    }
+  }
+
+  bool ok = CheckTracker();
+  printf("tracker checks: %s\n", ok ? "ok" : "FAILED");
+
+  // Host cost of tracking a launch that keeps an executable and 3 buffers
+  // alive, against the device completing everything at once.
+  {
+    const int64_t launches = quick ? 20000 : 2000000;
+    Tracker tracker(1024);
+    FakeStream stream;
+    auto executable = std::make_shared<int>(0);
+    auto buffer = std::make_shared<std::vector<char>>(64);
+    auto start = Clock::now();
+    for (int64_t i = 0; i < launches; ++i) {
+      stream.enqueued++;
+      tracker.Track(&stream, {executable, buffer, buffer, buffer});
+      stream.completed = stream.enqueued.load();
+    }
+    double track_ns = Ms(start) * 1e6 / launches;
+    auto mode_start = Clock::now();
+    backend::GcuRunModes modes(backend::GcuRunMode::kAsync);
+    modes.Set("nonzero", backend::GcuRunMode::kSync);
+    const std::string op_type = "conv2d";
+    int64_t sync_ops = 0;
+    for (int64_t i = 0; i < launches; ++i) {
+      sync_ops += modes.Get(op_type) == backend::GcuRunMode::kSync;
+    }
+    double mode_ns = Ms(mode_start) * 1e6 / launches;
+    printf(
+        "host overhead: %.1f ns per tracked launch, %.1f ns per run mode "
+        "lookup%s\n",
+        track_ns,
+        mode_ns,
+        sync_ops > 0 ? " (unexpected sync)" : "");
+  }
+
+  // A sequence of ops, each with host_us of host work (building the key,
+  // checking the cache, preparing the buffers) and a kernel_us kernel.
+  const int64_t ops = quick ? 200 : 5000;
+  double sync_ms = 0;
+  double async_ms = 0;
+  uint64_t throttled = 0;
+  {
+    FakeStream stream;
+    FakeDevice device(&stream, kernel_us);
+    auto start = Clock::now();
+    for (int64_t i = 0; i < ops; ++i) {
+      Spin(host_us);
+      device.Launch();
+      device.Sync();
+    }
+    sync_ms = Ms(start);
+  }
+  {
+    FakeStream stream;
+    FakeDevice device(&stream, kernel_us);
+    Tracker tracker(64);
+    auto executable = std::make_shared<int>(0);
+    auto start = Clock::now();
+    for (int64_t i = 0; i < ops; ++i) {
+      Spin(host_us);
+      device.Launch();
+      tracker.Track(&stream, {executable, std::make_shared<int>(0)});
+    }
+    device.Sync();
+    tracker.Release(&stream);
+    async_ms = Ms(start);
+    throttled = tracker.GetStats().throttled;
+  }
+  printf(
+      "%ld ops, %.0f us host + %.0f us kernel each: sync %.1f ms, async "
+      "%.1f ms (%lu launches throttled)\n",
+      static_cast<long>(ops),  // NOLINT
+      host_us,
+      kernel_us,
+      sync_ms,
+      async_ms,
+      static_cast<unsigned long>(throttled));  // NOLINT
+  return ok ? 0 : 1;
+}
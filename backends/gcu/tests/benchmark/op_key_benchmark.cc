@@ -0,0 +1,493 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Host overhead of the JIT op cache lookup done on every GcuOpRunner launch,
+// the text signature hashed with std::hash used before against GcuOpKey. A
+// fake compiler stands in for the tops compiler, so this builds and runs
+// without the GCU SDK:
+//
+//   cd backends/gcu && g++ -std=c++17 -O2 -I . -I <paddle>/include
+//       tests/benchmark/op_key_benchmark.cc -o op_key_benchmark
+//
+// Usage: op_key_benchmark [--quick]
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <functional>
+#include <map>
+#include <new>
+#include <sstream>
+#include <string>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "backend/executor/gcu_op_key.h"
+
+namespace {
+
+std::atomic<int64_t> g_allocations(0);
+
+}  // namespace
+
+void* operator new(size_t size) {
+  g_allocations.fetch_add(1, std::memory_order_relaxed);
+  if (void* p = std::malloc(size)) {
+    return p;
+  }
+  throw std::bad_alloc();
+}
+
+void operator delete(void* p) noexcept { std::free(p); }
+void operator delete(void* p, size_t) noexcept { std::free(p); }
+
+namespace {
+
+using backend::GcuOpKey;
+
+// Stand-in for phi::DenseTensor with the members the key reads.
+struct FakeTensor {
+  std::vector<int64_t> shape;
+  int type;
+  bool init;
+
+  const std::vector<int64_t>& dims() const { return shape; }
+  int dtype() const { return type; }
+  bool initialized() const { return init; }
+};
+
+using Attribute = paddle::variant<paddle::blank,
+                                  int,
+                                  float,
+                                  std::string,
+                                  std::vector<int>,
+                                  std::vector<float>,
+                                  std::vector<std::string>,
+                                  bool,
+                                  std::vector<bool>,
+                                  int64_t,
+                                  std::vector<int64_t>,
+                                  std::vector<double>,
+                                  double>;
+using AttributeMap = std::unordered_map<std::string, Attribute>;
+using NameMap = std::map<std::string, std::vector<std::string>>;
+using ValueMap = std::map<std::string, std::vector<FakeTensor*>>;
+
+struct OpCase {
+  std::string name;
+  std::string type;
+  std::vector<FakeTensor> tensors;
+  NameMap input_names;
+  ValueMap inputs;
+  NameMap output_names;
+  ValueMap outputs;
+  AttributeMap attrs;
+
+  OpCase() = default;
+  // Copies point into their own tensors.
+  OpCase(const OpCase& other)
+      : name(other.name),
+        type(other.type),
+        tensors(other.tensors),
+        input_names(other.input_names),
+        inputs(other.inputs),
+        output_names(other.output_names),
+        outputs(other.outputs),
+        attrs(other.attrs) {
+    for (ValueMap* values : {&inputs, &outputs}) {
+      for (auto& slot : *values) {
+        for (auto& t : slot.second) {
+          t = tensors.data() + (t - other.tensors.data());
+        }
+      }
+    }
+  }
+  OpCase& operator=(const OpCase& other) {
+    OpCase copy(other);
+    std::swap(*this, copy);
+    return *this;
+  }
+  OpCase(OpCase&&) = default;
+  OpCase& operator=(OpCase&&) = default;
+};
+
+template <typename T>
+std::string JoinValues(const std::vector<T>& values) {
+  std::ostringstream os;
+  os << "[";
+  for (size_t i = 0; i < values.size(); ++i) {
+    os << (i ? ", " : "") << values[i];
+  }
+  os << "]";
+  return os.str();
+}
+
+// The signature GcuOpRunner built before: every dim, dtype and attribute
+// formatted as text, with the current time for attribute types it could not
+// print (double), which made every launch of such ops miss the cache.
+std::string LegacySignature(const OpCase& op) {
+  auto to_signature = [](std::ostringstream& os,
+                         const NameMap& tensor_names,
+                         const ValueMap& tensor_values) {
+    for (const auto& slot : tensor_names) {
+      os << slot.first << "[ ";
+      const auto& vars = tensor_values.at(slot.first);
+      for (size_t i = 0; i < slot.second.size(); ++i) {
+        os << "["
+           << "dims: " << JoinValues(vars[i]->dims())
+           << ", dtype: " << vars[i]->dtype() << ", index: " << i << "]; ";
+      }
+      os << " ]; ";
+    }
+  };
+  std::ostringstream os;
+  os << "input: [";
+  to_signature(os, op.input_names, op.inputs);
+  os << "]; ";
+  os << "output: [";
+  to_signature(os, op.output_names, op.outputs);
+  os << "]; ";
+
+  os << "attrs:[ ";
+  for (auto iter : op.attrs) {
+    os << iter.first << ": ";
+    const Attribute& value = iter.second;
+    if (paddle::holds_alternative<paddle::blank>(value)) {
+      os << "paddle::blank";
+    } else if (paddle::holds_alternative<int>(value)) {
+      os << paddle::get<int>(value);
+    } else if (paddle::holds_alternative<float>(value)) {
+      os << paddle::get<float>(value);
+    } else if (paddle::holds_alternative<std::string>(value)) {
+      os << paddle::get<std::string>(value);
+    } else if (paddle::holds_alternative<bool>(value)) {
+      os << paddle::get<bool>(value);
+    } else if (paddle::holds_alternative<int64_t>(value)) {
+      os << paddle::get<int64_t>(value);
+    } else if (paddle::holds_alternative<std::vector<int>>(value)) {
+      os << JoinValues(paddle::get<std::vector<int>>(value));
+    } else if (paddle::holds_alternative<std::vector<float>>(value)) {
+      os << JoinValues(paddle::get<std::vector<float>>(value));
+    } else if (paddle::holds_alternative<std::vector<std::string>>(value)) {
+      os << JoinValues(paddle::get<std::vector<std::string>>(value));
+    } else if (paddle::holds_alternative<std::vector<bool>>(value)) {
+      os << JoinValues(paddle::get<std::vector<bool>>(value));
+    } else if (paddle::holds_alternative<std::vector<int64_t>>(value)) {
+      os << JoinValues(paddle::get<std::vector<int64_t>>(value));
+    } else if (paddle::holds_alternative<std::vector<double>>(value)) {
+      os << JoinValues(paddle::get<std::vector<double>>(value));
+    } else {
+      uint64_t ms = std::chrono::duration_cast<std::chrono::milliseconds>(
+                        std::chrono::system_clock::now().time_since_epoch())
+                        .count();
+      os << std::to_string(ms);
+    }
+    os << "; ";
+  }
+  os << " ]";
+  os << "\n";
+  return os.str();
+}
+
+bool BuildKey(const OpCase& op, GcuOpKey* key) {
+  return backend::BuildGcuOpKey(op.type,
+                                op.input_names,
+                                op.inputs,
+                                op.output_names,
+                                op.outputs,
+                                op.attrs,
+                                key);
+}
+
+// Fake tops compiler: spins for compile_us and hands out executable ids.
+struct FakeCompiler {
+  double compile_us;
+  int64_t compiles = 0;
+
+  int64_t Compile() {
+    auto start = std::chrono::steady_clock::now();
+    while (std::chrono::duration<double, std::micro>(
+               std::chrono::steady_clock::now() - start)
+               .count() < compile_us) {
+    }
+    return ++compiles;
+  }
+};
+
+OpCase MakeOp(
+    const std::string& name,
+    const std::string& type,
+    const std::vector<std::pair<std::string, std::vector<int64_t>>>& inputs,
+    const std::vector<std::pair<std::string, std::vector<int64_t>>>& outputs,
+    const AttributeMap& attrs) {
+  OpCase op;
+  op.name = name;
+  op.type = type;
+  op.attrs = attrs;
+  op.tensors.reserve(inputs.size() + outputs.size());
+  for (const auto& in : inputs) {
+    op.tensors.push_back({in.second, 10, true});
+    op.input_names[in.first].push_back(in.first + "_var");
+    op.inputs[in.first].push_back(&op.tensors.back());
+  }
+  for (const auto& out : outputs) {
+    op.tensors.push_back({out.second, 10, true});
+    op.output_names[out.first].push_back(out.first + "_var");
+    op.outputs[out.first].push_back(&op.tensors.back());
+  }
+  return op;
+}
+
+std::vector<OpCase> MakeOps() {
+  std::vector<OpCase> ops;
+  ops.push_back(MakeOp("matmul_v2",
+                       "matmul_v2",
+                       {{"X", {16, 128, 768}}, {"Y", {768, 3072}}},
+                       {{"Out", {16, 128, 3072}}},
+                       {{"trans_x", false}, {"trans_y", false}}));
+  ops.push_back(MakeOp("conv2d",
+                       "conv2d",
+                       {{"Input", {8, 64, 56, 56}}, {"Filter", {64, 64, 3, 3}}},
+                       {{"Output", {8, 64, 56, 56}}},
+                       {{"strides", std::vector<int>{1, 1}},
+                        {"paddings", std::vector<int>{1, 1}},
+                        {"dilations", std::vector<int>{1, 1}},
+                        {"groups", 1},
+                        {"data_format", std::string("NCHW")},
+                        {"padding_algorithm", std::string("EXPLICIT")},
+                        {"use_cudnn", true},
+                        {"fuse_relu_before_depthwise_conv", false},
+                        {"workspace_size_MB", 512},
+                        {"exhaustive_search", false}}));
+  ops.push_back(
+      MakeOp("layer_norm",
+             "layer_norm",
+             {{"X", {16, 128, 768}}, {"Scale", {768}}, {"Bias", {768}}},
+             {{"Y", {16, 128, 768}}, {"Mean", {2048}}, {"Variance", {2048}}},
+             {{"epsilon", 1e-5f}, {"begin_norm_axis", 2}}));
+  ops.push_back(MakeOp("clip (double attrs)",
+                       "clip",
+                       {{"X", {16, 128, 768}}},
+                       {{"Out", {16, 128, 768}}},
+                       {{"min", -1.0}, {"max", 1.0}}));
+  return ops;
+}
+
+bool CheckKeys() {
+  bool ok = true;
+  auto expect = [&ok](bool cond, const char* what) {
+    if (!cond) {
+      printf("key check failed: %s\n", what);
+      ok = false;
+    }
+  };
+  std::vector<OpCase> ops = MakeOps();
+  const OpCase& conv = ops[1];
+  GcuOpKey a, b;
+  BuildKey(conv, &a);
+
+  // Same attributes inserted in another order into a map of another size.
+  OpCase reordered = conv;
+  reordered.attrs.clear();
+  reordered.attrs.rehash(97);
+  std::vector<std::pair<std::string, Attribute>> entries(conv.attrs.begin(),
+                                                         conv.attrs.end());
+  for (auto it = entries.rbegin(); it != entries.rend(); ++it) {
+    reordered.attrs.insert(*it);
+  }
+  BuildKey(reordered, &b);
+  expect(a == b && a.hash() == b.hash(), "attribute order");
+
+  OpCase changed = conv;
+  changed.tensors[0].shape[0] = 16;
+  BuildKey(changed, &b);
+  expect(a != b, "dims");
+
+  changed = conv;
+  changed.tensors[1].type = 11;
+  BuildKey(changed, &b);
+  expect(a != b, "dtype");
+
+  changed = conv;
+  changed.tensors[1].init = false;
+  BuildKey(changed, &b);
+  expect(a != b, "initialized");
+
+  changed = conv;
+  changed.attrs["groups"] = int64_t(1);
+  BuildKey(changed, &b);
+  expect(a != b, "attribute type");
+
+  changed = conv;
+  changed.attrs["data_format"] = std::string("NHWC");
+  BuildKey(changed, &b);
+  expect(a != b, "attribute value");
+
+  // Field boundaries are part of the key.
+  OpCase ab = conv, c = conv;
+  ab.attrs = {{"ab", std::string("c")}};
+  c.attrs = {{"a", std::string("bc")}};
+  BuildKey(ab, &a);
+  BuildKey(c, &b);
+  expect(a != b, "field boundaries");
+
+  // Keys longer than the inline buffer spill to the heap.
+  OpCase big = conv;
+  big.attrs["table"] = std::vector<int64_t>(1000, 7);
+  BuildKey(big, &a);
+  GcuOpKey copy = a;
+  expect(a.size() > GcuOpKey::kInlineBytes && copy == a, "spilled key");
+  big.attrs["table"] = std::vector<int64_t>(1000, 8);
+  BuildKey(big, &b);
+  expect(a != b, "spilled key value");
+
+  // A key read back from its signature list line builds the same key again.
+  for (const auto& op : ops) {
+    BuildKey(op, &a);
+    GcuOpKey parsed;
+    backend::GcuOpSignature<Attribute> sig;
+    bool ok_parse =
+        parsed.FromHex(a.ToHex()) && backend::ParseGcuOpKey(parsed, &sig);
+    OpCase rebuilt;
+    rebuilt.type = sig.op_type;
+    size_t num_tensors = 0;
+    for (const auto* slots : {&sig.inputs, &sig.outputs}) {
+      for (const auto& slot : *slots) {
+        num_tensors += slot.second.size();
+      }
+    }
+    rebuilt.tensors.reserve(num_tensors);
+    for (int out = 0; out < 2; ++out) {
+      NameMap& names = out ? rebuilt.output_names : rebuilt.input_names;
+      ValueMap& values = out ? rebuilt.outputs : rebuilt.inputs;
+      for (const auto& slot : out ? sig.outputs : sig.inputs) {
+        for (const auto& t : slot.second) {
+          names[slot.first].push_back(
+              slot.first + "." + std::to_string(values[slot.first].size()));
+          rebuilt.tensors.push_back({t.dims, t.dtype, t.initialized});
+          values[slot.first].push_back(&rebuilt.tensors.back());
+        }
+      }
+    }
+    for (const auto& attr : sig.attrs) {
+      rebuilt.attrs.insert(attr);
+    }
+    BuildKey(rebuilt, &b);
+    expect(ok_parse && parsed == a && a == b && a.hash() == b.hash(),
+           "signature round trip");
+  }
+
+  // The hash only depends on the bytes.
+  GcuOpKey whole, pieces;
+  const char bytes[] = "0123456789abcdefghij";
+  whole.Append(bytes, 20);
+  pieces.Append(bytes, 3);
+  pieces.Append(bytes + 3, 9);
+  pieces.Append(bytes + 12, 8);
+  expect(whole == pieces && whole.hash() == pieces.hash(), "append split");
+
+  // The legacy signature of an op with a double attribute changes with the
+  // clock, the key does not.
+  const OpCase& clip = ops[3];
+  BuildKey(clip, &a);
+  BuildKey(clip, &b);
+  expect(a == b, "double attributes");
+  return ok;
+}
+
+struct Result {
+  double ns_per_launch;
+  double allocs_per_launch;
+  int64_t compiles;
+};
+
+template <typename Launch>
+Result Measure(int64_t launches,
+               const std::vector<OpCase>& ops,
+               FakeCompiler* compiler,
+               Launch launch) {
+  for (const auto& op : ops) {
+    launch(op);
+  }
+  const int64_t compiles_before = compiler->compiles;
+  const int64_t allocs_before = g_allocations.load();
+  auto start = std::chrono::steady_clock::now();
+  for (int64_t i = 0; i < launches; ++i) {
+    launch(ops[i % ops.size()]);
+  }
+  const double ns = std::chrono::duration<double, std::nano>(
+                        std::chrono::steady_clock::now() - start)
+                        .count();
+  return {ns / launches,
+          static_cast<double>(g_allocations.load() - allocs_before) / launches,
+          compiler->compiles - compiles_before};
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  bool quick = argc > 1 && std::string(argv[1]) == "--quick";
+  const int64_t launches = quick ? 20000 : 400000;
+
+  const bool ok = CheckKeys();
+  printf("key checks: %s\n", ok ? "ok" : "FAILED");
+
+  std::vector<OpCase> ops = MakeOps();
+  printf("%-22s %14s %14s %10s %14s %14s %10s\n",
+         "op",
+         "legacy ns",
+         "legacy allocs",
+         "compiles",
+         "key ns",
+         "key allocs",
+         "compiles");
+  for (const auto& op : ops) {
+    std::vector<OpCase> one = {op};
+
+    FakeCompiler legacy_compiler{50.0};
+    std::map<std::string, int64_t> legacy_cache;
+    Result legacy =
+        Measure(launches, one, &legacy_compiler, [&](const OpCase& o) {
+          std::hash<std::string> hasher;
+          auto key = std::to_string(hasher(LegacySignature(o) + o.type));
+          auto it = legacy_cache.find(key);
+          if (it == legacy_cache.end()) {
+            legacy_cache[key] = legacy_compiler.Compile();
+          }
+        });
+
+    FakeCompiler key_compiler{50.0};
+    std::unordered_map<GcuOpKey, int64_t, backend::GcuOpKeyHash> key_cache;
+    GcuOpKey key;
+    Result fast = Measure(launches, one, &key_compiler, [&](const OpCase& o) {
+      BuildKey(o, &key);
+      auto it = key_cache.find(key);
+      if (it == key_cache.end()) {
+        key_cache.emplace(key, key_compiler.Compile());
+      }
+    });
+
+    printf("%-22s %14.1f %14.2f %10ld %14.1f %14.2f %10ld\n",
+           op.name.c_str(),
+           legacy.ns_per_launch,
+           legacy.allocs_per_launch,
+           static_cast<long>(legacy.compiles),  // NOLINT
+           fast.ns_per_launch,
+           fast.allocs_per_launch,
+           static_cast<long>(fast.compiles));  // NOLINT
+  }
+  return ok ? 0 : 1;
+}
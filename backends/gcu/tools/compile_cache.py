@@ -0,0 +1,172 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Manage the persistent compile cache of the GCU JIT kernels.
+
+    paddle_gcu_compile_cache --cache-dir DIR list -o ops.txt
+    paddle_gcu_compile_cache --cache-dir DIR populate ops.txt
+    paddle_gcu_compile_cache --cache-dir DIR gc --max-bytes 2147483648
+    paddle_gcu_compile_cache --cache-dir DIR stats
+
+`list` writes the op keys of the cache, one hex key per line, and
+`populate` compiles such a list into a (new) cache directory, for instance
+while building the image of an inference service. The warmup files written
+by `paddle_custom_device.gcu.stop_op_recording` are key files as well. The
+keys compile in parallel, `--threads` sets the number of compile workers.
+"""
+
+import argparse
+import ctypes
+import os
+import sys
+
+# Field order of backend::CompileCache::Stats.
+_COMPILE_CACHE_STATS = (
+    "hits",
+    "misses",
+    "stores",
+    "store_failures",
+    "evictions",
+    "disk_bytes",
+)
+
+
+def _load_lib(args, with_device=False):
+    # The cache reads its configuration once, before the first compile.
+    os.environ["PADDLE_GCU_COMPILE_CACHE_DIR"] = os.path.abspath(args.cache_dir)
+    if args.max_bytes is not None:
+        os.environ["PADDLE_GCU_COMPILE_CACHE_BYTES"] = str(args.max_bytes)
+    if getattr(args, "threads", None):
+        os.environ["PADDLE_GCU_COMPILE_THREADS"] = str(args.threads)
+    import paddle
+    import paddle_custom_device
+
+    if with_device:
+        paddle.set_device("gcu")
+    return paddle_custom_device.gcu._load_lib()
+
+
+def _check(status, what):
+    # C_SUCCESS is 0
+    if status != 0:
+        sys.exit("paddle_gcu_compile_cache: {} failed".format(what))
+
+
+def list_keys(args):
+    lib = _load_lib(args)
+    count = ctypes.c_size_t(0)
+    out = os.path.abspath(args.output)
+    _check(lib.GcuCompileCacheList(out.encode(), ctypes.byref(count)), "list")
+    print("{} op keys written to {}".format(count.value, out))
+
+
+def populate(args):
+    lib = _load_lib(args, with_device=True)
+    compiled = ctypes.c_size_t(0)
+    failed = ctypes.c_size_t(0)
+    for key_file in args.key_files:
+        _check(
+            lib.GcuCompileCachePopulate(
+                os.path.abspath(key_file).encode(),
+                ctypes.byref(compiled),
+                ctypes.byref(failed),
+            ),
+            "populate from " + key_file,
+        )
+        print(
+            "{}: {} ops compiled, {} failed".format(
+                key_file, compiled.value, failed.value
+            )
+        )
+
+
+def gc(args):
+    lib = _load_lib(args)
+    removed = ctypes.c_size_t(0)
+    _check(
+        lib.GcuCompileCacheGarbageCollect(
+            ctypes.c_uint64(args.max_bytes or 0), ctypes.byref(removed)
+        ),
+        "gc",
+    )
+    print("{} entries removed".format(removed.value))
+
+
+def stats(args):
+    lib = _load_lib(args)
+    # Collecting with no size cap only removes stale temporary files, and
+    # measures the directory.
+    lib.GcuCompileCacheGarbageCollect(ctypes.c_uint64(0), None)
+    values = (ctypes.c_uint64 * len(_COMPILE_CACHE_STATS))()
+    _check(lib.GcuGetCompileCacheStats(values, ctypes.c_size_t(len(values))), "stats")
+    print("disk_bytes: {}".format(values[_COMPILE_CACHE_STATS.index("disk_bytes")]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="paddle_gcu_compile_cache",
+        description="Manage the persistent compile cache of the GCU JIT " "kernels.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.getenv("PADDLE_GCU_COMPILE_CACHE_DIR"),
+        help="cache directory, defaults to $PADDLE_GCU_COMPILE_CACHE_DIR",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    sub = subparsers.add_parser("list", help="write the op keys of the cache")
+    sub.add_argument("-o", "--output", required=True, help="key file")
+    sub.set_defaults(func=list_keys, max_bytes=None)
+
+    sub = subparsers.add_parser(
+        "populate", help="compile the op keys of key files into the cache"
+    )
+    sub.add_argument(
+        "key_files", nargs="+", help="key files written by list or warmup files"
+    )
+    sub.add_argument(
+        "--max-bytes", type=int, default=None, help="size cap of the cache directory"
+    )
+    sub.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="compile workers, defaults to "
+        "$PADDLE_GCU_COMPILE_THREADS or one per core up to 8",
+    )
+    sub.set_defaults(func=populate)
+
+    sub = subparsers.add_parser("gc", help="remove the least recently used entries")
+    sub.add_argument(
+        "--max-bytes",
+        type=int,
+        required=True,
+        help="size to shrink the cache directory to",
+    )
+    sub.set_defaults(func=gc)
+
+    sub = subparsers.add_parser("stats", help="show the cache size")
+    sub.set_defaults(func=stats, max_bytes=None)
+
+    args = parser.parse_args(argv)
+    if not args.cache_dir:
+        parser.error(
+            "no cache directory, pass --cache-dir or set "
+            "PADDLE_GCU_COMPILE_CACHE_DIR"
+        )
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()